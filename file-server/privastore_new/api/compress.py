@@ -0,0 +1,51 @@
+from typing import Optional
+import zlib
+
+# HTTP content codings.
+GZIP = 'gzip'
+DEFLATE = 'deflate'
+# In order of preference.
+ENCODINGS = [GZIP, DEFLATE]
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    '''
+        Pick the content coding for a response from the request's
+        Accept-Encoding header. Returns None if the body should be sent as
+        is.
+    '''
+    if accept_encoding is None:
+        return None
+    qvalues = dict()
+    for coding in accept_encoding.split(','):
+        coding, _, params = coding.partition(';')
+        coding = coding.strip().lower()
+        if coding == '':
+            continue
+        qvalue = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[coding] = qvalue
+
+    encoding = None
+    encoding_qvalue = 0.0
+    for coding in ENCODINGS:
+        qvalue = qvalues.get(coding, qvalues.get('*', 0.0))
+        if qvalue > encoding_qvalue:
+            encoding = coding
+            encoding_qvalue = qvalue
+    return encoding
+
+def compress(data: bytes, encoding: str, level: int=6) -> bytes:
+    if encoding == GZIP:
+        c = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif encoding == DEFLATE:
+        # HTTP deflate is the zlib format.
+        c = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS)
+    else:
+        raise Exception('Unsupported content coding [{}]'.format(encoding))
+    return c.compress(data) + c.flush()
@@ -1,8 +1,15 @@
 from flask import Flask
 import logging
 from ..daemon import Daemon
+from .pooled_wsgi_server import PooledWSGIServer
+from ..util import config_bool
 import wsgiref.simple_server
 
+# App config keys for JSON response compression (see flask_http).
+HTTP_COMPRESSION = 'HTTP_COMPRESSION'
+HTTP_COMPRESSION_MIN_SIZE = 'HTTP_COMPRESSION_MIN_SIZE'
+HTTP_COMPRESSION_LEVEL = 'HTTP_COMPRESSION_LEVEL'
+
 class FlaskDaemon(Daemon):
 
     def __init__(self, http_config, app: Flask, daemon=True):
@@ -10,20 +17,32 @@ class FlaskDaemon(Daemon):
 
         hostname: str = http_config.get('api-hostname', 'localhost')
         port: int = int(http_config.get('api-port', 8080))
-        self._server = wsgiref.simple_server.make_server(hostname, port, app)
+        max_workers = int(http_config.get('http-worker-threads', '32'))
+        backlog = int(http_config.get('http-accept-backlog', '128'))
+        self._shutdown_timeout = float(http_config.get('http-shutdown-timeout', '10'))
+        app.config[HTTP_COMPRESSION] = config_bool(http_config.get('http-compression', '1'))
+        app.config[HTTP_COMPRESSION_MIN_SIZE] = int(http_config.get('http-compression-min-size', '1024'))
+        app.config[HTTP_COMPRESSION_LEVEL] = int(http_config.get('http-compression-level', '6'))
+        logging.debug('HTTP compression: [{}] min size: [{}B] level: [{}]'.format(app.config[HTTP_COMPRESSION], app.config[HTTP_COMPRESSION_MIN_SIZE], app.config[HTTP_COMPRESSION_LEVEL]))
+        self._server = wsgiref.simple_server.make_server(hostname, port, app, server_class=lambda address, handler: PooledWSGIServer(address, handler, max_workers, backlog))
         logging.debug('Flask server listening on {}:{}'.format(hostname, port))
-        self._server.timeout = 0.1
 
         # TODO: SSL.
+
+    def stop(self):
+        super().stop()
+        self._server.shutdown()
     
     def run(self):
         self._started.set()
         logging.debug('Flask daemon started')
-        while not self._stop.is_set():
-            try:
-                self._server.handle_request()
-            except Exception as e:
-                logging.error('Error handling HTTP request: {}'.format(str(e)))
+        try:
+            self._server.serve()
+        except Exception as e:
+            logging.error('Error handling HTTP request: {}'.format(str(e)))
+        closed = self._server.drain(self._shutdown_timeout)
+        if closed > 0:
+            logging.debug('Closed [{}] connections after drain'.format(closed))
         self._server.server_close()
         self._stopped.set()
-        logging.debug('Flask daemon stopped')
\ No newline at end of file
+        logging.debug('Flask daemon stopped')
@@ -0,0 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import selectors
+import socket
+from threading import BoundedSemaphore, Condition
+import time
+from wsgiref.simple_server import WSGIServer
+
+class PooledServerMixIn(object):
+
+    '''
+        Handle requests on a fixed size thread pool rather than a new thread
+        per connection (see socketserver.ThreadingMixIn).
+
+        serve() waits on the listening socket with a selector and is woken up
+        right away by shutdown(). While every worker is busy new connections
+        aren't accepted, they wait in the listen backlog (request_queue_size).
+    '''
+    # Workers are only used for requests, the accept loop stops them.
+    daemon_threads = True
+
+    def init_pool(self, max_workers: int, thread_name_prefix: str='wsgi-worker') -> None:
+        self._max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._worker_slots = BoundedSemaphore(max_workers)
+        self._requests_done = Condition()
+        # Connections being handled.
+        self._requests: set[socket.socket] = set()
+        self._shutting_down = False
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    def serve(self) -> None:
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.socket, selectors.EVENT_READ)
+            selector.register(self._wakeup_r, selectors.EVENT_READ)
+            while not self._shutting_down:
+                for key, _ in selector.select():
+                    if self._shutting_down:
+                        break
+                    if key.fileobj is self.socket:
+                        self.accept_request()
+                    else:
+                        self._wakeup_r.recv(1024)
+
+    def accept_request(self) -> None:
+        # Wait for a free worker before taking the connection off the backlog.
+        while not self._worker_slots.acquire(timeout=0.1):
+            if self._shutting_down:
+                return
+        try:
+            request, client_address = self.get_request()
+        except OSError:
+            self._worker_slots.release()
+            return
+        if not self.verify_request(request, client_address):
+            self._worker_slots.release()
+            self.shutdown_request(request)
+            return
+        with self._requests_done:
+            self._requests.add(request)
+        self._executor.submit(self.process_request_worker, request, client_address)
+
+    def process_request_worker(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._requests_done:
+                self._requests.discard(request)
+                self._requests_done.notify_all()
+            self._worker_slots.release()
+
+    def shutdown(self) -> None:
+        '''
+            Stop accepting connections. Doesn't wait for requests in flight,
+            see drain.
+        '''
+        self._shutting_down = True
+        try:
+            self._wakeup_w.send(b'\0')
+        except OSError:
+            pass
+
+    def drain(self, timeout: float) -> int:
+        '''
+            Wait up to timeout for the requests in flight to finish, then
+            close the connections still open. Returns the number of
+            connections closed after the timeout.
+        '''
+        end_t = time.monotonic() + timeout
+        with self._requests_done:
+            while len(self._requests) > 0:
+                remaining = end_t - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._requests_done.wait(remaining)
+            requests = list(self._requests)
+        for request in requests:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._executor.shutdown(wait=True)
+        return len(requests)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+class PooledWSGIServer(PooledServerMixIn, WSGIServer):
+
+    '''
+        WSGI server that handles requests on a fixed size thread pool (the
+        wsgiref server handles one request at a time), see PooledServerMixIn.
+        The wsgiref handler closes the connection after each request, so
+        there are no idle keep-alive connections to manage.
+    '''
+    def __init__(self, server_address, request_handler, max_workers: int=32, backlog: int=128):
+        # Set before listen() is called.
+        self.request_queue_size = backlog
+        super().__init__(server_address, request_handler)
+        self.init_pool(max_workers)
+        logging.debug('WSGI server workers: [{}] accept backlog: [{}]'.format(max_workers, backlog))
@@ -1,9 +1,11 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response
 from functools import wraps
 from http import HTTPStatus
 import logging
 import urllib.parse
 
+from ...api.compress import compress, negotiate_encoding
+from ...api.flask_daemon import HTTP_COMPRESSION, HTTP_COMPRESSION_LEVEL, HTTP_COMPRESSION_MIN_SIZE
 from ...error import AuthenticationError, DirectoryError, FileError, HttpError, LogError, SessionError
 from ...log.log_entry import LogEntry
 from ...log.log_entry_type import LogEntryType
@@ -11,9 +13,43 @@ from ..server import get_local_server
 
 API_VERSION = 1
 SESSION_ID_HEADER = 'x-privastore-session-id'
+ACCEPT_ENCODING_HEADER = 'Accept-Encoding'
+CONTENT_ENCODING_HEADER = 'Content-Encoding'
+CONTENT_TYPE_JSON = 'application/json'
 
 app = Flask(__name__)
 
+@app.after_request
+def compress_response(response: Response) -> Response:
+    '''
+        Compress JSON responses with gzip or deflate if they're at least
+        http-compression-min-size and the client accepts it (see
+        FlaskDaemon). Nothing else is compressed, file data is encrypted and
+        doesn't compress.
+    '''
+    if not app.config.get(HTTP_COMPRESSION, False) or response.mimetype != CONTENT_TYPE_JSON:
+        return response
+    # Responses that may be compressed depend on Accept-Encoding.
+    response.vary.add(ACCEPT_ENCODING_HEADER)
+    if response.direct_passthrough or response.is_streamed or CONTENT_ENCODING_HEADER in response.headers:
+        return response
+
+    body = response.get_data()
+    if len(body) < app.config.get(HTTP_COMPRESSION_MIN_SIZE, 1024):
+        return response
+    encoding = negotiate_encoding(request.headers.get(ACCEPT_ENCODING_HEADER))
+    if encoding is None:
+        return response
+
+    # Also sets Content-Length.
+    response.set_data(compress(body, encoding, app.config.get(HTTP_COMPRESSION_LEVEL, 6)))
+    response.headers[CONTENT_ENCODING_HEADER] = encoding
+    # The compressed body isn't byte for byte the same representation.
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
 @app.errorhandler(AuthenticationError)
 def http_error_handler(e: AuthenticationError):
     return jsonify(e.to_dict()), HTTPStatus.UNAUTHORIZED
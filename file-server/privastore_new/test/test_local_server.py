@@ -42,7 +42,8 @@ class TestLocalServer(unittest.TestCase):
             'api': {
                 'api-type': 'http',
                 'api-hostname': HOSTNAME,
-                'api-port': str(LOCALS_PORT)
+                'api-port': str(LOCALS_PORT),
+                'http-compression-min-size': '100'
             },
             'db': {
                 'db-type': 'sqlite',
@@ -176,6 +177,36 @@ class TestLocalServer(unittest.TestCase):
         self.assertEqual(dir_5_parent, dir_2_uid)
         self.assertEqual(dir_5_path, '/dir_2/dir_2a')
     
+    def test_compression(self):
+        session_id = self.do_login(ADMIN_USERNAME, ADMIN_PASSWORD)
+        headers = {SESSION_ID_HEADER: session_id, 'Accept-Encoding': 'gzip, deflate'}
+        r = requests.put(CREATE_DIR_URL.format('dir_1'), headers=headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(r.headers.get('Content-Encoding'), 'gzip')
+        self.assertIn('Accept-Encoding', r.headers.get('Vary'))
+        self.assertEqual(r.json().get('name'), 'dir_1')
+        headers['Accept-Encoding'] = 'deflate'
+        r = requests.put(CREATE_DIR_URL.format('dir_2'), headers=headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(r.headers.get('Content-Encoding'), 'deflate')
+        self.assertEqual(r.json().get('name'), 'dir_2')
+        headers['Accept-Encoding'] = 'identity'
+        r = requests.put(CREATE_DIR_URL.format('dir_3'), headers=headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertIsNone(r.headers.get('Content-Encoding'))
+        self.assertIn('Accept-Encoding', r.headers.get('Vary'))
+        self.assertEqual(r.json().get('name'), 'dir_3')
+        # Responses under the minimum size are sent as is.
+        headers['Accept-Encoding'] = 'gzip'
+        r = requests.put(CREATE_DIR_URL.format('dir_3'), headers=headers)
+        self.assertEqual(r.status_code, HTTPStatus.CONFLICT)
+        self.assertIsNone(r.headers.get('Content-Encoding'))
+        # Only JSON is compressed.
+        r = requests.put(HEARTBEAT_URL, headers=headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertIsNone(r.headers.get('Content-Encoding'))
+        self.assertIsNone(r.headers.get('Vary'))
+
     def test_upload_file(self):
         session_id = self.do_login(ADMIN_USERNAME, ADMIN_PASSWORD)
         headers = {SESSION_ID_HEADER: session_id}
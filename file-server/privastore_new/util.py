@@ -7,4 +7,15 @@ def format_datetime(t: time.struct_time):
     return time.strftime('%Y-%m-%d %H:%M:%S', t)
 
 def str_path(path: list[str]):
-    return '/' + '/'.join(path)
\ No newline at end of file
+    return '/' + '/'.join(path)
+
+def config_bool(config_val: str) -> bool:
+    try:
+        config_val = config_val.lower()
+        if config_val == 'true' or config_val == '1':
+            return True
+        elif config_val == 'false' or config_val == '0':
+            return False
+    except:
+        pass
+    raise Exception('Invalid boolean configuration value')
\ No newline at end of file
@@ -0,0 +1,191 @@
+import configparser
+from collections import deque
+from .error import AdmissionError
+import logging
+from threading import Condition
+import time
+from typing import Optional, Union
+from .util.file import parse_mem_size, str_mem_size
+
+class Admission(object):
+
+    '''
+        A transfer let in by AdmissionControl.admit, holding its reserved
+        bytes until released.
+    '''
+    def __init__(self, admission_control: 'AdmissionControl', reserved_bytes: int):
+        self._admission_control = admission_control
+        self._reserved_bytes = reserved_bytes
+        self._released = False
+
+    def reserved_bytes(self) -> int:
+        return self._reserved_bytes
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._admission_control.release(self._reserved_bytes)
+
+class AdmissionControl(object):
+
+    '''
+        Limits the number of transfers (uploads and downloads) in progress and
+        the store space reserved by them, so a burst of transfers waits its
+        turn instead of running the store out of space or tying up the worker
+        queues.
+
+        Transfers over the limits wait in a queue and are let in in arrival
+        order (one that doesn't fit holds back those behind it), up to the
+        timeout. Transfers are rejected once the queue is full or on timeout.
+        A transfer reserving more than max_reserved_bytes is let in on its own.
+
+        max_transfers - transfers in progress, 0 for unlimited.
+        max_reserved_bytes - store space reserved by transfers, 0 for
+            unlimited.
+        unknown_size_bytes - store space reserved by uploads of unknown size
+            (ex. chunked requests).
+        max_waiting - transfers waiting to be let in.
+        timeout - seconds to wait to be let in.
+        retry_after - seconds clients are told to wait before retrying a
+            rejected transfer.
+    '''
+    def __init__(self, max_transfers: int=0, max_reserved_bytes: int=0, max_waiting: int=100, timeout: float=30, retry_after: int=5, unknown_size_bytes: int=0):
+        self._cond = Condition()
+        self._max_transfers = max_transfers
+        self._max_reserved_bytes = max_reserved_bytes
+        self._unknown_size_bytes = unknown_size_bytes
+        self._max_waiting = max_waiting
+        self._timeout = timeout
+        self._retry_after = retry_after
+        self._queue: deque[object] = deque()
+        self._transfers = 0
+        self._reserved_bytes = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._wait_time = 0
+
+    @staticmethod
+    def from_config(store_config: Union[dict, configparser.ConfigParser]) -> 'AdmissionControl':
+        '''
+            Configuration:
+                max-client-transfers - uploads and downloads in progress
+                    (default 0, unlimited)
+                max-reserved-bytes - store space reserved by transfers in
+                    progress (ex. 512MB, default 0, unlimited)
+                chunked-upload-reserved-bytes - store space reserved by an
+                    upload of unknown size (default max-file-size)
+                admission-queue-size - transfers waiting to be let in
+                    (default 100)
+                admission-timeout - seconds to wait to be let in (default 30)
+                admission-retry-after - Retry-After of rejected transfers
+                    (default 5s)
+        '''
+        max_reserved_bytes = store_config.get('max-reserved-bytes', '0')
+        max_reserved_bytes = parse_mem_size(max_reserved_bytes) if max_reserved_bytes != '0' else 0
+        unknown_size_bytes = store_config.get('chunked-upload-reserved-bytes', store_config.get('max-file-size', '500MB'))
+        unknown_size_bytes = parse_mem_size(unknown_size_bytes) if unknown_size_bytes != '0' else 0
+        admission_control = AdmissionControl(
+            max_transfers=int(store_config.get('max-client-transfers', '0')),
+            max_reserved_bytes=max_reserved_bytes,
+            max_waiting=int(store_config.get('admission-queue-size', '100')),
+            timeout=float(store_config.get('admission-timeout', '30')),
+            retry_after=int(store_config.get('admission-retry-after', '5')),
+            unknown_size_bytes=unknown_size_bytes
+        )
+        logging.debug('Max client transfers: [{}]'.format(admission_control.max_transfers()))
+        logging.debug('Max reserved bytes: [{}]'.format(str_mem_size(admission_control.max_reserved_bytes())))
+        logging.debug('Chunked upload reserved bytes: [{}]'.format(str_mem_size(admission_control.unknown_size_bytes())))
+        logging.debug('Admission queue size: [{}] timeout: [{}s]'.format(admission_control._max_waiting, admission_control._timeout))
+        return admission_control
+
+    def max_transfers(self) -> int:
+        return self._max_transfers
+
+    def max_reserved_bytes(self) -> int:
+        return self._max_reserved_bytes
+
+    def unknown_size_bytes(self) -> int:
+        return self._unknown_size_bytes
+
+    def transfers(self) -> int:
+        with self._cond:
+            return self._transfers
+
+    def reserved_bytes(self) -> int:
+        with self._cond:
+            return self._reserved_bytes
+
+    def waiting(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def fits(self, reserve_bytes: int) -> bool:
+        if self._max_transfers > 0 and self._transfers >= self._max_transfers:
+            return False
+        if self._max_reserved_bytes > 0 and self._reserved_bytes > 0 and self._reserved_bytes + reserve_bytes > self._max_reserved_bytes:
+            return False
+        return True
+
+    def admit(self, reserve_bytes: Optional[int]=0) -> Admission:
+        '''
+            Let a transfer reserving reserve_bytes of store space in, waiting
+            for its turn if needed. Release the returned admission once the
+            transfer is done. If reserve_bytes is None (size not known up
+            front) unknown_size_bytes are reserved.
+
+            Throws AdmissionError if the transfer isn't let in.
+        '''
+        if reserve_bytes is None:
+            reserve_bytes = self._unknown_size_bytes
+        with self._cond:
+            if len(self._queue) == 0 and self.fits(reserve_bytes):
+                return self.grant(reserve_bytes)
+
+            if len(self._queue) >= self._max_waiting:
+                self._rejected += 1
+                raise AdmissionError('Too many transfers in progress', self._retry_after)
+
+            ticket = object()
+            self._queue.append(ticket)
+            start_t = time.monotonic()
+            end_t = start_t + self._timeout
+            try:
+                while self._queue[0] is not ticket or not self.fits(reserve_bytes):
+                    remaining = end_t - time.monotonic()
+                    if remaining <= 0:
+                        self._timed_out += 1
+                        raise AdmissionError('Timed out waiting for transfers in progress', self._retry_after)
+                    self._cond.wait(remaining)
+            finally:
+                self._queue.remove(ticket)
+                self._wait_time += time.monotonic() - start_t
+                # The next in line may fit.
+                self._cond.notify_all()
+            return self.grant(reserve_bytes)
+
+    def grant(self, reserve_bytes: int) -> Admission:
+        self._transfers += 1
+        self._reserved_bytes += reserve_bytes
+        self._admitted += 1
+        return Admission(self, reserve_bytes)
+
+    def release(self, reserved_bytes: int) -> None:
+        with self._cond:
+            self._transfers -= 1
+            self._reserved_bytes -= reserved_bytes
+            self._cond.notify_all()
+
+    def metrics(self) -> dict:
+        with self._cond:
+            return {
+                'transfers': self._transfers,
+                'max-transfers': self._max_transfers,
+                'reserved-bytes': self._reserved_bytes,
+                'max-reserved-bytes': self._max_reserved_bytes,
+                'waiting': len(self._queue),
+                'admitted': self._admitted,
+                'rejected': self._rejected,
+                'timed-out': self._timed_out,
+                'wait-time': self._wait_time
+            }
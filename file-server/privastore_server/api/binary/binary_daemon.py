@@ -0,0 +1,66 @@
+import logging
+from ...daemon import Daemon
+from ..http.pooled_http_server import PooledServerMixIn
+from socketserver import TCPServer
+from ...util.sock import bind_server
+
+class BinaryServer(PooledServerMixIn, TCPServer):
+
+    '''
+        Binary protocol connections are long lived, each holds a worker
+        until it's closed. Connections over the worker limit wait in the
+        listen backlog (see PooledServerMixIn).
+    '''
+    allow_reuse_address = True
+
+    def __init__(self, server_address, request_handler, max_workers: int=64, backlog: int=128):
+        # Set before listen() is called.
+        self.request_queue_size = backlog
+        super().__init__(server_address, request_handler, bind_and_activate=False)
+        self.init_pool(max_workers, thread_name_prefix='binary-worker')
+        logging.debug('Binary server workers: [{}] accept backlog: [{}]'.format(max_workers, backlog))
+
+class BinaryDaemon(Daemon):
+
+    '''
+        Serves the binary protocol (see binary_protocol) on a separate port
+        alongside the HTTP API. Connections are handled on a bounded thread
+        pool.
+    '''
+
+    def __init__(self, api_config, request_handler, daemon=True, reuse_port=False):
+        super().__init__('binary-api', daemon)
+
+        self._hostname = hostname = api_config.get('api-hostname', 'localhost')
+        self._port = port = int(api_config.get('binary-api-port'))
+        max_workers = int(api_config.get('binary-worker-threads', '64'))
+        backlog = int(api_config.get('binary-accept-backlog', '128'))
+        self._shutdown_timeout = float(api_config.get('binary-shutdown-timeout', '10'))
+        self._server = BinaryServer((hostname, port), request_handler, max_workers, backlog)
+        bind_server(self._server, reuse_port)
+
+        # Read by the request handlers.
+        self._server.connection_timeout = float(api_config.get('binary-idle-timeout', '300'))
+        logging.debug('Binary API port: [{}] idle timeout: [{}s]'.format(port, self._server.connection_timeout))
+
+    def port(self):
+        return self._port
+
+    def stop(self):
+        super().stop()
+        self._server.shutdown()
+
+    def run(self):
+        self._started.set()
+        logging.debug('Binary daemon started')
+        try:
+            self._server.serve()
+        except Exception as e:
+            logging.error('Binary API server error: {}'.format(str(e)))
+        logging.debug('Draining binary API connections')
+        closed = self._server.drain(self._shutdown_timeout)
+        if closed > 0:
+            logging.debug('Closed [{}] binary API connections after drain'.format(closed))
+        self._server.server_close()
+        self._stopped.set()
+        logging.debug('Binary daemon stopped')
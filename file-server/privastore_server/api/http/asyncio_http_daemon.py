@@ -0,0 +1,283 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from ...daemon import Daemon
+from email.utils import formatdate
+from http import HTTPStatus
+import http.client
+import io
+import logging
+import socket
+from .http_request_handler import CONNECTION_CLOSE, CONNECTION_HEADER, CONNECTION_KEEP_ALIVE, CONTENT_LENGTH_HEADER, KEEP_ALIVE_HEADER, KEEP_ALIVE_MAX_DRAIN
+from typing import Optional
+import urllib.parse
+from ...util.file import config_bool
+
+# Largest request line and headers.
+MAX_REQUEST_HEAD = 64*1024
+HTTP_METHODS = ['GET', 'HEAD', 'POST', 'PUT', 'DELETE']
+
+class AsyncioHttpRequest(object):
+
+    '''
+        An HTTP request read on the event loop. The body is left on the
+        connection until the handler reads it (read_body), what's left of it
+        is discarded after the response.
+    '''
+    def __init__(self, method: str, path: str, version: str, headers: http.client.HTTPMessage, reader: asyncio.StreamReader):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers
+        self.url_path: Optional[str] = None
+        self.url_query: Optional[dict[str, list[str]]] = None
+        self._reader = reader
+        self._bytes_read = 0
+        self._eof = False
+
+    def parse_path(self) -> bool:
+        try:
+            url_parsed = urllib.parse.urlparse(self.path)
+
+            # Only use the path and query-string for APIs.
+            if url_parsed.fragment != '' or url_parsed.params != '':
+                return False
+            if url_parsed.path == '':
+                return False
+            self.url_path = url_parsed.path
+            self.url_query = urllib.parse.parse_qs(url_parsed.query) if url_parsed.query != '' else dict()
+            return True
+        except:
+            return False
+
+    def body_length(self) -> int:
+        try:
+            return max(0, int(self.headers.get(CONTENT_LENGTH_HEADER, '0')))
+        except:
+            return 0
+
+    def body_remaining(self) -> int:
+        return self.body_length() - self._bytes_read
+
+    def eof(self) -> bool:
+        return self._eof
+
+    async def read_body(self) -> bytes:
+        '''
+            Read the rest of the body. Returns fewer bytes than expected if the
+            connection is closed first.
+        '''
+        remaining = self.body_remaining()
+        if remaining <= 0:
+            return b''
+        try:
+            data = await self._reader.readexactly(remaining)
+        except asyncio.IncompleteReadError as e:
+            data = e.partial
+            self._eof = True
+        self._bytes_read += len(data)
+        return data
+
+    def client_close(self) -> bool:
+        '''
+            Whether the client asked to close the connection after this
+            request (see BaseHTTPRequestHandler.parse_request).
+        '''
+        conn_type = self.headers.get(CONNECTION_HEADER, '').lower()
+        if self.version == 'HTTP/1.0':
+            return conn_type != CONNECTION_KEEP_ALIVE
+        return conn_type == CONNECTION_CLOSE
+
+class AsyncioHttpResponse(object):
+
+    def __init__(self, code: int, headers: Optional[dict[str, str]]=None, body: bytes=b''):
+        self.code = code
+        self.headers = headers if headers is not None else dict()
+        self.body = body
+
+class AsyncioHttpDaemon(Daemon):
+
+    '''
+        HTTP API served from an asyncio event loop on the daemon's thread.
+
+        Connections are cheap while idle, so many keep-alive connections can
+        be held open. Requests are handled by the request handler's
+        coroutines, which run blocking (disk/database) work on the daemon's
+        executor (see BaseAsyncioHttpApiRequestHandler.run_blocking).
+    '''
+    def __init__(self, http_config, request_handler, daemon=True, reuse_port=False):
+        super().__init__('asyncio-http-api', daemon)
+
+        self._hostname = http_config.get('api-hostname', 'localhost')
+        self._port = int(http_config.get('api-port', 8080))
+        self._backlog = int(http_config.get('http-accept-backlog', '128'))
+        self._executor_threads = int(http_config.get('asyncio-executor-threads', '32'))
+        self._shutdown_timeout = float(http_config.get('http-shutdown-timeout', '10'))
+        self._keep_alive = config_bool(http_config.get('http-keep-alive', '1'))
+        self._keep_alive_timeout = float(http_config.get('keep-alive-timeout', '15'))
+        self._keep_alive_max_requests = int(http_config.get('keep-alive-max-requests', '100'))
+        self._reuse_port = reuse_port
+        self._request_handler = request_handler
+        # Advertised in health check responses if the binary API is enabled.
+        self._request_handler.binary_port = http_config.get('binary-api-port')
+        self._protocol_version = 'HTTP/1.1' if self._keep_alive else 'HTTP/1.0'
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        # Open connections and those of them waiting for their next request.
+        self._connections: dict[asyncio.StreamWriter, asyncio.Task] = dict()
+        self._idle: set[asyncio.StreamWriter] = set()
+        self._draining = False
+        logging.debug('Asyncio HTTP executor threads: [{}]'.format(self._executor_threads))
+        logging.debug('HTTP keep-alive: [{}] timeout: [{}s] max requests: [{}]'.format(self._keep_alive, self._keep_alive_timeout, self._keep_alive_max_requests))
+
+    def num_connections(self) -> int:
+        return len(self._connections)
+
+    def stop(self):
+        super().stop()
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._stop_event.set)
+            except RuntimeError:
+                # Loop already closed.
+                pass
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            logging.error('Asyncio HTTP server error: {}'.format(str(e)))
+        self._stopped.set()
+        self._started.set()
+        logging.debug('Asyncio HTTP daemon stopped')
+
+    async def serve(self):
+        self._stop_event = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        if self._stop.is_set():
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self._executor_threads, thread_name_prefix='asyncio-http-worker')
+        self._request_handler.set_executor(executor)
+        try:
+            server = await asyncio.start_server(self.handle_connection, self._hostname, self._port, limit=MAX_REQUEST_HEAD, backlog=self._backlog, reuse_address=True, reuse_port=self._reuse_port or None)
+            self._started.set()
+            logging.debug('Asyncio HTTP daemon started')
+            await self._stop_event.wait()
+
+            server.close()
+            await server.wait_closed()
+            logging.debug('Draining HTTP requests')
+            closed = await self.drain()
+            if closed > 0:
+                logging.debug('Closed [{}] HTTP connections after drain'.format(closed))
+        finally:
+            executor.shutdown(wait=True)
+
+    async def drain(self) -> int:
+        '''
+            Close the idle connections and wait up to the shutdown timeout for
+            the requests in flight, then cancel those left. Returns the number
+            of connections cancelled.
+        '''
+        self._draining = True
+        for writer in list(self._idle):
+            writer.close()
+        end_t = self._loop.time() + self._shutdown_timeout
+        while len(self._connections) > 0 and self._loop.time() < end_t:
+            await asyncio.sleep(0.05)
+        tasks = list(self._connections.values())
+        for task in tasks:
+            task.cancel()
+        if len(tasks) > 0:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return len(tasks)
+
+    def parse_request(self, head: bytes, reader: asyncio.StreamReader) -> Optional[AsyncioHttpRequest]:
+        request_line, _, header_lines = head.partition(b'\r\n')
+        words = request_line.decode('iso-8859-1').split()
+        if len(words) != 3 or not words[2].startswith('HTTP/'):
+            return None
+        method, path, version = words
+        headers = http.client.parse_headers(io.BytesIO(header_lines))
+        return AsyncioHttpRequest(method, path, version, headers, reader)
+
+    def keep_alive(self, request: AsyncioHttpRequest, num_requests: int) -> bool:
+        if not self._keep_alive or self._draining or request.eof() or request.client_close():
+            return False
+        if num_requests >= self._keep_alive_max_requests:
+            return False
+        # Too much of the body left to drain.
+        return request.body_remaining() <= KEEP_ALIVE_MAX_DRAIN
+
+    def write_response(self, writer: asyncio.StreamWriter, response: AsyncioHttpResponse, keep_alive: bool, num_requests: int) -> None:
+        try:
+            reason = HTTPStatus(response.code).phrase
+        except ValueError:
+            reason = ''
+        lines = ['{} {} {}'.format(self._protocol_version, int(response.code), reason)]
+        lines.append('Date: {}'.format(formatdate(usegmt=True)))
+        for name, value in response.headers.items():
+            lines.append('{}: {}'.format(name, value))
+        lines.append('{}: {}'.format(CONTENT_LENGTH_HEADER, len(response.body)))
+        if keep_alive:
+            lines.append('{}: {}'.format(CONNECTION_HEADER, CONNECTION_KEEP_ALIVE))
+            lines.append('{}: timeout={}, max={}'.format(KEEP_ALIVE_HEADER, int(self._keep_alive_timeout), self._keep_alive_max_requests - num_requests))
+        else:
+            lines.append('{}: {}'.format(CONNECTION_HEADER, CONNECTION_CLOSE))
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('iso-8859-1')
+        writer.write(head + response.body if len(response.body) > 0 else head)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections[writer] = asyncio.current_task()
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            # Don't let Nagle's algorithm hold back responses.
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        num_requests = 0
+
+        try:
+            while not self._draining:
+                self._idle.add(writer)
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self._keep_alive_timeout)
+                except asyncio.LimitOverrunError:
+                    self.write_response(writer, AsyncioHttpResponse(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE), False, num_requests)
+                    await writer.drain()
+                    break
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                finally:
+                    self._idle.discard(writer)
+
+                try:
+                    request = self.parse_request(head, reader)
+                except http.client.HTTPException:
+                    request = None
+                if request is None:
+                    self.write_response(writer, AsyncioHttpResponse(HTTPStatus.BAD_REQUEST), False, num_requests)
+                    await writer.drain()
+                    break
+                if request.method not in HTTP_METHODS:
+                    self.write_response(writer, AsyncioHttpResponse(HTTPStatus.NOT_IMPLEMENTED), False, num_requests)
+                    await writer.drain()
+                    break
+
+                response = await self._request_handler.handle(request)
+                num_requests += 1
+                keep_alive = self.keep_alive(request, num_requests)
+                self.write_response(writer, response, keep_alive, num_requests)
+                await writer.drain()
+                if not keep_alive:
+                    break
+                await request.read_body()
+                if request.eof():
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logging.error('Error handling HTTP connection: {}'.format(str(e)))
+        finally:
+            self._connections.pop(writer, None)
+            self._idle.discard(writer)
+            writer.close()
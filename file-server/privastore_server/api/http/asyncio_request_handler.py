@@ -0,0 +1,189 @@
+import asyncio
+import base64
+from concurrent.futures import Executor
+from ...controller import Controller
+from ...error import AuthenticationError, FileError, FileServerError, FileServerErrorCode, SessionError
+from http import HTTPStatus
+from .asyncio_http_daemon import AsyncioHttpRequest, AsyncioHttpResponse
+from .http_request_handler import AUTHORIZATION_HEADER, BINARY_PORT_HEADER, CONTENT_LENGTH_HEADER, CONTENT_TYPE_HEADER, CONTENT_TYPE_JSON, HEALTH_PATH, HEARTBEAT_PATH, LOGIN_PATH, LOGOUT_PATH, SESSION_ID_HEADER
+import logging
+from typing import Any, Awaitable, Callable, Optional
+from ...util.logging import log_exception_stack
+
+class AsyncioHttpError(Exception):
+
+    '''
+        Raised by request handlers to send an error response.
+    '''
+    def __init__(self, code: int, error: Optional[Exception]=None):
+        super().__init__(str(error) if error is not None else str(int(code)))
+        self.code = code
+        self.error = error
+
+class BaseAsyncioHttpApiRequestHandler(object):
+
+    '''
+        Asyncio counterpart of BaseHttpApiRequestHandler. Serves the same
+        routes with the same responses. One handler serves every request, the
+        controller is only called on the executor so the event loop isn't
+        blocked.
+    '''
+    def __init__(self, controller: Controller):
+        self._controller = controller
+        self._executor: Optional[Executor] = None
+        # Set by the daemon.
+        self.binary_port: Optional[str] = None
+
+    def controller(self) -> Controller:
+        return self._controller
+
+    def set_executor(self, executor: Executor) -> None:
+        self._executor = executor
+
+    async def run_blocking(self, fn: Callable[..., Any], *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def handle(self, request: AsyncioHttpRequest) -> AsyncioHttpResponse:
+        try:
+            if not request.parse_path():
+                raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Invalid URL path')
+            route = self.route(request)
+            if route is None:
+                logging.error('Invalid path: [{}]'.format(request.url_path))
+                raise AsyncioHttpError(HTTPStatus.NOT_FOUND)
+            return await route(request)
+        except AsyncioHttpError as e:
+            return self.error_response(e.code, e.error)
+        except Exception as e:
+            logging.error('Internal error: {}'.format(str(e)))
+            log_exception_stack()
+            return self.error_response(HTTPStatus.INTERNAL_SERVER_ERROR, e)
+
+    def route(self, request: AsyncioHttpRequest) -> Optional[Callable[[AsyncioHttpRequest], Awaitable[AsyncioHttpResponse]]]:
+        if request.method == 'GET' and request.url_path == HEALTH_PATH:
+            return self.handle_health_check
+        if request.method == 'POST':
+            if request.url_path == LOGIN_PATH:
+                return self.handle_login_user
+            if request.url_path == LOGOUT_PATH:
+                return self.handle_logout_user
+        if request.method == 'PUT' and request.url_path == HEARTBEAT_PATH:
+            return self.handle_heartbeat_session
+
+    def error_response(self, code: int, error: Optional[Exception]=None) -> AsyncioHttpResponse:
+        if error is None:
+            return AsyncioHttpResponse(code)
+
+        error_msg = str(error)
+        if isinstance(error, FileServerError):
+            error_code = error.error_code()
+            logging.error('Error [{}] - {}'.format(error_code, error_msg))
+        else:
+            error_code = str(int(code))
+            logging.error('Error [HTTP {}] - {}'.format(error_code, error_msg))
+        body = '{{"error":"{}", "msg":"{}"}}'.format(error_code, error_msg).encode('utf-8')
+        return AsyncioHttpResponse(code, {CONTENT_TYPE_HEADER: CONTENT_TYPE_JSON}, body)
+
+    def file_error(self, e: FileError) -> AsyncioHttpError:
+        logging.error('File error: {}'.format(str(e)))
+        if e.error_code() == FileServerErrorCode.FILE_NOT_FOUND:
+            return AsyncioHttpError(HTTPStatus.NOT_FOUND, e)
+        if e.error_code() in (FileServerErrorCode.FILE_NOT_REMOVABLE, FileServerErrorCode.FILE_NOT_WRITABLE, FileServerErrorCode.FILE_EXISTS,
+                FileServerErrorCode.FILE_IS_COMMITTED, FileServerErrorCode.FILE_IS_UNCOMMITTED, FileServerErrorCode.FILE_IS_DIRECTORY,
+                FileServerErrorCode.FILE_TOO_SMALL, FileServerErrorCode.FILE_TOO_LARGE):
+            return AsyncioHttpError(HTTPStatus.CONFLICT, e)
+        return AsyncioHttpError(HTTPStatus.BAD_REQUEST, e)
+
+    def session_error(self, e: SessionError) -> AsyncioHttpError:
+        logging.error('Session error: {}'.format(str(e)))
+        if e.error_code() == FileServerErrorCode.SESSION_NOT_FOUND:
+            return AsyncioHttpError(HTTPStatus.UNAUTHORIZED, e)
+        return AsyncioHttpError(HTTPStatus.BAD_REQUEST, e)
+
+    def get_session_id(self, request: AsyncioHttpRequest) -> str:
+        session_id = request.headers.get(SESSION_ID_HEADER)
+        if session_id is None:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Missing {} header'.format(SESSION_ID_HEADER))
+        return session_id
+
+    async def heartbeat_session(self, request: AsyncioHttpRequest) -> str:
+        '''
+            Renew the request's session, returns the session id.
+        '''
+        session_id = self.get_session_id(request)
+        try:
+            await self.run_blocking(self.controller().heartbeat_session, session_id)
+        except SessionError as e:
+            raise self.session_error(e)
+        return session_id
+
+    def parse_content_length(self, request: AsyncioHttpRequest) -> int:
+        content_len = request.headers.get(CONTENT_LENGTH_HEADER)
+
+        if content_len is None:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Missing {} header'.format(CONTENT_LENGTH_HEADER))
+
+        try:
+            content_len = int(content_len)
+            if content_len < 0:
+                raise Exception()
+            return content_len
+        except:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Invalid {} header value'.format(CONTENT_LENGTH_HEADER))
+
+    def parse_basic_auth(self, request: AsyncioHttpRequest) -> tuple[str, str]:
+        auth_header = request.headers.get(AUTHORIZATION_HEADER)
+
+        if auth_header is None or not auth_header.startswith('Basic '):
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Missing or invalid {} header'.format(AUTHORIZATION_HEADER))
+
+        try:
+            username, password = base64.b64decode(auth_header[6:]).decode('utf-8').split(':')
+            return username, password
+        except:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Invalid {} header value'.format(AUTHORIZATION_HEADER))
+
+    async def handle_login_user(self, request: AsyncioHttpRequest) -> AsyncioHttpResponse:
+        '''
+            Handle the user login API (see BaseHttpApiRequestHandler).
+        '''
+        logging.debug('Login request')
+        username, password = self.parse_basic_auth(request)
+
+        try:
+            session_id = await self.run_blocking(self.controller().login_user, username, password)
+        except AuthenticationError as e:
+            raise AsyncioHttpError(HTTPStatus.UNAUTHORIZED, e)
+
+        return AsyncioHttpResponse(HTTPStatus.OK, {SESSION_ID_HEADER: session_id})
+
+    async def handle_health_check(self, request: AsyncioHttpRequest) -> AsyncioHttpResponse:
+        '''
+            Handle the health check API (see BaseHttpApiRequestHandler).
+        '''
+        headers = dict()
+        if self.binary_port is not None:
+            headers[BINARY_PORT_HEADER] = str(self.binary_port)
+        return AsyncioHttpResponse(HTTPStatus.OK, headers)
+
+    async def handle_heartbeat_session(self, request: AsyncioHttpRequest) -> AsyncioHttpResponse:
+        '''
+            Handle the heartbeat session API (see BaseHttpApiRequestHandler).
+        '''
+        logging.debug('Heartbeat request')
+        await self.heartbeat_session(request)
+        return AsyncioHttpResponse(HTTPStatus.OK)
+
+    async def handle_logout_user(self, request: AsyncioHttpRequest) -> AsyncioHttpResponse:
+        '''
+            Handle the logout user API (see BaseHttpApiRequestHandler).
+        '''
+        logging.debug('Logout request')
+        session_id = self.get_session_id(request)
+
+        try:
+            await self.run_blocking(self.controller().logout_user, session_id)
+        except SessionError as e:
+            raise self.session_error(e)
+
+        return AsyncioHttpResponse(HTTPStatus.OK)
@@ -1,27 +1,85 @@
 from http.server import ThreadingHTTPServer
 import logging
 from ...daemon import Daemon
+from .pooled_http_server import PooledHTTPServer
+from ...util.file import config_bool
+from ...util.sock import bind_server
+
+# Server modes. The threading server starts a thread per connection, the
+# pooled server handles connections on a bounded thread pool.
+THREADING_MODE = 'threading'
+POOLED_MODE = 'pooled'
+SERVER_MODES = [THREADING_MODE, POOLED_MODE]
 
 class HttpDaemon(Daemon):
 
-    def __init__(self, http_config, request_handler, daemon=True):
+    def __init__(self, http_config, request_handler, daemon=True, reuse_port=False):
         super().__init__('http-api', daemon)
 
         self._hostname = hostname = http_config.get('api-hostname', 'localhost')
         self._port = port = int(http_config.get('api-port', 8080))
-        self._server = ThreadingHTTPServer((hostname, port), request_handler)
-        self._server.timeout = 0.1
+        self._mode = http_config.get('http-server-mode', THREADING_MODE)
+        if self._mode not in SERVER_MODES:
+            raise Exception('Invalid HTTP server mode [{}]'.format(self._mode))
+        logging.debug('HTTP server mode: [{}]'.format(self._mode))
+        if self._mode == POOLED_MODE:
+            max_workers = int(http_config.get('http-worker-threads', '32'))
+            backlog = int(http_config.get('http-accept-backlog', '128'))
+            self._shutdown_timeout = float(http_config.get('http-shutdown-timeout', '10'))
+            self._server = PooledHTTPServer((hostname, port), request_handler, max_workers, backlog, bind_and_activate=False)
+        else:
+            self._server = ThreadingHTTPServer((hostname, port), request_handler, bind_and_activate=False)
+            self._server.timeout = 0.1
+        # Pre-forked servers share the port (see prefork).
+        bind_server(self._server, reuse_port)
+
+        # Read by the request handlers.
+        self._server.keep_alive = config_bool(http_config.get('http-keep-alive', '1'))
+        self._server.keep_alive_timeout = float(http_config.get('keep-alive-timeout', '15'))
+        self._server.keep_alive_max_requests = int(http_config.get('keep-alive-max-requests', '100'))
+        logging.debug('HTTP keep-alive: [{}] timeout: [{}s] max requests: [{}]'.format(self._server.keep_alive, self._server.keep_alive_timeout, self._server.keep_alive_max_requests))
+        self._server.sendfile = config_bool(http_config.get('http-sendfile', '1'))
+        logging.debug('HTTP sendfile: [{}]'.format(self._server.sendfile))
+        # JSON responses of at least the min size are compressed if the
+        # client accepts it.
+        self._server.compression = config_bool(http_config.get('http-compression', '1'))
+        self._server.compression_min_size = int(http_config.get('http-compression-min-size', '1024'))
+        self._server.compression_level = int(http_config.get('http-compression-level', '6'))
+        logging.debug('HTTP compression: [{}] min size: [{}B] level: [{}]'.format(self._server.compression, self._server.compression_min_size, self._server.compression_level))
+        # Advertised in health check responses if the binary API is enabled.
+        self._server.binary_port = http_config.get('binary-api-port')
 
         # TODO: SSL.
-    
+
+    def mode(self) -> str:
+        return self._mode
+
+    def stop(self):
+        super().stop()
+        if self._mode == POOLED_MODE:
+            self._server.shutdown()
+
     def run(self):
         self._started.set()
         logging.debug('HTTP daemon started')
-        while not self._stop.is_set():
-            try:
-                self._server.handle_request()
-            except Exception as e:
-                logging.error('Error handling HTTP request: {}'.format(str(e)))
+        if self._mode == POOLED_MODE:
+            self.run_pooled()
+        else:
+            while not self._stop.is_set():
+                try:
+                    self._server.handle_request()
+                except Exception as e:
+                    logging.error('Error handling HTTP request: {}'.format(str(e)))
         self._server.server_close()
         self._stopped.set()
         logging.debug('HTTP daemon stopped')
+
+    def run_pooled(self):
+        try:
+            self._server.serve()
+        except Exception as e:
+            logging.error('HTTP server error: {}'.format(str(e)))
+        logging.debug('Draining HTTP requests')
+        closed = self._server.drain(self._shutdown_timeout)
+        if closed > 0:
+            logging.debug('Closed [{}] HTTP connections after drain'.format(closed))
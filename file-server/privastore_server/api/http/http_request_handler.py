@@ -1,29 +1,58 @@
 import base64
 from ...controller import Controller
-from ...error import AuthenticationError, FileError, FileServerError, FileServerErrorCode, SessionError
+import email.utils
+from ...error import AdmissionError, AuthenticationError, FileError, FileServerError, FileServerErrorCode, SessionError
 from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler
 import logging
 import urllib
 import urllib.parse
-from ...util.sock import SocketWrapper
+from ...util.compress import CompressWriter, compress, negotiate_encoding
+from ...util.sock import ChunkedReader, ChunkedWriter, SocketWrapper
 from typing import Optional
 from ...util.logging import log_exception_stack
 
+ACCEPT_ENCODING_HEADER = 'Accept-Encoding'
 AUTHORIZATION_HEADER = 'Authorization'
+CACHE_CONTROL_HEADER = 'Cache-Control'
 CONNECTION_HEADER = 'Connection'
 CONNECTION_CLOSE = 'close'
+CONNECTION_KEEP_ALIVE = 'keep-alive'
+KEEP_ALIVE_HEADER = 'Keep-Alive'
 CONTENT_TYPE_HEADER = 'Content-Type'
 CONTENT_TYPE_JSON = 'application/json'
+CONTENT_TYPE_OCTET_STREAM = 'application/octet-stream'
 CONTENT_LENGTH_HEADER = 'Content-Length'
+CONTENT_ENCODING_HEADER = 'Content-Encoding'
+TRANSFER_ENCODING_HEADER = 'Transfer-Encoding'
+TRANSFER_ENCODING_CHUNKED = 'chunked'
+ETAG_HEADER = 'ETag'
+IF_MODIFIED_SINCE_HEADER = 'If-Modified-Since'
+IF_NONE_MATCH_HEADER = 'If-None-Match'
+LAST_MODIFIED_HEADER = 'Last-Modified'
+RETRY_AFTER_HEADER = 'Retry-After'
+VARY_HEADER = 'Vary'
 SESSION_ID_HEADER = 'x-privastore-session-id'
+BINARY_PORT_HEADER = 'x-privastore-binary-port'
 
+HEALTH_PATH = '/1/health'
 HEARTBEAT_PATH = '/1/heartbeat'
 LOGIN_PATH = '/1/login'
 LOGOUT_PATH = '/1/logout'
 
+# Clients (ex. the UI server) may keep responses but must check they're
+# current (conditional request) before using them.
+CACHE_CONTROL_REVALIDATE = 'private, no-cache'
+
+# Largest unread request body drained to keep a connection alive.
+KEEP_ALIVE_MAX_DRAIN = 64*1024
+
 class BaseHttpApiRequestHandler(BaseHTTPRequestHandler):
 
+    # Headers and body are written separately, don't let Nagle's algorithm
+    # hold back the body on a keep-alive connection.
+    disable_nagle_algorithm = True
+
     def __init__(self, request, client_address, server, controller: Controller):
         self._controller = controller
         self.auth_username: Optional[str] = None
@@ -31,17 +60,228 @@ class BaseHttpApiRequestHandler(BaseHTTPRequestHandler):
         self.content_len: Optional[int] = None
         self.url_path: Optional[str] = None
         self.url_query: Optional[dict[str, list[str]]] = None
+        self._keep_alive: bool = getattr(server, 'keep_alive', False)
+        self._keep_alive_timeout: float = getattr(server, 'keep_alive_timeout', 15)
+        self._keep_alive_max_requests: int = getattr(server, 'keep_alive_max_requests', 100)
+        self._num_requests: int = 0
+        self._response_started: bool = False
+        self._conn_rfile = None
+        # HTTP/1.1 connections are persistent by default.
+        self.protocol_version = 'HTTP/1.1' if self._keep_alive else 'HTTP/1.0'
         super().__init__(request, client_address, server)
     
     def controller(self) -> Controller:
         return self._controller
 
+    def setup(self):
+        super().setup()
+        self._conn_rfile = self.rfile
+        if hasattr(self.server, 'connection_requests'):
+            # Resuming a keep-alive connection parked by the pooled server.
+            self._num_requests = self.server.connection_requests(self.connection)
+
+    def finish(self):
+        # Close the connection's reader rather than the last request's body
+        # reader, a parked connection isn't closed until its reader is.
+        if self._conn_rfile is not None:
+            self.rfile = self._conn_rfile
+        super().finish()
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            if self.park_connection():
+                return
+            self.handle_one_request()
+
+    def park_connection(self) -> bool:
+        '''
+            Hand the keep-alive connection back to the pooled server while it
+            waits for the next request, so an idle connection doesn't hold a
+            worker. Returns False if the connection stays with this handler.
+        '''
+        if not hasattr(self.server, 'park_connection'):
+            return False
+        if self.request_buffered():
+            # Pipelined, the buffered request would be lost.
+            return False
+        self.server.park_connection(self.connection, self._num_requests)
+        return True
+
+    def request_buffered(self) -> bool:
+        '''
+            Whether the next request (or part of it) has been read into the
+            connection's buffer already.
+        '''
+        self.connection.settimeout(0)
+        try:
+            return len(self._conn_rfile.peek(1)) > 0
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(None)
+
+    def reset_request(self):
+        '''
+            The handler is reused for every request on a keep-alive
+            connection. Clear the state of the previous request.
+        '''
+        self.rfile = self._conn_rfile
+        self.auth_username = None
+        self.auth_password = None
+        self.content_len = None
+        self.url_path = None
+        self.url_query = None
+        self._response_started = False
+
+    def handle_one_request(self):
+        self.reset_request()
+        if self._keep_alive:
+            # Idle timeout while waiting for the next request.
+            self.connection.settimeout(self._keep_alive_timeout)
+        if hasattr(self.server, 'connection_idle'):
+            # Lets the pooled server close the connection while it's idle.
+            self.server.connection_idle(self.connection)
+        super().handle_one_request()
+        self._num_requests += 1
+        if not self.close_connection:
+            self.finish_request_body()
+
+    def parse_request(self):
+        if hasattr(self.server, 'connection_busy'):
+            self.server.connection_busy(self.connection)
+        if self._keep_alive:
+            # The idle timeout doesn't apply once a request has started.
+            self.connection.settimeout(None)
+        return super().parse_request()
+
+    def finish_request_body(self):
+        '''
+            Drain what's left of the request body so the next request on the
+            connection can be read. Close the connection instead if there's too
+            much left or we can't tell how much was read.
+        '''
+        if self.is_chunked_request():
+            # The end of a chunked body is only known once it's read.
+            if not isinstance(self.rfile, ChunkedReader) or not self.rfile.eof():
+                logging.debug('Chunked request body not read, closing connection')
+                self.close_connection = True
+            return
+        try:
+            content_len = int(self.headers.get(CONTENT_LENGTH_HEADER, '0'))
+        except:
+            self.close_connection = True
+            return
+        if content_len <= 0:
+            return
+        if not isinstance(self.rfile, SocketWrapper):
+            logging.debug('Request body not tracked, closing connection')
+            self.close_connection = True
+            return
+        if content_len - self.rfile.bytes_read() > KEEP_ALIVE_MAX_DRAIN:
+            logging.debug('Request body not read, closing connection')
+            self.close_connection = True
+            return
+        self.read_body()
+        if self.rfile.bytes_read() < content_len:
+            self.close_connection = True
+
+    def keep_alive(self) -> bool:
+        # Close connections once the server is shutting down.
+        if getattr(self.server, 'draining', False):
+            return False
+        return self._keep_alive and not self.close_connection and self._num_requests + 1 < self._keep_alive_max_requests
+
+    def sendfile_enabled(self) -> bool:
+        '''
+            Whether file data may be sent straight from disk to the
+            connection (see File.send_chunk).
+        '''
+        return getattr(self.server, 'sendfile', False)
+
+    def compression_enabled(self) -> bool:
+        return getattr(self.server, 'compression', False)
+
+    def response_encoding(self, body_len: Optional[int]=None) -> Optional[str]:
+        '''
+            Content coding for a response body of body_len bytes (None if
+            not known up front), or None if it's sent as is. Only for API
+            responses, file data is encrypted and doesn't compress.
+        '''
+        if not self.compression_enabled():
+            return None
+        if body_len is not None and body_len < getattr(self.server, 'compression_min_size', 1024):
+            return None
+        return negotiate_encoding(self.headers.get(ACCEPT_ENCODING_HEADER))
+
+    def send_vary_header(self):
+        # Responses that may be compressed depend on Accept-Encoding.
+        if self.compression_enabled():
+            self.send_header(VARY_HEADER, ACCEPT_ENCODING_HEADER)
+
+    def send_response(self, code, message=None):
+        self._response_started = True
+        super().send_response(code, message)
+
+    def is_not_modified(self, etag: str, last_modified: Optional[int]=None) -> bool:
+        '''
+            Whether the client's copy of the resource is current. Checks
+            If-None-Match, or If-Modified-Since if there's no If-None-Match.
+        '''
+        if_none_match = self.headers.get(IF_NONE_MATCH_HEADER)
+        if if_none_match is not None:
+            if if_none_match.strip() == '*':
+                return True
+            # Weak comparison, as for GET/HEAD.
+            return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+        if_modified_since = self.headers.get(IF_MODIFIED_SINCE_HEADER)
+        if if_modified_since is None or last_modified is None:
+            return False
+        try:
+            modified_since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return last_modified <= modified_since
+
+    def send_validator_headers(self, etag: str, last_modified: Optional[int]=None, weak: bool=False):
+        '''
+            weak - The response body is an encoding of the resource (ex.
+             compressed), only equivalent to other encodings.
+        '''
+        self.send_header(ETAG_HEADER, 'W/' + etag if weak else etag)
+        if last_modified is not None:
+            self.send_header(LAST_MODIFIED_HEADER, self.date_time_string(last_modified))
+        self.send_header(CACHE_CONTROL_HEADER, CACHE_CONTROL_REVALIDATE)
+
+    def send_not_modified(self, etag: str, last_modified: Optional[int]=None):
+        self.send_response(HTTPStatus.NOT_MODIFIED)
+        self.send_validator_headers(etag, last_modified)
+        self.send_connection_header()
+        self.end_headers()
+
+    def send_connection_header(self):
+        '''
+            Keep the connection open for further requests unless keep-alive is
+            disabled, the client asked to close it or it has served its max
+            requests.
+        '''
+        if self.keep_alive():
+            self.send_header(CONNECTION_HEADER, CONNECTION_KEEP_ALIVE)
+            self.send_header(KEEP_ALIVE_HEADER, 'timeout={}, max={}'.format(int(self._keep_alive_timeout), self._keep_alive_max_requests - self._num_requests - 1))
+        else:
+            self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
+
     def do_GET(self):
         if not self.parse_path():
             return
 
-        logging.error('Invalid path: [{}]'.format(self.url_path))
-        self.send_error_response(HTTPStatus.NOT_FOUND)
+        if self.url_path == HEALTH_PATH:
+            self.handle_health_check()
+        else:
+            logging.error('Invalid path: [{}]'.format(self.url_path))
+            self.send_error_response(HTTPStatus.NOT_FOUND)
 
     def do_HEAD(self):
         if not self.parse_path():
@@ -105,6 +345,15 @@ class BaseHttpApiRequestHandler(BaseHTTPRequestHandler):
         else:
             self.send_error_response(HTTPStatus.BAD_REQUEST, e)
 
+    def handle_admission_error(self, e: AdmissionError):
+        logging.error('Admission error: {}'.format(str(e)))
+        # Don't read a large body of a rejected transfer, close the
+        # connection instead.
+        drain_body = self.remaining_body_len() <= KEEP_ALIVE_MAX_DRAIN
+        if not drain_body:
+            self.close_connection = True
+        self.send_error_response(HTTPStatus.SERVICE_UNAVAILABLE, e, {RETRY_AFTER_HEADER: str(e.retry_after())}, drain_body)
+
     def handle_internal_error(self, e: Exception):
         logging.error('Internal error: {}'.format(str(e)))
         self.send_error_response(HTTPStatus.INTERNAL_SERVER_ERROR, e)
@@ -188,7 +437,89 @@ class BaseHttpApiRequestHandler(BaseHTTPRequestHandler):
             body has been read so far.
 
         '''
-        self.rfile = SocketWrapper(self.rfile)
+        if not isinstance(self.rfile, SocketWrapper):
+            self.rfile = SocketWrapper(self.rfile)
+
+    def is_chunked_request(self) -> bool:
+        transfer_encoding = self.headers.get(TRANSFER_ENCODING_HEADER)
+        if transfer_encoding is None:
+            return False
+        # Chunked is always the last coding applied.
+        return transfer_encoding.split(',')[-1].strip().lower() == TRANSFER_ENCODING_CHUNKED
+
+    def wrap_chunked_body(self):
+        '''
+            Decode a chunked request body (Transfer-Encoding: chunked) read
+            from rfile.
+        '''
+        self.wrap_sockets()
+        if not isinstance(self.rfile, ChunkedReader):
+            self.rfile = ChunkedReader(self.rfile)
+
+    def send_json_response(self, body: bytes, etag: Optional[str]=None):
+        '''
+            Send a JSON response, compressed if it's large enough and the
+            client accepts a content coding we support.
+        '''
+        encoding = self.response_encoding(len(body))
+        if encoding is not None:
+            body = compress(body, encoding, getattr(self.server, 'compression_level', 6))
+        self.send_response(HTTPStatus.OK)
+        self.send_header(CONTENT_TYPE_HEADER, CONTENT_TYPE_JSON)
+        if encoding is not None:
+            self.send_header(CONTENT_ENCODING_HEADER, encoding)
+        self.send_vary_header()
+        self.send_header(CONTENT_LENGTH_HEADER, str(len(body)))
+        if etag is not None:
+            self.send_validator_headers(etag, weak=encoding is not None)
+        self.send_connection_header()
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_streamed_body_headers(self, encoding: Optional[str]=None):
+        '''
+            Send the last headers of a response whose body length isn't known
+            up front and end the headers. The body is sent chunked to HTTP/1.1
+            clients, otherwise the connection is closed after it. It's
+            compressed as it's written if encoding is given (see
+            response_encoding).
+
+            Returns the writer for the body, pass it to finish_streamed_body
+            once the body is written.
+        '''
+        if encoding is not None:
+            self.send_header(CONTENT_ENCODING_HEADER, encoding)
+        if self.protocol_version == 'HTTP/1.1' and self.request_version == 'HTTP/1.1':
+            self.send_header(TRANSFER_ENCODING_HEADER, TRANSFER_ENCODING_CHUNKED)
+            writer = ChunkedWriter(self.wfile)
+        else:
+            self.close_connection = True
+            writer = self.wfile
+        self.send_connection_header()
+        self.end_headers()
+        if encoding is not None:
+            writer = CompressWriter(writer, encoding, getattr(self.server, 'compression_level', 6))
+        return writer
+
+    def finish_streamed_body(self, writer):
+        if isinstance(writer, CompressWriter):
+            writer.finish()
+            writer = writer.writer()
+        if isinstance(writer, ChunkedWriter):
+            writer.finish()
+
+    def remaining_body_len(self) -> int:
+        '''
+            Length of the request body not read yet, if the body length is
+            known (Content-Length) and the reads are tracked.
+        '''
+        try:
+            content_len = int(self.headers.get(CONTENT_LENGTH_HEADER, '0'))
+        except:
+            return 0
+        if isinstance(self.rfile, SocketWrapper):
+            content_len -= self.rfile.bytes_read()
+        return max(0, content_len)
 
     def read_body(self):
         content_len = 0
@@ -219,9 +550,16 @@ class BaseHttpApiRequestHandler(BaseHTTPRequestHandler):
             except Exception as e:
                 logging.warn('Could not read HTTP request body: {}'.format(str(e)))
 
-    def send_error_response(self, code: int, error: Exception=None):
+    def send_error_response(self, code: int, error: Exception=None, headers: Optional[dict[str, str]]=None, drain_body: bool=True):
+        if self._response_started:
+            # Too late to send an error, the response is partially written.
+            logging.error('Error after response started [HTTP {}] - {}'.format(int(code), str(error)))
+            self.close_connection = True
+            return
+
         # May not have read the complete body if provided.
-        self.read_body()
+        if drain_body:
+            self.read_body()
 
         if error is not None:
             error_msg = str(error)
@@ -242,7 +580,10 @@ class BaseHttpApiRequestHandler(BaseHTTPRequestHandler):
         if body_len > 0:
             self.send_header(CONTENT_TYPE_HEADER, CONTENT_TYPE_JSON)
         self.send_header(CONTENT_LENGTH_HEADER, body_len)
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
+        if headers is not None:
+            for name, value in headers.items():
+                self.send_header(name, value)
+        self.send_connection_header()
         self.end_headers()
         if body:
             self.wfile.write(body)
@@ -302,10 +643,36 @@ class BaseHttpApiRequestHandler(BaseHTTPRequestHandler):
 
         self.send_response(HTTPStatus.OK)
         self.send_header(CONTENT_LENGTH_HEADER, '0')
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
+        self.send_connection_header()
         self.send_header(SESSION_ID_HEADER, session_id)
         self.end_headers()
     
+    def handle_health_check(self):
+        '''
+
+            Handle the health check API.
+            Used by clients to check that the server is up. No session is
+            needed.
+
+            Method: GET
+            Path: /1/health
+
+            Response Headers:
+                x-privastore-binary-port: <binary API port (if enabled)>
+
+        '''
+        self.wrap_sockets()
+        self.read_body()
+
+        binary_port = getattr(self.server, 'binary_port', None)
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header(CONTENT_LENGTH_HEADER, '0')
+        self.send_connection_header()
+        if binary_port is not None:
+            self.send_header(BINARY_PORT_HEADER, str(binary_port))
+        self.end_headers()
+
     def handle_heartbeat_session(self):
         '''
 
@@ -331,7 +698,7 @@ class BaseHttpApiRequestHandler(BaseHTTPRequestHandler):
 
         self.send_response(HTTPStatus.OK)
         self.send_header(CONTENT_LENGTH_HEADER, '0')
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
+        self.send_connection_header()
         self.end_headers()
     
     def handle_logout_user(self):
@@ -366,5 +733,5 @@ class BaseHttpApiRequestHandler(BaseHTTPRequestHandler):
 
         self.send_response(HTTPStatus.OK)
         self.send_header(CONTENT_LENGTH_HEADER, '0')
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
+        self.send_connection_header()
         self.end_headers()
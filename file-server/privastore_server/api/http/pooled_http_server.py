@@ -0,0 +1,273 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer
+import logging
+import selectors
+import socket
+from threading import BoundedSemaphore, Condition
+import time
+from typing import Optional
+
+def close_request(request: socket.socket) -> None:
+    '''
+        Shut down a connection from another thread, its handler sees the
+        connection closed.
+    '''
+    try:
+        request.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+class PooledServerMixIn(object):
+
+    '''
+        Handle requests on a fixed size thread pool rather than a new thread
+        per connection (see socketserver.ThreadingMixIn).
+
+        serve() waits on the listening socket with a selector and is woken up
+        right away by shutdown(). While every worker is busy new connections
+        aren't accepted, they wait in the listen backlog (request_queue_size).
+
+        Keep-alive connections waiting for their next request are handed back
+        by the request handler (see park_connection) and wait in the selector
+        instead of holding a worker. They are handed to a worker again once
+        the next request arrives, or closed after the keep-alive timeout.
+    '''
+    # Workers are only used for requests, the accept loop stops them.
+    daemon_threads = True
+
+    def init_pool(self, max_workers: int, thread_name_prefix: str='http-worker') -> None:
+        self._max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._worker_slots = BoundedSemaphore(max_workers)
+        self._requests_done = Condition()
+        # Connections being handled and those of them waiting for their next
+        # request (keep-alive).
+        self._requests: set[socket.socket] = set()
+        self._idle: set[socket.socket] = set()
+        # Connections handed back to wait for their next request in the
+        # selector: client address and time parked. Those not registered with
+        # the selector yet are queued.
+        self._parked: dict[socket.socket, tuple] = dict()
+        self._park_queue: list[socket.socket] = []
+        self._parking: set[socket.socket] = set()
+        # Requests handled on each keep-alive connection.
+        self._connection_requests: dict[socket.socket, int] = dict()
+        self._shutting_down = False
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        # Read by the request handlers, stops keep-alive while draining.
+        self.draining = False
+
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    def num_parked(self) -> int:
+        with self._requests_done:
+            return len(self._parked)
+
+    def serve(self) -> None:
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.socket, selectors.EVENT_READ)
+            selector.register(self._wakeup_r, selectors.EVENT_READ)
+            while not self._shutting_down:
+                for key, _ in selector.select(self.park_timeout()):
+                    if self._shutting_down:
+                        break
+                    if key.fileobj is self.socket:
+                        self.accept_request()
+                    elif key.fileobj is self._wakeup_r:
+                        self._wakeup_r.recv(1024)
+                    else:
+                        selector.unregister(key.fileobj)
+                        self.resume_request(key.fileobj)
+                self.register_parked(selector)
+                self.close_expired_parked(selector)
+
+    def idle_timeout(self) -> float:
+        # Set by the daemon (see HttpDaemon).
+        return getattr(self, 'keep_alive_timeout', 15)
+
+    def park_timeout(self) -> Optional[float]:
+        '''
+            Time until the next parked connection expires, None if there are
+            none.
+        '''
+        with self._requests_done:
+            if len(self._parked) == 0:
+                return None
+            parked_t = min(parked_t for _, parked_t in self._parked.values())
+        return max(0, parked_t + self.idle_timeout() - time.monotonic())
+
+    def wait_worker(self) -> bool:
+        # Wait for a free worker, False if shutting down.
+        while not self._worker_slots.acquire(timeout=0.1):
+            if self._shutting_down:
+                return False
+        return True
+
+    def accept_request(self) -> None:
+        # Wait for a free worker before taking the connection off the backlog.
+        if not self.wait_worker():
+            return
+        try:
+            request, client_address = self.get_request()
+        except OSError:
+            self._worker_slots.release()
+            return
+        if not self.verify_request(request, client_address):
+            self._worker_slots.release()
+            self.shutdown_request(request)
+            return
+        with self._requests_done:
+            self._requests.add(request)
+        self._executor.submit(self.process_request_worker, request, client_address)
+
+    def process_request_worker(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+            with self._requests_done:
+                self._parking.discard(request)
+        finally:
+            with self._requests_done:
+                self._requests.discard(request)
+                self._idle.discard(request)
+                park = request in self._parking and not self.draining
+                self._parking.discard(request)
+                if park:
+                    self._parked[request] = client_address, time.monotonic()
+                    self._park_queue.append(request)
+                else:
+                    self._connection_requests.pop(request, None)
+                self._requests_done.notify_all()
+            if park:
+                self.wakeup()
+            else:
+                self.shutdown_request(request)
+            self._worker_slots.release()
+
+    def park_connection(self, request: socket.socket, num_requests: int) -> None:
+        '''
+            Called by the request handler to hand back a keep-alive connection
+            once it's done with a request, the connection waits for the next
+            request in the selector.
+        '''
+        with self._requests_done:
+            self._parking.add(request)
+            self._connection_requests[request] = num_requests
+
+    def connection_requests(self, request: socket.socket) -> int:
+        '''
+            Number of requests handled so far on a keep-alive connection.
+        '''
+        with self._requests_done:
+            return self._connection_requests.get(request, 0)
+
+    def register_parked(self, selector: selectors.BaseSelector) -> None:
+        with self._requests_done:
+            park_queue = self._park_queue
+            self._park_queue = []
+        for request in park_queue:
+            selector.register(request, selectors.EVENT_READ)
+
+    def resume_request(self, request: socket.socket) -> None:
+        '''
+            The next request arrived on a parked connection (or the client
+            closed it), hand it to a worker.
+        '''
+        if not self.wait_worker():
+            # Closed by drain.
+            return
+        with self._requests_done:
+            client_address, _ = self._parked.pop(request)
+            self._requests.add(request)
+        self._executor.submit(self.process_request_worker, request, client_address)
+
+    def close_expired_parked(self, selector: selectors.BaseSelector) -> None:
+        now = time.monotonic()
+        expired = []
+        with self._requests_done:
+            for request, (_, parked_t) in list(self._parked.items()):
+                if parked_t + self.idle_timeout() <= now and request not in self._park_queue:
+                    self._parked.pop(request)
+                    self._connection_requests.pop(request, None)
+                    expired.append(request)
+        for request in expired:
+            selector.unregister(request)
+            self.shutdown_request(request)
+        if len(expired) > 0:
+            logging.debug('Closed [{}] idle keep-alive connections'.format(len(expired)))
+
+    def connection_idle(self, request: socket.socket) -> None:
+        '''
+            Called by the request handler while it waits for the next request
+            on a connection, idle connections are closed right away when
+            draining.
+        '''
+        with self._requests_done:
+            self._idle.add(request)
+            draining = self.draining
+        if draining:
+            close_request(request)
+
+    def connection_busy(self, request: socket.socket) -> None:
+        with self._requests_done:
+            self._idle.discard(request)
+
+    def shutdown(self) -> None:
+        '''
+            Stop accepting connections. Doesn't wait for requests in flight,
+            see drain.
+        '''
+        self._shutting_down = True
+        self.draining = True
+        self.wakeup()
+
+    def wakeup(self) -> None:
+        try:
+            self._wakeup_w.send(b'\0')
+        except OSError:
+            pass
+
+    def drain(self, timeout: float) -> int:
+        '''
+            Close the idle connections and wait up to timeout for the requests
+            in flight to finish, then close the connections still open.
+            Returns the number of connections closed after the timeout.
+        '''
+        end_t = time.monotonic() + timeout
+        with self._requests_done:
+            idle = list(self._idle)
+            parked = list(self._parked.keys())
+            self._parked.clear()
+            self._park_queue = []
+            self._connection_requests.clear()
+        for request in idle:
+            close_request(request)
+        for request in parked:
+            self.shutdown_request(request)
+        with self._requests_done:
+            while len(self._requests) > 0:
+                remaining = end_t - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._requests_done.wait(remaining)
+            requests = list(self._requests)
+        for request in requests:
+            close_request(request)
+        self._executor.shutdown(wait=True)
+        return len(requests)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+class PooledHTTPServer(PooledServerMixIn, HTTPServer):
+
+    def __init__(self, server_address, request_handler, max_workers: int=32, backlog: int=128, bind_and_activate: bool=True):
+        # Set before listen() is called.
+        self.request_queue_size = backlog
+        super().__init__(server_address, request_handler, bind_and_activate)
+        self.init_pool(max_workers)
+        logging.debug('HTTP server workers: [{}] accept backlog: [{}]'.format(max_workers, backlog))
@@ -0,0 +1,542 @@
+from .api.http.http_request_handler import AUTHORIZATION_HEADER, CONNECTION_CLOSE, CONNECTION_HEADER, CONTENT_LENGTH_HEADER, KEEP_ALIVE_HEADER, SESSION_ID_HEADER
+import asyncio
+import base64
+from .bandwidth_limiter import DOWNLOAD, UPLOAD
+from .chunk_batch import ChunkFrame, CHUNK_OK, decode_frames, encode_frames
+from collections import namedtuple
+from .error import FileServerErrorCode, RemoteClientError
+import hashlib
+from http import HTTPStatus
+import json
+import logging
+from .remote.api.http.http_request_handler import CHUNK_CHECKSUM_HEADER, EPOCH_NO_HEADER, FILE_ID_HEADER
+from .remote_client import chunk_frames_data, RemoteClient, RemoteEndpoint, RemoteFileMetadata
+from .retry_policy import is_retryable_status
+import ssl
+import time
+from typing import Optional, Union
+
+RemoteResponse = namedtuple('RemoteResponse', ['status_code', 'headers', 'content'])
+
+# Idle keep-alive connection and the time it's no longer reused.
+PooledConnection = namedtuple('PooledConnection', ['reader', 'writer', 'expires'])
+
+# How long an idle connection is reused if the server doesn't say (see
+# KEEP_ALIVE_HEADER), and how much sooner than the server's timeout it's
+# dropped so it isn't closed under a request.
+KEEP_ALIVE_TIMEOUT = 5
+KEEP_ALIVE_MARGIN = 1
+
+class AsyncioRemoteClient(object):
+
+    '''
+        Remote server client for use on an asyncio event loop.
+
+        Speaks just enough HTTP/1.1 over asyncio streams to call the remote
+        server API so many requests can be in flight on a single thread.
+        Endpoints, credentials, paths, the bandwidth limiter and the remote
+        session are taken from the wrapped (blocking) remote client.
+
+        Connections are kept alive and reused, up to max_idle_connections
+        idle connections per endpoint are kept on the event loop. A request
+        on a reused connection the server has closed in the meantime is
+        retried once on a new connection.
+    '''
+    def __init__(self, remote_client: RemoteClient, max_idle_connections: int=8):
+        self._remote_client = remote_client
+        self._session_lock: Optional[asyncio.Lock] = None
+        self._ssl_context: Optional[ssl.SSLContext] = None
+        self._max_idle_connections = max_idle_connections
+        # Idle connections by endpoint, most recently used last. They belong
+        # to the event loop they were opened on.
+        self._idle_connections: dict[str, list[PooledConnection]] = dict()
+        self._connections_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def remote_client(self) -> RemoteClient:
+        return self._remote_client
+
+    def session_lock(self) -> asyncio.Lock:
+        # Created lazily so it is bound to the running event loop.
+        if self._session_lock is None:
+            self._session_lock = asyncio.Lock()
+        return self._session_lock
+
+    def ssl_context(self, endpoint: RemoteEndpoint) -> Optional[ssl.SSLContext]:
+        if not endpoint.ssl():
+            return None
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def session_expired(self, session_id: str):
+        self._remote_client.session().expired(session_id)
+
+    async def throttle(self, direction: str, num_bytes: int) -> None:
+        bandwidth_limiter = self._remote_client.bandwidth_limiter()
+        if bandwidth_limiter is not None:
+            wait_t = bandwidth_limiter.reserve(direction, num_bytes)
+            if wait_t > 0:
+                await asyncio.sleep(wait_t)
+
+    def get_error_code(self, response: RemoteResponse) -> str:
+        try:
+            return json.loads(response.content)['error']
+        except:
+            pass
+
+        logging.warning('Remote server did not send back error code!')
+
+        return FileServerErrorCode.REMOTE_ERROR
+
+    def idle_connections(self, endpoint: RemoteEndpoint) -> list[PooledConnection]:
+        loop = asyncio.get_running_loop()
+        if self._connections_loop is not loop:
+            # Connections of an earlier event loop can't be used.
+            self._idle_connections = dict()
+            self._connections_loop = loop
+        return self._idle_connections.setdefault(str(endpoint), [])
+
+    def num_idle_connections(self, endpoint: RemoteEndpoint) -> int:
+        return len(self._idle_connections.get(str(endpoint), []))
+
+    async def get_connection(self, endpoint: RemoteEndpoint, reuse: bool=True) -> tuple[asyncio.StreamReader, asyncio.StreamWriter, bool]:
+        '''
+            An idle connection to the endpoint if there is one (and reuse is
+            set), otherwise a new one. Returns the reader, writer and whether
+            the connection was reused.
+        '''
+        if reuse:
+            idle = self.idle_connections(endpoint)
+            now = time.monotonic()
+            while len(idle) > 0:
+                conn = idle.pop()
+                if conn.expires > now and not conn.reader.at_eof() and not conn.writer.is_closing():
+                    return conn.reader, conn.writer, True
+                conn.writer.close()
+        reader, writer = await asyncio.open_connection(endpoint.host(), endpoint.port(), ssl=self.ssl_context(endpoint))
+        return reader, writer, False
+
+    def release_connection(self, endpoint: RemoteEndpoint, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, keep_alive_timeout: float) -> None:
+        idle = self.idle_connections(endpoint)
+        if keep_alive_timeout <= 0 or len(idle) >= self._max_idle_connections:
+            writer.close()
+            return
+        idle.append(PooledConnection(reader, writer, time.monotonic() + keep_alive_timeout))
+
+    async def close(self) -> None:
+        '''
+            Close the idle connections.
+        '''
+        idle_connections = self._idle_connections
+        self._idle_connections = dict()
+        writers = [conn.writer for idle in idle_connections.values() for conn in idle]
+        for writer in writers:
+            writer.close()
+        for writer in writers:
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    @staticmethod
+    def keep_alive_timeout(version: str, headers: dict) -> float:
+        '''
+            How long the connection can be reused after a response, 0 if the
+            server closes it.
+        '''
+        if headers.get(CONNECTION_HEADER.lower(), '').lower() == CONNECTION_CLOSE:
+            return 0
+        if version != 'HTTP/1.1' or CONTENT_LENGTH_HEADER.lower() not in headers:
+            return 0
+        for param in headers.get(KEEP_ALIVE_HEADER.lower(), '').split(','):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'timeout':
+                try:
+                    return max(0, int(value) - KEEP_ALIVE_MARGIN)
+                except ValueError:
+                    break
+        return KEEP_ALIVE_TIMEOUT
+
+    async def do_request(self, endpoint: RemoteEndpoint, method: str, path: str, headers: dict, data: Optional[bytes]) -> RemoteResponse:
+        data = data if data is not None else b''
+        request = [
+            '{} {} HTTP/1.1'.format(method, path),
+            'Host: {}'.format(str(endpoint)),
+            '{}: {}'.format(CONTENT_LENGTH_HEADER, len(data))
+        ]
+        for header, value in headers.items():
+            request.append('{}: {}'.format(header, value))
+        request_head = ('\r\n'.join(request) + '\r\n\r\n').encode('latin-1')
+
+        reuse = True
+        while True:
+            reader, writer, reused = await self.get_connection(endpoint, reuse)
+            try:
+                try:
+                    writer.write(request_head)
+                    if len(data) > 0:
+                        writer.write(data)
+                    await writer.drain()
+                    status_line = await reader.readline()
+                except ConnectionError:
+                    if not reused:
+                        raise
+                    status_line = b''
+                if len(status_line) == 0:
+                    if reused:
+                        # The server closed the idle connection before it
+                        # got the request, retry once on a new connection.
+                        logging.debug('Reused connection to [{}] closed, retrying'.format(str(endpoint)))
+                        writer.close()
+                        reuse = False
+                        continue
+                    raise ConnectionError('Connection closed before response')
+
+                status_line = status_line.decode('latin-1').split(None, 2)
+                if len(status_line) < 2:
+                    raise ConnectionError('Invalid response status line')
+                version = status_line[0]
+                status_code = int(status_line[1])
+
+                response_headers = dict()
+                while True:
+                    line = (await reader.readline()).decode('latin-1').strip()
+                    if line == '':
+                        break
+                    header, _, value = line.partition(':')
+                    response_headers[header.strip().lower()] = value.strip()
+
+                content_len = response_headers.get(CONTENT_LENGTH_HEADER.lower())
+                if content_len is not None:
+                    content = await reader.readexactly(int(content_len))
+                else:
+                    content = await reader.read()
+            except BaseException:
+                # Includes cancellation, the connection is mid request.
+                writer.close()
+                raise
+
+            self.release_connection(endpoint, reader, writer, self.keep_alive_timeout(version, response_headers))
+            return RemoteResponse(status_code, response_headers, content)
+
+    async def wait_retry(self, attempt: int, end_t: float) -> bool:
+        '''
+            Back off before retrying a failed request, see
+            RemoteClient.wait_retry.
+        '''
+        retry_policy = self._remote_client.retry_policy()
+        if not retry_policy.can_retry():
+            logging.warning('Retry budget exhausted')
+            return False
+        delay = retry_policy.backoff(attempt)
+        if time.time() + delay >= end_t:
+            return False
+        logging.debug('Retrying request in [{:.3f}s] ...'.format(delay))
+        await asyncio.sleep(delay)
+        return True
+
+    async def send_remote_request(self, path: str, method: str='GET', headers: dict=None, data: Optional[bytes]=None, renew_session: bool=False, timeout: float=90, endpoint: Optional[RemoteEndpoint]=None) -> Union[RemoteResponse, str]:
+        '''
+            See RemoteClient.send_remote_request. Cancel the task to stop the
+            request.
+        '''
+        headers = dict(headers) if headers is not None else dict()
+        end_t = time.time() + timeout
+        attempt = 0
+        self._remote_client.retry_policy().on_request()
+
+        while True:
+            now = time.time()
+            if timeout <= 0 or now >= end_t:
+                return FileServerErrorCode.IO_TIMEOUT
+
+            session_id = None
+            if renew_session:
+                session_id = headers[SESSION_ID_HEADER] = await self.get_session_id(timeout=(end_t - now))
+
+            try:
+                if endpoint is None or attempt > 0:
+                    endpoint = self._remote_client.get_remote_endpoint()
+            except RemoteClientError as e:
+                if e.error_code() == FileServerErrorCode.REMOTE_UNAVAILABLE:
+                    logging.error(str(e))
+                    return e.error_code()
+                raise e
+            endpoint_selector = self._remote_client.endpoint_selector()
+
+            request_t = endpoint_selector.begin_request(endpoint)
+            try:
+                r = await asyncio.wait_for(self.do_request(endpoint, method, path, headers, data), timeout=max(0, end_t - time.time()))
+            except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                endpoint_selector.end_request(endpoint, request_t, False)
+                logging.error('Request error: {}'.format(str(e)))
+                if await self.wait_retry(attempt, end_t):
+                    attempt += 1
+                    continue
+                return FileServerErrorCode.REMOTE_UNAVAILABLE
+            except asyncio.CancelledError:
+                endpoint_selector.cancel_request(endpoint)
+                raise
+            except BaseException:
+                endpoint_selector.end_request(endpoint, request_t, False)
+                raise
+            endpoint_selector.end_request(endpoint, request_t, r.status_code < HTTPStatus.INTERNAL_SERVER_ERROR)
+
+            logging.debug('Request returned status {}'.format(str(r.status_code)))
+
+            if r.status_code == HTTPStatus.OK:
+                if renew_session:
+                    self._remote_client.session().touch(session_id)
+                return r
+            elif r.status_code == HTTPStatus.UNAUTHORIZED:
+                if renew_session:
+                    self.session_expired(session_id)
+                    continue
+            elif is_retryable_status(r.status_code):
+                if await self.wait_retry(attempt, end_t):
+                    attempt += 1
+                    continue
+
+            error_code = self.get_error_code(r)
+            logging.debug('Request returned error code {}'.format(error_code))
+            return error_code
+
+    async def get_session_id(self, timeout: float=90) -> str:
+        '''
+            Get the session shared with the wrapped client and the session
+            heartbeat (see RemoteSession), logging in if there is none.
+        '''
+        session = self._remote_client.session()
+        session_id = session.get()
+        if session_id is not None:
+            return session_id
+
+        # Only one login in flight, concurrent transfers share the session.
+        async with self.session_lock():
+            session_id = session.get()
+            if session_id is not None:
+                return session_id
+
+            path = self._remote_client.login_path()
+            remote_creds = self._remote_client.get_remote_credentials()
+            auth = base64.b64encode('{}:{}'.format(remote_creds.username(), remote_creds.password()).encode('utf-8')).decode('ascii')
+            headers = dict()
+            headers[AUTHORIZATION_HEADER] = 'Basic {}'.format(auth)
+
+            logging.debug('Login user [{}]'.format(remote_creds.username()))
+            res = await self.send_remote_request(path, method='POST', headers=headers, timeout=timeout)
+            if isinstance(res, RemoteResponse):
+                session_id = res.headers.get(SESSION_ID_HEADER.lower())
+                logging.debug('User [{}] session [{}] started'.format(remote_creds.username(), session_id))
+                return session.started(session_id)
+            else:
+                logging.error('Login user [{}] error {}'.format(remote_creds.username(), res))
+                raise RemoteClientError('Login user [{}] error {}'.format(remote_creds.username(), res), res)
+
+    async def create_file(self, file_size: Optional[int] = None, timeout: int = 90) -> str:
+        path = self._remote_client.create_file_path(file_size)
+
+        logging.debug('Creating file size [{}]'.format(file_size))
+        res = await self.send_remote_request(path, method='POST', renew_session=True, timeout=timeout)
+        if isinstance(res, RemoteResponse):
+            file_id = res.headers.get(FILE_ID_HEADER.lower())
+            logging.debug('Created file [{}] size [{}]'.format(file_id, file_size))
+            return file_id
+        else:
+            logging.error('Create file error {}'.format(res))
+            raise RemoteClientError('Create file error {}'.format(res), res)
+
+    async def remove_file(self, file_id: str, epoch_no: int, timeout: int = 90) -> None:
+        path = self._remote_client.file_path(file_id)
+
+        headers = dict()
+        headers[EPOCH_NO_HEADER] = str(epoch_no)
+
+        logging.debug('Removing file [{}] epoch-no [{}]'.format(file_id, epoch_no))
+        res = await self.send_remote_request(path, method='DELETE', headers=headers, renew_session=True, timeout=timeout)
+        if isinstance(res, RemoteResponse):
+            logging.debug('Removed file [{}] epoch-no [{}]'.format(file_id, epoch_no))
+        else:
+            logging.error('Remove file [{}] epoch-no [{}] error {}'.format(file_id, epoch_no, res))
+            raise RemoteClientError('Remove file [{}] epoch-no [{}] error {}'.format(file_id, epoch_no, res), res)
+
+    async def get_file_metadata(self, remote_file_id: str, timeout: int = 90) -> RemoteFileMetadata:
+        path = self._remote_client.file_metadata_path(remote_file_id)
+
+        logging.debug('Get file [{}] metadata'.format(remote_file_id))
+        res = await self.send_remote_request(path, method='GET', renew_session=True, timeout=timeout)
+        if isinstance(res, RemoteResponse):
+            try:
+                metadata = json.loads(res.content)
+                file_metadata = RemoteFileMetadata(
+                    metadata['file-size'],
+                    metadata['file-store-usage'],
+                    metadata['file-chunks'],
+                    metadata['is-committed'],
+                    metadata['created-epoch-no'],
+                    metadata['removed-epoch-no']
+                )
+            except Exception as e:
+                logging.error('Invalid file [{}] metadata: {}'.format(remote_file_id, str(e)))
+                raise RemoteClientError('Invalid file [{}] metadata'.format(remote_file_id), FileServerErrorCode.REMOTE_ERROR)
+            logging.debug('Got file [{}] metadata chunks [{}] committed [{}]'.format(remote_file_id, file_metadata.file_chunks, file_metadata.is_committed))
+            return file_metadata
+        else:
+            logging.error('Get file [{}] metadata error {}'.format(remote_file_id, res))
+            raise RemoteClientError('Get file [{}] metadata error {}'.format(remote_file_id, res), res)
+
+    async def send_hedged_read(self, path: str, timeout: float=90) -> Union[RemoteResponse, str]:
+        '''
+            See RemoteClient.send_hedged_read. The losing request is
+            cancelled.
+        '''
+        endpoint_selector = self._remote_client.endpoint_selector()
+        try:
+            endpoint = self._remote_client.get_remote_endpoint()
+        except RemoteClientError as e:
+            if e.error_code() == FileServerErrorCode.REMOTE_UNAVAILABLE:
+                logging.error(str(e))
+                return e.error_code()
+            raise e
+
+        hedge_delay = endpoint_selector.hedge_delay(endpoint)
+        if hedge_delay is None:
+            endpoint_selector.record_read()
+            return await self.send_remote_request(path, method='GET', renew_session=True, timeout=timeout, endpoint=endpoint)
+
+        primary = asyncio.ensure_future(self.send_remote_request(path, method='GET', renew_session=True, timeout=timeout, endpoint=endpoint))
+        done, _ = await asyncio.wait([primary], timeout=hedge_delay)
+        if primary in done:
+            endpoint_selector.record_read()
+            return primary.result()
+
+        hedge_endpoint = endpoint_selector.select(exclude=[endpoint])
+        if hedge_endpoint is None:
+            endpoint_selector.record_read()
+            return await primary
+
+        logging.debug('Hedging read [{}] on remote endpoint [{}] after [{:.3f}s]'.format(path, str(hedge_endpoint), hedge_delay))
+        hedge = asyncio.ensure_future(self.send_remote_request(path, method='GET', renew_session=True, timeout=timeout, endpoint=hedge_endpoint))
+        pending = set([primary, hedge])
+        winner = None
+        res = None
+        error = None
+        try:
+            while winner is None and len(pending) > 0:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for request in done:
+                    try:
+                        res = request.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    if isinstance(res, RemoteResponse):
+                        winner = request
+                        break
+        finally:
+            for request in pending:
+                request.cancel()
+        endpoint_selector.record_read(hedged=True, hedge_won=(winner is hedge))
+
+        if winner is None and res is None and error is not None:
+            raise error
+        return res
+
+    async def read_file_chunk(self, remote_file_id: str, chunk_offset: int, timeout: int = 90) -> bytes:
+        path = self._remote_client.file_chunk_path(remote_file_id, chunk_offset)
+
+        logging.debug('Reading file [{}] chunk offset [{}]'.format(remote_file_id, chunk_offset))
+        res = await self.send_hedged_read(path, timeout=timeout)
+        if isinstance(res, RemoteResponse):
+            chunk = res.content
+            chunk_len = len(chunk)
+            logging.debug('Read file [{}] chunk offset [{}] size [{}B]'.format(remote_file_id, chunk_offset, chunk_len))
+            await self.throttle(DOWNLOAD, chunk_len)
+            return chunk
+        else:
+            logging.error('Read file [{}] chunk [{}] error {}'.format(remote_file_id, chunk_offset, res))
+            raise RemoteClientError('Read file [{}] chunk [{}] error {}'.format(remote_file_id, chunk_offset, res), res)
+
+    async def read_file_chunks(self, remote_file_id: str, chunk_offset: int, count: int, timeout: int = 90) -> list[bytes]:
+        '''
+            See RemoteClient.read_file_chunks.
+        '''
+        path = self._remote_client.file_chunks_path(remote_file_id, chunk_offset, count)
+
+        logging.debug('Reading file [{}] [{}] chunks from offset [{}]'.format(remote_file_id, count, chunk_offset))
+        res = await self.send_hedged_read(path, timeout=timeout)
+        if not isinstance(res, RemoteResponse):
+            logging.error('Read file [{}] chunks [{}] error {}'.format(remote_file_id, chunk_offset, res))
+            raise RemoteClientError('Read file [{}] chunks [{}] error {}'.format(remote_file_id, chunk_offset, res), res)
+        try:
+            frames = decode_frames(res.content, count)
+        except ValueError as e:
+            logging.error('Read file [{}] chunks [{}] invalid response: {}'.format(remote_file_id, chunk_offset, str(e)))
+            raise RemoteClientError('Read file [{}] chunks [{}] invalid response'.format(remote_file_id, chunk_offset), FileServerErrorCode.REMOTE_ERROR)
+        chunks, error_code = chunk_frames_data(frames, chunk_offset, count)
+        if len(chunks) == 0:
+            logging.error('Read file [{}] chunk [{}] error {}'.format(remote_file_id, chunk_offset, error_code))
+            raise RemoteClientError('Read file [{}] chunk [{}] error {}'.format(remote_file_id, chunk_offset, error_code), error_code)
+        chunks_len = sum([len(chunk) for chunk in chunks])
+        logging.debug('Read file [{}] [{}] chunks from offset [{}] size [{}B]'.format(remote_file_id, len(chunks), chunk_offset, chunks_len))
+        await self.throttle(DOWNLOAD, chunks_len)
+        return chunks
+
+    async def send_file_chunk(self, remote_file_id: str, chunk_data: bytes, chunk_offset: int, timeout: int = 90) -> None:
+        path = self._remote_client.file_chunk_path(remote_file_id, chunk_offset)
+        chunk_len = len(chunk_data)
+
+        await self.throttle(UPLOAD, chunk_len)
+
+        headers = dict()
+        # Lets the remote server check the chunk as it streams it to disk.
+        headers[CHUNK_CHECKSUM_HEADER] = hashlib.sha256(chunk_data).hexdigest()
+
+        logging.debug('Sending file [{}] chunk offset [{}] size [{}B]'.format(remote_file_id, chunk_offset, chunk_len))
+        res = await self.send_remote_request(path, method='PUT', headers=headers, data=chunk_data, renew_session=True, timeout=timeout)
+        if isinstance(res, RemoteResponse):
+            logging.debug('Sent file [{}] chunk offset [{}] size [{}B]'.format(remote_file_id, chunk_offset, chunk_len))
+        else:
+            logging.error('Send file [{}] chunk [{}] size [{}B] error {}'.format(remote_file_id, chunk_offset, chunk_len, res))
+            raise RemoteClientError('Send file [{}] chunk [{}] size [{}B] error {}'.format(remote_file_id, chunk_offset, chunk_len, res), res)
+
+    async def send_file_chunks(self, remote_file_id: str, chunks: list[bytes], chunk_offset: int, timeout: int = 90) -> None:
+        '''
+            See RemoteClient.send_file_chunks.
+        '''
+        path = self._remote_client.file_chunks_path(remote_file_id)
+        chunks_len = sum([len(chunk) for chunk in chunks])
+
+        await self.throttle(UPLOAD, chunks_len)
+
+        logging.debug('Sending file [{}] [{}] chunks from offset [{}] size [{}B]'.format(remote_file_id, len(chunks), chunk_offset, chunks_len))
+        data = encode_frames([ChunkFrame(chunk_offset+i, CHUNK_OK, chunk) for i, chunk in enumerate(chunks)])
+        res = await self.send_remote_request(path, method='PUT', data=data, renew_session=True, timeout=timeout)
+        if not isinstance(res, RemoteResponse):
+            logging.error('Send file [{}] chunks [{}] size [{}B] error {}'.format(remote_file_id, chunk_offset, chunks_len, res))
+            raise RemoteClientError('Send file [{}] chunks [{}] size [{}B] error {}'.format(remote_file_id, chunk_offset, chunks_len, res), res)
+        try:
+            frames = decode_frames(res.content, len(chunks))
+        except ValueError as e:
+            logging.error('Send file [{}] chunks [{}] invalid response: {}'.format(remote_file_id, chunk_offset, str(e)))
+            raise RemoteClientError('Send file [{}] chunks [{}] invalid response'.format(remote_file_id, chunk_offset), FileServerErrorCode.REMOTE_ERROR)
+        sent_chunks, error_code = chunk_frames_data(frames, chunk_offset, len(chunks))
+        if error_code is not None:
+            failed_offset = chunk_offset+len(sent_chunks)
+            logging.error('Send file [{}] chunk [{}] error {}'.format(remote_file_id, failed_offset, error_code))
+            raise RemoteClientError('Send file [{}] chunk [{}] error {}'.format(remote_file_id, failed_offset, error_code), error_code)
+        logging.debug('Sent file [{}] [{}] chunks from offset [{}] size [{}B]'.format(remote_file_id, len(chunks), chunk_offset, chunks_len))
+
+    async def commit_file(self, remote_file_id: str, epoch_no: int, timeout: int = 90) -> None:
+        path = self._remote_client.commit_path(remote_file_id)
+
+        headers = dict()
+        headers[EPOCH_NO_HEADER] = str(epoch_no)
+
+        logging.debug('Commit file [{}] epoch-no [{}]'.format(remote_file_id, epoch_no))
+        res = await self.send_remote_request(path, method='PUT', headers=headers, renew_session=True, timeout=timeout)
+        if isinstance(res, RemoteResponse):
+            logging.debug('Committed file [{}] epoch-no [{}]'.format(remote_file_id, epoch_no))
+        else:
+            logging.error('Commit file [{}] epoch-no [{}] error {}'.format(remote_file_id, epoch_no, res))
+            raise RemoteClientError('Commit file [{}] epoch-no [{}] error {}'.format(remote_file_id, epoch_no, res), res)
@@ -0,0 +1,357 @@
+import configparser
+import logging
+from threading import RLock
+import time
+from typing import Optional, Union
+from .util.file import parse_mem_size, str_mem_size
+
+UPLOAD = 'upload'
+DOWNLOAD = 'download'
+TOTAL = 'total'
+
+DIRECTIONS = [UPLOAD, DOWNLOAD, TOTAL]
+
+def parse_rate(rate: str) -> float:
+    '''
+        Parse a transfer rate (bytes per second) given as a memory size
+        (ex. 512KB). A rate of 0 (or "unlimited") disables rate limiting.
+    '''
+    rate = rate.strip()
+    if rate == '0' or rate.lower() == 'unlimited':
+        return 0
+    rate = parse_mem_size(rate)
+    if rate < 0:
+        raise Exception('Invalid rate [{}]'.format(rate))
+    return rate
+
+def str_rate(rate: float) -> str:
+    if rate == 0:
+        return 'unlimited'
+    return '{}/s'.format(str_mem_size(round(rate)))
+
+class TokenBucket(object):
+
+    '''
+        Thread-safe token bucket.
+
+        Tokens are taken up front and the bucket is allowed to go into debt,
+        the caller is told how long to wait until the debt is repaid. This
+        keeps requests larger than the bucket capacity (ex. file chunks)
+        moving and makes concurrent callers queue up behind each other.
+
+        rate - tokens (bytes) added per second, 0 for unlimited.
+        capacity - maximum tokens the bucket can accumulate (burst size).
+    '''
+    def __init__(self, rate: float=0, capacity: Optional[float]=None):
+        self._lock = RLock()
+        self._rate = 0
+        self._capacity = 0
+        self._tokens = 0
+        self._last_t = time.monotonic()
+        self.set_rate(rate, capacity)
+
+    def rate(self) -> float:
+        with self._lock:
+            return self._rate
+
+    def capacity(self) -> float:
+        with self._lock:
+            return self._capacity
+
+    def tokens(self) -> float:
+        with self._lock:
+            self.refill()
+            return self._tokens
+
+    def set_rate(self, rate: float, capacity: Optional[float]=None) -> None:
+        if rate < 0:
+            raise Exception('Invalid rate [{}]'.format(rate))
+        with self._lock:
+            self.refill()
+            self._rate = rate
+            # By default allow a burst of one second worth of tokens.
+            self._capacity = capacity if capacity is not None else rate
+            self._tokens = min(self._tokens, self._capacity)
+
+    def refill(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self._rate > 0:
+                self._tokens = min(self._capacity, self._tokens + (now - self._last_t) * self._rate)
+            self._last_t = now
+
+    def reserve(self, n: int) -> float:
+        '''
+            Take n tokens from the bucket. Return the number of seconds the
+            caller must wait before using them.
+        '''
+        with self._lock:
+            if self._rate == 0:
+                return 0
+            self.refill()
+            self._tokens -= n
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self._rate
+
+    def consume(self, n: int) -> float:
+        '''
+            Take n tokens from the bucket, blocking until they are available.
+            Return the number of seconds spent waiting.
+        '''
+        wait_t = self.reserve(n)
+        if wait_t > 0:
+            time.sleep(wait_t)
+        return wait_t
+
+class RateSchedule(object):
+
+    '''
+        Time-of-day rate schedule.
+
+        Specified as a comma separated list of <start>-<end>=<rate> windows
+        with times in 24-hour HH:MM format. Windows may wrap around midnight.
+
+        Example:
+            Unlimited overnight, 256KB/s during the day.
+            23:00-07:00=0,07:00-23:00=256KB
+    '''
+    def __init__(self, windows: list[tuple[int, int, float]]=[]):
+        self._windows = list(windows)
+
+    @staticmethod
+    def parse_time(t: str) -> int:
+        hours, minutes = t.strip().split(':')
+        hours = int(hours)
+        minutes = int(minutes)
+        if hours < 0 or hours > 24 or minutes < 0 or minutes > 59 or (hours == 24 and minutes != 0):
+            raise Exception('Invalid time [{}]'.format(t))
+        return hours * 60 + minutes
+
+    @staticmethod
+    def parse(schedule: str) -> 'RateSchedule':
+        windows = []
+        for window in schedule.split(','):
+            window = window.strip()
+            if window == '':
+                continue
+            try:
+                times, rate = window.split('=')
+                start_t, end_t = times.split('-')
+                windows.append((RateSchedule.parse_time(start_t), RateSchedule.parse_time(end_t), parse_rate(rate)))
+            except Exception:
+                raise Exception('Invalid rate schedule window [{}]'.format(window))
+        return RateSchedule(windows)
+
+    def windows(self) -> list[tuple[int, int, float]]:
+        return list(self._windows)
+
+    def rate_at(self, minute_of_day: int) -> Optional[float]:
+        '''
+            Return the scheduled rate at the given minute of the day or None
+            if no window applies.
+        '''
+        for start_t, end_t, rate in self._windows:
+            if start_t <= end_t:
+                if start_t <= minute_of_day < end_t:
+                    return rate
+            elif minute_of_day >= start_t or minute_of_day < end_t:
+                # Window wraps around midnight.
+                return rate
+        return None
+
+    def __str__(self):
+        return ','.join('{:02d}:{:02d}-{:02d}:{:02d}={}'.format(s // 60, s % 60, e // 60, e % 60, '{}B'.format(round(r)) if r > 0 else '0') for s, e, r in self._windows)
+
+class BandwidthLimiter(object):
+
+    '''
+        Limit the bandwidth used for remote transfers.
+
+        Each transfer direction (upload/download) has its own token bucket
+        and all transfers also go through a global (total) bucket. Limits can
+        be changed at runtime and optionally follow a time-of-day schedule.
+    '''
+    def __init__(self):
+        self._lock = RLock()
+        self._buckets: dict[str, TokenBucket] = dict()
+        self._limits: dict[str, float] = dict()
+        self._bursts: dict[str, Optional[float]] = dict()
+        self._schedules: dict[str, Optional[RateSchedule]] = dict()
+        self._bytes: dict[str, int] = dict()
+        self._throttled_time: dict[str, float] = dict()
+        self._throttled_count: dict[str, int] = dict()
+        self._schedule_minute: Optional[int] = None
+
+        for direction in DIRECTIONS:
+            self._buckets[direction] = TokenBucket()
+            self._limits[direction] = 0
+            self._bursts[direction] = None
+            self._schedules[direction] = None
+            self._bytes[direction] = 0
+            self._throttled_time[direction] = 0
+            self._throttled_count[direction] = 0
+
+    @staticmethod
+    def from_config(remote_config: Union[dict, configparser.ConfigParser]) -> 'BandwidthLimiter':
+        '''
+            Configuration:
+                bandwidth-limit - total bandwidth limit (ex. 1MB)
+                upload-bandwidth-limit - upload bandwidth limit
+                download-bandwidth-limit - download bandwidth limit
+                bandwidth-burst / upload-bandwidth-burst / download-bandwidth-burst
+                    - burst size (defaults to one second worth of bandwidth)
+                bandwidth-schedule / upload-bandwidth-schedule / download-bandwidth-schedule
+                    - time-of-day schedule overriding the limit
+        '''
+        limiter = BandwidthLimiter()
+        for direction in DIRECTIONS:
+            prefix = '' if direction == TOTAL else '{}-'.format(direction)
+            limit = parse_rate(remote_config.get('{}bandwidth-limit'.format(prefix), '0'))
+            burst = remote_config.get('{}bandwidth-burst'.format(prefix))
+            if burst is not None:
+                burst = parse_mem_size(burst)
+            limiter.set_limit(direction, limit, burst)
+            schedule = remote_config.get('{}bandwidth-schedule'.format(prefix))
+            if schedule is not None:
+                limiter.set_schedule(direction, RateSchedule.parse(schedule))
+        return limiter
+
+    def check_direction(self, direction: str) -> None:
+        if direction not in DIRECTIONS:
+            raise Exception('Invalid transfer direction [{}]'.format(direction))
+
+    def limit(self, direction: str) -> float:
+        self.check_direction(direction)
+        with self._lock:
+            return self._limits[direction]
+
+    def burst(self, direction: str) -> Optional[float]:
+        '''
+            Burst size set for the given direction, None if it defaults to
+            one second worth of bandwidth.
+        '''
+        self.check_direction(direction)
+        with self._lock:
+            return self._bursts[direction]
+
+    def set_limit(self, direction: str, limit: float, burst: Optional[float]=None) -> None:
+        '''
+            Set the default bandwidth limit (bytes per second) for the given
+            direction. Scheduled windows take priority over this limit.
+        '''
+        self.check_direction(direction)
+        if limit < 0:
+            raise Exception('Invalid bandwidth limit [{}]'.format(limit))
+        with self._lock:
+            self._limits[direction] = limit
+            self._bursts[direction] = burst
+            self._schedule_minute = None
+        logging.debug('Set {} bandwidth limit [{}]'.format(direction, str_rate(limit)))
+
+    def schedule(self, direction: str) -> Optional[RateSchedule]:
+        self.check_direction(direction)
+        with self._lock:
+            return self._schedules[direction]
+
+    def set_schedule(self, direction: str, schedule: Optional[RateSchedule]) -> None:
+        self.check_direction(direction)
+        with self._lock:
+            self._schedules[direction] = schedule
+            self._schedule_minute = None
+        logging.debug('Set {} bandwidth schedule [{}]'.format(direction, str(schedule) if schedule is not None else ''))
+
+    def current_rate(self, direction: str, minute_of_day: Optional[int]=None) -> float:
+        self.check_direction(direction)
+        self.apply_schedule(minute_of_day)
+        return self._buckets[direction].rate()
+
+    def current_burst(self, direction: str, minute_of_day: Optional[int]=None) -> float:
+        self.check_direction(direction)
+        self.apply_schedule(minute_of_day)
+        return self._buckets[direction].capacity()
+
+    def apply_schedule(self, minute_of_day: Optional[int]=None) -> None:
+        '''
+            Update the token buckets if the scheduled rates or the burst sizes
+            changed. This is cheap and is checked before every throttled
+            transfer.
+        '''
+        if minute_of_day is None:
+            now = time.localtime()
+            minute_of_day = now.tm_hour * 60 + now.tm_min
+        with self._lock:
+            if minute_of_day == self._schedule_minute:
+                return
+            self._schedule_minute = minute_of_day
+            for direction in DIRECTIONS:
+                rate = self._limits[direction]
+                schedule = self._schedules[direction]
+                if schedule is not None:
+                    scheduled_rate = schedule.rate_at(minute_of_day)
+                    if scheduled_rate is not None:
+                        rate = scheduled_rate
+                burst = self._bursts[direction]
+                bucket = self._buckets[direction]
+                if bucket.rate() != rate or bucket.capacity() != (burst if burst is not None else rate):
+                    bucket.set_rate(rate, burst)
+                    logging.debug('Using {} bandwidth limit [{}]'.format(direction, str_rate(rate)))
+
+    def reserve(self, direction: str, num_bytes: int) -> float:
+        '''
+            Account for num_bytes transferred in the given direction. Return
+            the number of seconds the caller must wait before continuing.
+        '''
+        if direction == TOTAL:
+            raise Exception('Transfer direction must be upload or download')
+        self.check_direction(direction)
+        self.apply_schedule()
+        wait_t = max(self._buckets[TOTAL].reserve(num_bytes), self._buckets[direction].reserve(num_bytes))
+        with self._lock:
+            self._bytes[direction] += num_bytes
+            self._bytes[TOTAL] += num_bytes
+            if wait_t > 0:
+                self._throttled_time[direction] += wait_t
+                self._throttled_count[direction] += 1
+        return wait_t
+
+    def throttle(self, direction: str, num_bytes: int) -> float:
+        '''
+            Account for num_bytes transferred in the given direction, blocking
+            as long as needed to stay within the bandwidth limits. Return the
+            number of seconds spent throttled.
+        '''
+        wait_t = self.reserve(direction, num_bytes)
+        if wait_t > 0:
+            logging.debug('Throttling {} of [{}] for [{:.3f}s]'.format(direction, str_mem_size(num_bytes), wait_t))
+            time.sleep(wait_t)
+        return wait_t
+
+    def throttle_upload(self, num_bytes: int) -> float:
+        return self.throttle(UPLOAD, num_bytes)
+
+    def throttle_download(self, num_bytes: int) -> float:
+        return self.throttle(DOWNLOAD, num_bytes)
+
+    def throttled_time(self, direction: str) -> float:
+        self.check_direction(direction)
+        with self._lock:
+            if direction == TOTAL:
+                return self._throttled_time[UPLOAD] + self._throttled_time[DOWNLOAD]
+            return self._throttled_time[direction]
+
+    def metrics(self) -> dict:
+        self.apply_schedule()
+        with self._lock:
+            metrics = dict()
+            for direction in DIRECTIONS:
+                metrics[direction] = {
+                    'limit': self._limits[direction],
+                    'current-limit': self._buckets[direction].rate(),
+                    'burst': self._buckets[direction].capacity(),
+                    'schedule': str(self._schedules[direction]) if self._schedules[direction] is not None else None,
+                    'bytes': self._bytes[direction],
+                    'throttled-time': self.throttled_time(direction),
+                    'throttled-count': self._throttled_count[UPLOAD] + self._throttled_count[DOWNLOAD] if direction == TOTAL else self._throttled_count[direction]
+                }
+            return metrics
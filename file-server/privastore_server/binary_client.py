@@ -0,0 +1,100 @@
+from .binary_protocol import encode_message, Message, recv_message
+from concurrent.futures import Future
+import logging
+import socket
+from threading import Lock, Thread
+
+class BinaryConnection(object):
+
+    '''
+        Client end of a binary protocol connection (see binary_protocol).
+
+        Requests from any number of threads are multiplexed over the one
+        connection. A reader thread matches responses to requests by request
+        id.
+    '''
+
+    def __init__(self, host: str, port: int, connect_timeout: float = 10):
+        self._sock = socket.create_connection((host, port), timeout=connect_timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock.settimeout(None)
+        self._name = f'{host}:{port}'
+        # Guards the pending requests and connection state.
+        self._lock = Lock()
+        self._write_lock = Lock()
+        self._pending: dict[int, Future] = dict()
+        self._next_request_id = 1
+        self._closed = False
+        self._logged_in = False
+        self._reader = Thread(name='binary-conn-reader', target=self.read_responses, daemon=True)
+        self._reader.start()
+        logging.debug('Opened binary connection to [{}]'.format(self._name))
+
+    def is_closed(self) -> bool:
+        return self._closed
+
+    def is_logged_in(self) -> bool:
+        return self._logged_in
+
+    def set_logged_in(self, logged_in: bool) -> None:
+        self._logged_in = logged_in
+
+    def submit(self, code: int, body: bytes = b'') -> Future:
+        '''
+            Send a request without waiting for the response. The returned
+            future's result is the response message, it fails with a
+            ConnectionError if the connection is lost first.
+        '''
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise ConnectionError('Binary connection [{}] is closed'.format(self._name))
+            request_id = self._next_request_id
+            self._next_request_id = request_id % 0xFFFFFFFF + 1
+            self._pending[request_id] = future
+
+        try:
+            with self._write_lock:
+                self._sock.sendall(encode_message(request_id, code, body))
+        except OSError as e:
+            self.close()
+            raise ConnectionError('Binary connection [{}] error: {}'.format(self._name, str(e)))
+        return future
+
+    def request(self, code: int, body: bytes = b'', timeout: float = 90) -> Message:
+        return self.submit(code, body).result(timeout)
+
+    def read_responses(self) -> None:
+        try:
+            while True:
+                message = recv_message(self._sock)
+                if message is None:
+                    break
+                with self._lock:
+                    future = self._pending.pop(message.request_id, None)
+                if future is None:
+                    logging.warning('Binary connection [{}] response to unknown request [{}]'.format(self._name, message.request_id))
+                    continue
+                future.set_result(message)
+        except (OSError, ValueError) as e:
+            if not self._closed:
+                logging.error('Binary connection [{}] error: {}'.format(self._name, str(e)))
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            pending = list(self._pending.values())
+            self._pending = dict()
+
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        for future in pending:
+            future.set_exception(ConnectionError('Binary connection [{}] closed'.format(self._name)))
+        logging.debug('Closed binary connection to [{}]'.format(self._name))
@@ -0,0 +1,123 @@
+'''
+    Length-prefixed binary protocol for the local to remote server chunk path.
+
+    Every message is a fixed size header followed by the message body:
+
+        body length (4 bytes, big-endian)
+        request id (4 bytes, big-endian)
+        code (1 byte, the operation for requests, the status for responses)
+        body
+
+    A connection starts with a LOGIN request. Requests after that are tied to
+    the connection's session and don't carry credentials. Requests are
+    matched to responses by request id so a client can have many requests in
+    flight on one connection, responses may come back in any order.
+
+    Request bodies:
+        LOGIN           <username> NUL <password>
+        CREATE_FILE     <file size (8 bytes)> [<file id>]
+        APPEND_CHUNK    <file id> <chunk number (4 bytes)> <chunk bytes>
+        READ_CHUNK      <file id> <chunk number (4 bytes)>
+        COMMIT_FILE     <file id> <epoch no (4 bytes)>
+        REMOVE_FILE     <file id> <epoch no (4 bytes)>
+        END_EPOCH       <epoch no (4 bytes)> [<marker file id>]
+        FILE_METADATA   <file id>
+
+    Response bodies are empty except CREATE_FILE (file id), READ_CHUNK (chunk
+    bytes) and FILE_METADATA (JSON, as the HTTP API). Error responses carry
+    the error code.
+'''
+from collections import namedtuple
+from .error import FileServerErrorCode, RemoteClientError
+from .file import FILE_ID_LENGTH
+import socket
+import struct
+from typing import Optional
+
+LOGIN = 1
+CREATE_FILE = 2
+APPEND_CHUNK = 3
+READ_CHUNK = 4
+COMMIT_FILE = 5
+REMOVE_FILE = 6
+END_EPOCH = 7
+FILE_METADATA = 8
+
+OPS = frozenset([LOGIN, CREATE_FILE, APPEND_CHUNK, READ_CHUNK, COMMIT_FILE, REMOVE_FILE, END_EPOCH, FILE_METADATA])
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+MESSAGE_HEADER = struct.Struct('>IIB')
+MESSAGE_HEADER_LEN = MESSAGE_HEADER.size
+
+FILE_SIZE = struct.Struct('>Q')
+UINT32 = struct.Struct('>I')
+
+# Largest message body accepted, bounds the memory a peer can make us use.
+MAX_BODY_LEN = 64*1024*1024
+
+Message = namedtuple('Message', ['request_id', 'code', 'body'])
+
+def encode_message(request_id: int, code: int, body: bytes=b'') -> bytes:
+    return MESSAGE_HEADER.pack(len(body), request_id, code) + body
+
+def recv_exactly(sock: socket.socket, num_bytes: int) -> Optional[bytes]:
+    '''
+        Read exactly num_bytes from the socket. Returns None if the peer closed
+        the connection first.
+    '''
+    buf = bytearray(num_bytes)
+    view = memoryview(buf)
+    received = 0
+    while received < num_bytes:
+        n = sock.recv_into(view[received:], num_bytes - received)
+        if n == 0:
+            return None
+        received += n
+    return bytes(buf)
+
+def recv_message(sock: socket.socket, max_body_len: int=MAX_BODY_LEN) -> Optional[Message]:
+    '''
+        Read the next message. Returns None if the connection was closed
+        between messages, raises ValueError if the message is malformed.
+    '''
+    header = recv_exactly(sock, MESSAGE_HEADER_LEN)
+    if header is None:
+        return None
+    body_len, request_id, code = MESSAGE_HEADER.unpack(header)
+    if body_len > max_body_len:
+        raise ValueError('Message body too large [{}B]'.format(body_len))
+    body = recv_exactly(sock, body_len) if body_len > 0 else b''
+    if body is None:
+        raise ValueError('Connection closed mid-message')
+    return Message(request_id, code, body)
+
+def encode_file_id(file_id: str) -> bytes:
+    file_id = file_id.encode('ascii')
+    if len(file_id) != FILE_ID_LENGTH:
+        raise RemoteClientError('Invalid file id', FileServerErrorCode.INVALID_FILE_ID)
+    return file_id
+
+def decode_file_id(body: bytes) -> tuple[str, bytes]:
+    '''
+        Split a request body into the leading file id and the rest.
+    '''
+    if len(body) < FILE_ID_LENGTH:
+        raise ValueError('Missing file id')
+    return body[:FILE_ID_LENGTH].decode('ascii'), body[FILE_ID_LENGTH:]
+
+def encode_file_request(file_id: str, num: Optional[int]=None, data: bytes=b'') -> bytes:
+    '''
+        Body of a request on a file, num is the chunk or epoch number.
+    '''
+    body = encode_file_id(file_id)
+    if num is not None:
+        body += UINT32.pack(num)
+    return body + data
+
+def decode_file_request(body: bytes) -> tuple[str, int, bytes]:
+    file_id, rest = decode_file_id(body)
+    if len(rest) < UINT32.size:
+        raise ValueError('Missing chunk or epoch number')
+    return file_id, UINT32.unpack_from(rest)[0], rest[UINT32.size:]
@@ -0,0 +1,66 @@
+'''
+    Framing for multi-chunk (batch) transfers.
+
+    A batch is a sequence of frames, each a fixed size header followed by the
+    frame payload:
+
+        chunk number (4 bytes, big-endian)
+        status (1 byte, CHUNK_OK or CHUNK_ERROR)
+        payload length (4 bytes, big-endian)
+        payload (chunk bytes or, if the status is CHUNK_ERROR, the error code)
+
+    Batch write requests carry CHUNK_OK frames with the chunk data, the
+    response has a frame per chunk with an empty payload if the chunk was
+    written. Batch read responses have a frame per chunk requested.
+'''
+from collections import namedtuple
+import struct
+from typing import Optional
+
+CHUNK_OK = 0
+CHUNK_ERROR = 1
+
+FRAME_HEADER = struct.Struct('>IBI')
+FRAME_HEADER_LEN = FRAME_HEADER.size
+
+# Most chunks that can be transferred in one batch request.
+MAX_BATCH_CHUNKS = 64
+
+ChunkFrame = namedtuple('ChunkFrame', ['chunk_num', 'status', 'payload'])
+
+def encode_frame(chunk_num: int, payload: bytes=b'', status: int=CHUNK_OK) -> bytes:
+    return FRAME_HEADER.pack(chunk_num, status, len(payload)) + payload
+
+def encode_error_frame(chunk_num: int, error_code: str) -> bytes:
+    return encode_frame(chunk_num, error_code.encode('utf-8'), CHUNK_ERROR)
+
+def encode_frames(frames: list[ChunkFrame]) -> bytes:
+    return b''.join([encode_frame(frame.chunk_num, frame.payload, frame.status) for frame in frames])
+
+def decode_frames(data: bytes, max_frames: Optional[int]=None) -> list[ChunkFrame]:
+    '''
+        Decode a batch. Raises ValueError if the batch is malformed or has more
+        than max_frames frames.
+    '''
+    frames: list[ChunkFrame] = []
+    view = memoryview(data)
+    offset = 0
+    while offset < len(data):
+        if max_frames is not None and len(frames) >= max_frames:
+            raise ValueError('Too many chunks in batch. Max is {}'.format(max_frames))
+        if offset + FRAME_HEADER_LEN > len(data):
+            raise ValueError('Truncated chunk frame header')
+        chunk_num, status, payload_len = FRAME_HEADER.unpack_from(data, offset)
+        offset += FRAME_HEADER_LEN
+        if offset + payload_len > len(data):
+            raise ValueError('Truncated chunk [{}] frame'.format(chunk_num))
+        if status != CHUNK_OK and status != CHUNK_ERROR:
+            raise ValueError('Invalid chunk [{}] frame status [{}]'.format(chunk_num, status))
+        frames.append(ChunkFrame(chunk_num, status, bytes(view[offset:offset+payload_len])))
+        offset += payload_len
+    return frames
+
+def frame_error_code(frame: ChunkFrame) -> Optional[str]:
+    if frame.status == CHUNK_OK:
+        return None
+    return frame.payload.decode('utf-8')
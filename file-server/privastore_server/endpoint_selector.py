@@ -0,0 +1,387 @@
+from .api.http.http_request_handler import HEALTH_PATH
+from collections import deque
+import configparser
+from .daemon import Daemon
+import logging
+import random
+import requests
+from threading import RLock
+import time
+from typing import Callable, Optional, Union
+from .util.file import config_bool
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half-open'
+
+class EndpointHealth(object):
+
+    '''
+        Request statistics and circuit breaker for a remote endpoint.
+
+        Latency and error rate are exponentially weighted moving averages so
+        recent requests count the most.
+
+        The circuit opens after too many consecutive failures and requests
+        skip the endpoint while it is open. Once open_time has passed it is
+        half-open: a single trial request is let through, success closes the
+        circuit and failure opens it again for twice as long (up to
+        max_open_time).
+    '''
+    def __init__(self, endpoint, ewma_alpha: float=0.3, open_time: float=5, max_open_time: float=60, num_samples: int=100):
+        self._endpoint = endpoint
+        self._ewma_alpha = ewma_alpha
+        self._latency: Optional[float] = None
+        # Recent successful request latencies, for percentiles.
+        self._samples: deque[float] = deque(maxlen=num_samples)
+        self._error_rate = 0.0
+        self._outstanding = 0
+        self._requests = 0
+        self._errors = 0
+        self._consecutive_failures = 0
+        self._base_open_time = open_time
+        self._max_open_time = max_open_time
+        self._open_time = open_time
+        self._circuit = CIRCUIT_CLOSED
+        self._open_until: Optional[float] = None
+
+    def endpoint(self):
+        return self._endpoint
+
+    def latency(self) -> Optional[float]:
+        return self._latency
+
+    def error_rate(self) -> float:
+        return self._error_rate
+
+    def outstanding(self) -> int:
+        return self._outstanding
+
+    def consecutive_failures(self) -> int:
+        return self._consecutive_failures
+
+    def circuit(self) -> str:
+        return self._circuit
+
+    def open_until(self) -> Optional[float]:
+        return self._open_until
+
+    def is_closed(self) -> bool:
+        return self._circuit == CIRCUIT_CLOSED
+
+    def can_trial(self, now: float) -> bool:
+        '''
+            Whether a trial request may be sent to the endpoint while its
+            circuit isn't closed.
+        '''
+        # A trial that hasn't finished within the open time is given up on.
+        return not self.is_closed() and now >= self._open_until
+
+    def start_trial(self, now: float) -> None:
+        self._circuit = CIRCUIT_HALF_OPEN
+        self._open_until = now + self._open_time
+
+    def latency_percentile(self, percentile: float, min_samples: int=1) -> Optional[float]:
+        if len(self._samples) == 0 or len(self._samples) < min_samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+    def begin_request(self) -> None:
+        self._outstanding += 1
+
+    def cancel_request(self) -> None:
+        self._outstanding = max(0, self._outstanding - 1)
+
+    def end_request(self, latency: float, success: bool) -> None:
+        self._outstanding = max(0, self._outstanding - 1)
+        self._requests += 1
+        if success:
+            self._samples.append(latency)
+        alpha = self._ewma_alpha
+        if self._latency is None:
+            self._latency = latency
+        else:
+            self._latency = alpha * latency + (1 - alpha) * self._latency
+        self._error_rate = alpha * (0 if success else 1) + (1 - alpha) * self._error_rate
+        if success:
+            self._consecutive_failures = 0
+        else:
+            self._errors += 1
+            self._consecutive_failures += 1
+
+    def open_circuit(self, now: float) -> None:
+        if self._circuit == CIRCUIT_HALF_OPEN:
+            # Failed the trial, back off further.
+            self._open_time = min(self._max_open_time, self._open_time * 2)
+        self._circuit = CIRCUIT_OPEN
+        self._open_until = now + self._open_time
+
+    def close_circuit(self) -> None:
+        self._circuit = CIRCUIT_CLOSED
+        self._open_until = None
+        self._open_time = self._base_open_time
+        self._consecutive_failures = 0
+
+    def score(self, default_latency: float) -> float:
+        '''
+            Lower is better. Expected latency scaled by the requests already
+            waiting on the endpoint and penalized by its error rate.
+        '''
+        latency = self._latency if self._latency is not None else default_latency
+        return latency * (self._outstanding + 1) / max(0.05, 1 - self._error_rate)
+
+    def metrics(self) -> dict:
+        return {
+            'latency': self._latency,
+            'error-rate': self._error_rate,
+            'outstanding': self._outstanding,
+            'requests': self._requests,
+            'errors': self._errors,
+            'circuit': self._circuit
+        }
+
+class EndpointSelector(object):
+
+    '''
+        Thread-safe remote endpoint selection.
+
+        Uses the power of two choices: picks two available endpoints at random
+        and uses the one with the lower score (see EndpointHealth.score). This
+        sends most traffic to fast, lightly loaded endpoints without every
+        client piling onto the same one.
+
+        Endpoints are available while their circuit is closed, or for a single
+        trial request once an open circuit's timer runs out. Health probes can
+        close a circuit early. If no endpoint is available select returns None
+        so callers fail fast instead of waiting on a dead remote.
+
+        Reads can be hedged: if a read takes longer than the endpoint's usual
+        latency (hedge_percentile of its recent requests) the same read is
+        sent to another endpoint and whichever answers first is used.
+    '''
+    def __init__(self, ewma_alpha: float=0.3, failure_threshold: int=3, open_time: float=5, max_open_time: float=60, hedge_reads: bool=False, hedge_percentile: float=95, hedge_min_samples: int=20, hedge_min_delay: float=0.01):
+        self._lock = RLock()
+        self._ewma_alpha = ewma_alpha
+        self._failure_threshold = failure_threshold
+        self._open_time = open_time
+        self._max_open_time = max_open_time
+        self._hedge_reads = hedge_reads
+        self._hedge_percentile = hedge_percentile
+        self._hedge_min_samples = hedge_min_samples
+        self._hedge_min_delay = hedge_min_delay
+        self._health: dict[str, EndpointHealth] = dict()
+        self._reads = 0
+        self._hedged_reads = 0
+        self._hedge_wins = 0
+
+    @staticmethod
+    def from_config(remote_config: Union[dict, configparser.ConfigParser]) -> 'EndpointSelector':
+        '''
+            Configuration:
+                endpoint-ewma-alpha - weight of the latest request in the
+                    latency and error rate averages (default 0.3)
+                circuit-failure-threshold - consecutive failures before an
+                    endpoint's circuit opens (default 3)
+                circuit-open-time - seconds before an open circuit lets a
+                    trial request through (default 5)
+                circuit-max-open-time - cap on the open time, which doubles
+                    on every failed trial (default 60)
+                hedge-reads - hedge chunk reads (default 0)
+                hedge-percentile - latency percentile after which a read is
+                    hedged (default 95)
+                hedge-min-samples - requests an endpoint must have answered
+                    before its reads are hedged (default 20)
+                hedge-min-delay - least time to wait before hedging a read
+                    (default 0.01s)
+        '''
+        return EndpointSelector(
+            ewma_alpha=float(remote_config.get('endpoint-ewma-alpha', '0.3')),
+            failure_threshold=int(remote_config.get('circuit-failure-threshold', '3')),
+            open_time=float(remote_config.get('circuit-open-time', '5')),
+            max_open_time=float(remote_config.get('circuit-max-open-time', '60')),
+            hedge_reads=config_bool(remote_config.get('hedge-reads', '0')),
+            hedge_percentile=float(remote_config.get('hedge-percentile', '95')),
+            hedge_min_samples=int(remote_config.get('hedge-min-samples', '20')),
+            hedge_min_delay=float(remote_config.get('hedge-min-delay', '0.01'))
+        )
+
+    def add_endpoint(self, endpoint) -> None:
+        with self._lock:
+            # Clients sharing the selector may add the same endpoint.
+            if str(endpoint) not in self._health:
+                self._health[str(endpoint)] = EndpointHealth(endpoint, self._ewma_alpha, self._open_time, self._max_open_time)
+
+    def endpoints(self) -> list:
+        with self._lock:
+            return [health.endpoint() for health in self._health.values()]
+
+    def health(self, endpoint) -> EndpointHealth:
+        with self._lock:
+            return self._health[str(endpoint)]
+
+    def select(self, exclude: Optional[list]=None):
+        '''
+            Select an endpoint, other than the excluded ones. Returns None if
+            none is available.
+        '''
+        with self._lock:
+            now = time.monotonic()
+            candidates = self._health.values()
+            if exclude is not None:
+                excluded = set([str(endpoint) for endpoint in exclude])
+                candidates = [health for health in candidates if str(health.endpoint()) not in excluded]
+
+            # Trials go first, otherwise a recovered endpoint would lose out
+            # to the closed ones on its error rate and never be tried.
+            for health in candidates:
+                if health.can_trial(now):
+                    logging.debug('Trial request to remote endpoint [{}]'.format(str(health.endpoint())))
+                    health.start_trial(now)
+                    return health.endpoint()
+
+            available = [health for health in candidates if health.is_closed()]
+            if len(available) == 0:
+                return None
+            if len(available) == 1:
+                return available[0].endpoint()
+
+            # Endpoints without samples yet are assumed as fast as the best.
+            latencies = [health.latency() for health in available if health.latency() is not None]
+            default_latency = min(latencies) if len(latencies) > 0 else 0.001
+            a, b = random.sample(available, 2)
+            return a.endpoint() if a.score(default_latency) <= b.score(default_latency) else b.endpoint()
+
+    def begin_request(self, endpoint) -> float:
+        '''
+            Record a request to the endpoint. Returns the start time to pass to
+            end_request.
+        '''
+        with self._lock:
+            self._health[str(endpoint)].begin_request()
+        return time.monotonic()
+
+    def cancel_request(self, endpoint) -> None:
+        '''
+            Record that a request was abandoned (ex. the losing hedged read).
+            Doesn't count towards the endpoint's latency or errors.
+        '''
+        with self._lock:
+            self._health[str(endpoint)].cancel_request()
+
+    def end_request(self, endpoint, start_t: float, success: bool) -> None:
+        '''
+            Record the outcome of a request. Failures are errors talking to the
+            endpoint (connection errors, timeouts, 5xx responses), not API
+            errors.
+        '''
+        now = time.monotonic()
+        with self._lock:
+            health = self._health[str(endpoint)]
+            health.end_request(now - start_t, success)
+            if health.circuit() == CIRCUIT_HALF_OPEN:
+                if success:
+                    logging.info('Closing remote endpoint [{}] circuit'.format(str(endpoint)))
+                    health.close_circuit()
+                else:
+                    logging.warning('Remote endpoint [{}] trial request failed'.format(str(endpoint)))
+                    health.open_circuit(now)
+            elif not success and health.is_closed() and health.consecutive_failures() >= self._failure_threshold:
+                logging.warning('Opening remote endpoint [{}] circuit after [{}] failures'.format(str(endpoint), health.consecutive_failures()))
+                health.open_circuit(now)
+
+    def open_endpoints(self) -> list:
+        '''
+            Endpoints whose circuit isn't closed.
+        '''
+        with self._lock:
+            return [health.endpoint() for health in self._health.values() if not health.is_closed()]
+
+    def close_circuit(self, endpoint) -> None:
+        with self._lock:
+            logging.info('Closing remote endpoint [{}] circuit'.format(str(endpoint)))
+            self._health[str(endpoint)].close_circuit()
+
+    def probe(self, check_health: Callable[[object], bool]) -> int:
+        '''
+            Probe the endpoints with open circuits and close the circuits of
+            the healthy ones. Returns the number of circuits closed.
+        '''
+        num_closed = 0
+        for endpoint in self.open_endpoints():
+            try:
+                healthy = check_health(endpoint)
+            except Exception as e:
+                logging.debug('Remote endpoint [{}] health probe error: {}'.format(str(endpoint), str(e)))
+                healthy = False
+            if healthy:
+                self.close_circuit(endpoint)
+                num_closed += 1
+        return num_closed
+
+    def hedge_delay(self, endpoint) -> Optional[float]:
+        '''
+            How long to wait on a read from the endpoint before hedging it.
+            None if reads shouldn't be hedged (hedging disabled, a single
+            endpoint or too few samples to go on).
+        '''
+        if not self._hedge_reads:
+            return None
+        with self._lock:
+            if len(self._health) < 2:
+                return None
+            delay = self._health[str(endpoint)].latency_percentile(self._hedge_percentile, self._hedge_min_samples)
+            if delay is None:
+                return None
+            return max(self._hedge_min_delay, delay)
+
+    def record_read(self, hedged: bool=False, hedge_won: bool=False) -> None:
+        with self._lock:
+            self._reads += 1
+            if hedged:
+                self._hedged_reads += 1
+            if hedge_won:
+                self._hedge_wins += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {name: health.metrics() for name, health in self._health.items()}
+
+    def hedge_metrics(self) -> dict:
+        with self._lock:
+            return {
+                'reads': self._reads,
+                'hedged-reads': self._hedged_reads,
+                'hedge-wins': self._hedge_wins,
+                'hedge-rate': self._hedged_reads / self._reads if self._reads > 0 else 0.0
+            }
+
+def check_endpoint_health(endpoint, timeout: float=5) -> bool:
+    r = requests.get(endpoint.http_url() + HEALTH_PATH, timeout=timeout)
+    return r.status_code == 200
+
+class HealthProber(Daemon):
+
+    '''
+        Periodically probes endpoints with open circuits so they are brought
+        back as soon as they recover.
+    '''
+    def __init__(self, endpoint_selector: EndpointSelector, probe_interval: float=10, probe_timeout: float=5):
+        super().__init__('health-prober')
+        self._endpoint_selector = endpoint_selector
+        self._probe_interval = probe_interval
+        self._probe_timeout = probe_timeout
+
+    def check_health(self, endpoint) -> bool:
+        return check_endpoint_health(endpoint, self._probe_timeout)
+
+    def run(self):
+        self._started.set()
+        logging.debug('Health prober started')
+        while not self._stop.wait(self._probe_interval):
+            try:
+                self._endpoint_selector.probe(self.check_health)
+            except Exception as e:
+                logging.error('Health probe error: {}'.format(str(e)))
+        self._stopped.set()
+        logging.debug('Health prober stopped')
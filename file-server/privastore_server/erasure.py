@@ -0,0 +1,165 @@
+'''
+    Systematic Reed-Solomon erasure code over GF(256).
+
+    Each group of k data chunks is encoded into m parity fragments. The data
+    chunks are stored as is (data fragments), any k of the k+m fragments are
+    enough to reconstruct the group. Parity rows come from a Cauchy matrix so
+    every k x k submatrix of the encoding matrix is invertible.
+
+    Arithmetic is done a whole fragment at a time: multiplying by a constant
+    is a bytes.translate() through that constant's multiplication table and
+    addition is XOR of the fragments as (arbitrarily large) integers, both
+    run in C.
+
+    Chunks in a group may differ in size (the file's last chunk) so parity
+    fragments start with the sizes of the group's data chunks:
+
+        data chunk sizes (k x 4 bytes, big-endian)
+        parity bytes (size of the group's largest data chunk)
+'''
+import struct
+
+# x^8 + x^4 + x^3 + x^2 + 1
+GF_POLY = 0x11d
+
+GF_EXP = [0] * 512
+GF_LOG = [0] * 256
+
+def init_tables() -> None:
+    x = 1
+    for i in range(255):
+        GF_EXP[i] = x
+        GF_LOG[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= GF_POLY
+    for i in range(255, 512):
+        GF_EXP[i] = GF_EXP[i - 255]
+
+init_tables()
+
+def gf_mul(a: int, b: int) -> int:
+    if a == 0 or b == 0:
+        return 0
+    return GF_EXP[GF_LOG[a] + GF_LOG[b]]
+
+def gf_inv(a: int) -> int:
+    if a == 0:
+        raise ZeroDivisionError('Zero has no inverse in GF(256)')
+    return GF_EXP[255 - GF_LOG[a]]
+
+# Multiplication table of each constant, for bytes.translate().
+GF_MUL_TABLES = [bytes(gf_mul(c, x) for x in range(256)) for c in range(256)]
+
+CHUNK_SIZE = struct.Struct('>I')
+
+def gf_invert_matrix(matrix: list[list[int]]) -> list[list[int]]:
+    '''
+        Invert a square matrix by Gauss-Jordan elimination. Raises ValueError
+        if it is singular.
+    '''
+    n = len(matrix)
+    a = [list(row) + [1 if i == j else 0 for j in range(n)] for i, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = next((row for row in range(col, n) if a[row][col] != 0), None)
+        if pivot is None:
+            raise ValueError('Singular matrix')
+        a[col], a[pivot] = a[pivot], a[col]
+        inv = gf_inv(a[col][col])
+        a[col] = [gf_mul(inv, x) for x in a[col]]
+        for row in range(n):
+            factor = a[row][col]
+            if row != col and factor != 0:
+                a[row] = [x ^ gf_mul(factor, y) for x, y in zip(a[row], a[col])]
+    return [row[n:] for row in a]
+
+def gf_linear_combination(coefficients: list[int], fragments: list[bytes], size: int) -> bytes:
+    '''
+        Sum of coefficient * fragment over GF(256). Fragments shorter than
+        size are zero-padded.
+    '''
+    acc = 0
+    for c, fragment in zip(coefficients, fragments):
+        if c == 0 or len(fragment) == 0:
+            continue
+        scaled = fragment if c == 1 else fragment.translate(GF_MUL_TABLES[c])
+        acc ^= int.from_bytes(scaled, 'little')
+    return acc.to_bytes(size, 'little')
+
+class ErasureCode(object):
+
+    def __init__(self, data_shards: int, parity_shards: int):
+        if data_shards < 1:
+            raise ValueError('Erasure code needs at least 1 data shard')
+        if parity_shards < 0:
+            raise ValueError('Erasure code parity shards must be >= 0')
+        if data_shards + parity_shards > 256:
+            raise ValueError('Erasure code supports at most 256 shards')
+        self._data_shards = data_shards
+        self._parity_shards = parity_shards
+        # Parity rows of the encoding matrix, the data rows are the identity.
+        self._parity_matrix = [[gf_inv((data_shards + i) ^ j) for j in range(data_shards)] for i in range(parity_shards)]
+
+    def data_shards(self) -> int:
+        return self._data_shards
+
+    def parity_shards(self) -> int:
+        return self._parity_shards
+
+    def total_shards(self) -> int:
+        return self._data_shards + self._parity_shards
+
+    def encoding_row(self, fragment_index: int) -> list[int]:
+        if fragment_index < self._data_shards:
+            return [1 if j == fragment_index else 0 for j in range(self._data_shards)]
+        return self._parity_matrix[fragment_index - self._data_shards]
+
+    def encode(self, chunks: list[bytes]) -> list[bytes]:
+        '''
+            Encode a group of up to k data chunks (a short group is padded
+            with empty chunks). Returns the m parity fragments.
+        '''
+        k = self._data_shards
+        if len(chunks) > k:
+            raise ValueError('Group has [{}] chunks, expected at most [{}]'.format(len(chunks), k))
+        chunks = list(chunks) + [b''] * (k - len(chunks))
+        header = b''.join(CHUNK_SIZE.pack(len(chunk)) for chunk in chunks)
+        size = max(len(chunk) for chunk in chunks)
+        return [header + gf_linear_combination(row, chunks, size) for row in self._parity_matrix]
+
+    def decode(self, fragments: dict[int, bytes]) -> list[bytes]:
+        '''
+            Reconstruct a group's k data chunks from any k of its fragments, by
+            fragment index (data fragments are 0 to k-1). Raises ValueError if
+            there are fewer than k fragments.
+        '''
+        k = self._data_shards
+        if all(i in fragments for i in range(k)):
+            return [fragments[i] for i in range(k)]
+
+        parity = [i for i in fragments if i >= k]
+        if len(fragments) < k or len(parity) == 0:
+            raise ValueError('Need [{}] fragments to decode, have [{}]'.format(k, len(fragments)))
+        header_len = k * CHUNK_SIZE.size
+        header = fragments[parity[0]][:header_len]
+        if len(header) != header_len:
+            raise ValueError('Parity fragment too short')
+        sizes = [CHUNK_SIZE.unpack_from(header, j * CHUNK_SIZE.size)[0] for j in range(k)]
+        size = max(sizes)
+
+        # Use the data fragments we have, then as many parity fragments as
+        # needed.
+        indexes = sorted(fragments, key=lambda i: (i >= k, i))[:k]
+        payloads = [fragments[i] if i < k else fragments[i][header_len:] for i in indexes]
+        for i, payload in zip(indexes, payloads):
+            if i >= k and len(payload) != size:
+                raise ValueError('Parity fragment [{}] size mismatch'.format(i))
+        decoding_matrix = gf_invert_matrix([self.encoding_row(i) for i in indexes])
+
+        chunks = []
+        for j in range(k):
+            if j in fragments:
+                chunks.append(fragments[j])
+            else:
+                chunks.append(gf_linear_combination(decoding_matrix[j], payloads, size)[:sizes[j]])
+        return chunks
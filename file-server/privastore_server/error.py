@@ -25,6 +25,7 @@ class FileServerErrorCode:
     FILE_IS_DIRECTORY = "FILE_IS_DIRECTORY"
     FILE_STORE_FULL = "FILE_STORE_FULL"
     FILE_CHUNK_TOO_LARGE = "FILE_CHUNK_TOO_LARGE"
+    FILE_CHUNK_CHECKSUM_MISMATCH = "FILE_CHUNK_CHECKSUM_MISMATCH"
     FILE_TOO_SMALL = "FILE_TOO_SMALL"
     FILE_TOO_LARGE = "FILE_TOO_LARGE"
     INSUFFICIENT_SPACE = "INSUFFICIENT_SPACE"
@@ -32,12 +33,14 @@ class FileServerErrorCode:
     IO_TIMEOUT = "IO_TIMEOUT"
     KEY_NOT_FOUND = "KEY_NOT_FOUND"
     SESSION_NOT_FOUND = "SESSION_NOT_FOUND"
+    TASK_NOT_FOUND = "TASK_NOT_FOUND"
     INVALID_CHUNK_NUM = "INVALID_CHUNK_NUM"
     INVALID_EPOCH_NO = "INVALID_EPOCH_NO"
     INVALID_FILE_ID = "INVALID_FILE_ID"
     INVALID_FILE_SIZE = "INVALID_FILE_SIZE"
     INVALID_KEY_ID = "INVALID_KEY_ID"
     INVALID_PATH = "INVALID_PATH"
+    INVALID_REQUEST = "INVALID_REQUEST"
     INVALID_SEEK_OFFSET = "INVALID_SEEK_OFFSET"
     INVALID_SESSION_ID = "INVALID_SESSION_ID"
     INTERNAL_ERROR = "INTERNAL_ERROR"
@@ -50,6 +53,8 @@ class FileServerErrorCode:
     REMOTE_UPLOAD_ERROR = "REMOTE_UPLOAD_ERROR"
     REMOTE_UPLOAD_CANCELLED = "REMOTE_UPLOAD_CANCELLED"
     REMOTE_DOWNLOAD_CANCELLED = "REMOTE_DOWNLOAD_CANCELLED"
+    REMOTE_UNAVAILABLE = "REMOTE_UNAVAILABLE"
+    SERVER_BUSY = "SERVER_BUSY"
 
 class FileServerError(Exception):
     def __init__(self, msg: str, error_code: str=FileServerErrorCode.INTERNAL_ERROR):
@@ -59,6 +64,19 @@ class FileServerError(Exception):
     def error_code(self) -> str:
         return self._error_code
 
+class AdmissionError(FileServerError):
+
+    '''
+        A transfer wasn't admitted, the server is at its limits. The client
+        may retry after retry_after seconds.
+    '''
+    def __init__(self, msg: str, retry_after: int=5, error_code: str=FileServerErrorCode.SERVER_BUSY):
+        super().__init__(msg, error_code)
+        self._retry_after = retry_after
+
+    def retry_after(self) -> int:
+        return self._retry_after
+
 class AuthenticationError(FileServerError):
     def __init__(self, msg: str, error_code: str=FileServerErrorCode.INTERNAL_ERROR):
         super().__init__(msg, error_code)
@@ -119,6 +137,10 @@ class SessionError(FileServerError):
     def __init__(self, msg: str, error_code: str=FileServerErrorCode.INTERNAL_ERROR):
         super().__init__(msg, error_code)
 
+class TaskError(FileServerError):
+    def __init__(self, msg: str, error_code: str=FileServerErrorCode.INTERNAL_ERROR):
+        super().__init__(msg, error_code)
+
 class WorkerError(FileServerError):
     def __init__(self, msg: str, error_code: str=FileServerErrorCode.INTERNAL_ERROR):
         super().__init__(msg, error_code)
\ No newline at end of file
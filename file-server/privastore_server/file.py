@@ -1,12 +1,14 @@
+import hashlib
 import logging
 import os
 import shutil
+import socket
 import uuid
 from .error import FileError, FileServerErrorCode
 from .file_chunk import default_chunk_encoder, default_chunk_decoder
 from .util.crypto import sha256
-from .util.file import KILOBYTE
-from typing import Optional
+from .util.file import KILOBYTE, read_all, stream_copy, STREAM_BUFFER_SIZE
+from typing import BinaryIO, Optional
 
 METADATA_FILE = '.metadata'
 FILE_ID_LENGTH = 38
@@ -236,6 +238,92 @@ class File(object):
         self._total_chunks += 1
         self._modified = True
     
+    def append_chunk_stream(self, in_file: BinaryIO, chunk_len: int, checksum: Optional[bytes] = None, buffer_size: int = STREAM_BUFFER_SIZE) -> bytes:
+        '''
+            Append a chunk of chunk_len bytes read from in_file. With the
+            default chunk encoder the chunk is streamed to its chunk file
+            buffer_size bytes at a time, otherwise it's read whole and encoded.
+
+            The chunk's SHA-256 is computed as it is read, if checksum is given
+            and doesn't match the chunk isn't appended. Returns the checksum.
+        '''
+        if self.error():
+            raise FileError('Cannot write file [{}] in error state'.format(self.file_id()))
+        if self.closed():
+            raise FileError('File closed')
+        if self._mode != 'w' and self._mode != 'a':
+            raise FileError('File not opened for writing')
+        if chunk_len == 0:
+            raise FileError('Cannot append empty chunk')
+
+        hash = hashlib.sha256()
+        if self._encode_chunk is not default_chunk_encoder:
+            chunk_bytes = read_all(in_file, chunk_len)
+            hash.update(chunk_bytes)
+            if checksum is not None and hash.digest() != checksum:
+                raise FileError('File [{}] chunk checksum mismatch'.format(self.file_id()), FileServerErrorCode.FILE_CHUNK_CHECKSUM_MISMATCH)
+            self.append_chunk(chunk_bytes)
+            return hash.digest()
+
+        file_path = os.path.join(self._file_path, str(self._total_chunks+1))
+        if os.path.exists(file_path):
+            raise FileError('File chunk exists', FileServerErrorCode.FILE_IS_CORRUPT)
+        try:
+            with open(file_path, 'wb') as chunk_file:
+                copied = stream_copy(in_file, chunk_file, chunk_len, bytearray(min(buffer_size, chunk_len)), hash)
+                if copied < chunk_len:
+                    raise FileError('File [{}] chunk truncated, read [{}] of [{}] bytes'.format(self.file_id(), copied, chunk_len), FileServerErrorCode.IO_ERROR)
+                if checksum is not None and hash.digest() != checksum:
+                    raise FileError('File [{}] chunk checksum mismatch'.format(self.file_id()), FileServerErrorCode.FILE_CHUNK_CHECKSUM_MISMATCH)
+                chunk_file.flush()
+        except Exception as e:
+            # Don't leave a partial chunk behind.
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise e
+        self._size_on_disk += chunk_len
+        self._chunks_written += 1
+        self._file_size += chunk_len
+        self._total_chunks += 1
+        self._modified = True
+        return hash.digest()
+
+    def append_chunks_from(self, src_file: 'File') -> None:
+        '''
+            Append the chunks of src_file as they are stored, without decoding
+            and encoding them again. Both files must use the same chunk
+            encoder (ex. encrypted with the same key), encoded chunks don't
+            depend on their position in the file.
+
+            Chunk files are hard linked so no data is copied, they are only
+            copied where links aren't supported.
+        '''
+        if self.error():
+            raise FileError('Cannot write file [{}] in error state'.format(self.file_id()))
+        if self.closed():
+            raise FileError('File closed')
+        if self._mode != 'w' and self._mode != 'a':
+            raise FileError('File not opened for writing')
+        if len(self._write_buffer) > 0:
+            raise FileError('Cannot append chunks to file [{}] with buffered data'.format(self.file_id()))
+
+        for chunk_num in range(1, src_file.total_chunks()+1):
+            src_path = os.path.join(src_file._file_path, str(chunk_num))
+            if not os.path.exists(src_path):
+                raise FileError('File chunk not found', FileServerErrorCode.FILE_IS_CORRUPT)
+            file_path = os.path.join(self._file_path, str(self._total_chunks+1))
+            if os.path.exists(file_path):
+                raise FileError('File chunk exists', FileServerErrorCode.FILE_IS_CORRUPT)
+            try:
+                os.link(src_path, file_path)
+            except OSError:
+                shutil.copyfile(src_path, file_path)
+            self._size_on_disk += os.path.getsize(file_path)
+            self._chunks_written += 1
+            self._total_chunks += 1
+        self._file_size += src_file.file_size()
+        self._modified = True
+
     def read(self, size: Optional[int] = None) -> bytes:
         '''
             Implement this so it behaves like file-like object.
@@ -292,6 +380,52 @@ class File(object):
             return chunk_bytes
         return b''
 
+    def can_sendfile(self) -> bool:
+        '''
+            Chunks written with the default encoder are stored as is, so they
+            can be sent straight from disk (see send_chunk).
+        '''
+        return self._decode_chunk is default_chunk_decoder
+
+    def next_chunk_path(self) -> Optional[str]:
+        if self.error():
+            raise FileError('Cannot read file [{}] in error state'.format(self.file_id()))
+        if self.closed():
+            raise FileError('File closed')
+        if self._mode != 'r':
+            raise FileError('File not opened for reading')
+        if not self.can_sendfile():
+            raise FileError('File [{}] chunks are encoded'.format(self.file_id()))
+        if self._chunks_read < self._total_chunks:
+            file_path = os.path.join(self._file_path, str(self._chunks_read+1))
+            if not os.path.exists(file_path):
+                raise FileError('File chunk not found', FileServerErrorCode.FILE_IS_CORRUPT)
+            return file_path
+
+    def next_chunk_length(self) -> int:
+        '''
+            Length of the next chunk to be read, 0 at the end of the file.
+            Only for files that can be sent as is.
+        '''
+        file_path = self.next_chunk_path()
+        if file_path is None:
+            return 0
+        return os.path.getsize(file_path)
+
+    def send_chunk(self, sock: socket.socket) -> int:
+        '''
+            Send the next chunk from disk to sock without copying it through
+            Python (see socket.sendfile). Only for files that can be sent as is.
+            Returns the bytes sent, 0 at the end of the file.
+        '''
+        file_path = self.next_chunk_path()
+        if file_path is None:
+            return 0
+        with open(file_path, 'rb') as chunk_file:
+            sent = sock.sendfile(chunk_file)
+        self._chunks_read += 1
+        return sent
+
     def remove(self) -> None:
         shutil.rmtree(self._file_path)
     
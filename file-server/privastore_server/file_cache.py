@@ -3,7 +3,7 @@ import configparser
 from .error import FileCacheError, FileError, FileServerErrorCode
 from .file import File
 from .file_chunk import chunk_encoder, chunk_decoder, default_chunk_encoder, default_chunk_decoder
-from .util.file import config_bool, parse_mem_size, str_mem_size, KILOBYTE
+from .util.file import config_bool, parse_mem_size, str_mem_size, KILOBYTE, STREAM_BUFFER_SIZE
 import logging
 import os
 import shutil
@@ -11,6 +11,17 @@ from threading import Condition, RLock
 import time
 from typing import Optional, Union
 
+# Held (flock) by the writer of a file in a shared store.
+WRITER_LOCK_FILE = '.writer-lock'
+# Held shared (flock) by the readers of a file in a shared store.
+READER_LOCK_FILE = '.reader-lock'
+# Space allocated to a file in a shared store.
+ALLOC_SPACE_FILE = '.alloc-space'
+# Space allocated to all the files in a shared store.
+STORE_USED_FILE = '.store-used'
+# Held shared (flock) by the processes using a shared store.
+STORE_USERS_LOCK_FILE = '.store-users'
+
 class FileCache(object):
 
     class IndexNode(object):
@@ -32,6 +43,8 @@ class FileCache(object):
             self._next: 'FileCache.IndexNode' = None
             self.lock = RLock()
             self._readers = Condition(self.lock)
+            # Writer lock file, shared stores only.
+            self.writer_lock = None
         
         def index(self) -> 'FileCache.Index':
             return self._index
@@ -211,6 +224,8 @@ class FileCache(object):
         def __init__(self, file_id: str, node: 'FileCache.IndexNode', chunk_size: int = KILOBYTE, encode_chunk: chunk_encoder=default_chunk_encoder, decode_chunk: chunk_encoder=default_chunk_decoder, skip_metadata=False):
             super().__init__(node.index().cache().cache_path(), file_id, mode='r', chunk_size=chunk_size, encode_chunk=encode_chunk, decode_chunk=decode_chunk, skip_metadata=skip_metadata)
             self._node = node
+            # Reader lock file, shared stores only.
+            self.reader_lock = None
 
         def node(self):
             return self._node
@@ -231,6 +246,10 @@ class FileCache(object):
                     error = e
                 
                 self._node.remove_reader()
+                if self.reader_lock is not None:
+                    # Closing the file releases the lock.
+                    self.reader_lock.close()
+                    self.reader_lock = None
                 if error is not None:
                     raise error
 
@@ -260,6 +279,18 @@ class FileCache(object):
             
             return super().read_chunk()
 
+        def next_chunk_length(self):
+            if self._chunks_read == self._total_chunks:
+                self.wait_for_chunks(self._chunks_read+1)
+
+            return super().next_chunk_length()
+
+        def send_chunk(self, sock):
+            if self._chunks_read == self._total_chunks:
+                self.wait_for_chunks(self._chunks_read+1)
+
+            return super().send_chunk(sock)
+
         def wait_for_chunks(self, num_chunks):
             now = start_t = time.time()
             end_t = start_t + self._read_timeout
@@ -306,6 +337,43 @@ class FileCache(object):
             except Exception as e:
                 node.set_error()
                 raise e
+            self.chunk_appended(prev_size)
+
+        def append_chunk_stream(self, in_file, chunk_len, checksum=None, buffer_size=STREAM_BUFFER_SIZE):
+            node = self._node
+            if node.error():
+                raise FileCacheError('Cannot append chunk to file [{}] in error state'.format(self.file_id()))
+
+            prev_size = self.size_on_disk()
+            try:
+                digest = super().append_chunk_stream(in_file, chunk_len, checksum, buffer_size)
+            except FileError as e:
+                # A bad or truncated request doesn't break the file, the
+                # partial chunk has been removed.
+                if e.error_code() != FileServerErrorCode.FILE_CHUNK_CHECKSUM_MISMATCH and e.error_code() != FileServerErrorCode.IO_ERROR:
+                    node.set_error()
+                raise e
+            except Exception as e:
+                node.set_error()
+                raise e
+            self.chunk_appended(prev_size)
+            return digest
+
+        def append_chunks_from(self, src_file):
+            node = self._node
+            if node.error():
+                raise FileCacheError('Cannot append chunks to file [{}] in error state'.format(self.file_id()))
+
+            prev_size = self.size_on_disk()
+            try:
+                super().append_chunks_from(src_file)
+            except Exception as e:
+                node.set_error()
+                raise e
+            self.chunk_appended(prev_size)
+
+        def chunk_appended(self, prev_size):
+            node = self._node
             curr_size = self.size_on_disk()
             
             if curr_size > prev_size:
@@ -414,48 +482,178 @@ class FileCache(object):
             self.add_node(node)
 
 
-    def __init__(self, cache_config: Union[dict, configparser.ConfigParser]):
+    '''
+        A shared store is used by several processes at once (see prefork).
+        Its index only holds the files open in this process, other files are
+        looked up on disk when opened. Writers are locked out across processes
+        with a lock file and files being read can't be removed by other
+        processes. The space allocated to each file and to the whole store is
+        kept in files on disk so the store size applies to all the processes
+        together. Files aren't evicted.
+    '''
+    def __init__(self, cache_config: Union[dict, configparser.ConfigParser], shared: bool=False):
         self._cache_path: str = cache_config.get('store-path', './cache')
         self._cache_used = 0
         self._cache_size = parse_mem_size(cache_config.get('store-size', '1GB'))
         self._chunk_size = parse_mem_size(cache_config.get('chunk-size', '1MB'))
         self._max_file_size = parse_mem_size(cache_config.get('max-file-size', '500MB'))
         self._file_eviction = config_bool(cache_config.get('enable-file-eviction', '1'))
+        self._shared = shared
+        self._users_lock = None
+        if shared and self._file_eviction:
+            logging.warning('File eviction disabled for shared file store')
+            self._file_eviction = False
 
         self._index = FileCache.Index(cache=self)
         self._index_lock = RLock()
 
         if not os.path.exists(self._cache_path):
-            os.mkdir(self._cache_path)
+            # Pre-forked processes may race to create the store.
+            if shared:
+                os.makedirs(self._cache_path, exist_ok=True)
+            else:
+                os.mkdir(self._cache_path)
             logging.info('File cache created in path [{}]'.format(self._cache_path))
-        else:
+        elif not shared:
             for file_id in os.listdir(self._cache_path):
+                if not File.is_valid_file_id(file_id):
+                    # Shared store bookkeeping.
+                    continue
                 try:
                     f = File(self._cache_path, file_id, mode='r')
                     self.create_cache_entry(file_id, f.size_on_disk(), writable=False, removable=True)
                     f.close()
                 except Exception as e:
                     logging.error('Error initializing cache file [{}]: {}'.format(file_id, str(e)))
+        if shared:
+            self.open_shared_store()
         
-        logging.debug('File store used [{}]'.format(str_mem_size(self._cache_used)))
+        logging.debug('File store used [{}]'.format(str_mem_size(self.cache_used())))
         logging.debug('File store size [{}]'.format(str_mem_size(self._cache_size)))
         logging.debug('File chunk size [{}]'.format(str_mem_size(self._chunk_size)))
         logging.debug('Max file size [{}]'.format(str_mem_size(self._max_file_size)))
         logging.debug('File eviction enabled: [{}]'.format(self._file_eviction))
+        logging.debug('File store shared: [{}]'.format(self._shared))
 
     def cache_path(self) -> str:
         return self._cache_path
 
+    def shared(self) -> bool:
+        return self._shared
+
     def cache_size(self) -> int:
         return self._cache_size
     
     def cache_used(self) -> int:
+        if self._shared:
+            return self.update_shared_used(0)
         with self._index_lock:
             return self._cache_used
     
     def cache_free_space(self) -> int:
+        return max(0, self._cache_size - self.cache_used())
+
+    def open_shared_store(self) -> None:
+        '''
+            Register this process as a user of the shared store. The first
+            process to open the store recounts the space used from the files
+            on disk, dropping space left allocated by processes that exited
+            while writing.
+        '''
+        import fcntl
+
+        lock_file = open(os.path.join(self._cache_path, STORE_USERS_LOCK_FILE), 'ab')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            first_user = True
+        except OSError:
+            first_user = False
+        try:
+            if first_user:
+                self.recount_shared_used()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+        self._users_lock = lock_file
+
+    def update_shared_used(self, delta: int, check_space: bool=False, used: Optional[int]=None) -> int:
+        '''
+            Add delta to the space used by all the processes sharing the
+            store (or set it to used) and return it. If check_space is set
+            the space must be available.
+
+            Throws FileCacheError if there is insufficient space.
+        '''
+        import fcntl
+
+        fd = os.open(os.path.join(self._cache_path, STORE_USED_FILE), os.O_RDWR | os.O_CREAT)
+        with os.fdopen(fd, 'r+b') as f:
+            # Closing the file releases the lock.
+            fcntl.flock(f, fcntl.LOCK_EX)
+            if used is None:
+                data = f.read().strip()
+                used = int(data) if len(data) > 0 else 0
+                if check_space and used + delta > self._cache_size:
+                    raise FileCacheError('Cannot allocate [{}B] space. Insufficient space [{}B] in cache'.format(delta, max(0, self._cache_size - used)), FileServerErrorCode.INSUFFICIENT_SPACE)
+                if delta == 0:
+                    return used
+                used = max(0, used + delta)
+            f.seek(0)
+            f.truncate()
+            f.write(str(used).encode('utf-8'))
+            return used
+
+    def recount_shared_used(self) -> int:
+        used = 0
+        for file_id in self.files():
+            alloc_space = self.file_alloc_space(file_id)
+            if alloc_space is None:
+                try:
+                    f = File(self._cache_path, file_id, mode='r')
+                    alloc_space = f.size_on_disk()
+                    f.close()
+                except Exception as e:
+                    logging.error('Error reading shared file [{}]: {}'.format(file_id, str(e)))
+                    continue
+            used += alloc_space
+        logging.debug('Shared file store used [{}]'.format(str_mem_size(used)))
+        return self.update_shared_used(0, used=used)
+
+    def file_alloc_space(self, file_id: str) -> Optional[int]:
+        '''
+            Space allocated to a file in a shared store, None if not known.
+        '''
+        try:
+            with open(os.path.join(self._cache_path, file_id, ALLOC_SPACE_FILE), 'rb') as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def set_file_alloc_space(self, file_id: str, alloc_space: int) -> None:
+        if not self._shared:
+            return
+        alloc_space_path = os.path.join(self._cache_path, file_id, ALLOC_SPACE_FILE)
+        tmp_path = '{}.{}'.format(alloc_space_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(str(alloc_space).encode('utf-8'))
+        os.replace(tmp_path, alloc_space_path)
+
+    def allocate_space(self, size: int) -> None:
+        '''
+            Allocate space in the cache, across processes in a shared store.
+        '''
         with self._index_lock:
-            return max(0, self._cache_size - self._cache_used)
+            if self._shared:
+                if size > 0:
+                    self.update_shared_used(size, check_space=True)
+            else:
+                self.ensure_cache_space(size)
+            self._cache_used += size
+
+    def free_space(self, size: int) -> None:
+        with self._index_lock:
+            if self._shared and size > 0:
+                self.update_shared_used(-size)
+            self._cache_used -= size
     
     def file_chunk_size(self) -> int:
         return self._chunk_size
@@ -465,7 +663,9 @@ class FileCache(object):
 
     def has_file(self, file_id: str) -> bool:
         with self._index_lock:
-            return self._index.has_node(file_id)
+            if self._index.has_node(file_id):
+                return True
+        return self._shared and os.path.exists(os.path.join(self._cache_path, file_id))
 
     def file_has_readers(self, file_id: str) -> bool:
         with self._index_lock:
@@ -482,22 +682,154 @@ class FileCache(object):
             return node.num_writers() != 0
 
     def files(self):
+        if self._shared:
+            return [file_id for file_id in os.listdir(self._cache_path) if File.is_valid_file_id(file_id)]
         with self._index_lock:
             files = list(self._index.files())
         return files
 
     def create_cache_entry(self, file_id: str, alloc_space: int, writable: bool, removable: bool) -> 'FileCache.IndexNode':
         with self._index_lock:
-            if self._index.has_node(file_id):
+            if self._index.has_node(file_id) or (self._shared and os.path.exists(os.path.join(self._cache_path, file_id))):
                 raise FileCacheError('File [{}] already exists in cache'.format(file_id), FileServerErrorCode.FILE_EXISTS)
             logging.debug('Create cache entry for file [{}] using [{}] space'.format(file_id, str_mem_size(alloc_space)))
-            self.ensure_cache_space(alloc_space)
+            self.allocate_space(alloc_space)
             node = FileCache.IndexNode(self._index, file_id, alloc_space, writable, removable)
             self._index.add_node(node)
-            self._cache_used += alloc_space
             logging.debug('Created cache entry for file [{}] using [{}] space'.format(file_id, str_mem_size(alloc_space)))
             return node
 
+    def find_node(self, file_id: str, writable: bool=False) -> Optional['FileCache.IndexNode']:
+        '''
+            Get the file's index node or None if the file isn't in the cache.
+            In a shared store files that aren't open in this process are
+            loaded from disk.
+        '''
+        with self._index_lock:
+            if self._index.has_node(file_id):
+                return self._index.get_node(file_id)
+            if not self._shared or not os.path.exists(os.path.join(self._cache_path, file_id)):
+                return None
+
+            f = File(self._cache_path, file_id, mode='r')
+            try:
+                alloc_space = self.file_alloc_space(file_id)
+                if alloc_space is None:
+                    alloc_space = f.size_on_disk()
+                node = FileCache.IndexNode(self._index, file_id, alloc_space, writable, removable=True)
+                node.set_used_space(f.size_on_disk())
+                node.set_available_bytes(f.file_size())
+                node.set_available_chunks(f.total_chunks())
+            finally:
+                f.close()
+            self._index.add_node(node)
+            self._cache_used += node.alloc_space()
+            logging.debug('Loaded shared file [{}] into cache index'.format(file_id))
+            return node
+
+    def release_node(self, node: 'FileCache.IndexNode') -> None:
+        '''
+            Drop a shared store's file from the index once it isn't open in
+            this process, it is loaded again (with the changes made by other
+            processes) when next opened.
+        '''
+        if not self._shared:
+            return
+        file_id = node.file_id()
+        with self._index_lock:
+            with node.lock:
+                if node.num_readers() > 0 or node.num_writers() > 0 or node.removed():
+                    return
+            if self._index.get_node(file_id) is node:
+                self._index.pop_node(file_id)
+                self._cache_used -= node.alloc_space()
+
+    def lock_writer(self, node: 'FileCache.IndexNode') -> None:
+        '''
+            Lock out writers of the same file in other processes (shared
+            stores only).
+        '''
+        if not self._shared:
+            return
+        import fcntl
+
+        lock_file = open(os.path.join(self._cache_path, node.file_id(), WRITER_LOCK_FILE), 'wb')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise FileCacheError('Cannot add writer. File [{}] has writers in another process!'.format(node.file_id()), FileServerErrorCode.FILE_NOT_WRITABLE)
+        node.writer_lock = lock_file
+        # The file may have grown through another process.
+        alloc_space = self.file_alloc_space(node.file_id())
+        if alloc_space is not None:
+            node.set_alloc_space(alloc_space)
+
+    def unlock_writer(self, node: 'FileCache.IndexNode') -> None:
+        with node.lock:
+            lock_file = node.writer_lock
+            node.writer_lock = None
+        if lock_file is not None:
+            # Closing the file releases the lock.
+            lock_file.close()
+
+    def lock_reader(self, node: 'FileCache.IndexNode'):
+        '''
+            Lock out removal of the file by other processes while it's being
+            read (shared stores only). Returns the lock file, closing it
+            releases the lock.
+        '''
+        if not self._shared:
+            return None
+        import fcntl
+
+        file_path = os.path.join(self._cache_path, node.file_id())
+        try:
+            lock_file = open(os.path.join(file_path, READER_LOCK_FILE), 'ab')
+        except OSError:
+            raise FileCacheError('File [{}] not found in cache'.format(node.file_id()), FileServerErrorCode.FILE_NOT_FOUND)
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise FileCacheError('File [{}] is being removed by another process'.format(node.file_id()), FileServerErrorCode.FILE_NOT_FOUND)
+        if not os.path.exists(file_path):
+            # Removed before the lock was taken.
+            lock_file.close()
+            raise FileCacheError('File [{}] not found in cache'.format(node.file_id()), FileServerErrorCode.FILE_NOT_FOUND)
+        return lock_file
+
+    def lock_removal(self, node: 'FileCache.IndexNode') -> list:
+        '''
+            Lock out readers and writers of the file in other processes
+            before removing it (shared stores only). Returns the lock files,
+            closing them releases the locks.
+
+            Throws FileCacheError if the file is open in another process.
+        '''
+        if not self._shared:
+            return []
+        import fcntl
+
+        locks = []
+        try:
+            for lock_name in [WRITER_LOCK_FILE, READER_LOCK_FILE]:
+                try:
+                    lock_file = open(os.path.join(self._cache_path, node.file_id(), lock_name), 'ab')
+                except FileNotFoundError:
+                    # The file was never created on disk.
+                    break
+                locks.append(lock_file)
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    raise FileCacheError('File [{}] is open in another process'.format(node.file_id()), FileServerErrorCode.FILE_NOT_REMOVABLE)
+        except Exception as e:
+            for lock_file in locks:
+                lock_file.close()
+            raise e
+        return locks
+
     '''
         Open file in cache for reading.
         While file is opened, it will be locked preventing its removal from the cache.
@@ -508,30 +840,44 @@ class FileCache(object):
     '''
     def read_file(self, file_id: str, encode_chunk: chunk_encoder=default_chunk_encoder, decode_chunk: chunk_decoder=default_chunk_decoder) -> Optional['FileCache.CacheFileReader']:
         with self._index_lock:
-            if self._index.has_node(file_id):
-                node = self._index.get_node(file_id)
+            node = self.find_node(file_id)
+            if node is None:
+                return
 
-                #
-                # This is now the MRU (most recently used) file.
-                #
-                self._index.move_to_back(file_id)
-            else:
+            #
+            # This is now the MRU (most recently used) file.
+            #
+            self._index.move_to_back(file_id)
+
+        try:
+            reader_lock = self.lock_reader(node)
+        except FileCacheError as e:
+            self.release_node(node)
+            if e.error_code() == FileServerErrorCode.FILE_NOT_FOUND:
                 return
+            raise e
 
-        with node.lock:
-            node.add_reader()
+        try:
+            with node.lock:
+                node.add_reader()
 
-            try:
-                if node.writable():
-                    reader = FileCache.ConcurrentCacheFileReader(file_id, node, chunk_size=self.file_chunk_size(), encode_chunk=encode_chunk, decode_chunk=decode_chunk)
-                else:
-                    reader = FileCache.CacheFileReader(file_id, node, chunk_size=self.file_chunk_size(), encode_chunk=encode_chunk, decode_chunk=decode_chunk)
-            except Exception as e:
-                logging.error('Error opening file [{}] reader: {}'.format(file_id, str(e)))
-                node.remove_reader()
-                raise e
-            
-            return reader
+                try:
+                    if node.writable():
+                        reader = FileCache.ConcurrentCacheFileReader(file_id, node, chunk_size=self.file_chunk_size(), encode_chunk=encode_chunk, decode_chunk=decode_chunk)
+                    else:
+                        reader = FileCache.CacheFileReader(file_id, node, chunk_size=self.file_chunk_size(), encode_chunk=encode_chunk, decode_chunk=decode_chunk)
+                except Exception as e:
+                    logging.error('Error opening file [{}] reader: {}'.format(file_id, str(e)))
+                    node.remove_reader()
+                    raise e
+
+                reader.reader_lock = reader_lock
+                return reader
+        except Exception as e:
+            if reader_lock is not None:
+                reader_lock.close()
+            self.release_node(node)
+            raise e
 
     '''
         Open file in cache for writing.
@@ -551,11 +897,14 @@ class FileCache(object):
         with node.lock:
             try:
                 writer = FileCache.CacheFileWriter(file_id, node, chunk_size=self.file_chunk_size(), encode_chunk=encode_chunk, decode_chunk=decode_chunk)
+                self.lock_writer(node)
+                self.set_file_alloc_space(file_id, alloc_space)
             except Exception as e:
                 logging.error('Error opening file [{}] writer: {}'.format(file_id, str(e)))
+                self.unlock_writer(node)
                 node.remove_writer()
                 try:
-                    self.remove_file_by_node(node)
+                    self.discard_node(node, e)
                 except Exception as e1:
                     logging.warn('Error cleaning up file [{}] writer: {}'.format(file_id, str(e1)))
                 raise e
@@ -572,22 +921,33 @@ class FileCache(object):
     '''
     def append_file(self, file_id: str, encode_chunk: chunk_encoder=default_chunk_encoder, decode_chunk: chunk_decoder=default_chunk_decoder) -> 'FileCache.CacheFileWriter':
         with self._index_lock:
-            if not self._index.has_node(file_id):
+            # Whether a shared file may still be written is up to the caller.
+            node = self.find_node(file_id, writable=True)
+            if node is None:
                 raise FileCacheError('File [{}] not found in cache'.format(file_id), FileServerErrorCode.FILE_NOT_FOUND)
 
-            node = self._index.get_node(file_id)
+        try:
+            with node.lock:
+                node.add_writer()
 
-        with node.lock:
-            node.add_writer()
+                try:
+                    self.lock_writer(node)
+                except Exception as e:
+                    node.remove_writer()
+                    raise e
 
-            try:
-                writer = FileCache.CacheFileWriter(file_id, node, mode='a', chunk_size=self.file_chunk_size(), encode_chunk=encode_chunk, decode_chunk=decode_chunk)
-            except Exception as e:
-                node.remove_writer()
-                node.set_error()
-                raise e
-            
-            return writer
+                try:
+                    writer = FileCache.CacheFileWriter(file_id, node, mode='a', chunk_size=self.file_chunk_size(), encode_chunk=encode_chunk, decode_chunk=decode_chunk)
+                except Exception as e:
+                    self.unlock_writer(node)
+                    node.remove_writer()
+                    node.set_error()
+                    raise e
+
+                return writer
+        except Exception as e:
+            self.release_node(node)
+            raise e
 
     '''
         Create empty file in the cache with file_size bytes reserved.
@@ -608,17 +968,19 @@ class FileCache(object):
         with node.lock:
             try:
                 File.create_empty(self._cache_path, file_id)
+                self.set_file_alloc_space(file_id, alloc_space)
                 logging.debug('Empty file [{}] created with [{}] space allocated'.format(file_id, str_mem_size(alloc_space)))
             except Exception as e:
                 logging.error('Error creating empty file [{}]: {}'.format(file_id, str(e)))
                 node.remove_writer()
                 try:
-                    self.remove_file_by_node(node)
+                    self.discard_node(node, e)
                 except Exception as e1:
                     logging.error('Error cleaning up empty file [{}]: {}'.format(file_id, str(e1)))
                 raise e
             
             node.remove_writer()
+        self.release_node(node)
 
     '''
         Retrieve file metadata:
@@ -658,14 +1020,14 @@ class FileCache(object):
                     logging.debug('Allocate [{}B] extra space for file [{}]'.format(extra_space, file_id))
 
                     try:
-                        self.ensure_cache_space(extra_space)
+                        self.allocate_space(extra_space)
                     except Exception as e:
                         logging.error('Error allocating [{}B] extra space for file [{}]'.format(extra_space, file_id))
                         node.set_error()
                         raise e
 
                     node.set_alloc_space(size_on_disk)
-                    self._cache_used += extra_space
+                    self.set_file_alloc_space(file_id, size_on_disk)
                     logging.debug('Allocated [{}B] extra space for file [{}]'.format(extra_space, file_id))
                 elif not node.writable():
                     extra_space = alloc_space - size_on_disk
@@ -673,7 +1035,8 @@ class FileCache(object):
                     if extra_space > 0:
                         logging.debug('Free [{}B] extra space for file [{}]'.format(extra_space, file_id))
                         node.set_alloc_space(size_on_disk)
-                        self._cache_used -= extra_space
+                        self.set_file_alloc_space(file_id, size_on_disk)
+                        self.free_space(extra_space)
                         logging.debug('Free [{}B] extra space for file [{}]'.format(extra_space, file_id))
 
     '''
@@ -708,6 +1071,8 @@ class FileCache(object):
                 raise FileCacheError('File [{}] not found in cache'.format(file_id))
 
             with node.lock:
+                if mode == 'w' or mode == 'a':
+                    self.unlock_writer(node)
                 node.set_removable(removable)
                 if mode == 'w' or mode == 'a':
                     if not writable:
@@ -716,6 +1081,8 @@ class FileCache(object):
                     if not node.error():
                         self.resize_node(node, file.size_on_disk())
 
+            self.release_node(node)
+
         if error is not None:
             raise error
 
@@ -745,12 +1112,30 @@ class FileCache(object):
 
     def remove_file_by_id(self, file_id: str) -> None:
         with self._index_lock:
-            if self._index.has_node(file_id):
-                node = self._index.get_node(file_id)
-                self.remove_file_by_node(node)
+            node = self.find_node(file_id)
+            if node is not None:
+                try:
+                    self.remove_file_by_node(node)
+                except Exception as e:
+                    self.release_node(node)
+                    raise e
             else:
                 raise FileCacheError('File [{}] not found in cache'.format(file_id), FileServerErrorCode.FILE_NOT_FOUND)
 
+    def discard_node(self, node: 'FileCache.IndexNode', error: Exception) -> None:
+        '''
+            Clean up after failing to create a file. If the file already
+            existed on disk (created by another process in a shared store)
+            only the index entry is dropped.
+        '''
+        if isinstance(error, FileError) and error.error_code() == FileServerErrorCode.FILE_EXISTS:
+            with self._index_lock:
+                if self._index.get_node(node.file_id()) is node:
+                    self._index.pop_node(node.file_id())
+                    self.free_space(node.alloc_space())
+            return
+        self.remove_file_by_node(node)
+
     def remove_file_by_node(self, node: 'FileCache.IndexNode') -> None:
         file_id = node.file_id()
         with node.lock:
@@ -763,20 +1148,30 @@ class FileCache(object):
             if node.num_writers() > 0:
                 raise FileCacheError('Removing file with [{}] writers'.format(node.num_writers), FileServerErrorCode.INTERNAL_ERROR)
             
+            # Other processes sharing the store may have the file open.
+            locks = self.lock_removal(node)
             alloc_space = node.alloc_space()
             node.set_removed()
 
-        with self._index_lock:
-            if self._index.has_node(file_id):
-                self._index.pop_node(file_id)
-            else:
-                raise FileCacheError('File [{}] already removed'.format(file_id), FileServerErrorCode.INTERNAL_ERROR)
-            self._cache_used -= alloc_space
-
         try:
-            shutil.rmtree(os.path.join(self._cache_path, file_id))
-        except Exception as e:
-            logging.warn('Could not remove file [{}] from cache: {}'.format(file_id, str(e)))
+            with self._index_lock:
+                if self._index.has_node(file_id):
+                    self._index.pop_node(file_id)
+                else:
+                    raise FileCacheError('File [{}] already removed'.format(file_id), FileServerErrorCode.INTERNAL_ERROR)
+                self._cache_used -= alloc_space
+                if self._shared:
+                    # The file may have grown through another process.
+                    shared_alloc_space = self.file_alloc_space(file_id)
+                    self.update_shared_used(-(shared_alloc_space if shared_alloc_space is not None else alloc_space))
+
+            try:
+                shutil.rmtree(os.path.join(self._cache_path, file_id))
+            except Exception as e:
+                logging.warn('Could not remove file [{}] from cache: {}'.format(file_id, str(e)))
+        finally:
+            for lock_file in locks:
+                lock_file.close()
 
         logging.debug('Removed file [{}] from cache. Reclaimed [{}B] space in cache'.format(file_id, alloc_space))
 
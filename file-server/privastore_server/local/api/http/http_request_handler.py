@@ -1,14 +1,18 @@
+from ....bandwidth_limiter import DIRECTIONS, RateSchedule, TOTAL, parse_rate
 from ...controller import LocalServerController
-from ....error import DirectoryError, FileError, FileServerErrorCode
+from ....error import AdmissionError, DirectoryError, FileError, FileServerErrorCode, FileUploadError
+import hashlib
 from http import HTTPStatus
 from ....api.http.http_request_handler import BaseHttpApiRequestHandler
-from ....api.http.http_request_handler import CONNECTION_HEADER, CONNECTION_CLOSE, CONTENT_TYPE_HEADER, CONTENT_TYPE_JSON, CONTENT_LENGTH_HEADER
+from ....api.http.http_request_handler import CONTENT_TYPE_HEADER, CONTENT_LENGTH_HEADER
 import json
 from ....key import Key
 import logging
 from typing import Optional
 import urllib.parse
+from ....util.file import parse_mem_size, str_path
 from ....util.logging import log_exception_stack
+from ....util.sock import ChunkedEncodingError
 
 DIRECTORY_PATH = '/1/directory'
 DIRECTORY_PATH_LEN = len(DIRECTORY_PATH)
@@ -16,12 +20,34 @@ FILE_PATH = '/1/file'
 FILE_PATH_LEN = len(FILE_PATH)
 UPLOAD_PATH = '/1/upload'
 UPLOAD_PATH_LEN = len(UPLOAD_PATH)
+MULTIPART_PATH = '/1/multipart'
+MULTIPART_PATH_LEN = len(MULTIPART_PATH)
+UPLOADS_PATH = '/1/uploads/'
+UPLOADS_PATH_LEN = len(UPLOADS_PATH)
 DOWNLOAD_PATH = '/1/download'
 DOWNLOAD_PATH_LEN = len(DOWNLOAD_PATH)
+PROGRESS_PATH = '/1/progress'
+PROGRESS_PATH_LEN = len(PROGRESS_PATH)
+# Longest a progress request can wait for changes.
+MAX_PROGRESS_WAIT = 60
+METRICS_PATH = '/1/metrics'
+BANDWIDTH_PATH = '/1/bandwidth'
+
+# Directory listing pages.
+DEFAULT_LIST_LIMIT = 1000
+MAX_LIST_LIMIT = 10000
+LIST_FORMAT_JSON = 'json'
+LIST_FORMAT_JSON_LINES = 'jsonl'
+CONTENT_TYPE_JSON_LINES = 'application/x-ndjson'
+# Streamed listing lines are sent in writes of about this size.
+LIST_STREAM_BUFFER_SIZE = 16*1024
 
 class HttpApiRequestHandler(BaseHttpApiRequestHandler):
 
     def __init__(self, request, client_address, server, controller: LocalServerController):
+        # Validators of the file being downloaded.
+        self._download_etag: Optional[str] = None
+        self._download_last_modified: Optional[int] = None
         super().__init__(request, client_address, server, controller)
 
     def controller(self) -> LocalServerController:
@@ -37,6 +63,12 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             self.handle_download_file()
         elif self.url_path.startswith(FILE_PATH):
             self.handle_get_file_metadata()
+        elif self.url_path.startswith(PROGRESS_PATH):
+            self.handle_get_transfer_progress()
+        elif self.url_path == METRICS_PATH:
+            self.handle_get_metrics()
+        elif self.url_path.startswith(UPLOADS_PATH):
+            self.handle_get_multipart_upload()
         else:
             super().do_GET()
     
@@ -53,8 +85,13 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
         if not self.parse_path():
             return
 
-        if self.url_path.startswith(UPLOAD_PATH):
+        # Before the upload API, its path is a prefix of this one.
+        if self.url_path.startswith(UPLOADS_PATH):
+            self.handle_complete_multipart_upload()
+        elif self.url_path.startswith(UPLOAD_PATH):
             self.handle_upload_file()
+        elif self.url_path.startswith(MULTIPART_PATH):
+            self.handle_start_multipart_upload()
         else:
             super().do_POST()
 
@@ -64,6 +101,10 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
 
         if self.url_path.startswith(DIRECTORY_PATH):
             self.handle_create_directory()
+        elif self.url_path == BANDWIDTH_PATH:
+            self.handle_set_bandwidth_limit()
+        elif self.url_path.startswith(UPLOADS_PATH):
+            self.handle_upload_part()
         else:
             super().do_PUT()
 
@@ -73,6 +114,8 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
 
         if self.url_path.startswith(FILE_PATH):
             self.handle_remove_file()
+        elif self.url_path.startswith(UPLOADS_PATH):
+            self.handle_abort_multipart_upload()
         else:
             super().do_DELETE()
 
@@ -90,6 +133,27 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid file version')
             return
 
+    def get_key_id(self) -> Optional[str]:
+        '''
+            Encryption key id from the query-string, defaults to the system
+            key.
+        '''
+        try:
+            key_id = self.url_query.get('key')
+            if key_id is not None:
+                key_id = key_id[-1]
+
+                if not Key.is_valid_key_id(key_id):
+                    self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid encryption key!')
+                    return
+                return key_id
+            else:
+                # Default to encrypting using system key.
+                return 'system'
+        except:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid encryption key!')
+            return
+
     def parse_directory_path(self, path: str) -> list[str]:
         if len(path) == 0:
             raise Exception('Path is empty')
@@ -163,7 +227,7 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
 
         self.send_response(HTTPStatus.OK)
         self.send_header(CONTENT_LENGTH_HEADER, '0')
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
+        self.send_connection_header()
         self.end_headers()
     
     def handle_list_directory(self):
@@ -177,7 +241,28 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             Path: /1/directory/<path>
             Request Headers:
                 x-privastore-session-id: <session-id>
+                If-None-Match: <etag> (optional)
+
+            Response Headers:
+                ETag: <etag>
             
+            The ETag changes when entries are added to or removed from the
+            directory, 304 (Not Modified) is returned if it matches.
+
+            Large directories can be listed in pages sorted by name
+            (directories and files together) with the query-string:
+
+                limit=<n> - Maximum number of entries (default 1000).
+                after=<name> - Start after this entry, the "next" value of the
+                 previous page.
+
+            The response body is then an object with the page's entries and
+            the "next" cursor (null on the last page).
+
+            With format=jsonl the entries (all of them, or those selected by
+            limit and after) are streamed one JSON array per line, as they
+            are listed from the database.
+
             Examples:
                 List "/foo/bar" containing two directories "dir_1" and "dir_2"
                 and a file "README.txt".
@@ -190,6 +275,30 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
                         ['f', 'README.txt']
                     ]
 
+                List the first two entries of "/foo/bar".
+
+                GET /1/directory/foo/bar?limit=2
+                Response Body:
+                    {
+                        'entries': [['f', 'README.txt'], ['d', 'dir_1']],
+                        'next': 'dir_1'
+                    }
+
+                GET /1/directory/foo/bar?limit=2&after=dir_1
+                Response Body:
+                    {
+                        'entries': [['d', 'dir_2']],
+                        'next': null
+                    }
+
+                Stream "/foo/bar".
+
+                GET /1/directory/foo/bar?format=jsonl
+                Response Body:
+                    ['f', 'README.txt']
+                    ['d', 'dir_1']
+                    ['d', 'dir_2']
+
         '''
         logging.debug('List directory request')
         self.wrap_sockets()
@@ -206,9 +315,44 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
         except:
             self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid directory path')
             return
+
+        try:
+            limit = self.url_query.get('limit')
+            if limit is not None:
+                limit = int(limit[-1])
+                if limit < 1 or limit > MAX_LIST_LIMIT:
+                    raise Exception()
+        except:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid listing limit')
+            return
+        after = self.url_query.get('after')
+        if after is not None:
+            after = after[-1]
+        list_format = self.url_query.get('format')
+        list_format = list_format[-1] if list_format is not None else LIST_FORMAT_JSON
+        if list_format not in (LIST_FORMAT_JSON, LIST_FORMAT_JSON_LINES):
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid listing format')
+            return
         
         try:
-            dir_entries = self.controller().list_directory(path)
+            # Checked before listing, a change while listing makes the next
+            # request list again.
+            directory_id, change_counter = self.controller().get_directory_version(path)
+            etag = '"d{}-{}"'.format(directory_id, change_counter)
+            if self.is_not_modified(etag):
+                self.send_not_modified(etag)
+                return
+            if list_format == LIST_FORMAT_JSON_LINES:
+                self.stream_directory(path, after, limit, etag)
+                return
+            if limit is not None or after is not None:
+                limit = limit if limit is not None else DEFAULT_LIST_LIMIT
+                # One more entry tells if there's a next page.
+                dir_entries = self.controller().list_directory_page(path, after, limit+1)
+                next_after = dir_entries[limit-1][1] if len(dir_entries) > limit else None
+                dir_entries = {'entries': dir_entries[:limit], 'next': next_after}
+            else:
+                dir_entries = self.controller().list_directory(path)
             dir_entries = json.dumps(dir_entries).encode('utf-8')
         except DirectoryError as e:
             self.handle_directory_error(e)
@@ -218,13 +362,37 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             log_exception_stack()
             return
 
-        self.send_response(HTTPStatus.OK)
-        self.send_header(CONTENT_TYPE_HEADER, CONTENT_TYPE_JSON)
-        self.send_header(CONTENT_LENGTH_HEADER, str(len(dir_entries)))
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
-        self.end_headers()
-        self.wfile.write(dir_entries)
+        self.send_json_response(dir_entries, etag)
     
+    def stream_directory(self, path: list[str], after: Optional[str], limit: Optional[int], etag: str):
+        entries = self.controller().iter_directory(path, after, limit)
+        # List the first page before responding, so errors get an error
+        # response.
+        entry = next(entries, None)
+
+        # Streamed listings are large, compress them whatever their size.
+        encoding = self.response_encoding()
+        self.send_response(HTTPStatus.OK)
+        self.send_header(CONTENT_TYPE_HEADER, CONTENT_TYPE_JSON_LINES)
+        self.send_vary_header()
+        self.send_validator_headers(etag, weak=encoding is not None)
+        writer = self.send_streamed_body_headers(encoding)
+        try:
+            buf = bytearray()
+            while entry is not None:
+                buf += json.dumps(entry).encode('utf-8') + b'\n'
+                if len(buf) >= LIST_STREAM_BUFFER_SIZE:
+                    writer.write(bytes(buf))
+                    buf.clear()
+                entry = next(entries, None)
+            writer.write(bytes(buf))
+            self.finish_streamed_body(writer)
+        except Exception as e:
+            # Too late for an error response, the client sees the body end
+            # early.
+            logging.error('Error streaming directory [{}]: {}'.format(str_path(path), str(e)))
+            self.close_connection = True
+
     def handle_get_file_metadata(self):
         '''
         
@@ -234,6 +402,10 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             Path: /1/file/<path>
             Request Headers:
                 x-privastore-session-id: <session-id>
+                If-None-Match: <etag> (optional)
+
+            Response Headers:
+                ETag: <etag>
             
             Examples:
                 Get file /foo/bar metadata.
@@ -277,6 +449,8 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
         try:
             file_metadata = self.controller().get_file_metadata(path, file_name)
             file_metadata = json.dumps(file_metadata).encode('utf-8')
+            # Metadata changes as the file is synced, tag the response itself.
+            etag = '"{}"'.format(hashlib.sha256(file_metadata).hexdigest()[:32])
         except DirectoryError as e:
             self.handle_directory_error(e)
             return
@@ -288,12 +462,97 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             log_exception_stack()
             return
 
-        self.send_response(HTTPStatus.OK)
-        self.send_header(CONTENT_TYPE_HEADER, CONTENT_TYPE_JSON)
-        self.send_header(CONTENT_LENGTH_HEADER, str(len(file_metadata)))
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
-        self.end_headers()
-        self.wfile.write(file_metadata)
+        if self.is_not_modified(etag):
+            self.send_not_modified(etag)
+            return
+
+        self.send_json_response(file_metadata, etag)
+
+    def handle_get_transfer_progress(self):
+        '''
+
+            Handle get file transfer progress API. With wait, the response
+            is held until the file's transfers report progress or finish (or
+            the wait times out) so clients can follow a transfer without
+            polling. Nothing is held if no transfer is in progress.
+
+            Method: GET
+            Path: /1/progress/<path>[?wait=<seconds>]
+            Request Headers:
+                x-privastore-session-id: <session-id>
+
+            Examples:
+                Get file /foo/bar transfer progress.
+
+                GET /1/progress/foo/bar
+                Response Body:
+                {
+                    "local-file-id": "F-5c0875e8-3551-41f6-9e44-bb8af4f1718e",
+                    "total-chunks": 5,
+                    "local-transfer-status": "SYNCED_DATA",
+                    "remote-transfer-status": "TRANSFERRING_DATA",
+                    "upload":
+                    {
+                        "transferred-chunks": 3,
+                        "in-progress": true
+                    },
+                    "download":
+                    {
+                        "transferred-chunks": 0,
+                        "in-progress": false
+                    }
+                }
+
+                Wait up to 30 seconds for the next change.
+
+                GET /1/progress/foo/bar?wait=30
+
+        '''
+        logging.debug('Get file transfer progress')
+        self.wrap_sockets()
+        self.read_body()
+        session_id = self.get_session_id()
+        if session_id is None:
+            return
+
+        if not self.heartbeat_session(session_id):
+            return
+
+        try:
+            path = self.parse_directory_path(self.url_path[PROGRESS_PATH_LEN:])
+            file_name = path.pop()
+        except:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid directory path or filename')
+            return
+
+        try:
+            wait = self.url_query.get('wait')
+            if wait is not None:
+                wait = float(wait[-1])
+                if wait < 0 or wait > MAX_PROGRESS_WAIT:
+                    raise Exception()
+        except:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid progress wait time')
+            return
+
+        try:
+            if wait is not None and wait > 0:
+                progress = self.controller().wait_for_transfer_progress(path, file_name, wait)
+            else:
+                progress = self.controller().get_transfer_progress(path, file_name)
+            progress = json.dumps(progress).encode('utf-8')
+        except DirectoryError as e:
+            self.handle_directory_error(e)
+            return
+        except FileError as e:
+            self.handle_file_error(e)
+            return
+        except Exception as e:
+            self.handle_internal_error(e)
+            log_exception_stack()
+            return
+
+        self.send_json_response(progress)
 
     def handle_upload_file(self):
         '''
@@ -304,6 +563,8 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             Path: /1/upload/<path>[?key=<key-id>]
             Request Headers:
                 Content-Length: <file-size (bytes)>
+                  or
+                Transfer-Encoding: chunked
                 Content-Type: <mime-type>
                 x-privastore-session-id: <session-id>
             Request Body:
@@ -326,30 +587,265 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid directory path or filename')
             return
         
-        if not self.parse_content_length():
+        if self.is_chunked_request():
+            # File size isn't known until the whole body is read.
+            self.wrap_chunked_body()
+            file_size = None
+        elif not self.parse_content_length():
             return
         elif self.content_len == 0:
             self.send_error_response(HTTPStatus.BAD_REQUEST, 'Missing file data')
             return
+        else:
+            file_size = self.content_len
+
+        key_id = self.get_key_id()
+        if key_id is None:
+            return
 
         try:
-            key_id = self.url_query.get('key')
-            if key_id is not None:
-                key_id = key_id[-1]
+            # TODO: Upload a new file version.
+            self.controller().upload_file(path, file_name, self.rfile, file_size, 1, key_id)
+        except AdmissionError as e:
+            self.handle_admission_error(e)
+            return
+        except DirectoryError as e:
+            self.handle_directory_error(e)
+            return
+        except FileError as e:
+            self.handle_file_error(e)
+            return
+        except ChunkedEncodingError as e:
+            self.close_connection = True
+            self.send_error_response(HTTPStatus.BAD_REQUEST, e)
+            return
+        except FileUploadError as e:
+            if e.error_code() != FileServerErrorCode.INVALID_FILE_SIZE:
+                self.handle_internal_error(e)
+                return
+            self.send_error_response(HTTPStatus.BAD_REQUEST, e)
+            return
+        except Exception as e:
+            self.handle_internal_error(e)
+            log_exception_stack()
+            return
 
-                if not Key.is_valid_key_id(key_id):
-                    self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid encryption key!')
-                    return
-            else:
-                # Default to encrypting using system key.
-                key_id = 'system'
+        self.send_response(HTTPStatus.OK)
+        self.send_header(CONTENT_LENGTH_HEADER, '0')
+        self.send_connection_header()
+        self.end_headers()
+    
+    def handle_start_multipart_upload(self):
+        '''
+
+            Handle start multipart upload API. The file is uploaded in parts
+            (see handle_upload_part) and created once the upload is completed.
+            Uploads not used for the expiry time are removed.
+
+            Method: POST
+            Path: /1/multipart/<path>[?key=<key-id>]
+            Request Headers:
+                x-privastore-session-id: <session-id>
+
+            Response Body:
+                {
+                    "upload-id": "U-5c0875e8-3551-41f6-9e44-bb8af4f1718e"
+                }
+
+        '''
+        logging.debug('Start multipart upload')
+        self.wrap_sockets()
+        self.read_body()
+        session_id = self.get_session_id()
+        if session_id is None:
+            return
+
+        if not self.heartbeat_session(session_id):
+            return
+
+        try:
+            path = self.parse_directory_path(self.url_path[MULTIPART_PATH_LEN:])
+            file_name = path.pop()
         except:
-            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid encryption key!')
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid directory path or filename')
+            return
+
+        key_id = self.get_key_id()
+        if key_id is None:
             return
 
         try:
-            # TODO: Upload a new file version.
-            self.controller().upload_file(path, file_name, self.rfile, self.content_len, 1, key_id)
+            upload_id = self.controller().start_multipart_upload(path, file_name, key_id)
+            response = json.dumps({"upload-id": upload_id}).encode('utf-8')
+        except FileError as e:
+            self.handle_file_error(e)
+            return
+        except Exception as e:
+            self.handle_internal_error(e)
+            log_exception_stack()
+            return
+
+        self.send_json_response(response)
+
+    def parse_upload_path(self) -> Optional[list[str]]:
+        '''
+            Parse /1/uploads/<upload-id>[/<part-num>].
+        '''
+        upload_path = self.url_path[UPLOADS_PATH_LEN:].split('/')
+        if len(upload_path) > 2 or len(upload_path[0]) == 0:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid upload path')
+            return
+        return upload_path
+
+    def handle_get_multipart_upload(self):
+        '''
+
+            Handle get multipart upload API. Lists the parts received so far.
+
+            Method: GET
+            Path: /1/uploads/<upload-id>
+            Request Headers:
+                x-privastore-session-id: <session-id>
+
+            Response Body:
+                {
+                    "upload-id": "U-5c0875e8-3551-41f6-9e44-bb8af4f1718e",
+                    "path": "/foo/bar",
+                    "expires": "2024-01-01 12:00:00",
+                    "parts": [
+                        {
+                            "part": 1,
+                            "size": 1048576
+                        }
+                    ]
+                }
+
+        '''
+        logging.debug('Get multipart upload')
+        self.wrap_sockets()
+        self.read_body()
+        session_id = self.get_session_id()
+        if session_id is None:
+            return
+
+        if not self.heartbeat_session(session_id):
+            return
+
+        upload_path = self.parse_upload_path()
+        if upload_path is None:
+            return
+        elif len(upload_path) != 1:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid upload path')
+            return
+
+        try:
+            response = json.dumps(self.controller().get_multipart_upload(upload_path[0])).encode('utf-8')
+        except FileError as e:
+            self.handle_file_error(e)
+            return
+        except Exception as e:
+            self.handle_internal_error(e)
+            log_exception_stack()
+            return
+
+        self.send_json_response(response)
+
+    def handle_upload_part(self):
+        '''
+
+            Handle upload part API. Parts are numbered from 1, they may be
+            uploaded in any order and in parallel. A part uploaded again
+            replaces the earlier one.
+
+            Method: PUT
+            Path: /1/uploads/<upload-id>/<part-num>
+            Request Headers:
+                Content-Length: <part-size (bytes)>
+                x-privastore-session-id: <session-id>
+            Request Body:
+                <part bytes>
+
+        '''
+        logging.debug('Upload part')
+        self.wrap_sockets()
+        session_id = self.get_session_id()
+        if session_id is None:
+            return
+
+        if not self.heartbeat_session(session_id):
+            return
+
+        upload_path = self.parse_upload_path()
+        if upload_path is None:
+            return
+        elif len(upload_path) != 2:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid upload path')
+            return
+
+        try:
+            part_num = int(upload_path[1])
+        except:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid part number')
+            return
+
+        if not self.parse_content_length():
+            return
+        elif self.content_len == 0:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Missing part data')
+            return
+
+        try:
+            self.controller().upload_part(upload_path[0], part_num, self.rfile, self.content_len)
+        except AdmissionError as e:
+            self.handle_admission_error(e)
+            return
+        except FileError as e:
+            self.handle_file_error(e)
+            return
+        except Exception as e:
+            self.handle_internal_error(e)
+            log_exception_stack()
+            return
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header(CONTENT_LENGTH_HEADER, '0')
+        self.send_connection_header()
+        self.end_headers()
+
+    def handle_complete_multipart_upload(self):
+        '''
+
+            Handle complete multipart upload API. Creates the file from parts
+            1 to N, none may be missing.
+
+            Method: POST
+            Path: /1/uploads/<upload-id>
+            Request Headers:
+                x-privastore-session-id: <session-id>
+
+        '''
+        logging.debug('Complete multipart upload')
+        self.wrap_sockets()
+        self.read_body()
+        session_id = self.get_session_id()
+        if session_id is None:
+            return
+
+        if not self.heartbeat_session(session_id):
+            return
+
+        upload_path = self.parse_upload_path()
+        if upload_path is None:
+            return
+        elif len(upload_path) != 1:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid upload path')
+            return
+
+        try:
+            self.controller().complete_multipart_upload(upload_path[0])
+        except AdmissionError as e:
+            self.handle_admission_error(e)
+            return
         except DirectoryError as e:
             self.handle_directory_error(e)
             return
@@ -363,9 +859,53 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
 
         self.send_response(HTTPStatus.OK)
         self.send_header(CONTENT_LENGTH_HEADER, '0')
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
+        self.send_connection_header()
         self.end_headers()
-    
+
+    def handle_abort_multipart_upload(self):
+        '''
+
+            Handle abort multipart upload API. Removes the upload and its
+            parts.
+
+            Method: DELETE
+            Path: /1/uploads/<upload-id>
+            Request Headers:
+                x-privastore-session-id: <session-id>
+
+        '''
+        logging.debug('Abort multipart upload')
+        self.wrap_sockets()
+        self.read_body()
+        session_id = self.get_session_id()
+        if session_id is None:
+            return
+
+        if not self.heartbeat_session(session_id):
+            return
+
+        upload_path = self.parse_upload_path()
+        if upload_path is None:
+            return
+        elif len(upload_path) != 1:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid upload path')
+            return
+
+        try:
+            self.controller().abort_multipart_upload(upload_path[0])
+        except FileError as e:
+            self.handle_file_error(e)
+            return
+        except Exception as e:
+            self.handle_internal_error(e)
+            log_exception_stack()
+            return
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header(CONTENT_LENGTH_HEADER, '0')
+        self.send_connection_header()
+        self.end_headers()
+
     def handle_download_file(self):
         '''
 
@@ -376,10 +916,18 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             Path: /1/download/<path>[?version=<v>]
             Request Headers:
                 x-privastore-session-id: <session-id>
+                If-None-Match: <etag> (optional)
+                If-Modified-Since: <date> (optional)
             
             Response Headers:
                 Content-Length: <file-size (in bytes)>
                 Content-Type: <mime-type>
+                ETag: <etag>
+                Last-Modified: <date>
+
+            The ETag is derived from the file data id and version, 304 (Not
+            Modified) is returned without reading the file if the client's
+            copy is current.
             Response Body:
                 <file-bytes>
 
@@ -407,7 +955,13 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             metadata_only = True
         
         try:
-            self.controller().download_file(path, file_name, self.wfile, file_version, api_callback=self.send_download_file_headers, metadata_only=metadata_only)
+            sock = self.connection if self.sendfile_enabled() else None
+            self._download_etag = None
+            self._download_last_modified = None
+            self.controller().download_file(path, file_name, self.wfile, file_version, api_callback=self.send_download_file_headers, metadata_only=metadata_only, sock=sock, check_modified=self.check_download_modified)
+        except AdmissionError as e:
+            self.handle_admission_error(e)
+            return
         except DirectoryError as e:
             self.handle_directory_error(e)
             return
@@ -419,6 +973,14 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             log_exception_stack()
             return
     
+    def check_download_modified(self, file_id, version, created_timestamp) -> bool:
+        self._download_etag = '"{}-{}"'.format(file_id, version)
+        self._download_last_modified = created_timestamp
+        if self.is_not_modified(self._download_etag, created_timestamp):
+            self.send_not_modified(self._download_etag, created_timestamp)
+            return False
+        return True
+
     def send_download_file_headers(self, file_id, file_type, file_size):
         logging.debug('Send download file headers [{}] [{}] [{}]'.format(file_id, file_type.mime_type, file_size))
         self.send_response(HTTPStatus.OK)
@@ -427,6 +989,9 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             self.send_header(CONTENT_LENGTH_HEADER, str(file_size))
         else:
             self.send_header(CONTENT_LENGTH_HEADER, '0')
+        if self._download_etag is not None:
+            self.send_validator_headers(self._download_etag, self._download_last_modified)
+        self.send_connection_header()
         self.end_headers()
     
     def handle_remove_file(self):
@@ -474,5 +1039,128 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
 
         self.send_response(HTTPStatus.OK)
         self.send_header(CONTENT_LENGTH_HEADER, '0')
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
+        self.send_connection_header()
+        self.end_headers()
+
+    def handle_get_metrics(self):
+        '''
+
+            Handle get metrics API.
+
+            Method: GET
+            Path: /1/metrics
+            Request Headers:
+                x-privastore-session-id: <session-id>
+
+            Examples:
+                GET /1/metrics
+                Response Body:
+                {
+                    "bandwidth":
+                    {
+                        "upload":
+                        {
+                            "limit": 262144,
+                            "current-limit": 262144,
+                            "burst": 262144,
+                            "schedule": "23:00-07:00=unlimited",
+                            "bytes": 10485760,
+                            "throttled-time": 38.2,
+                            "throttled-count": 10
+                        },
+                        "download": { ... },
+                        "total": { ... }
+                    }
+                }
+
+        '''
+        logging.debug('Get metrics')
+        self.wrap_sockets()
+        self.read_body()
+        session_id = self.get_session_id()
+        if session_id is None:
+            return
+        
+        if not self.heartbeat_session(session_id):
+            return
+
+        try:
+            metrics = self.controller().get_metrics()
+            metrics = json.dumps(metrics).encode('utf-8')
+        except Exception as e:
+            self.handle_internal_error(e)
+            log_exception_stack()
+            return
+
+        self.send_json_response(metrics)
+
+    def handle_set_bandwidth_limit(self):
+        '''
+
+            Handle set bandwidth limit API.
+            Set the remote transfer bandwidth limit, burst size and/or
+            time-of-day schedule at runtime. A limit of 0 removes the limit, a
+            schedule of "none" removes the schedule. Anything not given keeps
+            its current value.
+
+            Method: PUT
+            Path: /1/bandwidth?[direction=<upload|download|total>][&limit=<rate>][&burst=<size>][&schedule=<schedule>]
+            Request Headers:
+                x-privastore-session-id: <session-id>
+
+            Examples:
+                Limit uploads to 256KB/s.
+                PUT /1/bandwidth?direction=upload&limit=256KB
+
+                Let uploads burst up to 4MB.
+                PUT /1/bandwidth?direction=upload&burst=4MB
+
+                Unlimited bandwidth overnight, 1MB/s during the day.
+                PUT /1/bandwidth?schedule=23:00-07:00=0,07:00-23:00=1MB
+
+        '''
+        logging.debug('Set bandwidth limit')
+        self.wrap_sockets()
+        self.read_body()
+        session_id = self.get_session_id()
+        if session_id is None:
+            return
+        
+        if not self.heartbeat_session(session_id):
+            return
+
+        try:
+            direction = self.url_query.get('direction')
+            direction = direction[-1] if direction is not None else TOTAL
+            if direction not in DIRECTIONS:
+                raise Exception('Invalid direction')
+            limit = self.url_query.get('limit')
+            if limit is not None:
+                limit = parse_rate(limit[-1])
+            burst = self.url_query.get('burst')
+            if burst is not None:
+                burst = parse_mem_size(burst[-1])
+            schedule = self.url_query.get('schedule')
+            clear_schedule = False
+            if schedule is not None:
+                schedule = schedule[-1]
+                if schedule == 'none':
+                    schedule = None
+                    clear_schedule = True
+                else:
+                    schedule = RateSchedule.parse(schedule)
+        except:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid bandwidth limit')
+            return
+
+        try:
+            self.controller().set_bandwidth_limit(direction, limit, schedule, clear_schedule, burst)
+        except Exception as e:
+            self.handle_internal_error(e)
+            log_exception_stack()
+            return
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header(CONTENT_LENGTH_HEADER, '0')
+        self.send_connection_header()
         self.end_headers()
\ No newline at end of file
@@ -1,73 +1,248 @@
-from .async_worker import AsyncWorker
+from .async_worker import AsyncWorker, create_remote_client
+from .asyncio_transfer_engine import ASYNCIO_ENGINE, AsyncioTransferEngine, THREAD_ENGINE, TRANSFER_ENGINES
+from ..bandwidth_limiter import BandwidthLimiter
+from ..chunk_batch import MAX_BATCH_CHUNKS
+from ..endpoint_selector import EndpointSelector, HealthProber
+from ..erasure import ErasureCode
 import configparser
 from .commit_file_task import CommitFileTask
 from ..daemon import Daemon
 from .db.dao_factory import DAOFactory
-from .db.file_dao import FileVersionMetadata
+from .db.task_dao import DOWNLOAD_WORKER, TaskMetadata, UPLOAD_WORKER
 from ..db.db_conn_mgr import DbConnectionManager
 from .database import DbWrapper
 from .delete_file_task import DeleteFileTask
 from .download_worker import DownloadWorker
-from ..error import FileDeleteError, FileDownloadError, FileServerErrorCode, FileUploadError
-from ..file import File
+from ..error import FileDeleteError, FileDownloadError, FileServerError, FileServerErrorCode, FileUploadError, WorkerError
 from ..file_cache import FileCache
 from .file_task import FileTask
 from .file_transfer_status import FileTransferStatus
 import logging
-from queue import Queue
+from concurrent.futures import CancelledError, wait
+from queue import Empty, Full, Queue
 from threading import RLock
 import time
+from .task_future import TaskFuture
+from .task_status import TaskStatus
 from .transfer_file_task import TransferFileTask
-from typing import Union
+from typing import Callable, Optional, Union
 from .upload_worker import UploadWorker
+from ..remote_client import RemoteClient, TRANSPORT_BINARY, TRANSPORT_HTTP
+from ..remote_session import RemoteSession, SessionHeartbeat
+from ..retry_policy import RetryPolicy
 from ..util.file import config_bool
+import uuid
 from ..worker_task import PingWorkerTask, WorkerTask
 
+#
+# Errors that won't go away by retrying the task.
+#
+NON_RETRYABLE_ERRORS = [
+    FileServerErrorCode.FILE_IS_COMMITTED,
+    FileServerErrorCode.FILE_NOT_FOUND,
+    FileServerErrorCode.FILE_VERSION_NOT_FOUND,
+    FileServerErrorCode.INVALID_FILE_ID,
+    FileServerErrorCode.REMOTE_DOWNLOAD_CANCELLED,
+    FileServerErrorCode.REMOTE_UPLOAD_CANCELLED,
+]
+
 class AsyncController(Daemon):
 
-    def __init__(self, remote_config: Union[dict, configparser.ConfigParser], dao_factory: DAOFactory, db_conn_mgr: DbConnectionManager, store: FileCache):
+    '''
+        Runs remote transfer (upload, commit, delete and download) tasks in the
+        background.
+
+        Tasks are persisted in the database so queued work survives restarts.
+        The controller leases ready tasks in batches and hands them to the
+        workers, tasks that fail are retried with exponential backoff until
+        they run out of retries.
+
+        Pre-forked servers (a shared store) each run a controller with its
+        own lease owner, a task may be run by any of them. Tasks are only
+        recovered (see recover_tasks) if recover is set, by the first server
+        started.
+    '''
+    def __init__(self, remote_config: Union[dict, configparser.ConfigParser], dao_factory: DAOFactory, db_conn_mgr: DbConnectionManager, store: FileCache, recover: bool=True):
         super().__init__('async-controller')
 
         self._db = DbWrapper(dao_factory, db_conn_mgr)
         self._store = store
+        self._shared = store.shared()
+        self._recover = recover
 
         self._remote_enabled = config_bool(remote_config.get('enable-remote-server', '1'))
+        self._transfer_engine_type = remote_config.get('transfer-engine', THREAD_ENGINE)
+        if self._transfer_engine_type not in TRANSFER_ENGINES:
+            raise WorkerError('Invalid transfer engine [{}]'.format(self._transfer_engine_type))
         self._num_upload_workers = int(remote_config.get('num-upload-workers', '1'))
         self._num_download_workers = int(remote_config.get('num-download-workers', '1'))
         worker_queue_size = int(remote_config.get('worker-queue-size', '100'))
         worker_retry_interval = int(remote_config.get('worker-retry-interval', '1'))
         self._worker_io_timeout = worker_io_timeout = int(remote_config.get('worker-io-timeout', '90'))
-
+        self._task_lease_time = int(remote_config.get('task-lease-time', '300'))
+        self._task_max_retries = int(remote_config.get('task-max-retries', '5'))
+        self._task_retry_backoff = float(remote_config.get('task-retry-backoff', '1'))
+        self._task_max_retry_backoff = float(remote_config.get('task-max-retry-backoff', '300'))
+        self._task_batch_size = int(remote_config.get('task-batch-size', str(worker_queue_size)))
+        self._task_poll_interval = float(remote_config.get('task-poll-interval', '1'))
+        self._sync_upload_timeout = float(remote_config.get('sync-upload-timeout', str(worker_io_timeout)))
+        self._sync_download_timeout = float(remote_config.get('sync-download-timeout', str(worker_io_timeout)))
+        self._task_lease_owner = 'async-controller-{}'.format(uuid.uuid4())
+        self._last_lease_renewal = time.monotonic()
+
+        logging.debug('Transfer engine: [{}]'.format(self._transfer_engine_type))
         logging.debug('Num upload workers: [{}]'.format(self._num_upload_workers))
         logging.debug('Num download workers: [{}]'.format(self._num_download_workers))
         logging.debug('Worker queue size: [{}]'.format(worker_queue_size))
         logging.debug('Worker I/O timeout: [{}s]'.format(worker_io_timeout))
         logging.debug('Worker retry interval: [{}s]'.format(worker_retry_interval))
+        logging.debug('Task lease time: [{}s]'.format(self._task_lease_time))
+        logging.debug('Task max retries: [{}]'.format(self._task_max_retries))
+        logging.debug('Task retry backoff: [{}s]'.format(self._task_retry_backoff))
+        logging.debug('Task batch size: [{}]'.format(self._task_batch_size))
+        logging.debug('Task poll interval: [{}s]'.format(self._task_poll_interval))
+        logging.debug('Sync upload timeout: [{}s]'.format(self._sync_upload_timeout))
+        logging.debug('Sync download timeout: [{}s]'.format(self._sync_download_timeout))
+
+        self._bandwidth_limiter = BandwidthLimiter.from_config(remote_config)
+        # Endpoint health is shared by all transfers.
+        self._endpoint_selector = EndpointSelector.from_config(remote_config)
+        endpoint_probe_interval = float(remote_config.get('endpoint-probe-interval', '10'))
+        logging.debug('Endpoint probe interval: [{}s]'.format(endpoint_probe_interval))
+        self._retry_policy = RetryPolicy.from_config(remote_config)
+        self._transfer_batch_chunks = int(remote_config.get('transfer-batch-chunks', '8'))
+        if self._transfer_batch_chunks < 1 or self._transfer_batch_chunks > MAX_BATCH_CHUNKS:
+            raise WorkerError('Invalid transfer batch chunks [{}]. Must be between 1 and {}'.format(self._transfer_batch_chunks, MAX_BATCH_CHUNKS))
+        logging.debug('Transfer batch chunks: [{}]'.format(self._transfer_batch_chunks))
+        self._remote_transport = remote_config.get('remote-transport', TRANSPORT_HTTP)
+        if self._remote_transport != TRANSPORT_HTTP and self._remote_transport != TRANSPORT_BINARY:
+            raise WorkerError('Invalid remote transport [{}]. Must be {} or {}'.format(self._remote_transport, TRANSPORT_HTTP, TRANSPORT_BINARY))
+        logging.debug('Remote transport: [{}]'.format(self._remote_transport))
+        self._replication_factor = int(remote_config.get('replication-factor', '1'))
+        erasure_data_shards = int(remote_config.get('erasure-data-shards', '0'))
+        erasure_parity_shards = int(remote_config.get('erasure-parity-shards', '2'))
+        self._erasure_code: Optional[ErasureCode] = None
+        if erasure_data_shards > 0:
+            try:
+                self._erasure_code = ErasureCode(erasure_data_shards, erasure_parity_shards)
+            except ValueError as e:
+                raise WorkerError('Invalid erasure code: {}'.format(str(e)))
+            if self._replication_factor != 1:
+                raise WorkerError('Replication and erasure coding can\'t both be enabled')
+            # Shards that must acknowledge writes, at least the k needed to
+            # read the file back.
+            min_quorum = erasure_data_shards
+            max_quorum = self._erasure_code.total_shards()
+            self._write_quorum = int(remote_config.get('write-quorum', str(min(erasure_data_shards + 1, max_quorum))))
+        else:
+            min_quorum = 1
+            max_quorum = self._replication_factor
+            self._write_quorum = int(remote_config.get('write-quorum', str(self._replication_factor // 2 + 1)))
+        if self._replication_factor < 1 or self._write_quorum < min_quorum or self._write_quorum > max_quorum:
+            raise WorkerError('Invalid write quorum [{}]. Must be between {} and {}'.format(self._write_quorum, min_quorum, max_quorum))
+        if (self._replication_factor > 1 or self._erasure_code is not None) and self._transfer_engine_type == ASYNCIO_ENGINE:
+            raise WorkerError('Replication and erasure coding are not supported by the {} transfer engine'.format(ASYNCIO_ENGINE))
+        if self._remote_transport != TRANSPORT_HTTP and self._transfer_engine_type == ASYNCIO_ENGINE:
+            raise WorkerError('The {} remote transport is not supported by the {} transfer engine'.format(self._remote_transport, ASYNCIO_ENGINE))
+        logging.debug('Replication factor: [{}]'.format(self._replication_factor))
+        if self._erasure_code is not None:
+            logging.debug('Erasure code: [{}] data shards [{}] parity shards'.format(erasure_data_shards, erasure_parity_shards))
+        logging.debug('Write quorum: [{}]'.format(self._write_quorum))
+        self._health_prober = HealthProber(self._endpoint_selector, endpoint_probe_interval, min(endpoint_probe_interval, worker_io_timeout))
+        # Workers share one remote session, idle sessions are renewed in the
+        # background before they expire (0 disables the heartbeats).
+        session_heartbeat_interval = float(remote_config.get('session-heartbeat-interval', '60'))
+        logging.debug('Session heartbeat interval: [{}s]'.format(session_heartbeat_interval))
+        self._remote_session = RemoteSession(session_heartbeat_interval)
+        self._session_heartbeat: Optional[SessionHeartbeat] = None
+        self._heartbeat_client: Optional[RemoteClient] = None
+
+        #
+        # The number of tasks in flight is bounded by the worker queues (or
+        # the transfer engine's max transfers) so the completion queue doesn't
+        # need to be.
+        #
+        self._completion_queue: Queue[WorkerTask] = Queue()
+        self._transfer_engine: Optional[AsyncioTransferEngine] = None
+        if self._transfer_engine_type == ASYNCIO_ENGINE:
+            self.create_transfer_engine(remote_config, dao_factory, db_conn_mgr, store, worker_retry_interval, worker_io_timeout)
+        else:
+            self.create_workers(dao_factory, db_conn_mgr, store, worker_queue_size, worker_retry_interval, worker_io_timeout)
+        if session_heartbeat_interval > 0:
+            self._heartbeat_client = create_remote_client(self._db, worker_retry_interval, endpoint_selector=self._endpoint_selector, retry_policy=self._retry_policy, remote_session=self._remote_session)
+            self._session_heartbeat = SessionHeartbeat(lambda: self._heartbeat_client.renew_sessions(timeout=min(session_heartbeat_interval, worker_io_timeout)), session_heartbeat_interval / 2)
+
+        self._async_lock = RLock()
+        # Tasks dispatched to workers by task id.
+        self._active_tasks: dict[int, tuple[TaskMetadata, FileTask]] = dict()
+        # Unresolved task futures by task id.
+        self._futures: dict[int, TaskFuture] = dict()
 
-        self._completion_queue: Queue[WorkerTask] = Queue(worker_queue_size*2)
+    def create_workers(self, dao_factory: DAOFactory, db_conn_mgr: DbConnectionManager, store: FileCache, worker_queue_size: int, worker_retry_interval: int, worker_io_timeout: int):
         self._upload_workers: list[UploadWorker]= []
         for i in range(self._num_upload_workers):
-            self._upload_workers.append(UploadWorker(dao_factory, db_conn_mgr, 
-                store, worker_index=i, queue_size=worker_queue_size, 
-                completion_queue=self._completion_queue, 
-                retry_interval=worker_retry_interval, 
-                io_timeout=worker_io_timeout))
+            self._upload_workers.append(UploadWorker(dao_factory, db_conn_mgr,
+                store, worker_index=i, queue_size=worker_queue_size,
+                completion_queue=self._completion_queue,
+                retry_interval=worker_retry_interval,
+                io_timeout=worker_io_timeout,
+                bandwidth_limiter=self._bandwidth_limiter,
+                endpoint_selector=self._endpoint_selector,
+                retry_policy=self._retry_policy,
+                batch_chunks=self._transfer_batch_chunks,
+                transport=self._remote_transport,
+                replication_factor=self._replication_factor,
+                write_quorum=self._write_quorum,
+                erasure_code=self._erasure_code,
+                remote_session=self._remote_session))
         self._download_workers: list[DownloadWorker]= []
         for i in range(self._num_download_workers):
-            self._download_workers.append(DownloadWorker(dao_factory, db_conn_mgr, 
-                store, worker_index=i, queue_size=worker_queue_size, 
-                completion_queue=self._completion_queue, 
-                retry_interval=worker_retry_interval, 
-                io_timeout=worker_io_timeout))
-        
-        self._async_lock = RLock()
-        self._upload_tasks: dict[str, list[FileTask]] = dict()
-        self._download_tasks: dict[str, TransferFileTask] = dict()
-        self._delete_tasks: dict[str, DeleteFileTask] = dict()
-    
+            self._download_workers.append(DownloadWorker(dao_factory, db_conn_mgr,
+                store, worker_index=i, queue_size=worker_queue_size,
+                completion_queue=self._completion_queue,
+                retry_interval=worker_retry_interval,
+                io_timeout=worker_io_timeout,
+                bandwidth_limiter=self._bandwidth_limiter,
+                endpoint_selector=self._endpoint_selector,
+                retry_policy=self._retry_policy,
+                batch_chunks=self._transfer_batch_chunks,
+                transport=self._remote_transport,
+                replication_factor=self._replication_factor,
+                write_quorum=self._write_quorum,
+                erasure_code=self._erasure_code,
+                remote_session=self._remote_session))
+
+    def create_transfer_engine(self, remote_config: Union[dict, configparser.ConfigParser], dao_factory: DAOFactory, db_conn_mgr: DbConnectionManager, store: FileCache, worker_retry_interval: int, worker_io_timeout: int):
+        '''
+            Run all transfers on a single asyncio event loop. The engine stands
+            in for the upload and download workers.
+        '''
+        max_transfers = int(remote_config.get('max-concurrent-transfers', '100'))
+        transfer_window = int(remote_config.get('transfer-window', '4'))
+        executor_threads = int(remote_config.get('transfer-engine-threads', '8'))
+        logging.debug('Max concurrent transfers: [{}]'.format(max_transfers))
+        logging.debug('Transfer window: [{}]'.format(transfer_window))
+        logging.debug('Transfer engine threads: [{}]'.format(executor_threads))
+
+        self._transfer_engine = AsyncioTransferEngine(dao_factory, db_conn_mgr,
+            store, completion_queue=self._completion_queue,
+            max_transfers=max_transfers, transfer_window=transfer_window,
+            executor_threads=executor_threads,
+            retry_interval=worker_retry_interval,
+            io_timeout=worker_io_timeout,
+            bandwidth_limiter=self._bandwidth_limiter,
+            endpoint_selector=self._endpoint_selector,
+            retry_policy=self._retry_policy,
+            batch_chunks=self._transfer_batch_chunks,
+            remote_session=self._remote_session)
+        self._num_upload_workers = 1
+        self._num_download_workers = 1
+        self._upload_workers = [self._transfer_engine.upload_worker()]
+        self._download_workers = [self._transfer_engine.download_worker()]
+
     def db(self):
         return self._db
-    
+
     def store(self):
         return self._store
 
@@ -77,64 +252,117 @@ class AsyncController(Daemon):
     def worker_io_timeout(self):
         return self._worker_io_timeout
 
-    def has_upload(self, local_file_id: str):
-        with self._async_lock:
-            return local_file_id in self._upload_tasks
-    
-    def has_download(self, local_file_id: str):
-        with self._async_lock:
-            return local_file_id in self._download_tasks
+    def sync_upload_timeout(self):
+        return self._sync_upload_timeout
 
-    def has_delete(self, local_file_id: str):
-        with self._async_lock:
-            return local_file_id in self._delete_tasks
+    def sync_download_timeout(self):
+        return self._sync_download_timeout
 
-    def add_upload_task(self, local_file_id: str, task: TransferFileTask):
-        with self._async_lock:
-            if self.has_upload(local_file_id):
-                raise FileUploadError('File [{}] already being uploaded'.format(local_file_id))
-            self._upload_tasks[local_file_id] = [task]
+    def bandwidth_limiter(self) -> BandwidthLimiter:
+        return self._bandwidth_limiter
 
-    def add_commit_task(self, local_file_id: str, task: CommitFileTask):
-        with self._async_lock:
-            if not self.has_upload(local_file_id):
-                raise FileUploadError('File [{}] not being uploaded'.format(local_file_id))
-            self._upload_tasks[local_file_id].append(task)
+    def endpoint_selector(self) -> EndpointSelector:
+        return self._endpoint_selector
 
-    def add_delete_task(self, local_file_id: str, task: DeleteFileTask):
-        with self._async_lock:
-            if self.has_delete(local_file_id):
-                raise FileDeleteError('File [{}] already being deleted'.format(local_file_id))
-            self._delete_tasks[local_file_id] = task
+    def retry_policy(self) -> RetryPolicy:
+        return self._retry_policy
 
-    def add_download_task(self, local_file_id: str, task: TransferFileTask):
-        with self._async_lock:
-            if self.has_download(local_file_id):
-                raise FileDownloadError('File [{}] already being downloaded'.format(local_file_id))
-            self._download_tasks[local_file_id] = task
+    def remote_session(self) -> RemoteSession:
+        return self._remote_session
 
-    def get_upload_tasks(self, local_file_id: str) -> list[FileTask]:
-        with self._async_lock:
-            return self._upload_tasks.get(local_file_id)
+    def task_lease_owner(self) -> str:
+        return self._task_lease_owner
 
-    def get_download_task(self, local_file_id: str) -> TransferFileTask:
-        with self._async_lock:
-            return self._download_tasks.get(local_file_id)
+    def has_tasks(self, local_file_id: str, worker_type: str, task_code: Optional[int]=None) -> bool:
+        for task in self.db().list_tasks(local_file_id, worker_type):
+            if task.status == TaskStatus.FAILED:
+                continue
+            if task_code is None or task.task_code == task_code:
+                return True
+        return False
 
-    def remove_upload_task(self, local_file_id: str):
+    def has_upload(self, local_file_id: str):
+        return self.has_tasks(local_file_id, UPLOAD_WORKER, TransferFileTask.TASK_CODE) or self.has_tasks(local_file_id, UPLOAD_WORKER, CommitFileTask.TASK_CODE)
+
+    def has_download(self, local_file_id: str):
+        return self.has_tasks(local_file_id, DOWNLOAD_WORKER)
+
+    def has_delete(self, local_file_id: str):
+        return self.has_tasks(local_file_id, UPLOAD_WORKER, DeleteFileTask.TASK_CODE)
+
+    @staticmethod
+    def task_key(worker_type: str, task_code: int, local_file_id: str) -> str:
+        return '{}:{}:{}'.format(worker_type, task_code, local_file_id)
+
+    def add_task(self, worker_type: str, task_code: int, local_file_id: str, epoch_no: Optional[int]=None, file_size: Optional[int]=None) -> TaskFuture:
+        '''
+            Persist a task and return its future. Tasks are idempotent, adding
+            a task that is already queued returns the existing task's future.
+        '''
+        task_key = self.task_key(worker_type, task_code, local_file_id)
+        with self._async_lock:
+            task_id, added = self.db().add_task(task_key, worker_type, task_code, local_file_id, epoch_no, file_size)
+            future = self.get_future(task_id, task_key, worker_type, task_code, local_file_id)
+        if added:
+            logging.debug('Added task [{}] id [{}]'.format(task_key, task_id))
+            self.wake()
+        else:
+            logging.debug('Task [{}] id [{}] already queued'.format(task_key, task_id))
+        return future
+
+    def add_leased_task(self, worker_type: str, task_code: int, local_file_id: str, epoch_no: Optional[int]=None, file_size: Optional[int]=None) -> Optional[TaskMetadata]:
+        '''
+            Persist a task leased to this controller, for it to dispatch (see
+            dispatch_task). Returns None if the task is already queued.
+        '''
+        task_key = self.task_key(worker_type, task_code, local_file_id)
+        task_id, added = self.db().add_task(task_key, worker_type, task_code, local_file_id, epoch_no, file_size, self._task_lease_owner, self._task_lease_time)
+        if not added:
+            logging.debug('Task [{}] id [{}] already queued'.format(task_key, task_id))
+            return None
+        logging.debug('Added leased task [{}] id [{}]'.format(task_key, task_id))
+        return self.db().get_task(task_id)
+
+    def get_future(self, task_id: int, task_key: str, worker_type: str, task_code: int, local_file_id: str) -> TaskFuture:
+        with self._async_lock:
+            future = self._futures.get(task_id)
+            if future is None or future.done():
+                future = self._futures[task_id] = TaskFuture(task_id, task_key, worker_type, task_code, local_file_id)
+            return future
+
+    def get_futures(self, local_file_id: str, worker_type: Optional[str]=None) -> list[TaskFuture]:
+        '''
+            Return the futures of the file's unresolved tasks. Callers can
+            wait on them or subscribe to progress and completion.
+        '''
         with self._async_lock:
-            if local_file_id in self._upload_tasks:
-                self._upload_tasks.pop(local_file_id)
+            return [future for future in self._futures.values() if future.local_file_id() == local_file_id and (worker_type is None or future.worker_type() == worker_type)]
 
-    def remove_download_task(self, local_file_id: str):
+    def resolve_future(self, task_id: int, error: Optional[Exception]=None, cancelled: bool=False) -> None:
         with self._async_lock:
-            if local_file_id in self._download_tasks:
-                self._download_tasks.pop(local_file_id)
+            future = self._futures.pop(task_id, None)
+        if future is None or future.done():
+            return
+        if cancelled:
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(None)
+
+    def wake(self):
+        '''
+            Wake up the controller to dispatch newly added tasks.
+        '''
+        try:
+            self._completion_queue.put(PingWorkerTask(), block=False)
+        except Full:
+            # Controller is busy and will pick up the tasks anyway.
+            pass
 
-    def remove_delete_task(self, local_file_id: str):
+    def get_active_tasks(self, local_file_id: str, worker_type: str) -> list[FileTask]:
         with self._async_lock:
-            if local_file_id in self._delete_tasks:
-                self._delete_tasks.pop(local_file_id)
+            return [task for task_metadata, task in self._active_tasks.values() if task_metadata.local_id == local_file_id and task_metadata.worker_type == worker_type]
 
     def get_upload_worker(self, local_file_id: str) -> UploadWorker:
         return self._upload_workers[hash(local_file_id) % self._num_upload_workers]
@@ -142,38 +370,61 @@ class AsyncController(Daemon):
     def get_download_worker(self, local_file_id: str) -> DownloadWorker:
         return self._download_workers[hash(local_file_id) % self._num_download_workers]
 
-    def start_upload(self, local_file_id: str, file_size: int, timeout: float=None):
+    def start_upload(self, local_file_id: str, file_size: int) -> TaskFuture:
         logging.debug('Starting async upload file [{}]'.format(local_file_id))
-        task = TransferFileTask(local_file_id, file_size, is_commit=False)
-        self.add_upload_task(local_file_id, task)
-        self.get_upload_worker(local_file_id).send_task(task, timeout=timeout)
+        if self.has_upload(local_file_id):
+            raise FileUploadError('File [{}] already being uploaded'.format(local_file_id))
+        future = self.add_task(UPLOAD_WORKER, TransferFileTask.TASK_CODE, local_file_id, file_size=file_size)
+        # The upload streams from the cache while it is written, start it now.
+        self.dispatch_tasks(UPLOAD_WORKER, self.get_upload_worker)
         logging.debug('Started async upload file [{}]'.format(local_file_id))
-        return task
+        return future
 
-    def commit_upload(self, local_file_id: str, timeout: float=None):
+    def commit_upload(self, local_file_id: str) -> TaskFuture:
         # TODO: Epoch handling.
         logging.debug('Starting async commit file [{}]'.format(local_file_id))
-        task = CommitFileTask(local_file_id, epoch_no=1)
-        self.add_commit_task(local_file_id, task)
         #
-        # We can send a commit task immediately as the worker will check the
-        # remote transfer state of the file before actually committing.
+        # The commit task is only leased after the transfer task for the file
+        # completes.
         #
-        self.get_upload_worker(local_file_id).send_task(task, timeout=timeout)
+        future = self.add_task(UPLOAD_WORKER, CommitFileTask.TASK_CODE, local_file_id, epoch_no=1)
         logging.debug('Started async commit file [{}]'.format(local_file_id))
-        return task
+        return future
+
+    def resume_upload(self, local_file_id: str) -> list[TaskFuture]:
+        '''
+            Resume uploading a file that was fully received locally but not
+            synced to the remote server (ex. after a restart). The transfer
+            worker picks up from the last chunk acknowledged by the remote
+            server. If the data was already transferred only commit the file.
+        '''
+        file_metadata = self.db().get_file_metadata(local_file_id)
+        transfer_status = file_metadata.remote_transfer_status
+        if file_metadata.local_transfer_status != FileTransferStatus.SYNCED_DATA:
+            raise FileUploadError('Cannot resume upload of file [{}] not fully received'.format(local_file_id))
+        if transfer_status == FileTransferStatus.SYNCED_DATA:
+            logging.debug('File [{}] already synced'.format(local_file_id))
+            return []
+
+        logging.debug('Resuming async upload file [{}] remote status [{}]'.format(local_file_id, transfer_status.name))
+        futures: list[TaskFuture] = []
+        if transfer_status == FileTransferStatus.NONE or transfer_status == FileTransferStatus.TRANSFERRING_DATA or transfer_status == FileTransferStatus.TRANSFER_DATA_FAILED:
+            futures.append(self.add_task(UPLOAD_WORKER, TransferFileTask.TASK_CODE, local_file_id, file_size=file_metadata.file_size))
+        # TODO: Epoch handling.
+        futures.append(self.add_task(UPLOAD_WORKER, CommitFileTask.TASK_CODE, local_file_id, epoch_no=1))
+        logging.debug('Resumed async upload file [{}]'.format(local_file_id))
+        return futures
 
-    def delete(self, local_file_id: str, timeout: float=None):
+    def delete(self, local_file_id: str) -> TaskFuture:
         logging.debug('Starting async delete file [{}]'.format(local_file_id))
-        # TODO: Epoch handling.
-        task = DeleteFileTask(local_file_id, epoch_no=1)
         with self._async_lock:
             # TODO: Add a force option.
             if self.has_download(local_file_id):
                 raise FileDeleteError('Cannot delete file [{}]. File is being downloaded'.format(local_file_id))
-            self.add_delete_task(local_file_id, task)
-        self.get_upload_worker(local_file_id).send_task(task, timeout=timeout)
+            # TODO: Epoch handling.
+            future = self.add_task(UPLOAD_WORKER, DeleteFileTask.TASK_CODE, local_file_id, epoch_no=1)
         logging.debug('Started async delete file [{}]'.format(local_file_id))
+        return future
 
     def remove_orphaned_files(self):
         orphaned_files = self.db().list_orphaned_file_data()
@@ -181,13 +432,13 @@ class AsyncController(Daemon):
             logging.debug('Removing orphaned file [{}]'.format(file.local_id))
             self.delete(file.local_id)
 
-    def start_download(self, local_file_id: str, timeout: float=None):
+    def start_download(self, local_file_id: str) -> Optional[TaskFuture]:
         file_metadata = self.db().get_file_metadata(local_file_id)
         file_size = file_metadata.file_size
         transfer_status = file_metadata.remote_transfer_status
         if transfer_status != FileTransferStatus.SYNCED_DATA:
             raise FileDownloadError('Cannot download file [{}] not fully synced on remote server'.format(local_file_id), FileServerErrorCode.REMOTE_DOWNLOAD_ERROR)
-        
+
         with self._async_lock:
             if self.has_delete(local_file_id):
                 raise FileDownloadError('File [{}] being deleted'.format(local_file_id), FileServerErrorCode.FILE_NOT_FOUND)
@@ -195,76 +446,269 @@ class AsyncController(Daemon):
                 logging.debug('File [{}] already being downloaded'.format(local_file_id))
                 return
             logging.debug('Starting async download file [{}]'.format(local_file_id))
+            if self._shared:
+                return self.start_shared_download(local_file_id, file_size)
             self.db().update_file_download(local_file_id, 0)
-            task = TransferFileTask(local_file_id, file_size)
-            self.add_download_task(local_file_id, task)
             self.store().create_empty_file(local_file_id, file_size)
-        
-        self.get_download_worker(local_file_id).send_task(task, timeout=timeout)
-        logging.debug('Started async download file [{}]'.format(local_file_id))
-    
-    def wait_for_upload(self, local_file_id: str, timeout: float=None) -> FileTask:
-        # TODO
-        pass
+            future = self.add_task(DOWNLOAD_WORKER, TransferFileTask.TASK_CODE, local_file_id, file_size=file_size)
+            # The caller is waiting to read the file, start the download now.
+            self.dispatch_tasks(DOWNLOAD_WORKER, self.get_download_worker)
 
-    def cancel_upload(self, local_file_id: str) -> list[FileTask]:
-        with self._async_lock:
-            tasks = self.get_upload_tasks(local_file_id)
-            if tasks is None:
+        logging.debug('Started async download file [{}]'.format(local_file_id))
+        return future
+
+    def start_shared_download(self, local_file_id: str, file_size: int) -> Optional[TaskFuture]:
+        '''
+            Another server process may be starting the same download. The
+            process that adds the task downloads the file, the task is added
+            leased to it so no other process runs it before the file is
+            created.
+        '''
+        task_metadata = self.add_leased_task(DOWNLOAD_WORKER, TransferFileTask.TASK_CODE, local_file_id, file_size=file_size)
+        if task_metadata is None:
+            logging.debug('File [{}] already being downloaded'.format(local_file_id))
+            return
+        try:
+            self.db().update_file_download(local_file_id, 0)
+            self.store().create_empty_file(local_file_id, file_size)
+        except Exception as e:
+            self.db().remove_tasks(local_file_id, DOWNLOAD_WORKER, include_leased=True)
+            raise e
+        if not self.dispatch_task(task_metadata, self.get_download_worker):
+            # Any process can run it now that the file is created.
+            self.db().release_leases(self._task_lease_owner, [task_metadata.task_id])
+        logging.debug('Started async download file [{}]'.format(local_file_id))
+        return self.get_future(task_metadata.task_id, task_metadata.task_key, task_metadata.worker_type, task_metadata.task_code, local_file_id)
+
+    def wait_for_upload(self, local_file_id: str, timeout: float=None) -> None:
+        '''
+            Wait for the file's queued upload tasks to finish. Raises the error
+            of a failed upload task.
+        '''
+        futures = self.get_futures(local_file_id, UPLOAD_WORKER)
+        logging.debug('Waiting for [{}] upload tasks of file [{}]'.format(len(futures), local_file_id))
+        _, not_done = wait(futures, timeout)
+        if len(not_done) > 0:
+            raise FileUploadError('Timed out waiting for file [{}] to upload'.format(local_file_id), FileServerErrorCode.IO_TIMEOUT)
+        for future in futures:
+            try:
+                future.result()
+            except CancelledError:
+                raise FileUploadError('File [{}] upload cancelled'.format(local_file_id), FileServerErrorCode.REMOTE_UPLOAD_CANCELLED)
+
+        # The tasks may have been resolved before we got to wait on them.
+        for task in self.db().list_tasks(local_file_id, UPLOAD_WORKER, TaskStatus.FAILED):
+            raise FileUploadError('File [{}] upload failed: {}'.format(local_file_id, task.last_error), FileServerErrorCode.REMOTE_UPLOAD_ERROR)
+
+    def wait_for_download(self, local_file_id: str, timeout: float=None) -> None:
+        '''
+            Wait for the file's download to finish. In a shared store it may
+            be run by another server process, the database is polled. Raises
+            the error of a failed download.
+        '''
+        logging.debug('Waiting for file [{}] download'.format(local_file_id))
+        end_t = time.monotonic() + (timeout if timeout is not None else self._sync_download_timeout)
+        while True:
+            tasks = self.db().list_tasks(local_file_id, DOWNLOAD_WORKER)
+            for task in tasks:
+                if task.status == TaskStatus.FAILED:
+                    raise FileDownloadError('File [{}] download failed: {}'.format(local_file_id, task.last_error), FileServerErrorCode.REMOTE_DOWNLOAD_ERROR)
+            if len(tasks) == 0:
                 return
+            now = time.monotonic()
+            if now >= end_t:
+                raise FileDownloadError('Timed out waiting for file [{}] to download'.format(local_file_id), FileServerErrorCode.IO_TIMEOUT)
+            time.sleep(min(self._task_poll_interval, end_t - now))
+
+    def cancel_tasks(self, local_file_id: str, worker_type: str) -> list[FileTask]:
+        '''
+            Remove queued tasks for the file and cancel the ones already
+            dispatched to workers. Return the dispatched tasks.
+        '''
+        with self._async_lock:
+            self.db().remove_tasks(local_file_id, worker_type)
+            tasks = self.get_active_tasks(local_file_id, worker_type)
             for task in tasks:
                 task.cancel()
+            # Dispatched tasks resolve their futures when they complete.
+            active_task_ids = [task.task_id() for task in tasks]
+            for future in self.get_futures(local_file_id, worker_type):
+                if future.task_id() not in active_task_ids:
+                    self.resolve_future(future.task_id(), cancelled=True)
             return tasks
 
-    def cancel_download(self, local_file_id: str) -> TransferFileTask:
-        with self._async_lock:
-            task = self.get_download_task(local_file_id)
-            if task is None:
-                return
-            task.cancel()
-            return task
+    def cancel_upload(self, local_file_id: str) -> list[FileTask]:
+        return self.cancel_tasks(local_file_id, UPLOAD_WORKER)
+
+    def cancel_download(self, local_file_id: str) -> list[FileTask]:
+        return self.cancel_tasks(local_file_id, DOWNLOAD_WORKER)
 
-    def stop_upload(self, local_file_id: str, timeout: float=None) -> bool:
+    def stop_upload(self, local_file_id: str, timeout: float=None) -> None:
         tasks = self.cancel_upload(local_file_id)
-        if tasks is not None:
-            for task in tasks:
-                try:
-                    task.wait_processed(timeout)
-                except:
-                    pass
-                if not task.is_processed():
-                    raise FileUploadError('Timed out waiting for file [{}] to upload'.format(local_file_id))
-            
-            self.remove_upload_task(local_file_id)
-
-    def stop_download(self, local_file_id: str, timeout: float=None) -> bool:
-        task = self.cancel_download(local_file_id)
-        if task is not None:
+        for task in tasks:
             try:
                 task.wait_processed(timeout)
             except:
                 pass
             if not task.is_processed():
-                raise FileUploadError('Timed out waiting for file [{}] to download'.format(local_file_id))
-            
-            self.remove_download_task(local_file_id)
+                raise FileUploadError('Timed out waiting for file [{}] to upload'.format(local_file_id))
 
-    def on_commit_file_completed(self, task: CommitFileTask):
-        file_id = task.local_file_id()
-
-        self.remove_upload_task(file_id)
+    def stop_download(self, local_file_id: str, timeout: float=None) -> None:
+        tasks = self.cancel_download(local_file_id)
+        for task in tasks:
+            try:
+                task.wait_processed(timeout)
+            except:
+                pass
+            if not task.is_processed():
+                raise FileDownloadError('Timed out waiting for file [{}] to download'.format(local_file_id))
+
+    def create_worker_task(self, task_metadata: TaskMetadata) -> FileTask:
+        task_code = task_metadata.task_code
+        local_file_id = task_metadata.local_id
+        if task_code == TransferFileTask.TASK_CODE:
+            task = TransferFileTask(local_file_id, task_metadata.file_size, is_commit=False)
+        elif task_code == CommitFileTask.TASK_CODE:
+            task = CommitFileTask(local_file_id, task_metadata.epoch_no)
+        elif task_code == DeleteFileTask.TASK_CODE:
+            task = DeleteFileTask(local_file_id, task_metadata.epoch_no)
+        else:
+            raise WorkerError('Unrecognized task code [{}]'.format(task_code))
+        task.set_task_id(task_metadata.task_id)
+        return task
 
-    def on_delete_file_completed(self, task: DeleteFileTask):
-        file_id = task.local_file_id()
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, FileServerError):
+            return error.error_code() not in NON_RETRYABLE_ERRORS
+        return True
 
-        self.remove_delete_task(file_id)
+    def retry_backoff(self, retry_count: int) -> float:
+        return min(self._task_max_retry_backoff, self._task_retry_backoff * (2 ** retry_count))
 
-    def on_transfer_file_completed(self, task: TransferFileTask):
-        file_id = task.local_file_id()
+    def on_task_completed(self, task: FileTask):
+        with self._async_lock:
+            task_metadata, _ = self._active_tasks.pop(task.task_id(), (None, None))
+        if task_metadata is None:
+            logging.warning('Task [{}] not found'.format(str(task)))
+            return
+
+        error = task.error()
+        if error is None or task.is_cancelled():
+            self.db().complete_task(task_metadata.task_id)
+            self.resolve_future(task_metadata.task_id, cancelled=task.is_cancelled())
+            return
+
+        if isinstance(error, FileServerError) and error.error_code() == FileServerErrorCode.REMOTE_UNAVAILABLE:
+            # Every remote endpoint's circuit is open. Wait for the remote to
+            # come back without using up the task's retries.
+            backoff = self.retry_backoff(task_metadata.retry_count)
+            logging.debug('Remote unavailable, retrying task [{}] in [{}s]'.format(str(task), backoff))
+            self.db().retry_task(task_metadata.task_id, str(error), time.time() + backoff, count_retry=False)
+            return
+
+        if task_metadata.retry_count < self._task_max_retries and self.is_retryable(error):
+            backoff = self.retry_backoff(task_metadata.retry_count)
+            logging.debug('Retrying task [{}] in [{}s]'.format(str(task), backoff))
+            self.db().retry_task(task_metadata.task_id, str(error), time.time() + backoff)
+            return
+
+        logging.error('Task [{}] failed: {}'.format(str(task), str(error)))
+        self.db().fail_task(task_metadata.task_id, str(error))
+        self.resolve_future(task_metadata.task_id, error)
+        if task_metadata.worker_type == UPLOAD_WORKER and task_metadata.task_code == TransferFileTask.TASK_CODE:
+            # No point committing a file whose data didn't make it.
+            error = FileUploadError('File [{}] data transfer failed'.format(task_metadata.local_id), FileServerErrorCode.REMOTE_UPLOAD_ERROR)
+            self.db().fail_tasks(task_metadata.local_id, UPLOAD_WORKER, CommitFileTask.TASK_CODE, str(error))
+            for future in self.get_futures(task_metadata.local_id, UPLOAD_WORKER):
+                if future.task_code() == CommitFileTask.TASK_CODE:
+                    self.resolve_future(future.task_id(), error)
+
+    def dispatch_tasks(self, worker_type: str, get_worker: Callable[[str], AsyncWorker]) -> int:
+        '''
+            Lease a batch of ready tasks and send them to the workers without
+            blocking. Tasks that don't fit in the worker queues are released.
+        '''
+        with self._async_lock:
+            tasks = self.db().lease_tasks(worker_type, self._task_lease_owner, self._task_lease_time, self._task_batch_size)
+            if len(tasks) == 0:
+                return 0
+
+            released: list[int] = []
+            for task_metadata in tasks:
+                if task_metadata.task_id in self._active_tasks:
+                    # Lease expired while the task was still running.
+                    continue
+                if not self.dispatch_task(task_metadata, get_worker):
+                    released.append(task_metadata.task_id)
+
+            if len(released) > 0:
+                logging.debug('Worker queues full. Released [{}] tasks'.format(len(released)))
+                self.db().release_leases(self._task_lease_owner, released)
+            return len(tasks) - len(released)
+
+    def resolve_shared_futures(self) -> None:
+        '''
+            In a shared store the tasks of this controller's futures may be
+            run by another server process. Resolve the futures of the tasks
+            it finished, from the database.
+        '''
+        with self._async_lock:
+            futures = [future for task_id, future in self._futures.items() if task_id not in self._active_tasks]
+        for future in futures:
+            tasks = self.db().list_tasks(future.local_file_id(), future.worker_type())
+            task_metadata = next((task for task in tasks if task.task_id == future.task_id()), None)
+            if task_metadata is None:
+                self.resolve_future(future.task_id())
+            elif task_metadata.status == TaskStatus.FAILED:
+                if future.worker_type() == UPLOAD_WORKER:
+                    error = FileUploadError('File [{}] upload failed: {}'.format(future.local_file_id(), task_metadata.last_error), FileServerErrorCode.REMOTE_UPLOAD_ERROR)
+                else:
+                    error = FileDownloadError('File [{}] download failed: {}'.format(future.local_file_id(), task_metadata.last_error), FileServerErrorCode.REMOTE_DOWNLOAD_ERROR)
+                self.resolve_future(future.task_id(), error)
+
+    def dispatch_task(self, task_metadata: TaskMetadata, get_worker: Callable[[str], AsyncWorker]) -> bool:
+        '''
+            Send a task leased by this controller to its worker without
+            blocking. Returns False if the worker's queue is full, the lease
+            is for the caller to release.
+        '''
+        with self._async_lock:
+            try:
+                task = self.create_worker_task(task_metadata)
+            except Exception as e:
+                logging.error('Invalid task [{}]: {}'.format(task_metadata.task_key, str(e)))
+                self.db().fail_task(task_metadata.task_id, str(e))
+                self.resolve_future(task_metadata.task_id, e)
+                return True
+            # Tasks queued before a restart get their future here.
+            future = self.get_future(task_metadata.task_id, task_metadata.task_key, task_metadata.worker_type, task_metadata.task_code, task_metadata.local_id)
+            task.set_progress_callback(future.set_progress)
+            try:
+                get_worker(task_metadata.local_id).send_task(task, block=False)
+            except Full:
+                return False
+            self._active_tasks[task_metadata.task_id] = (task_metadata, task)
+            return True
+
+    def renew_leases(self):
+        now = time.monotonic()
+        if now - self._last_lease_renewal < self._task_lease_time / 3:
+            return
+        self._last_lease_renewal = now
+        with self._async_lock:
+            if len(self._active_tasks) > 0:
+                self.db().renew_leases(self._task_lease_owner, self._task_lease_time)
+
+    def recover_tasks(self):
+        '''
+            Called on startup before any tasks are dispatched. Tasks leased
+            before a restart are made available again. Downloads are not
+            resumed, they are restarted on demand.
+        '''
+        num_released = self.db().release_leases()
+        num_removed = self.db().remove_tasks(worker_type=DOWNLOAD_WORKER)
+        logging.debug('Recovered [{}] leased tasks. Removed [{}] download tasks'.format(num_released, num_removed))
 
-        if self.has_download(file_id):
-            self.remove_download_task(file_id)
-   
     def start_async_workers(self, workers: list[AsyncWorker]):
         for worker in workers:
             worker.start()
@@ -280,10 +724,57 @@ class AsyncController(Daemon):
         self.start_async_workers(self._download_workers)
         logging.debug('Started download workers')
 
+    def start_transfer_engine(self):
+        if self._transfer_engine is not None:
+            logging.debug('Starting transfer engine')
+            self._transfer_engine.start()
+            self._transfer_engine.wait_started()
+            logging.debug('Started transfer engine')
+
+    def stop_transfer_engine(self):
+        if self._transfer_engine is not None:
+            logging.debug('Stopping transfer engine')
+            self._transfer_engine.stop()
+            self._transfer_engine.join()
+            logging.debug('Stopped transfer engine')
+
+    def start_health_prober(self):
+        if self._remote_enabled:
+            logging.debug('Starting health prober')
+            self._health_prober.start()
+            self._health_prober.wait_started()
+            logging.debug('Started health prober')
+
+    def stop_health_prober(self):
+        if self._remote_enabled:
+            logging.debug('Stopping health prober')
+            self._health_prober.stop()
+            self._health_prober.join()
+            logging.debug('Stopped health prober')
+
+    def start_session_heartbeat(self):
+        if self._remote_enabled and self._session_heartbeat is not None:
+            logging.debug('Starting session heartbeat')
+            self._session_heartbeat.start()
+            self._session_heartbeat.wait_started()
+            logging.debug('Started session heartbeat')
+
+    def stop_session_heartbeat(self):
+        if self._remote_enabled and self._session_heartbeat is not None:
+            logging.debug('Stopping session heartbeat')
+            self._session_heartbeat.stop()
+            self._session_heartbeat.join()
+            self._heartbeat_client.close()
+            logging.debug('Stopped session heartbeat')
+
     def stop_async_workers(self, workers: list[AsyncWorker]):
         for worker in workers:
             worker.stop()
-            worker.send_task(PingWorkerTask())
+            try:
+                worker.send_task(PingWorkerTask(), block=False)
+            except Full:
+                # Worker isn't blocked waiting for a task.
+                pass
         for worker in workers:
             worker.join()
 
@@ -298,54 +789,94 @@ class AsyncController(Daemon):
         self.stop_async_workers(self._download_workers)
         self._download_workers = []
         logging.debug('Stopped download workers')
-    
+
     def stop(self):
         if not self._stop.is_set():
             super().stop()
             self._completion_queue.put(PingWorkerTask(), block=True)
 
     def run(self):
+        if self._recover:
+            try:
+                self.recover_tasks()
+            except Exception as e:
+                logging.error('Failed to recover tasks: {}'.format(str(e)))
+
+        try:
+            self.start_transfer_engine()
+        except Exception as e:
+            logging.error('Failed to start transfer engine: {}'.format(str(e)))
+            self._stopped.set()
+            self._started.set()
+
+        try:
+            self.start_health_prober()
+        except Exception as e:
+            logging.error('Failed to start health prober: {}'.format(str(e)))
+
+        try:
+            self.start_session_heartbeat()
+        except Exception as e:
+            logging.error('Failed to start session heartbeat: {}'.format(str(e)))
+
         try:
             self.start_upload_workers()
         except Exception as e:
             logging.error('Failed to start upload workers: {}'.format(str(e)))
             self._stopped.set()
             self._started.set()
-        
+
         try:
             self.start_download_workers()
         except Exception as e:
             logging.error('Failed to start upload workers: {}'.format(str(e)))
             self._stopped.set()
             self._started.set()
-        
+
         self._started.set()
         logging.debug('Async controller started')
 
         while not self._stop.is_set():
-            completed_task = self._completion_queue.get(block=True)
-
-            if completed_task.error() is None:
-                logging.debug('Task [{}] completed'.format(str(completed_task)))
-            else:
-                logging.debug('Task [{}] completed with error {}'.format(str(completed_task), str(completed_task.error())))
+            try:
+                completed_task = self._completion_queue.get(block=True, timeout=self._task_poll_interval)
+            except Empty:
+                completed_task = None
+
+            while completed_task is not None:
+                if completed_task.error() is None:
+                    logging.debug('Task [{}] completed'.format(str(completed_task)))
+                else:
+                    logging.debug('Task [{}] completed with error {}'.format(str(completed_task), str(completed_task.error())))
+
+                if completed_task.task_code() == PingWorkerTask.TASK_CODE:
+                    logging.debug('Async controller pinged')
+                else:
+                    try:
+                        self.on_task_completed(completed_task)
+                    except Exception as e:
+                        logging.error('Failed to complete task [{}]: {}'.format(str(completed_task), str(e)))
 
-            if completed_task.task_code() == PingWorkerTask.TASK_CODE:
-                logging.debug('Async controller pinged')
-                continue
-            if completed_task.task_code() == CommitFileTask.TASK_CODE:
-                self.on_commit_file_completed(completed_task)
-                continue
-            if completed_task.task_code() == TransferFileTask.TASK_CODE:
-                self.on_transfer_file_completed(completed_task)
-                continue
-            if completed_task.task_code() == DeleteFileTask.TASK_CODE:
-                self.on_delete_file_completed(completed_task)
-                continue
+                try:
+                    completed_task = self._completion_queue.get(block=False)
+                except Empty:
+                    completed_task = None
 
             if self._stop.is_set():
                 break
 
+            try:
+                self.renew_leases()
+                self.dispatch_tasks(UPLOAD_WORKER, self.get_upload_worker)
+                self.dispatch_tasks(DOWNLOAD_WORKER, self.get_download_worker)
+            except Exception as e:
+                logging.error('Failed to dispatch tasks: {}'.format(str(e)))
+
+            if self._shared:
+                try:
+                    self.resolve_shared_futures()
+                except Exception as e:
+                    logging.error('Failed to resolve task futures: {}'.format(str(e)))
+
         try:
             self.stop_upload_workers()
         except Exception as e:
@@ -354,6 +885,29 @@ class AsyncController(Daemon):
             self.stop_download_workers()
         except Exception as e:
             logging.error('Failed to stop upload workers: {}'.format(str(e)))
+        try:
+            self.stop_transfer_engine()
+        except Exception as e:
+            logging.error('Failed to stop transfer engine: {}'.format(str(e)))
+        try:
+            self.stop_health_prober()
+        except Exception as e:
+            logging.error('Failed to stop health prober: {}'.format(str(e)))
+        try:
+            self.stop_session_heartbeat()
+        except Exception as e:
+            logging.error('Failed to stop session heartbeat: {}'.format(str(e)))
+        try:
+            # Leased tasks are picked up again on the next start.
+            self.db().release_leases(self._task_lease_owner)
+        except Exception as e:
+            logging.error('Failed to release task leases: {}'.format(str(e)))
+
+        # Don't leave anyone waiting on tasks that won't run.
+        with self._async_lock:
+            task_ids = list(self._futures.keys())
+        for task_id in task_ids:
+            self.resolve_future(task_id, cancelled=True)
 
         self._stopped.set()
-        logging.debug('Async controller stopped')
\ No newline at end of file
+        logging.debug('Async controller stopped')
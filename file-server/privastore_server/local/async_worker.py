@@ -1,3 +1,6 @@
+from ..bandwidth_limiter import BandwidthLimiter
+from ..endpoint_selector import EndpointSelector
+from ..erasure import ErasureCode
 from .db.dao_factory import DAOFactory
 from ..db.db_conn_mgr import DbConnectionManager
 from .db.file_dao import FileVersionMetadata
@@ -7,33 +10,61 @@ from ..file_cache import FileCache
 from .file_transfer_status import FileTransferStatus
 import logging
 from queue import Queue
-from ..remote_client import RemoteClient, RemoteCredentials, RemoteEndpoint
+from ..remote_client import RemoteClient, TRANSPORT_HTTP
+from ..remote_session import RemoteSession
+from ..replication import ErasureCoder, Replicator
+from ..retry_policy import RetryPolicy
 from typing import Optional
 from ..worker import Worker
 from ..worker_task import WorkerTask
 
 SESSION_ID_HEADER = 'x-privastore-session-id'
 
+def create_remote_client(db: DbWrapper, retry_interval: int=1, bandwidth_limiter: Optional[BandwidthLimiter]=None, endpoint_selector: Optional[EndpointSelector]=None, retry_policy: Optional[RetryPolicy]=None, transport: str=TRANSPORT_HTTP, remote_session: Optional[RemoteSession]=None) -> RemoteClient:
+    '''
+        Create a remote client for the default cluster's servers. Clients
+        given the same remote_session share their login.
+    '''
+    remote_client = RemoteClient(retry_interval=retry_interval, transport=transport)
+    remote_client.set_bandwidth_limiter(bandwidth_limiter)
+    if remote_session is not None:
+        remote_client.set_session(remote_session)
+    if endpoint_selector is not None:
+        remote_client.set_endpoint_selector(endpoint_selector)
+    if retry_policy is not None:
+        remote_client.set_retry_policy(retry_policy)
+
+    conn = db.db_conn_mgr().db_connect()
+    try:
+        remote_dao = db.dao_factory().remote_dao(conn)
+        servers = remote_dao.get_remote_servers('default-cluster')
+        creds = remote_dao.get_remote_credentials('default-cluster')
+        for server in servers:
+            remote_client.add_remote_endpoint(server)
+        remote_client.set_remote_credentials(creds)
+    finally:
+        db.db_conn_mgr().db_close(conn)
+
+    return remote_client
+
 class AsyncWorker(Worker):
 
-    def __init__(self, dao_factory: DAOFactory, db_conn_mgr: DbConnectionManager, store: FileCache, worker_name: str='async-worker', worker_index: int=None, queue_size: int=1, completion_queue: Optional[Queue[WorkerTask]] = None, retry_interval: int=1, io_timeout: int=90):
+    def __init__(self, dao_factory: DAOFactory, db_conn_mgr: DbConnectionManager, store: FileCache, worker_name: str='async-worker', worker_index: int=None, queue_size: int=1, completion_queue: Optional[Queue[WorkerTask]] = None, retry_interval: int=1, io_timeout: int=90, bandwidth_limiter: Optional[BandwidthLimiter]=None, endpoint_selector: Optional[EndpointSelector]=None, retry_policy: Optional[RetryPolicy]=None, batch_chunks: int=1, transport: str=TRANSPORT_HTTP, replication_factor: int=1, write_quorum: int=1, erasure_code: Optional[ErasureCode]=None, remote_session: Optional[RemoteSession]=None):
         super().__init__(worker_name=worker_name, worker_index=worker_index, queue_size=queue_size, completion_queue=completion_queue)
         self._db = DbWrapper(dao_factory, db_conn_mgr)
         self._store = store
         self._retry_interval = retry_interval
         self._io_timeout = io_timeout
-        self._remote_client = RemoteClient(retry_interval=retry_interval)
-
-        conn = self.db().db_conn_mgr().db_connect()
-        try:
-            remote_dao = self.db().dao_factory().remote_dao(conn)
-            servers = remote_dao.get_remote_servers('default-cluster')
-            creds = remote_dao.get_remote_credentials('default-cluster')
-            for server in servers:
-                self._remote_client.add_remote_endpoint(server)
-            self._remote_client.set_remote_credentials(creds)
-        finally:
-            self.db().db_conn_mgr().db_close(conn)
+        # Chunks moved per remote request.
+        self._batch_chunks = batch_chunks
+        self._remote_client = create_remote_client(self._db, retry_interval, bandwidth_limiter, endpoint_selector, retry_policy, transport, remote_session)
+        # New remote files are erasure coded if erasure_code is given,
+        # otherwise written to replication_factor endpoints when > 1.
+        self._erasure_code = erasure_code
+        if erasure_code is not None:
+            self._replicator = Replicator(self._remote_client, erasure_code.total_shards(), write_quorum)
+        else:
+            self._replicator = Replicator(self._remote_client, replication_factor, write_quorum)
     
     def db(self) -> DbWrapper:
         return self._db
@@ -46,6 +77,21 @@ class AsyncWorker(Worker):
     
     def io_timeout(self):
         return self._io_timeout
+
+    def batch_chunks(self):
+        return self._batch_chunks
     
     def remote_client(self):
-        return self._remote_client
\ No newline at end of file
+        return self._remote_client
+
+    def replicator(self) -> Replicator:
+        return self._replicator
+
+    def erasure_code(self) -> Optional[ErasureCode]:
+        return self._erasure_code
+
+    def erasure_coder(self, data_shards: int, total_shards: int) -> ErasureCoder:
+        '''
+            Erasure coder for a file stored as total_shards shards.
+        '''
+        return ErasureCoder(self._replicator, ErasureCode(data_shards, total_shards - data_shards))
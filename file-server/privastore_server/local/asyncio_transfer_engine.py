@@ -0,0 +1,465 @@
+from .async_worker import create_remote_client
+import asyncio
+from ..asyncio_remote_client import AsyncioRemoteClient
+from ..bandwidth_limiter import BandwidthLimiter
+from ..endpoint_selector import EndpointSelector
+from collections import deque
+from .commit_file_task import CommitFileTask
+from concurrent.futures import ThreadPoolExecutor
+from ..daemon import Daemon
+from .db.dao_factory import DAOFactory
+from .db.task_dao import DOWNLOAD_WORKER, UPLOAD_WORKER
+from ..db.db_conn_mgr import DbConnectionManager
+from .database import DbWrapper
+from .delete_file_task import DeleteFileTask
+from ..error import FileDownloadError, FileError, FileServerError, FileServerErrorCode, FileUploadError, RemoteClientError, WorkerError
+from ..file_cache import FileCache
+from .file_transfer_status import FileTransferStatus
+import functools
+import logging
+from queue import Full, Queue
+from ..remote_session import RemoteSession
+from ..retry_policy import RetryPolicy
+from threading import Condition
+from .transfer_file_task import TransferFileTask
+from typing import Optional
+from ..util.logging import log_exception_stack
+from ..worker_task import PingWorkerTask, WorkerTask
+
+THREAD_ENGINE = 'thread'
+ASYNCIO_ENGINE = 'asyncio'
+
+TRANSFER_ENGINES = [THREAD_ENGINE, ASYNCIO_ENGINE]
+
+class AsyncioWorker(object):
+
+    '''
+        Worker facade of the asyncio transfer engine. Lets the async controller
+        dispatch upload and download tasks to the engine the same way it does
+        to the worker threads. The engine itself is started and stopped by the
+        controller.
+    '''
+    def __init__(self, engine: 'AsyncioTransferEngine', worker_type: str):
+        self._engine = engine
+        self._worker_type = worker_type
+
+    def name(self):
+        return '{}-{}'.format(self._engine.name(), self._worker_type)
+
+    def worker_type(self):
+        return self._worker_type
+
+    def start(self):
+        pass
+
+    def wait_started(self, timeout=None):
+        pass
+
+    def stop(self):
+        pass
+
+    def join(self, timeout=None):
+        pass
+
+    def send_task(self, task: WorkerTask, block=True, timeout=None) -> None:
+        self._engine.send_task(self, task, block, timeout)
+
+class AsyncioTransferEngine(Daemon):
+
+    '''
+        Runs many remote file transfers concurrently on a single asyncio event
+        loop instead of one blocking transfer per worker thread.
+
+        Runs the same transfer, commit and delete tasks as the upload and
+        download workers and makes the same database updates. Blocking database
+        and cache calls are run in a small thread pool. Chunks are moved
+        batch_chunks per request like the workers do. Each transfer keeps up
+        to transfer_window requests in flight, uploads read the next batch
+        from the cache while the current one is sent (the remote server only
+        accepts chunks in order) and downloads fetch batches in parallel and
+        append them in order.
+
+        Only the HTTP transport to a single (not replicated or erasure coded)
+        copy is supported, see AsyncController.
+    '''
+    def __init__(self, dao_factory: DAOFactory, db_conn_mgr: DbConnectionManager, store: FileCache, completion_queue: Optional[Queue[WorkerTask]]=None, max_transfers: int=100, transfer_window: int=4, executor_threads: int=8, retry_interval: int=1, io_timeout: int=90, bandwidth_limiter: Optional[BandwidthLimiter]=None, endpoint_selector: Optional[EndpointSelector]=None, retry_policy: Optional[RetryPolicy]=None, batch_chunks: int=1, remote_session: Optional[RemoteSession]=None):
+        super().__init__('asyncio-transfer-engine')
+        if max_transfers < 1:
+            raise WorkerError('Max transfers must be at least 1')
+        if transfer_window < 1:
+            raise WorkerError('Transfer window must be at least 1')
+        self._db = DbWrapper(dao_factory, db_conn_mgr)
+        self._store = store
+        self._completion_queue = completion_queue
+        self._max_transfers = max_transfers
+        self._transfer_window = transfer_window
+        self._executor_threads = executor_threads
+        self._io_timeout = io_timeout
+        # Chunks moved per remote request.
+        self._batch_chunks = batch_chunks
+        self._remote_client = AsyncioRemoteClient(create_remote_client(self._db, retry_interval, bandwidth_limiter, endpoint_selector, retry_policy, remote_session=remote_session))
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self._transfers: dict[WorkerTask, asyncio.Task] = dict()
+        self._num_tasks = 0
+        self._tasks_cv = Condition()
+
+    def db(self) -> DbWrapper:
+        return self._db
+
+    def store(self) -> FileCache:
+        return self._store
+
+    def io_timeout(self):
+        return self._io_timeout
+
+    def transfer_window(self):
+        return self._transfer_window
+
+    def batch_chunks(self):
+        return self._batch_chunks
+
+    def remote_client(self) -> AsyncioRemoteClient:
+        return self._remote_client
+
+    def num_tasks(self) -> int:
+        with self._tasks_cv:
+            return self._num_tasks
+
+    def upload_worker(self) -> AsyncioWorker:
+        return AsyncioWorker(self, UPLOAD_WORKER)
+
+    def download_worker(self) -> AsyncioWorker:
+        return AsyncioWorker(self, DOWNLOAD_WORKER)
+
+    def send_task(self, worker: AsyncioWorker, task: WorkerTask, block=True, timeout=None) -> None:
+        '''
+            Schedule the task on the event loop. Raises Full if the engine is
+            already running max_transfers tasks (and block is False or the
+            timeout expires).
+        '''
+        task.set_worker(worker)
+        if task.task_code() == PingWorkerTask.TASK_CODE:
+            task.set_processed()
+            return
+
+        loop = self._loop
+        if loop is None or self._stop.is_set():
+            raise WorkerError('Transfer engine not running')
+
+        with self._tasks_cv:
+            if not block:
+                if self._num_tasks >= self._max_transfers:
+                    raise Full
+            elif not self._tasks_cv.wait_for(lambda: self._num_tasks < self._max_transfers, timeout):
+                raise Full
+            self._num_tasks += 1
+
+        logging.debug('Sending task [{}] to [{}]'.format(str(task), worker.name()))
+        loop.call_soon_threadsafe(self.start_task, worker, task)
+
+    def start_task(self, worker: AsyncioWorker, task: WorkerTask) -> None:
+        self._transfers[task] = asyncio.ensure_future(self.run_task(worker, task))
+
+    def completed_task(self, task: WorkerTask) -> None:
+        self._transfers.pop(task, None)
+        with self._tasks_cv:
+            self._num_tasks -= 1
+            self._tasks_cv.notify()
+        if self._completion_queue is not None:
+            self._completion_queue.put(task, block=True)
+
+    async def run_task(self, worker: AsyncioWorker, task: WorkerTask) -> None:
+        logging.debug('[{}] received task [{}]'.format(worker.name(), str(task)))
+        if task.is_cancelled():
+            logging.debug('[{}] ignoring cancelled task [{}]'.format(worker.name(), str(task)))
+            task.set_processed()
+        else:
+            try:
+                await self.process_task(worker.worker_type(), task)
+                task.set_processed()
+            except asyncio.CancelledError:
+                # The engine is stopping, the task is retried on restart.
+                logging.debug('[{}] task [{}] cancelled'.format(worker.name(), str(task)))
+                task.set_error(WorkerError('Task [{}] cancelled'.format(str(task))))
+            except Exception as e:
+                logging.error('[{}] - error while processing task [{}]: {}'.format(worker.name(), str(task), str(e)))
+                log_exception_stack()
+                task.set_error(e)
+        self.completed_task(task)
+
+    async def process_task(self, worker_type: str, task: WorkerTask) -> None:
+        task_code = task.task_code()
+        if worker_type == UPLOAD_WORKER and task_code == TransferFileTask.TASK_CODE:
+            await self.do_upload_file(task)
+        elif worker_type == UPLOAD_WORKER and task_code == CommitFileTask.TASK_CODE:
+            await self.do_commit_file(task)
+        elif worker_type == UPLOAD_WORKER and task_code == DeleteFileTask.TASK_CODE:
+            await self.do_delete_file(task)
+        elif worker_type == DOWNLOAD_WORKER and task_code == TransferFileTask.TASK_CODE:
+            await self.do_download_file(task)
+        else:
+            raise WorkerError('Unrecognized task code [{}]'.format(task_code))
+
+    def run_blocking(self, fn, *args, **kwargs) -> asyncio.Future:
+        '''
+            Run a blocking (database or cache) call in the engine thread pool.
+        '''
+        return self._loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def read_chunks(self, file) -> list[bytes]:
+        '''
+            Read the next batch of chunks from the cache (blocking).
+        '''
+        chunks: list[bytes] = []
+        while len(chunks) < self.batch_chunks():
+            chunk_data = file.read_chunk()
+            if len(chunk_data) == 0:
+                break
+            chunks.append(chunk_data)
+        return chunks
+
+    async def read_remote_chunks(self, remote_id: str, chunk_num: int, num_chunks: int) -> list[bytes]:
+        if num_chunks == 1:
+            return [await self.remote_client().read_file_chunk(remote_id, chunk_num, timeout=self.io_timeout())]
+        chunks: list[bytes] = []
+        # A batch read returns the chunks up to the first one it couldn't
+        # read, read the rest again.
+        while len(chunks) < num_chunks:
+            chunks.extend(await self.remote_client().read_file_chunks(remote_id, chunk_num+len(chunks), num_chunks-len(chunks), timeout=self.io_timeout()))
+        return chunks
+
+    async def do_commit_file(self, task: CommitFileTask) -> None:
+        local_file_id = task.local_file_id()
+        file_metadata = await self.run_blocking(self.db().get_file_metadata, local_file_id)
+        remote_id = file_metadata.remote_id
+        remote_transfer_status = file_metadata.remote_transfer_status
+
+        if remote_transfer_status == FileTransferStatus.TRANSFERRED_DATA or remote_transfer_status == FileTransferStatus.SYNCING_DATA or remote_transfer_status == FileTransferStatus.SYNC_DATA_FAILED:
+            await self.run_blocking(self.db().update_file_remote, local_file_id, transfer_status=FileTransferStatus.SYNCING_DATA)
+            logging.debug('Updated file remote status to syncing data')
+
+            try:
+                await self.remote_client().commit_file(remote_id, task.epoch_no(), timeout=self.io_timeout())
+                logging.debug('Committed file')
+            except RemoteClientError as e:
+                if e.error_code() != FileServerErrorCode.FILE_IS_COMMITTED:
+                    await self.run_blocking(self.db().update_file_remote, local_file_id, transfer_status=FileTransferStatus.SYNC_DATA_FAILED)
+                    raise e
+                else:
+                    logging.debug('File [{}] already committed'.format(local_file_id))
+
+            await self.run_blocking(self.db().update_file_remote, local_file_id, transfer_status=FileTransferStatus.SYNCED_DATA)
+            logging.debug('Updated file remote status to synced data')
+        elif remote_transfer_status == FileTransferStatus.SYNCED_DATA:
+            logging.debug('File [{}] already committed'.format(local_file_id))
+        else:
+            raise FileUploadError('Cannot commit file [{}]. Invalid status {}'.format(local_file_id, remote_transfer_status))
+
+    async def do_delete_file(self, task: DeleteFileTask) -> None:
+        local_file_id = task.local_file_id()
+        try:
+            file_metadata = await self.run_blocking(self.db().get_file_metadata, local_file_id)
+            remote_id = file_metadata.remote_id
+        except FileError as e:
+            if e.error_code() == FileServerErrorCode.FILE_NOT_FOUND:
+                return
+            elif e.error_code() == FileServerErrorCode.FILE_VERSION_NOT_FOUND:
+                return
+            raise e
+
+        if remote_id is not None:
+            logging.debug('File [{}] remote id [{}]'.format(local_file_id, remote_id))
+            try:
+                await self.remote_client().remove_file(remote_id, task.epoch_no(), timeout=self.io_timeout())
+                logging.debug('Removed file [{}] on remote server'.format(local_file_id))
+            except RemoteClientError as e:
+                if e.error_code() != FileServerErrorCode.FILE_NOT_FOUND:
+                    raise e
+
+        try:
+            await self.run_blocking(self.db().remove_file_data, local_file_id)
+            logging.debug('Removed file [{}] in db'.format(local_file_id))
+        except FileError as e:
+            if e.error_code() != FileServerErrorCode.FILE_VERSION_NOT_FOUND:
+                raise e
+
+    def check_upload_cancelled(self, task: TransferFileTask) -> None:
+        if task.is_cancelled():
+            raise FileUploadError('File [{}] upload cancelled'.format(task.local_file_id()), FileServerErrorCode.REMOTE_UPLOAD_CANCELLED)
+
+    async def do_upload_file(self, task: TransferFileTask) -> None:
+        local_file_id = task.local_file_id()
+        file_metadata = await self.run_blocking(self.db().get_file_metadata, local_file_id)
+        remote_transfer_status = file_metadata.remote_transfer_status
+
+        if remote_transfer_status == FileTransferStatus.SYNCING_DATA or remote_transfer_status == FileTransferStatus.SYNCED_DATA or remote_transfer_status == FileTransferStatus.SYNC_DATA_FAILED:
+            raise FileUploadError('File [{}] has or may already be committed. Cannot transfer file data'.format(local_file_id), FileServerErrorCode.FILE_IS_COMMITTED)
+
+        remote_file_id = file_metadata.remote_id
+        chunks_sent = 0
+        # Only known once the file has been fully received.
+        total_chunks = file_metadata.total_chunks if file_metadata.local_transfer_status == FileTransferStatus.SYNCED_DATA else None
+
+        if remote_file_id is not None:
+            # Resume from the last chunk the remote server acknowledged.
+            try:
+                remote_metadata = await self.remote_client().get_file_metadata(remote_file_id, timeout=self.io_timeout())
+                if remote_metadata.is_committed:
+                    logging.debug('Remote file [{}] already committed'.format(remote_file_id))
+                    await self.run_blocking(self.db().update_file_remote, local_file_id, transfer_status=FileTransferStatus.TRANSFERRED_DATA, transferred_chunks=remote_metadata.file_chunks)
+                    return
+                chunks_sent = remote_metadata.file_chunks
+                logging.debug('Resuming upload to remote file [{}] from chunk [{}]'.format(remote_file_id, chunks_sent+1))
+                await self.run_blocking(self.db().update_file_remote, local_file_id, transfer_status=FileTransferStatus.TRANSFERRING_DATA, transferred_chunks=chunks_sent)
+            except RemoteClientError as e:
+                if e.error_code() != FileServerErrorCode.FILE_NOT_FOUND:
+                    raise e
+                logging.debug('Remote file [{}] not found. Restarting upload'.format(remote_file_id))
+                remote_file_id = None
+
+        if remote_file_id is None:
+            remote_file_id = await self.remote_client().create_file(task.file_size(), timeout=self.io_timeout())
+            logging.debug('Created remote file [{}]'.format(remote_file_id))
+
+            await self.run_blocking(self.db().update_file_remote, local_file_id, remote_file_id, FileTransferStatus.TRANSFERRING_DATA)
+            logging.debug('Updated file remote status to transferring data')
+
+        self.check_upload_cancelled(task)
+
+        file = await self.run_blocking(self.store().read_file, local_file_id)
+        logging.debug('Opened file [{}] in cache for reading'.format(local_file_id))
+
+        next_read: Optional[asyncio.Future] = None
+        try:
+            if chunks_sent > 0:
+                await self.run_blocking(file.seek_chunk, chunks_sent)
+            next_read = self.run_blocking(self.read_chunks, file)
+            while True:
+                self.check_upload_cancelled(task)
+                chunks = await next_read
+                next_read = None
+                if len(chunks) == 0:
+                    break
+                # Read the next batch from the cache while this one is sent.
+                next_read = self.run_blocking(self.read_chunks, file)
+                if len(chunks) == 1:
+                    await self.remote_client().send_file_chunk(remote_file_id, chunks[0], chunks_sent+1, timeout=self.io_timeout())
+                else:
+                    await self.remote_client().send_file_chunks(remote_file_id, chunks, chunks_sent+1, timeout=self.io_timeout())
+                chunks_sent += len(chunks)
+                await self.run_blocking(self.db().update_file_remote, local_file_id, transfer_status=FileTransferStatus.TRANSFERRING_DATA, transferred_chunks=chunks_sent)
+                task.report_progress(chunks_sent, total_chunks)
+            logging.debug('Sent {} file chunks'.format(chunks_sent))
+        except (FileServerError, asyncio.CancelledError) as e:
+            await self.run_blocking(self.db().update_file_remote, local_file_id, transfer_status=FileTransferStatus.TRANSFER_DATA_FAILED, transferred_chunks=chunks_sent)
+            raise e
+        finally:
+            if next_read is not None:
+                # Don't close the file under a read in progress.
+                await asyncio.gather(next_read, return_exceptions=True)
+            await self.run_blocking(self.store().close_file, file)
+            logging.debug('Closed file in cache')
+
+        await self.run_blocking(self.db().update_file_remote, local_file_id, transfer_status=FileTransferStatus.TRANSFERRED_DATA, transferred_chunks=chunks_sent)
+        task.report_progress(chunks_sent, chunks_sent)
+        logging.debug('Updated file remote status to transferred data')
+
+    async def do_download_file(self, task: TransferFileTask) -> None:
+        local_file_id = task.local_file_id()
+        file_metadata = await self.run_blocking(self.db().get_file_metadata, local_file_id)
+        remote_id = file_metadata.remote_id
+        transfer_status = file_metadata.remote_transfer_status
+        total_chunks = file_metadata.total_chunks
+        downloaded_chunks = file_metadata.downloaded_chunks
+
+        if transfer_status != FileTransferStatus.SYNCED_DATA:
+            raise FileDownloadError('Cannot download file [{}] not fully synced on remote server'.format(local_file_id), FileServerErrorCode.REMOTE_DOWNLOAD_ERROR)
+
+        logging.debug('Downloading file [{}] from remote server'.format(local_file_id))
+
+        file = await self.run_blocking(self.store().append_file, local_file_id)
+        logging.debug('Opened file for appending')
+
+        # Batches being read, by the number of their last chunk.
+        window: deque[tuple[int, asyncio.Task]] = deque()
+        try:
+            downloaded = False
+            # Chunk numbers are 1-indexed.
+            next_chunk = downloaded_chunks+1
+            logging.debug('Downloading chunks {} through {}'.format(next_chunk, total_chunks))
+            while next_chunk <= total_chunks or len(window) > 0:
+                while next_chunk <= total_chunks and len(window) < self.transfer_window():
+                    num_chunks = min(self.batch_chunks(), total_chunks-next_chunk+1)
+                    next_chunk += num_chunks
+                    window.append((next_chunk-1, asyncio.ensure_future(self.read_remote_chunks(remote_id, next_chunk-num_chunks, num_chunks))))
+
+                if task.is_cancelled():
+                    raise FileDownloadError('File [{}] download cancelled'.format(local_file_id), FileServerErrorCode.REMOTE_DOWNLOAD_CANCELLED)
+
+                last_chunk, read_chunks = window.popleft()
+                chunks = await read_chunks
+                for chunk in chunks:
+                    await self.run_blocking(file.append_chunk, chunk)
+                await self.run_blocking(self.db().update_file_download, local_file_id, last_chunk)
+                task.report_progress(last_chunk, total_chunks)
+                logging.debug('Received {} chunks'.format(len(chunks)))
+            logging.debug('Received {} chunks'.format(total_chunks))
+            downloaded = True
+        finally:
+            for _, read_chunks in window:
+                read_chunks.cancel()
+            await asyncio.gather(*[read_chunks for _, read_chunks in window], return_exceptions=True)
+            if downloaded:
+                await self.run_blocking(self.store().close_file, file)
+            else:
+                # Keep the file writable for retries.
+                await self.run_blocking(self.store().close_file, file, writable=True, removable=False)
+            logging.debug('Closed file in cache')
+
+    def stop(self):
+        if not self._stop.is_set():
+            super().stop()
+            loop = self._loop
+            if loop is not None:
+                loop.call_soon_threadsafe(self.stop_loop)
+
+    def stop_loop(self):
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    async def serve(self) -> None:
+        self._stop_event = asyncio.Event()
+        self._started.set()
+        logging.debug('Transfer engine started')
+        if self._stop.is_set():
+            return
+        await self._stop_event.wait()
+
+        # Cancel the tasks in progress along with their remote requests and
+        # let them report back.
+        transfers = list(self._transfers.items())
+        for task, transfer in transfers:
+            task.cancel()
+            transfer.cancel()
+        await asyncio.gather(*[transfer for _, transfer in transfers], return_exceptions=True)
+        await self._remote_client.close()
+
+    def run(self):
+        self._executor = ThreadPoolExecutor(max_workers=self._executor_threads, thread_name_prefix='{}-io'.format(self.name()))
+        loop = asyncio.new_event_loop()
+        try:
+            self._loop = loop
+            loop.run_until_complete(self.serve())
+        except Exception as e:
+            logging.error('Transfer engine error: {}'.format(str(e)))
+            log_exception_stack()
+        finally:
+            self._loop = None
+            loop.close()
+            self._executor.shutdown(wait=True)
+            self._stopped.set()
+            # Unblock anyone waiting on wait_started if the loop failed.
+            self._started.set()
+            logging.debug('Transfer engine stopped')
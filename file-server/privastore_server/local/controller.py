@@ -1,23 +1,31 @@
+from ..admission_control import AdmissionControl
 from .async_controller import AsyncController
+from ..bandwidth_limiter import RateSchedule
 from ..controller import Controller
 from .db.dao_factory import DAOFactory
+from .db.task_dao import DOWNLOAD_WORKER, UPLOAD_WORKER
 from ..db.db_conn_mgr import DbConnectionManager
 from .database import DbWrapper
-from ..error import FileCacheError, FileDeleteError, FileDownloadError, FileServerErrorCode, FileUploadError
+from ..error import FileCacheError, FileDeleteError, FileDownloadError, FileError, FileServerErrorCode, FileUploadError
 from ..file import File
 from ..file_cache import FileCache
 from ..file_chunk import chunk_encoder, chunk_decoder, default_chunk_encoder, default_chunk_decoder, get_encrypted_chunk_encoder, get_encrypted_chunk_decoder
 from .file_task import FileTask
 from .file_transfer_status import FileTransferStatus
 from .file_type import FileType
+from .multipart_upload import MultipartUpload, MultipartUploadManager
 from ..key import Key
 from ..session_mgr import SessionManager
 from ..util.file import chunked_copy, str_mem_size, str_path, write_all
 from ..util.crypto import get_encryptor_factory, get_decryptor_factory
 from ..util.logging import log_exception_stack
 import logging
-from threading import RLock
-from typing import BinaryIO, Callable, Optional
+import socket
+from threading import Event, RLock
+from typing import BinaryIO, Callable, Iterator, Optional
+
+# Directory entries listed per transaction when iterating a directory.
+LIST_PAGE_SIZE = 1000
 
 class LocalServerController(Controller):
 
@@ -28,10 +36,14 @@ class LocalServerController(Controller):
         db_conn_mgr - database connection manager
         session_mgr - session store
         store - file store
+        upload_mgr - multipart uploads in progress
+        admission_control - limits on the transfers in progress
     '''
-    def __init__(self, async_controller: AsyncController, dao_factory: DAOFactory, db_conn_mgr: DbConnectionManager, session_mgr: SessionManager, store: FileCache):
+    def __init__(self, async_controller: AsyncController, dao_factory: DAOFactory, db_conn_mgr: DbConnectionManager, session_mgr: SessionManager, store: FileCache, upload_mgr: Optional[MultipartUploadManager]=None, admission_control: Optional[AdmissionControl]=None):
         super().__init__(db_conn_mgr, session_mgr, store)
         self._async_controller = async_controller
+        self._upload_mgr = upload_mgr if upload_mgr is not None else MultipartUploadManager(dict(), store)
+        self._admission_control = admission_control if admission_control is not None else AdmissionControl()
         self._dao_factory = dao_factory
         self._db = DbWrapper(dao_factory, db_conn_mgr)
         self._chunk_encryptors: dict[str, chunk_encoder] = dict()
@@ -51,6 +63,12 @@ class LocalServerController(Controller):
     def remote_enabled(self):
         return self._async_controller.remote_enabled()
 
+    def upload_mgr(self) -> MultipartUploadManager:
+        return self._upload_mgr
+
+    def admission_control(self) -> AdmissionControl:
+        return self._admission_control
+
     def get_key(self, key_id: str) -> Key:
         conn = self.db_conn_mgr().db_connect()
         try:
@@ -96,6 +114,7 @@ class LocalServerController(Controller):
         conn = self.db_conn_mgr().db_connect()
         try:
             file_dao = self.dao_factory().file_dao(conn)
+            task_dao = self.dao_factory().task_dao(conn)
             unsynced_local_files = file_dao.list_unsynced_files(local=True)
             num_files_removed = 0
 
@@ -107,6 +126,7 @@ class LocalServerController(Controller):
                 file_dao.remove_file_version(file_id, version)
 
                 if local_id is not None:
+                    task_dao.remove_tasks(local_id, include_leased=True)
                     file_dao.remove_file_data(local_id)
 
                     try:
@@ -123,6 +143,34 @@ class LocalServerController(Controller):
         finally:
             self.db_conn_mgr().db_close(conn)
 
+    def resume_uploads(self):
+        '''
+            Resume uploading files to the remote server that were interrupted
+            by a restart. Must be called after the async controller is
+            started.
+        '''
+        if not self.remote_enabled():
+            return
+
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            file_dao = self.dao_factory().file_dao(conn)
+            unsynced_remote_files = file_dao.list_unsynced_files(local=False, remote=True)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+        
+        num_files_resumed = 0
+        for file in unsynced_remote_files:
+            if file.local_id is None or file.local_transfer_status != FileTransferStatus.SYNCED_DATA:
+                continue
+            try:
+                self.async_controller().resume_upload(file.local_id)
+                num_files_resumed += 1
+            except Exception as e:
+                logging.warning('Could not resume file [{}] upload: {}'.format(file.local_id, str(e)))
+        
+        logging.debug('Resumed [{}] file uploads'.format(num_files_resumed))
+
     def login_user(self, username: str, password: str):
         logging.debug('User [{}] login attempt'.format(username))
         conn = self.db_conn_mgr().db_connect()
@@ -147,7 +195,29 @@ class LocalServerController(Controller):
         finally:
             self.db_conn_mgr().db_close(conn)
 
-    def upload_file(self, path: list[str], file_name: str, file: BinaryIO, file_size: int, file_version: int, key_id: str, sync: bool=True):
+    def upload_file(self, path: list[str], file_name: str, file: BinaryIO, file_size: Optional[int], file_version: int, key_id: str, sync: bool=True):
+        '''
+            Store file_size bytes read from file as a new file. If file_size
+            is None the file is read to its end (ex. a chunked request), the
+            cache space is allocated as it grows and the remote upload is only
+            started once its size is known.
+
+            The upload waits its turn if the server is at its transfer limits
+            (see AdmissionControl), throws AdmissionError if it isn't let in.
+            Uploads of unknown size reserve the configured estimate.
+        '''
+        admission = self.admission_control().admit(file_size)
+        try:
+            self.upload_file_data(path, file_name, file, file_size, file_version, key_id, sync)
+        finally:
+            admission.release()
+
+    def upload_file_data(self, path: list[str], file_name: str, file: Optional[BinaryIO], file_size: Optional[int], file_version: int, key_id: str, sync: bool=True, upload: Optional[MultipartUpload]=None):
+        '''
+            Store the file without admission control (see upload_file). If
+            upload is set the file is made of its parts rather than read from
+            file.
+        '''
         logging.debug('Upload file [{}] version [{}] size [{}]'.format(str_path(path + [file_name]), file_version, file_size))
 
         if file_version == 1:
@@ -168,7 +238,7 @@ class LocalServerController(Controller):
             # Set a unique id (UUID) for the file and record its size.
             #
             local_file_id = File.generate_file_id()
-            self.db().update_file_local(path, file_name, file_version, local_file_id, key_id, file_size, size_on_disk=0, total_chunks=0, transfer_status=FileTransferStatus.TRANSFERRING_DATA)
+            self.db().update_file_local(path, file_name, file_version, local_file_id, key_id, file_size or 0, size_on_disk=0, total_chunks=0, transfer_status=FileTransferStatus.TRANSFERRING_DATA)
             logging.debug('Set local file id [{}]'.format(local_file_id))
 
             #
@@ -176,29 +246,52 @@ class LocalServerController(Controller):
             # or evicted from the cache until it has been synced to the remote
             # server.
             #
-            upload_file = self.store().write_file(local_file_id, alloc_space=file_size, encode_chunk=chunk_encryptor)
+            upload_file = self.store().write_file(local_file_id, alloc_space=file_size or 0, encode_chunk=chunk_encryptor)
             logging.debug('Opened file for writing in cache [{}]'.format(upload_file.file_id()))
 
-            if self.remote_enabled():
-                if sync:
-                    # TODO: Configure timeout.
-                    self.async_controller().start_upload(local_file_id, file_size, timeout=30)
-
             #
-            # Read the file in chunks of the configured chunk size and append to
-            # the file in the cache.
+            # The upload streams from the cache while the file is written. In
+            # a shared store it's only started once the file is closed, it
+            # may be run by another server process that can't follow the
+            # writes.
             #
-            bytes_read = 0
-            while bytes_read < file_size:
-                # TODO: Config this from read buffer size.
-                data = file.read(min(file_size - bytes_read, 64*1024))
-                data_len = len(data)
-                if data_len == 0:
-                    raise FileUploadError('Could not read all upload file data!', FileServerErrorCode.IO_ERROR)
-                bytes_read += data_len
-                upload_file.write(data)
+            upload_started = False
+            if self.remote_enabled():
+                if sync and file_size is not None and not self.store().shared():
+                    self.async_controller().start_upload(local_file_id, file_size)
+                    upload_started = True
+
+            if upload is not None:
+                #
+                # The parts are stored encrypted with the same key, link their
+                # chunks into the file rather than copying the data.
+                #
+                bytes_read = self.upload_mgr().append_parts(upload, upload_file)
+            else:
+                #
+                # Read the file in chunks of the configured chunk size and append to
+                # the file in the cache.
+                #
+                bytes_read = 0
+                while file_size is None or bytes_read < file_size:
+                    # TODO: Config this from read buffer size.
+                    read_len = 64*1024 if file_size is None else min(file_size - bytes_read, 64*1024)
+                    data = file.read(read_len)
+                    data_len = len(data)
+                    if data_len == 0:
+                        if file_size is None:
+                            break
+                        raise FileUploadError('Could not read all upload file data!', FileServerErrorCode.IO_ERROR)
+                    bytes_read += data_len
+                    upload_file.write(data)
             upload_file.flush()
 
+            if file_size is None:
+                if bytes_read == 0:
+                    raise FileUploadError('Missing file data', FileServerErrorCode.INVALID_FILE_SIZE)
+                file_size = bytes_read
+                logging.debug('Read upload file of size [{}]'.format(str_mem_size(file_size)))
+
             # bytes_transferred = chunked_copy(file, upload_file, file_size, self.store().file_chunk_size())
             if bytes_read < file_size:
                 raise FileUploadError('Could not upload all file data! [{}/{}]'.format(str_mem_size(bytes_read), str_mem_size(file_size)))
@@ -219,14 +312,11 @@ class LocalServerController(Controller):
             self.db().update_file_local(path, file_name, file_version, upload_file.file_id(), key_id, file_size, size_on_disk, total_chunks, transfer_status=FileTransferStatus.SYNCED_DATA)
             logging.debug('File metadata updated')
 
-            #
-            # If this is a synced upload, make sure all data has made it to the
-            # the remote server before returning a response to the caller.
-            #
             if self.remote_enabled():
                 if sync:
-                    # TODO: Configure timeout.
-                    self.async_controller().commit_upload(local_file_id, timeout=30)
+                    if not upload_started:
+                        self.async_controller().start_upload(local_file_id, file_size)
+                    self.async_controller().commit_upload(local_file_id)
         except Exception as e:
             logging.error('Could not upload file: {}'.format(str(e)))
             log_exception_stack()
@@ -268,9 +358,123 @@ class LocalServerController(Controller):
 
             raise e
 
+        #
+        # If this is a synced upload, make sure all data has made it to the
+        # the remote server before returning a response to the caller. The
+        # file is kept if this fails, the upload is retried in the background.
+        #
+        if self.remote_enabled():
+            if sync:
+                self.async_controller().wait_for_upload(local_file_id, self.async_controller().sync_upload_timeout())
+
         logging.debug('Uploaded file [{}]'.format(str_path(path + [file_name])))
 
-    def download_file(self, path: list[str], file_name: str, file: BinaryIO, file_version: Optional[int]=None, api_callback: Optional[Callable[[str, FileType, int], None]]=None, metadata_only: bool=False):
+    def start_multipart_upload(self, path: list[str], file_name: str, key_id: str) -> str:
+        '''
+            Start uploading a file in parts (see upload_part). The file is
+            only created once the upload is completed.
+        '''
+        logging.debug('Start multipart upload file [{}]'.format(str_path(path + [file_name])))
+        if len(file_name) == 0:
+            raise FileError('File name can\'t be empty!', FileServerErrorCode.FILE_NAME_EMPTY)
+        # Fail early if the key can't be used.
+        self.chunk_encryptor(key_id)
+        upload = self.upload_mgr().start_upload(path, file_name, key_id)
+        return upload.upload_id()
+
+    def upload_part(self, upload_id: str, part_num: int, file: BinaryIO, part_size: int) -> None:
+        '''
+            Store part part_num (from 1) of a multipart upload, read from
+            file. Parts may be uploaded in any order and in parallel, a part
+            uploaded again replaces the earlier one.
+        '''
+        logging.debug('Upload part [{}] of multipart upload [{}] size [{}]'.format(part_num, upload_id, part_size))
+        upload = self.upload_mgr().get_upload(upload_id)
+        if part_size <= 0 or part_size > self.store().max_file_size():
+            raise FileError('Invalid part size [{}]'.format(part_size), FileServerErrorCode.INVALID_FILE_SIZE)
+        admission = self.admission_control().admit(part_size)
+        try:
+            self.upload_mgr().start_part(upload, part_num)
+        except Exception as e:
+            admission.release()
+            raise e
+
+        part_file = None
+        part_stored = False
+        try:
+            # Parts are encrypted in the store like the file itself.
+            part_file = self.store().write_file(alloc_space=part_size, encode_chunk=self.chunk_encryptor(upload.key_id()))
+            bytes_read = 0
+            while bytes_read < part_size:
+                data = file.read(min(part_size - bytes_read, 64*1024))
+                if len(data) == 0:
+                    raise FileUploadError('Could not read all upload part data!', FileServerErrorCode.IO_ERROR)
+                bytes_read += len(data)
+                part_file.write(data)
+            part_file.flush()
+            self.store().close_file(part_file, removable=False, writable=False)
+            part_stored = True
+        except Exception as e:
+            logging.error('Could not upload part [{}] of multipart upload [{}]: {}'.format(part_num, upload_id, str(e)))
+            if part_file is not None:
+                if not part_file.closed():
+                    try:
+                        self.store().close_file(part_file, removable=True)
+                    except Exception as e1:
+                        logging.error('Could not close upload part file in cache: {}'.format(str(e1)))
+                self.upload_mgr().remove_part_file(part_file.file_id())
+            raise e
+        finally:
+            self.upload_mgr().end_part(upload, part_num, part_file.file_id() if part_stored else None, part_size)
+            admission.release()
+
+    def get_multipart_upload(self, upload_id: str) -> dict:
+        return self.upload_mgr().get_upload(upload_id).to_dict()
+
+    def complete_multipart_upload(self, upload_id: str, sync: bool=True) -> None:
+        '''
+            Create the file from the parts of a multipart upload, numbered 1
+            to N with none missing. The parts are kept if this fails so it can
+            be retried.
+
+            The chunks of the parts are hard linked into the file, no data is
+            copied. Their space is counted twice in the store until the parts
+            are removed.
+        '''
+        logging.debug('Complete multipart upload [{}]'.format(upload_id))
+        upload = self.upload_mgr().get_upload(upload_id)
+        upload = self.upload_mgr().start_complete(upload)
+
+        completed = False
+        try:
+            # The parts were admitted as they were uploaded and linking them
+            # into the file takes no new store space, so it isn't admitted
+            # again.
+            self.upload_file_data(upload.path(), upload.file_name(), None, upload.total_size(), 1, upload.key_id(), sync=sync, upload=upload)
+            completed = True
+        finally:
+            self.upload_mgr().end_complete(upload, completed)
+        logging.debug('Completed multipart upload [{}]'.format(upload_id))
+
+    def abort_multipart_upload(self, upload_id: str) -> None:
+        logging.debug('Abort multipart upload [{}]'.format(upload_id))
+        upload = self.upload_mgr().get_upload(upload_id)
+        self.upload_mgr().remove_upload(upload, abort=True)
+
+    def download_file(self, path: list[str], file_name: str, file: BinaryIO, file_version: Optional[int]=None, api_callback: Optional[Callable[[str, FileType, int], None]]=None, metadata_only: bool=False, sock: Optional[socket.socket]=None, check_modified: Optional[Callable[[str, int, int], bool]]=None):
+        '''
+            Write the file's data to file. If sock (the socket underneath
+            file) is given, unencrypted chunks are sent to it straight from
+            the cache (see File.send_chunk).
+
+            check_modified(local_id, version, created_timestamp) is called
+            before the file is opened, the download stops there if it returns
+            False (ex. the client's copy is current).
+
+            The download then waits its turn if the server is at its transfer
+            limits (see AdmissionControl). It reserves no store space, files
+            downloaded from the remote server are evictable.
+        '''
         logging.debug('Download file [{}] version [{}]'.format(str_path(path + [file_name]), file_version))
 
         file_metadata = self.db().get_file_version_metadata(path, file_name, file_version)
@@ -286,58 +490,84 @@ class LocalServerController(Controller):
         logging.debug('File local transfer status [{}]'.format(transfer_status.name))
         if transfer_status != FileTransferStatus.SYNCED_DATA:
             raise FileDownloadError('Cannot download file [{}]. File is not fully uploaded'.format(file_id), FileServerErrorCode.FILE_NOT_READABLE)
-        
-        chunk_decryptor = self.chunk_decryptor(key_id)
 
-        #
-        # First, try reading the file from the cache if it is already
-        # present there.
-        #
-        download_file = self.store().read_file(file_id, decode_chunk=chunk_decryptor)
+        if check_modified is not None:
+            created_timestamp = self.db().get_file_version_timestamp(file_metadata.file_id, file_metadata.version)
+            if not check_modified(file_id, file_metadata.version, created_timestamp):
+                logging.debug('File [{}] not modified'.format(file_id))
+                return
+
+        admission = self.admission_control().admit()
+        try:
+            chunk_decryptor = self.chunk_decryptor(key_id)
 
-        if download_file is None:
             #
-            # Cache miss, download the file into the cache.
+            # In a shared store the file may be being downloaded by another
+            # server process. The download can't be followed from here, wait
+            # for it to finish.
             #
-            logging.debug('Cache miss, starting download')
-            self.async_controller().start_download(file_id, timeout=30)
-            download_file = self.store().read_file(file_id, decode_chunk=chunk_decryptor)
+            shared = self.store().shared()
+            if shared and self.async_controller().has_download(file_id):
+                self.async_controller().wait_for_download(file_id)
 
-        #
-        # Cache hit, send the file to the client.
-        #
-        logging.debug('Opened file [{}] for reading in cache'.format(download_file.file_id()))
+            #
+            # First, try reading the file from the cache if it is already
+            # present there.
+            #
+            download_file = self.store().read_file(file_id, decode_chunk=chunk_decryptor)
 
-        try:
-            if api_callback is not None:
+            if download_file is None:
                 #
-                # Notify the API of the file-type, file-size etc. in case it
-                # needs to send headers before we transfer the actual file.
+                # Cache miss, download the file into the cache.
                 #
-                api_callback(file_id, file_type, file_size)
-
-            if metadata_only:
-                logging.debug('Metadata sent. Done')
-                return
+                logging.debug('Cache miss, starting download')
+                self.async_controller().start_download(file_id)
+                if shared:
+                    self.async_controller().wait_for_download(file_id)
+                download_file = self.store().read_file(file_id, decode_chunk=chunk_decryptor)
 
-            bytes_transferred = 0
-            try:
-                for _ in range(total_chunks):
-                    chunk_data = download_file.read_chunk()
-                    bytes_transferred += write_all(file, chunk_data)
+            #
+            # Cache hit, send the file to the client.
+            #
+            logging.debug('Opened file [{}] for reading in cache'.format(download_file.file_id()))
 
-                if bytes_transferred < file_size:
-                    logging.error('Could not download all file data! [{}/{}]'.format(str_mem_size(bytes_transferred), str_mem_size(file_size)))
-            except Exception as e:
-                logging.error('Could not download all file data! [{}/{}]: {}'.format(str_mem_size(bytes_transferred), str_mem_size(file_size)), str(e))
-                log_exception_stack()
-        finally:
             try:
-                self.store().close_file(download_file)
-            except Exception as e:
-                logging.warn('Could not close download file in cache: {}'.format(str(e)))
+                if api_callback is not None:
+                    #
+                    # Notify the API of the file-type, file-size etc. in case it
+                    # needs to send headers before we transfer the actual file.
+                    #
+                    api_callback(file_id, file_type, file_size)
+
+                if metadata_only:
+                    logging.debug('Metadata sent. Done')
+                    return
+
+                bytes_transferred = 0
+                sendfile = sock is not None and download_file.can_sendfile()
+                logging.debug('Download sendfile [{}]'.format(sendfile))
+                try:
+                    for _ in range(total_chunks):
+                        if sendfile:
+                            bytes_transferred += download_file.send_chunk(sock)
+                        else:
+                            chunk_data = download_file.read_chunk()
+                            bytes_transferred += write_all(file, chunk_data)
+
+                    if bytes_transferred < file_size:
+                        logging.error('Could not download all file data! [{}/{}]'.format(str_mem_size(bytes_transferred), str_mem_size(file_size)))
+                except Exception as e:
+                    logging.error('Could not download all file data! [{}/{}]: {}'.format(str_mem_size(bytes_transferred), str_mem_size(file_size)), str(e))
+                    log_exception_stack()
+            finally:
+                try:
+                    self.store().close_file(download_file)
+                except Exception as e:
+                    logging.warn('Could not close download file in cache: {}'.format(str(e)))
         
-        logging.debug('File data downloaded [{}]'.format(str_mem_size(bytes_transferred)))
+            logging.debug('File data downloaded [{}]'.format(str_mem_size(bytes_transferred)))
+        finally:
+            admission.release()
 
     def remove_file_check_readers_cb(self, path: list[str], file_name: str, version: Optional[int], local_id: str, remote_id: str):
         try:
@@ -382,6 +612,38 @@ class LocalServerController(Controller):
         finally:
             self.db_conn_mgr().db_close(conn)
     
+    def list_directory_page(self, path: list[str], after: Optional[str]=None, limit: int=LIST_PAGE_SIZE, show_hidden: bool=False) -> list[tuple]:
+        logging.debug('List directory [{}] after [{}] limit [{}]'.format(str_path(path), after, limit))
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            dir_dao = self._dao_factory.directory_dao(conn)
+            return dir_dao.list_directory_page(path, after, limit, show_hidden)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def iter_directory(self, path: list[str], after: Optional[str]=None, limit: Optional[int]=None, show_hidden: bool=False) -> Iterator[tuple]:
+        '''
+            Iterate over the directory's entries (sorted by name) a page at a
+            time. Each page is listed in a transaction of its own, so the
+            database isn't held while the entries are consumed.
+        '''
+        while limit is None or limit > 0:
+            page_size = LIST_PAGE_SIZE if limit is None else min(limit, LIST_PAGE_SIZE)
+            entries = self.list_directory_page(path, after, page_size, show_hidden)
+            yield from entries
+            if len(entries) < page_size:
+                return
+            after = entries[-1][1]
+            if limit is not None:
+                limit -= len(entries)
+
+    def get_directory_version(self, path: list[str]) -> tuple[int, int]:
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            return self._dao_factory.directory_dao(conn).get_directory_version(path)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
     def get_file_metadata(self, path: list[str], file_name: str, show_hidden: bool=False):
         logging.debug('Get file metadata [{}]'.format(str_path(path + [file_name])))
         conn = self.db_conn_mgr().db_connect()
@@ -408,4 +670,88 @@ class LocalServerController(Controller):
                 ]
             }
         finally:
-            self.db_conn_mgr().db_close(conn)
\ No newline at end of file
+            self.db_conn_mgr().db_close(conn)
+
+    def get_transfer_progress(self, path: list[str], file_name: str):
+        logging.debug('Get file transfer progress [{}]'.format(str_path(path + [file_name])))
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            file_dao = self._dao_factory.file_dao(conn)
+            file_metadata = file_dao.get_file_version_metadata(path, file_name)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+        progress = {
+            "local-file-id": file_metadata.local_id,
+            "total-chunks": file_metadata.total_chunks,
+            "local-transfer-status": file_metadata.local_transfer_status.name,
+            "remote-transfer-status": file_metadata.remote_transfer_status.name,
+            "upload": {
+                "transferred-chunks": file_metadata.uploaded_chunks,
+                "in-progress": False
+            },
+            "download": {
+                "transferred-chunks": file_metadata.downloaded_chunks,
+                "in-progress": False
+            }
+        }
+        if file_metadata.local_id is not None:
+            progress["upload"]["in-progress"] = len(self.async_controller().get_futures(file_metadata.local_id, UPLOAD_WORKER)) > 0
+            progress["download"]["in-progress"] = len(self.async_controller().get_futures(file_metadata.local_id, DOWNLOAD_WORKER)) > 0
+        return progress
+
+    def wait_for_transfer_progress(self, path: list[str], file_name: str, timeout: float):
+        '''
+            Wait up to timeout seconds for the file's transfers to report
+            progress or finish, then return the transfer progress (see
+            get_transfer_progress). Returns right away if nothing is being
+            transferred.
+        '''
+        progress = self.get_transfer_progress(path, file_name)
+        local_file_id = progress["local-file-id"]
+        if local_file_id is None:
+            return progress
+        futures = self.async_controller().get_futures(local_file_id)
+        if len(futures) == 0:
+            return progress
+
+        changed = Event()
+        def on_progress(future, transferred_chunks, total_chunks):
+            changed.set()
+        for future in futures:
+            future.add_progress_callback(on_progress)
+            future.add_done_callback(lambda future: changed.set())
+        try:
+            # Don't miss a change made before the callbacks were added.
+            if self.get_transfer_progress(path, file_name) != progress:
+                changed.set()
+            logging.debug('Waiting for file [{}] transfer progress'.format(local_file_id))
+            changed.wait(timeout)
+        finally:
+            for future in futures:
+                future.remove_progress_callback(on_progress)
+        return self.get_transfer_progress(path, file_name)
+
+    def get_metrics(self):
+        return {
+            "bandwidth": self.async_controller().bandwidth_limiter().metrics(),
+            "endpoints": self.async_controller().endpoint_selector().metrics(),
+            "hedging": self.async_controller().endpoint_selector().hedge_metrics(),
+            "retries": self.async_controller().retry_policy().metrics(),
+            "admission": self.admission_control().metrics()
+        }
+
+    def set_bandwidth_limit(self, direction: str, limit: Optional[float]=None, schedule: Optional[RateSchedule]=None, clear_schedule: bool=False, burst: Optional[float]=None):
+        '''
+            Change the bandwidth limit, burst size and/or schedule. Whatever
+            isn't given keeps its current value.
+        '''
+        bandwidth_limiter = self.async_controller().bandwidth_limiter()
+        if limit is not None or burst is not None:
+            if limit is None:
+                limit = bandwidth_limiter.limit(direction)
+            if burst is None:
+                burst = bandwidth_limiter.burst(direction)
+            bandwidth_limiter.set_limit(direction, limit, burst)
+        if schedule is not None or clear_schedule:
+            bandwidth_limiter.set_schedule(direction, schedule)
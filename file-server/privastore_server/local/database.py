@@ -1,8 +1,12 @@
 from .db.dao_factory import DAOFactory
 from ..db.db_conn_mgr import DbConnectionManager
 from .db.file_dao import FileMetadata, FileVersionMetadata
+from .db.remote_dao import FileReplica, FileShard
+from .db.task_dao import TaskMetadata
 from .file_transfer_status import FileTransferStatus
 from .file_type import FileType
+from ..remote_client import RemoteEndpoint
+from .task_status import TaskStatus
 from typing import Callable, Optional
 
 class DbWrapper(object):
@@ -36,6 +40,13 @@ class DbWrapper(object):
         finally:
             self.db_conn_mgr().db_close(conn)
 
+    def get_file_version_timestamp(self, file_id: int, version: int) -> int:
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            return self.dao_factory().file_dao(conn).get_file_version_timestamp(file_id, version)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
     def get_file_metadata(self, local_id: str) -> 'FileMetadata':
         conn = self.db_conn_mgr().db_connect()
         try:
@@ -57,7 +68,7 @@ class DbWrapper(object):
         finally:
             self.db_conn_mgr().db_close(conn)
 
-    def update_file_remote(self, local_id: str, remote_id: Optional[str]=None, transfer_status: FileTransferStatus=FileTransferStatus.NONE, transferred_chunks: int=0):
+    def update_file_remote(self, local_id: str, remote_id: Optional[str]=None, transfer_status: FileTransferStatus=FileTransferStatus.NONE, transferred_chunks: Optional[int]=None):
         conn = self.db_conn_mgr().db_connect()
         try:
             self.dao_factory().file_dao(conn).update_file_remote(local_id, remote_id, transfer_status, transferred_chunks)
@@ -83,4 +94,123 @@ class DbWrapper(object):
         try:
             self.dao_factory().file_dao(conn).remove_file_data(local_id)
         finally:
-            self.db_conn_mgr().db_close(conn)
\ No newline at end of file
+            self.db_conn_mgr().db_close(conn)
+
+    def add_task(self, task_key: str, worker_type: str, task_code: int, local_id: str, epoch_no: Optional[int]=None, file_size: Optional[int]=None, lease_owner: Optional[str]=None, lease_time: Optional[float]=None) -> tuple[int, bool]:
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            return self.dao_factory().task_dao(conn).add_task(task_key, worker_type, task_code, local_id, epoch_no, file_size, lease_owner, lease_time)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def get_task(self, task_id: int) -> 'TaskMetadata':
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            return self.dao_factory().task_dao(conn).get_task(task_id)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def list_tasks(self, local_id: Optional[str]=None, worker_type: Optional[str]=None, status: Optional[TaskStatus]=None) -> list['TaskMetadata']:
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            return self.dao_factory().task_dao(conn).list_tasks(local_id, worker_type, status)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def lease_tasks(self, worker_type: str, lease_owner: str, lease_time: float, batch_size: int) -> list['TaskMetadata']:
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            return self.dao_factory().task_dao(conn).lease_tasks(worker_type, lease_owner, lease_time, batch_size)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def renew_leases(self, lease_owner: str, lease_time: float) -> int:
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            return self.dao_factory().task_dao(conn).renew_leases(lease_owner, lease_time)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def release_leases(self, lease_owner: Optional[str]=None, task_ids: Optional[list[int]]=None) -> int:
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            return self.dao_factory().task_dao(conn).release_leases(lease_owner, task_ids)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def complete_task(self, task_id: int):
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            self.dao_factory().task_dao(conn).complete_task(task_id)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def retry_task(self, task_id: int, error: str, next_attempt: float, count_retry: bool=True):
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            self.dao_factory().task_dao(conn).retry_task(task_id, error, next_attempt, count_retry)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def fail_task(self, task_id: int, error: str):
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            self.dao_factory().task_dao(conn).fail_task(task_id, error)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def fail_tasks(self, local_id: str, worker_type: str, task_code: int, error: str) -> int:
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            return self.dao_factory().task_dao(conn).fail_tasks(local_id, worker_type, task_code, error)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def remove_tasks(self, local_id: Optional[str]=None, worker_type: Optional[str]=None, include_leased: bool=False) -> int:
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            return self.dao_factory().task_dao(conn).remove_tasks(local_id, worker_type, include_leased)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def get_file_replicas(self, remote_id: str) -> list['FileReplica']:
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            return self.dao_factory().remote_dao(conn).get_file_replicas(remote_id)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def update_file_replica(self, remote_id: str, endpoint: RemoteEndpoint, transfer_status: FileTransferStatus, transferred_chunks: int=0) -> None:
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            self.dao_factory().remote_dao(conn).update_file_replica(remote_id, endpoint, transfer_status, transferred_chunks)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def remove_file_replicas(self, remote_id: str, endpoints: Optional[list[RemoteEndpoint]]=None) -> None:
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            self.dao_factory().remote_dao(conn).remove_file_replicas(remote_id, endpoints)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def get_file_shards(self, remote_id: str) -> list['FileShard']:
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            return self.dao_factory().remote_dao(conn).get_file_shards(remote_id)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def update_file_shard(self, remote_id: str, shard_index: int, shard_id: str, endpoint: RemoteEndpoint, data_shards: int, transfer_status: FileTransferStatus, transferred_chunks: int=0) -> None:
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            self.dao_factory().remote_dao(conn).update_file_shard(remote_id, shard_index, shard_id, endpoint, data_shards, transfer_status, transferred_chunks)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+    def remove_file_shards(self, remote_id: str, shard_indexes: Optional[list[int]]=None) -> None:
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            self.dao_factory().remote_dao(conn).remove_file_shards(remote_id, shard_indexes)
+        finally:
+            self.db_conn_mgr().db_close(conn)
@@ -3,6 +3,7 @@ from .file_dao import FileDAO
 from .key_dao import KeyDAO
 from .log_dao import LogDAO
 from .remote_dao import RemoteDAO
+from .task_dao import TaskDAO
 from .user_dao import UserDAO
 import sqlite3
 
@@ -27,4 +28,7 @@ class DAOFactory(object):
         raise Exception('Not implemented!')
 
     def remote_dao(self, conn: sqlite3.Connection) -> RemoteDAO:
+        raise Exception('Not implemented!')
+
+    def task_dao(self, conn: sqlite3.Connection) -> TaskDAO:
         raise Exception('Not implemented!')
\ No newline at end of file
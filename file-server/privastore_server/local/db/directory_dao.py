@@ -49,6 +49,18 @@ class DirectoryDAO(DataAccessObject):
     def remove_file(self, path: list[str], file_name: str, remove_file_cb: Optional[Callable[[list[str], str, Optional[int], str, str], None]]=None, is_hidden: bool=False) -> None:
         raise Exception('Not implemented')
 
+    '''
+        Get the directory's id and a counter of the changes to its entries
+        (directories and files created, removed or that finished uploading).
+        Used to tell if a listing is still current.
+
+        path - Path to the directory.
+
+        Throws DirectoryError is path doesn't exist.
+    '''
+    def get_directory_version(self, path: list[str]) -> tuple[int, int]:
+        raise Exception('Not implemented!')
+
     '''
         List directory entries.
 
@@ -60,4 +72,20 @@ class DirectoryDAO(DataAccessObject):
         Throws DirectoryError is path doesn't exist.
     '''
     def list_directory(self, path: list[str], show_hidden: bool=False) -> list[tuple]:
+        raise Exception('Not implemented!')
+
+    '''
+        List a page of directory entries, sorted by name (directories and
+        files together).
+
+        path - Path to the directory.
+        after - Name of the last entry of the previous page, None for the
+         first page.
+        limit - Maximum number of entries.
+        show_hidden - Show hidden directories.
+
+        Returns a list of tuples as for list_directory.
+        Throws DirectoryError is path doesn't exist.
+    '''
+    def list_directory_page(self, path: list[str], after: Optional[str]=None, limit: int=1000, show_hidden: bool=False) -> list[tuple]:
         raise Exception('Not implemented!')
\ No newline at end of file
@@ -14,6 +14,9 @@ class FileDAO(DataAccessObject):
     def get_file_version_metadata(self, path: list[str], file_name: str, version: Optional[int]=None) -> 'FileVersionMetadata':
         raise Exception('Not implemented!')
     
+    def get_file_version_timestamp(self, file_id: int, version: int) -> int:
+        raise Exception('Not implemented!')
+
     def get_file_metadata(self, local_id: str) -> 'FileMetadata':
         raise Exception('Not implemented!')
 
@@ -26,7 +29,7 @@ class FileDAO(DataAccessObject):
     def update_file_local(self, path: list[str], file_name: str, version: int, local_id: str, key_id: str, file_size: int, size_on_disk: int, total_chunks: int, transfer_status: FileTransferStatus=FileTransferStatus.NONE) -> None:
         raise Exception('Not implemented!')
 
-    def update_file_remote(self, local_id: str, remote_id: Optional[str]=None, transfer_status: FileTransferStatus=FileTransferStatus.NONE, transferred_chunks: int=0) -> None:
+    def update_file_remote(self, local_id: str, remote_id: Optional[str]=None, transfer_status: FileTransferStatus=FileTransferStatus.NONE, transferred_chunks: Optional[int]=None) -> None:
         raise Exception('Not implemented!')
     
     def update_file_download(self, local_id: str, transferred_chunks: int=0) -> None:
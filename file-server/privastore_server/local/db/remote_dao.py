@@ -1,5 +1,11 @@
+from collections import namedtuple
 from ...db.dao import DataAccessObject
+from ..file_transfer_status import FileTransferStatus
 from ...remote_client import RemoteEndpoint, RemoteCredentials
+from typing import Optional
+
+FileReplica = namedtuple('FileReplica', ['remote_id', 'endpoint', 'transfer_status', 'transferred_chunks'])
+FileShard = namedtuple('FileShard', ['remote_id', 'shard_index', 'shard_id', 'endpoint', 'data_shards', 'transfer_status', 'transferred_chunks'])
 
 class RemoteDAO(DataAccessObject):
 
@@ -10,4 +16,45 @@ class RemoteDAO(DataAccessObject):
         raise Exception('Not implemented!')
 
     def get_remote_servers(self, cluster_name: str) -> list[RemoteEndpoint]:
-        raise Exception('Not implemented!')
\ No newline at end of file
+        raise Exception('Not implemented!')
+
+    '''
+        Get the endpoints holding a replica of the remote file (see
+        replication.Replicator).
+    '''
+    def get_file_replicas(self, remote_id: str) -> list['FileReplica']:
+        raise Exception('Not implemented!')
+
+    '''
+        Add or update the remote file's replica on the given endpoint.
+    '''
+    def update_file_replica(self, remote_id: str, endpoint: RemoteEndpoint, transfer_status: FileTransferStatus, transferred_chunks: int=0) -> None:
+        raise Exception('Not implemented!')
+
+    '''
+        Remove the remote file's replicas on the given endpoints, or all of
+        them if endpoints is None.
+    '''
+    def remove_file_replicas(self, remote_id: str, endpoints: Optional[list[RemoteEndpoint]]=None) -> None:
+        raise Exception('Not implemented!')
+
+    '''
+        Get the erasure coded shards of the remote file (see
+        replication.ErasureCoder), by shard index.
+    '''
+    def get_file_shards(self, remote_id: str) -> list['FileShard']:
+        raise Exception('Not implemented!')
+
+    '''
+        Add or update a shard of the remote file. The shard is stored as
+        remote file shard_id on the given endpoint.
+    '''
+    def update_file_shard(self, remote_id: str, shard_index: int, shard_id: str, endpoint: RemoteEndpoint, data_shards: int, transfer_status: FileTransferStatus, transferred_chunks: int=0) -> None:
+        raise Exception('Not implemented!')
+
+    '''
+        Remove the remote file's shards with the given indexes, or all of them
+        if shard_indexes is None.
+    '''
+    def remove_file_shards(self, remote_id: str, shard_indexes: Optional[list[int]]=None) -> None:
+        raise Exception('Not implemented!')
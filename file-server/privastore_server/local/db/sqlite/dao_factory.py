@@ -4,6 +4,7 @@ from .file_dao import SqliteFileDAO
 from .key_dao import SqliteKeyDAO
 from .log_dao import SqliteLogDAO
 from .remote_dao import SqliteRemoteDAO
+from .task_dao import SqliteTaskDAO
 from .user_dao import SqliteUserDAO
 
 class SqliteDAOFactory(DAOFactory):
@@ -27,4 +28,7 @@ class SqliteDAOFactory(DAOFactory):
         return SqliteLogDAO(conn)
 
     def remote_dao(self, conn):
-        return SqliteRemoteDAO(conn)
\ No newline at end of file
+        return SqliteRemoteDAO(conn)
+
+    def task_dao(self, conn):
+        return SqliteTaskDAO(conn)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from ..directory_dao import DirectoryDAO
-from .directory_util import query_directory_id, query_file_id, traverse_path
+from .directory_util import query_directory_id, query_file_id, touch_directory, traverse_path
 from ....error import DirectoryError, FileError, FileServerErrorCode
 from ....file import File
 from ...file_transfer_status import FileTransferStatus
@@ -28,6 +28,7 @@ class SqliteDirectoryDAO(DirectoryDAO):
                 cur.execute('INSERT INTO ps_directory (name, is_hidden) VALUES (?, ?)', (directory_name, is_hidden))
                 created_directory_id = cur.lastrowid
                 cur.execute('INSERT INTO ps_link (parent_id, child_id) VALUES (?, ?)', (directory_id, created_directory_id))
+                touch_directory(cur, directory_id)
                 self._conn.commit()
                 return created_directory_id
             except DirectoryError as e:
@@ -68,6 +69,7 @@ class SqliteDirectoryDAO(DirectoryDAO):
                 file_data_id = cur.lastrowid
                 cur.execute('INSERT INTO ps_file_version (file_id, version, created_timestamp, file_data_id) VALUES (?, ?, ?, ?)', 
                     (created_file_id, 1, now, file_data_id))
+                touch_directory(cur, directory_id)
                 self._conn.commit()
                 return created_file_id
             except DirectoryError as e:
@@ -118,6 +120,8 @@ class SqliteDirectoryDAO(DirectoryDAO):
                 if cur.rowcount == 0:
                     raise FileError('File [{}] not found!'.format(str_path(path + [file_name])), FileServerErrorCode.FILE_NOT_FOUND)
 
+                touch_directory(cur, directory_id)
+
                 if remove_file_cb is not None:
                     for version, local_id, remote_id in remove_file_cb_args:
                         remove_file_cb(path, file_name, version, local_id, remote_id)
@@ -141,6 +145,30 @@ class SqliteDirectoryDAO(DirectoryDAO):
             except:
                 pass
 
+    def get_directory_version(self, path):
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('BEGIN')
+                directory_id = traverse_path(cur, path)
+                cur.execute('SELECT change_counter FROM ps_directory WHERE id = ?', (directory_id,))
+                change_counter, = cur.fetchone()
+                self._conn.commit()
+                return directory_id, change_counter
+            except DirectoryError as e:
+                logging.error('Directory error: {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
     def list_directory(self, path, show_hidden=False):
         cur = self._conn.cursor()
         try:
@@ -175,4 +203,44 @@ class SqliteDirectoryDAO(DirectoryDAO):
             try:
                 cur.close()
             except:
-                pass
\ No newline at end of file
+                pass
+
+    def list_directory_page(self, path, after=None, limit=1000, show_hidden=False):
+        if limit < 1:
+            raise DirectoryError('Invalid listing limit [{}]'.format(limit), FileServerErrorCode.INVALID_REQUEST)
+        after = after if after is not None else ''
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('BEGIN')
+                directory_id = traverse_path(cur, path)
+                # Up to limit entries of each type after the cursor, merged
+                # below. Files are range scanned on (parent_id, name).
+                cur.execute('''SELECT D.name
+                    FROM ps_directory AS D INNER JOIN ps_link AS L ON D.id = L.child_id
+                    WHERE L.parent_id = ? AND D.name > ? AND (D.is_hidden <> 1 OR D.is_hidden = ?)
+                    ORDER BY D.name ASC LIMIT ?''', (directory_id, after, show_hidden, limit))
+                directories = [('d', directory_name[0]) for directory_name in cur.fetchall()]
+                cur.execute('''SELECT F.name
+                    FROM ps_file AS F
+                    WHERE F.parent_id = ? AND F.name > ? AND (F.is_hidden <> 1 OR F.is_hidden = ?) AND EXISTS (
+                        SELECT 1 FROM ps_file_version AS V INNER JOIN ps_file_data AS D on V.file_data_id = D.id
+                        WHERE V.file_id = F.id AND D.local_transfer_status <> ?)
+                    ORDER BY F.name ASC LIMIT ?''', (directory_id, after, show_hidden, FileTransferStatus.TRANSFERRING_DATA.value, limit))
+                files = [('f', file_name[0]) for file_name in cur.fetchall()]
+                self._conn.commit()
+                # Names are unique in a directory.
+                return sorted(directories + files, key=lambda entry: entry[1])[:limit]
+            except DirectoryError as e:
+                logging.error('Directory error: {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
@@ -24,6 +24,19 @@ def query_file_id(cur: sqlite3.Cursor, parent_directory_id: int, file_name: str,
         return None
     return res[0]
 
+def touch_directory(cur: sqlite3.Cursor, directory_id: int) -> None:
+    '''
+        Count a change to the directory's entries (see
+        DirectoryDAO.get_directory_version).
+    '''
+    cur.execute('UPDATE ps_directory SET change_counter = change_counter + 1 WHERE id = ?', (directory_id,))
+
+def touch_file_directory(cur: sqlite3.Cursor, file_id: int) -> None:
+    cur.execute('''
+        UPDATE ps_directory SET change_counter = change_counter + 1
+        WHERE id = (SELECT parent_id FROM ps_file WHERE id = ?)
+    ''', (file_id,))
+
 def traverse_path(cur: sqlite3.Cursor, path: list[str]) -> int:
     # Start from root directory and iterate to the last directory in the path.
     #
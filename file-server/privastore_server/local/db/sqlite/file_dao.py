@@ -1,6 +1,6 @@
 from ..file_dao import FileDAO, FileMetadata, FileVersionMetadata
 from ....error import DirectoryError, FileError, FileServerErrorCode, KeyError
-from .directory_util import query_file_id, traverse_path
+from .directory_util import query_file_id, touch_file_directory, traverse_path
 from ....file import File
 from ...file_type import FileType
 from ...file_transfer_status import FileTransferStatus
@@ -79,6 +79,31 @@ class SqliteFileDAO(FileDAO):
             except:
                 pass
 
+    def get_file_version_timestamp(self, file_id: int, version: int) -> int:
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('BEGIN')
+                cur.execute('SELECT created_timestamp FROM ps_file_version WHERE file_id = ? AND version = ?', (file_id, version))
+                res = cur.fetchone()
+                if res is None:
+                    raise FileError('File version not found!', FileServerErrorCode.FILE_VERSION_NOT_FOUND)
+                self._conn.commit()
+                return res[0]
+            except FileError as e:
+                logging.error('File error: {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
     def get_file_metadata(self, local_id: str) -> 'FileMetadata':
         if not File.is_valid_file_id(local_id):
             raise FileError('Invalid local file id!', FileServerErrorCode.INVALID_FILE_ID)
@@ -130,48 +155,36 @@ class SqliteFileDAO(FileDAO):
             try:
                 unsynced = list()
                 query = '''
-                        SELECT V.file_id, V.version, D.local_id, D.remote_id, D.local_transfer_status, 
-                            D.remote_transfer_status 
-                        FROM ps_file_version AS V INNER JOIN ps_file_data AS D ON V.file_data_id = D.id
+                        SELECT V.file_id, F.file_type, V.version, D.local_id, D.remote_id, 
+                            K.name, D.file_size, D.size_on_disk, D.total_chunks, 
+                            D.uploaded_chunks, D.downloaded_chunks, 
+                            D.local_transfer_status, D.remote_transfer_status 
+                        FROM ps_file AS F INNER JOIN ps_file_version AS V ON F.id = V.file_id 
+                            INNER JOIN ps_file_data AS D ON V.file_data_id = D.id 
+                            INNER JOIN ps_key AS K ON K.id = D.key_id 
                         WHERE D.{} <> ?
                     '''
                 cur.execute('BEGIN')
+                columns = []
                 if local:
-                    cur.execute(query.format('local_transfer_status'), (FileTransferStatus.SYNCED_DATA.value,))
-                    for file_id, version, local_id, remote_id, local_transfer_status, remote_transfer_status in cur.fetchall():
-                        # TODO: Return other fields if required.
-                        unsynced.append(FileVersionMetadata(
-                            file_id,
-                            None,
-                            version,
-                            local_id,
-                            remote_id,
-                            None,
-                            None,
-                            None,
-                            None,
-                            None,
-                            None,
-                            FileTransferStatus(local_transfer_status),
-                            FileTransferStatus(remote_transfer_status)
-                        ))
-                
+                    columns.append('local_transfer_status')
                 if remote:
-                    cur.execute(query.format('remote_transfer_status'), (FileTransferStatus.SYNCED_DATA.value,))
-                    for file_id, version, local_id, remote_id, local_transfer_status, remote_transfer_status in cur.fetchall():
-                        # TODO: Return other fields if required.
+                    columns.append('remote_transfer_status')
+                for column in columns:
+                    cur.execute(query.format(column), (FileTransferStatus.SYNCED_DATA.value,))
+                    for file_id, file_type, version, local_id, remote_id, key_id, file_size, size_on_disk, total_chunks, uploaded_chunks, downloaded_chunks, local_transfer_status, remote_transfer_status in cur.fetchall():
                         unsynced.append(FileVersionMetadata(
                             file_id,
-                            None,
+                            FileType(file_type),
                             version,
                             local_id,
                             remote_id,
-                            None,
-                            None,
-                            None,
-                            None,
-                            None,
-                            None,
+                            key_id,
+                            file_size,
+                            size_on_disk,
+                            total_chunks,
+                            uploaded_chunks,
+                            downloaded_chunks,
                             FileTransferStatus(local_transfer_status),
                             FileTransferStatus(remote_transfer_status)
                         ))
@@ -236,7 +249,8 @@ class SqliteFileDAO(FileDAO):
             raise FileError('Invalid local file id!', FileServerErrorCode.INVALID_FILE_ID)
         if key_id != 'null' and not Key.is_valid_key_id(key_id):
             raise KeyError('Invalid key id!', FileServerErrorCode.INVALID_KEY_ID)
-        if file_size <= 0:
+        # The size of a file still being received may not be known yet.
+        if file_size < 0 or (file_size == 0 and transfer_status != FileTransferStatus.TRANSFERRING_DATA):
             raise FileError('File size must be >= 0', FileServerErrorCode.INVALID_FILE_SIZE)
         if size_on_disk < 0:
             raise FileError('File size on disk must be >= 0', FileServerErrorCode.INTERNAL_ERROR)
@@ -259,6 +273,8 @@ class SqliteFileDAO(FileDAO):
                     ''', (local_id, key_id, file_size, size_on_disk, total_chunks, total_chunks, transfer_status.value, file_data_id,))
                 if cur.rowcount != 1:
                     raise FileError('File [{}] version [{}] metadata could not be updated!'.format(str_path(path + [file_name]), version))
+                # Files being uploaded aren't listed.
+                touch_file_directory(cur, file_id)
                 self._conn.commit()
             except DirectoryError as e:
                 logging.error('Directory error: {}'.format(str(e)))
@@ -278,7 +294,7 @@ class SqliteFileDAO(FileDAO):
             except:
                 pass
     
-    def update_file_remote(self, local_id, remote_id = None, transfer_status = FileTransferStatus.NONE, transferred_chunks=0):
+    def update_file_remote(self, local_id, remote_id = None, transfer_status = FileTransferStatus.NONE, transferred_chunks = None):
         if not File.is_valid_file_id(local_id):
             raise FileError('Invalid local file id!', FileServerErrorCode.INVALID_FILE_ID)
         if remote_id is not None and not File.is_valid_file_id(remote_id):
@@ -287,11 +303,18 @@ class SqliteFileDAO(FileDAO):
         try:
             try:
                 if remote_id is not None:
+                    # New remote file, nothing uploaded to it yet.
                     cur.execute('''
                             UPDATE ps_file_data 
-                            SET remote_id = ?, remote_transfer_status = ? 
+                            SET remote_id = ?, remote_transfer_status = ?, uploaded_chunks = ? 
+                            WHERE local_id = ?
+                        ''', (remote_id, transfer_status.value, transferred_chunks if transferred_chunks is not None else 0, local_id))
+                elif transferred_chunks is None:
+                    cur.execute('''
+                            UPDATE ps_file_data 
+                            SET remote_transfer_status = ? 
                             WHERE local_id = ?
-                        ''', (remote_id, transfer_status.value, local_id))
+                        ''', (transfer_status.value, local_id))
                 else:
                     cur.execute('''
                             UPDATE ps_file_data 
@@ -363,6 +386,7 @@ class SqliteFileDAO(FileDAO):
                         ''', (local_transfer_status.value, file_data_id))
                     if cur.rowcount != 1:
                         raise FileError('File [{}] version [{}] not found!'.format(str_path(path + [file_name]), version), FileServerErrorCode.FILE_VERSION_NOT_FOUND)
+                    touch_file_directory(cur, file_id)
                 if remote_transfer_status is not None:
                     cur.execute('''
                             UPDATE ps_file_data  
@@ -426,6 +450,7 @@ class SqliteFileDAO(FileDAO):
         try:
             try:
                 cur.execute('BEGIN')
+                touch_file_directory(cur, file_id)
                 cur.execute(
                     '''
                         DELETE 
@@ -1,6 +1,7 @@
 import logging
 from ....error import RemoteServerError, FileServerErrorCode
-from ..remote_dao import RemoteDAO, RemoteCredentials, RemoteEndpoint
+from ...file_transfer_status import FileTransferStatus
+from ..remote_dao import FileReplica, FileShard, RemoteDAO, RemoteCredentials, RemoteEndpoint
 
 class SqliteRemoteDAO(RemoteDAO):
 
@@ -55,4 +56,146 @@ class SqliteRemoteDAO(RemoteDAO):
             try:
                 cur.close()
             except:
-                pass
\ No newline at end of file
+                pass
+    def get_file_replicas(self, remote_id):
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('''
+                    SELECT hostname, port, use_ssl, transfer_status, transferred_chunks
+                    FROM ps_file_replica
+                    WHERE remote_id = ?
+                    ORDER BY hostname, port
+                ''', (remote_id,))
+                replicas = list()
+                for hostname, port, use_ssl, transfer_status, transferred_chunks in cur.fetchall():
+                    replicas.append(FileReplica(remote_id, RemoteEndpoint(hostname, port, bool(use_ssl)), FileTransferStatus(transfer_status), transferred_chunks))
+                self._conn.commit()
+                return replicas
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
+    def update_file_replica(self, remote_id, endpoint, transfer_status, transferred_chunks=0):
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('''
+                    INSERT INTO ps_file_replica (remote_id, hostname, port, use_ssl, transfer_status, transferred_chunks)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (remote_id, hostname, port) DO UPDATE
+                    SET use_ssl = excluded.use_ssl, transfer_status = excluded.transfer_status, transferred_chunks = excluded.transferred_chunks
+                ''', (remote_id, endpoint.host(), endpoint.port(), endpoint.ssl(), transfer_status.value, transferred_chunks))
+                self._conn.commit()
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
+    def remove_file_replicas(self, remote_id, endpoints=None):
+        cur = self._conn.cursor()
+        try:
+            try:
+                if endpoints is None:
+                    cur.execute('''
+                        DELETE FROM ps_file_replica
+                        WHERE remote_id = ?
+                    ''', (remote_id,))
+                else:
+                    cur.executemany('''
+                        DELETE FROM ps_file_replica
+                        WHERE remote_id = ? AND hostname = ? AND port = ?
+                    ''', [(remote_id, endpoint.host(), endpoint.port()) for endpoint in endpoints])
+                self._conn.commit()
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
+    def get_file_shards(self, remote_id):
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('''
+                    SELECT shard_index, shard_id, hostname, port, use_ssl, data_shards, transfer_status, transferred_chunks
+                    FROM ps_file_shard
+                    WHERE remote_id = ?
+                    ORDER BY shard_index
+                ''', (remote_id,))
+                shards = list()
+                for shard_index, shard_id, hostname, port, use_ssl, data_shards, transfer_status, transferred_chunks in cur.fetchall():
+                    shards.append(FileShard(remote_id, shard_index, shard_id, RemoteEndpoint(hostname, port, bool(use_ssl)), data_shards, FileTransferStatus(transfer_status), transferred_chunks))
+                self._conn.commit()
+                return shards
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
+    def update_file_shard(self, remote_id, shard_index, shard_id, endpoint, data_shards, transfer_status, transferred_chunks=0):
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('''
+                    INSERT INTO ps_file_shard (remote_id, shard_index, shard_id, hostname, port, use_ssl, data_shards, transfer_status, transferred_chunks)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (remote_id, shard_index) DO UPDATE
+                    SET shard_id = excluded.shard_id, hostname = excluded.hostname, port = excluded.port, use_ssl = excluded.use_ssl,
+                        data_shards = excluded.data_shards, transfer_status = excluded.transfer_status, transferred_chunks = excluded.transferred_chunks
+                ''', (remote_id, shard_index, shard_id, endpoint.host(), endpoint.port(), endpoint.ssl(), data_shards, transfer_status.value, transferred_chunks))
+                self._conn.commit()
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
+    def remove_file_shards(self, remote_id, shard_indexes=None):
+        cur = self._conn.cursor()
+        try:
+            try:
+                if shard_indexes is None:
+                    cur.execute('''
+                        DELETE FROM ps_file_shard
+                        WHERE remote_id = ?
+                    ''', (remote_id,))
+                else:
+                    cur.executemany('''
+                        DELETE FROM ps_file_shard
+                        WHERE remote_id = ? AND shard_index = ?
+                    ''', [(remote_id, shard_index) for shard_index in shard_indexes])
+                self._conn.commit()
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
@@ -20,13 +20,40 @@ def setup_db(db_config):
         create_file_data_table(conn)
         create_file_version_table(conn)
         create_remote_server_table(conn)
+        create_file_replica_table(conn)
+        create_file_shard_table(conn)
         create_log_table(conn)
+        create_task_table(conn)
     finally:
         try:
             conn.close()
         except:
             pass
 
+def upgrade_db(db_config):
+    '''
+        Bring a database set up by an older version up to date. Each step is
+        idempotent so it's safe to run on every start.
+    '''
+    db_path = db_config.get('sqlite-db-path', 'local_server.db')
+
+    logging.debug('Upgrading SQLite database \'{}\''.format(db_path))
+    conn = sqlite3.connect(db_path)
+    try:
+        create_task_table(conn)
+        create_file_replica_table(conn)
+        create_file_shard_table(conn)
+        add_directory_change_counter(conn)
+        create_file_index(conn)
+    finally:
+        try:
+            conn.close()
+        except:
+            pass
+
+def has_column(conn, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute('PRAGMA table_info({})'.format(table)))
+
 def create_user_account_table(conn):
     logging.debug('Setting up ps_user_account table')
     conn.execute(
@@ -73,7 +100,8 @@ def create_directory_table(conn):
         CREATE TABLE ps_directory (
             id INTEGER PRIMARY KEY NOT NULL,
             name VARCHAR(256) NOT NULL,
-            is_hidden BOOLEAN NOT NULL DEFAULT 0
+            is_hidden BOOLEAN NOT NULL DEFAULT 0,
+            change_counter INTEGER NOT NULL DEFAULT 0
         )
         '''
     )
@@ -92,6 +120,13 @@ def create_directory_table(conn):
     )
     conn.commit()
 
+def add_directory_change_counter(conn):
+    if has_column(conn, 'ps_directory', 'change_counter'):
+        return
+    logging.debug('Adding ps_directory change_counter column')
+    conn.execute('ALTER TABLE ps_directory ADD COLUMN change_counter INTEGER NOT NULL DEFAULT 0')
+    conn.commit()
+
 def create_file_table(conn):
     logging.debug('Setting up ps_file table')
     conn.execute(
@@ -108,6 +143,12 @@ def create_file_table(conn):
         '''
     )
     conn.commit()
+    create_file_index(conn)
+
+def create_file_index(conn):
+    # Directory listings by name (see list_directory_page).
+    conn.execute('CREATE INDEX IF NOT EXISTS ps_file_parent_name_idx ON ps_file (parent_id, name)')
+    conn.commit()
 
 def create_file_version_table(conn):
     logging.debug('Setting up ps_file_version table')
@@ -179,6 +220,43 @@ def create_remote_server_table(conn):
     conn.execute("INSERT INTO ps_remote_server (hostname, port, cluster_id) VALUES ('localhost', 9090, 1)")
     conn.commit()
 
+def create_file_replica_table(conn):
+    logging.debug('Setting up ps_file_replica table')
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS ps_file_replica (
+            remote_id VARCHAR(38) NOT NULL,
+            hostname VARCHAR(256) NOT NULL,
+            port INTEGER NOT NULL,
+            use_ssl BOOLEAN NOT NULL DEFAULT 0,
+            transfer_status INTEGER NOT NULL,
+            transferred_chunks INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (remote_id, hostname, port)
+        )
+        '''
+    )
+    conn.commit()
+
+def create_file_shard_table(conn):
+    logging.debug('Setting up ps_file_shard table')
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS ps_file_shard (
+            remote_id VARCHAR(38) NOT NULL,
+            shard_index INTEGER NOT NULL,
+            shard_id VARCHAR(38) NOT NULL,
+            hostname VARCHAR(256) NOT NULL,
+            port INTEGER NOT NULL,
+            use_ssl BOOLEAN NOT NULL DEFAULT 0,
+            data_shards INTEGER NOT NULL,
+            transfer_status INTEGER NOT NULL,
+            transferred_chunks INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (remote_id, shard_index)
+        )
+        '''
+    )
+    conn.commit()
+
 def create_log_table(conn):
     logging.debug('Setting up ps_log table')
     conn.execute(
@@ -192,4 +270,30 @@ def create_log_table(conn):
         '''
     )
     # Create start epoch 1 log entry.
-    conn.execute('INSERT INTO ps_log (seq_no, epoch_no, entry_type) VALUES (?, ?, ?)', (1, 1, 1))
\ No newline at end of file
+    conn.execute('INSERT INTO ps_log (seq_no, epoch_no, entry_type) VALUES (?, ?, ?)', (1, 1, 1))
+
+def create_task_table(conn):
+    logging.debug('Setting up ps_task table')
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS ps_task (
+            id INTEGER PRIMARY KEY NOT NULL,
+            task_key VARCHAR(256) UNIQUE NOT NULL,
+            worker_type VARCHAR(20) NOT NULL,
+            task_code INTEGER NOT NULL,
+            local_id VARCHAR(38) NOT NULL,
+            epoch_no INTEGER NULL,
+            file_size INTEGER NULL,
+            status INTEGER NOT NULL,
+            lease_owner VARCHAR(256) NULL,
+            lease_expiry REAL NULL,
+            retry_count INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL DEFAULT 0,
+            last_error TEXT NULL,
+            created_timestamp INTEGER NOT NULL
+        )
+        '''
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS ps_task_local_id_idx ON ps_task (local_id, worker_type, status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS ps_task_next_attempt_idx ON ps_task (worker_type, status, next_attempt)')
+    conn.commit()
@@ -0,0 +1,336 @@
+from ....error import FileServerErrorCode, TaskError
+from ....file import File
+from ..task_dao import TaskDAO, TaskMetadata
+from ...task_status import TaskStatus
+import logging
+import time
+
+TASK_COLUMNS = '''
+    id, task_key, worker_type, task_code, local_id, epoch_no, file_size,
+    status, lease_owner, lease_expiry, retry_count, next_attempt, last_error
+'''
+
+def to_task_metadata(row) -> TaskMetadata:
+    task_id, task_key, worker_type, task_code, local_id, epoch_no, file_size, status, lease_owner, lease_expiry, retry_count, next_attempt, last_error = row
+    return TaskMetadata(task_id, task_key, worker_type, task_code, local_id, epoch_no, file_size, TaskStatus(status), lease_owner, lease_expiry, retry_count, next_attempt, last_error)
+
+class SqliteTaskDAO(TaskDAO):
+
+    def __init__(self, conn):
+        super().__init__(conn)
+
+    def add_task(self, task_key, worker_type, task_code, local_id, epoch_no=None, file_size=None, lease_owner=None, lease_time=None):
+        if not File.is_valid_file_id(local_id):
+            raise TaskError('Invalid local file id!', FileServerErrorCode.INVALID_FILE_ID)
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('BEGIN')
+                now = time.time()
+                if lease_owner is None:
+                    status, lease_expiry = TaskStatus.PENDING, None
+                else:
+                    status, lease_expiry = TaskStatus.LEASED, now + lease_time
+                cur.execute('''
+                    INSERT INTO ps_task (task_key, worker_type, task_code, local_id, epoch_no, file_size,
+                        status, lease_owner, lease_expiry, retry_count, next_attempt, created_timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?)
+                    ON CONFLICT (task_key) DO UPDATE
+                    SET status = excluded.status, lease_owner = excluded.lease_owner, lease_expiry = excluded.lease_expiry,
+                        retry_count = 0, next_attempt = excluded.next_attempt, last_error = NULL
+                    WHERE status = ?
+                ''', (task_key, worker_type, task_code, local_id, epoch_no, file_size, status.value, lease_owner, lease_expiry, now, round(now), TaskStatus.FAILED.value))
+                added = cur.rowcount == 1
+                cur.execute('SELECT id FROM ps_task WHERE task_key = ?', (task_key,))
+                task_id, = cur.fetchone()
+                self._conn.commit()
+                return task_id, added
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
+    def get_task(self, task_id):
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('SELECT {} FROM ps_task WHERE id = ?'.format(TASK_COLUMNS), (task_id,))
+                res = cur.fetchone()
+                if res is None:
+                    raise TaskError('Task [{}] not found!'.format(task_id), FileServerErrorCode.TASK_NOT_FOUND)
+                self._conn.commit()
+                return to_task_metadata(res)
+            except TaskError as e:
+                logging.error('Task error: {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
+    def list_tasks(self, local_id=None, worker_type=None, status=None):
+        cur = self._conn.cursor()
+        try:
+            try:
+                query = 'SELECT {} FROM ps_task WHERE 1 = 1'.format(TASK_COLUMNS)
+                params = []
+                if local_id is not None:
+                    query += ' AND local_id = ?'
+                    params.append(local_id)
+                if worker_type is not None:
+                    query += ' AND worker_type = ?'
+                    params.append(worker_type)
+                if status is not None:
+                    query += ' AND status = ?'
+                    params.append(status.value)
+                query += ' ORDER BY id'
+                cur.execute(query, params)
+                tasks = list(map(to_task_metadata, cur.fetchall()))
+                self._conn.commit()
+                return tasks
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
+    def lease_tasks(self, worker_type, lease_owner, lease_time, batch_size):
+        cur = self._conn.cursor()
+        try:
+            try:
+                #
+                # Take the write lock up front so concurrent callers can't
+                # lease the same tasks.
+                #
+                cur.execute('BEGIN IMMEDIATE')
+                now = time.time()
+                cur.execute('''
+                    SELECT {} FROM ps_task AS T
+                    WHERE T.worker_type = ? AND
+                        ((T.status = ? AND T.next_attempt <= ?) OR (T.status = ? AND T.lease_expiry < ?)) AND
+                        NOT EXISTS (
+                            SELECT 1 FROM ps_task AS P
+                            WHERE P.local_id = T.local_id AND P.worker_type = T.worker_type AND
+                                P.id < T.id AND P.status IN (?, ?)
+                        )
+                    ORDER BY T.next_attempt, T.id
+                    LIMIT ?
+                '''.format(TASK_COLUMNS), (worker_type, TaskStatus.PENDING.value, now, TaskStatus.LEASED.value, now, TaskStatus.PENDING.value, TaskStatus.LEASED.value, batch_size))
+                tasks = list(map(to_task_metadata, cur.fetchall()))
+                lease_expiry = now + lease_time
+                cur.executemany('''
+                    UPDATE ps_task
+                    SET status = ?, lease_owner = ?, lease_expiry = ?
+                    WHERE id = ?
+                ''', [(TaskStatus.LEASED.value, lease_owner, lease_expiry, task.task_id) for task in tasks])
+                self._conn.commit()
+                return [task._replace(status=TaskStatus.LEASED, lease_owner=lease_owner, lease_expiry=lease_expiry) for task in tasks]
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
+    def renew_leases(self, lease_owner, lease_time):
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('BEGIN')
+                cur.execute('''
+                    UPDATE ps_task
+                    SET lease_expiry = ?
+                    WHERE status = ? AND lease_owner = ?
+                ''', (time.time() + lease_time, TaskStatus.LEASED.value, lease_owner))
+                renewed = cur.rowcount
+                self._conn.commit()
+                return renewed
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
+    def release_leases(self, lease_owner=None, task_ids=None):
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('BEGIN')
+                query = '''
+                    UPDATE ps_task
+                    SET status = ?, lease_owner = NULL, lease_expiry = NULL
+                    WHERE status = ?
+                '''
+                params = [TaskStatus.PENDING.value, TaskStatus.LEASED.value]
+                if lease_owner is not None:
+                    query += ' AND lease_owner = ?'
+                    params.append(lease_owner)
+                if task_ids is not None:
+                    query += ' AND id IN ({})'.format(', '.join('?' * len(task_ids)))
+                    params.extend(task_ids)
+                cur.execute(query, params)
+                released = cur.rowcount
+                self._conn.commit()
+                return released
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
+    def complete_task(self, task_id):
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('BEGIN')
+                cur.execute('DELETE FROM ps_task WHERE id = ?', (task_id,))
+                if cur.rowcount != 1:
+                    raise TaskError('Task [{}] not found!'.format(task_id), FileServerErrorCode.TASK_NOT_FOUND)
+                self._conn.commit()
+            except TaskError as e:
+                logging.error('Task error: {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
+    def retry_task(self, task_id, error, next_attempt, count_retry=True):
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('BEGIN')
+                cur.execute('''
+                    UPDATE ps_task
+                    SET status = ?, lease_owner = NULL, lease_expiry = NULL,
+                        retry_count = retry_count + ?, next_attempt = ?, last_error = ?
+                    WHERE id = ?
+                ''', (TaskStatus.PENDING.value, 1 if count_retry else 0, next_attempt, error, task_id))
+                if cur.rowcount != 1:
+                    raise TaskError('Task [{}] not found!'.format(task_id), FileServerErrorCode.TASK_NOT_FOUND)
+                self._conn.commit()
+            except TaskError as e:
+                logging.error('Task error: {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
+    def fail_task(self, task_id, error):
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('BEGIN')
+                cur.execute('''
+                    UPDATE ps_task
+                    SET status = ?, lease_owner = NULL, lease_expiry = NULL, last_error = ?
+                    WHERE id = ?
+                ''', (TaskStatus.FAILED.value, error, task_id))
+                if cur.rowcount != 1:
+                    raise TaskError('Task [{}] not found!'.format(task_id), FileServerErrorCode.TASK_NOT_FOUND)
+                self._conn.commit()
+            except TaskError as e:
+                logging.error('Task error: {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
+    def fail_tasks(self, local_id, worker_type, task_code, error):
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('BEGIN')
+                cur.execute('''
+                    UPDATE ps_task
+                    SET status = ?, last_error = ?
+                    WHERE local_id = ? AND worker_type = ? AND task_code = ? AND status = ?
+                ''', (TaskStatus.FAILED.value, error, local_id, worker_type, task_code, TaskStatus.PENDING.value))
+                failed = cur.rowcount
+                self._conn.commit()
+                return failed
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
+
+    def remove_tasks(self, local_id=None, worker_type=None, include_leased=False):
+        cur = self._conn.cursor()
+        try:
+            try:
+                cur.execute('BEGIN')
+                query = 'DELETE FROM ps_task WHERE 1 = 1'
+                params = []
+                if local_id is not None:
+                    query += ' AND local_id = ?'
+                    params.append(local_id)
+                if worker_type is not None:
+                    query += ' AND worker_type = ?'
+                    params.append(worker_type)
+                if not include_leased:
+                    query += ' AND status <> ?'
+                    params.append(TaskStatus.LEASED.value)
+                cur.execute(query, params)
+                removed = cur.rowcount
+                self._conn.commit()
+                return removed
+            except Exception as e:
+                logging.error('Query error {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
+        finally:
+            try:
+                cur.close()
+            except:
+                pass
@@ -173,4 +173,46 @@ class TestSqliteDirectoryDAO(unittest.TestCase):
         self.assertEqual(len(self.dao.list_directory(['dir_1'])), 1)
         self.dao.remove_file(['dir_1'], 'file_4')
         self.assertEqual(len(self.dao.list_directory(['dir_1'])), 0)
-        self.assertEqual(len(self.dao.list_directory([])), 1)
\ No newline at end of file
+        self.assertEqual(len(self.dao.list_directory([])), 1)
+
+    def test_get_directory_version(self):
+        self.dao.create_directory([], 'dir_1')
+        dir_id, counter = self.dao.get_directory_version(['dir_1'])
+        self.assertEqual(self.dao.get_directory_version(['dir_1']), (dir_id, counter))
+        self.dao.create_file(['dir_1'], 'file_1')
+        self.assertEqual(self.dao.get_directory_version(['dir_1']), (dir_id, counter+1))
+        self.dao.create_directory(['dir_1'], 'dir_1a')
+        self.assertEqual(self.dao.get_directory_version(['dir_1']), (dir_id, counter+2))
+        # Changes to sub-directories don't change the directory.
+        self.dao.create_file(['dir_1', 'dir_1a'], 'file_2')
+        self.assertEqual(self.dao.get_directory_version(['dir_1']), (dir_id, counter+2))
+        self.dao.remove_file(['dir_1'], 'file_1')
+        self.assertEqual(self.dao.get_directory_version(['dir_1']), (dir_id, counter+3))
+        try:
+            self.dao.get_directory_version(['dir_2'])
+            self.fail()
+        except DirectoryError as e:
+            self.assertTrue(str(e).startswith('Invalid path to directory'), 'Expected invalid path error')
+
+    def test_list_directory_page(self):
+        self.dao.create_directory([], 'dir_1')
+        self.dao.create_directory(['dir_1'], 'b')
+        self.dao.create_directory(['dir_1'], 'd')
+        self.dao.create_file(['dir_1'], 'a')
+        self.dao.create_file(['dir_1'], 'c')
+        self.dao.create_file(['dir_1'], 'e')
+        self.dao.create_file([], 'file_1')
+        self.assertEqual(self.dao.list_directory_page(['dir_1']), [('f', 'a'), ('d', 'b'), ('f', 'c'), ('d', 'd'), ('f', 'e')])
+        self.assertEqual(self.dao.list_directory_page(['dir_1'], limit=2), [('f', 'a'), ('d', 'b')])
+        self.assertEqual(self.dao.list_directory_page(['dir_1'], 'b', 2), [('f', 'c'), ('d', 'd')])
+        self.assertEqual(self.dao.list_directory_page(['dir_1'], 'd', 2), [('f', 'e')])
+        self.assertEqual(self.dao.list_directory_page(['dir_1'], 'e', 2), [])
+        # The cursor needn't be an entry.
+        self.assertEqual(self.dao.list_directory_page(['dir_1'], 'bb', 2), [('f', 'c'), ('d', 'd')])
+        self.assertEqual(self.dao.list_directory_page([], limit=1), [('d', 'dir_1')])
+        self.assertEqual(self.dao.list_directory_page([], 'dir_1', 1), [('f', 'file_1')])
+        try:
+            self.dao.list_directory_page(['dir_2'])
+            self.fail()
+        except DirectoryError as e:
+            self.assertTrue(str(e).startswith('Invalid path to directory'), 'Expected invalid path error')
@@ -239,6 +239,33 @@ class TestSqliteFileDAO(unittest.TestCase):
             FileTransferStatus.TRANSFERRED_DATA
         ))
     
+    def test_list_unsynced_files(self):
+        f1_local_id = 'F-{}'.format(uuid.uuid4())
+        f1_remote_id = 'F-{}'.format(uuid.uuid4())
+        f2_local_id = 'F-{}'.format(uuid.uuid4())
+        f2_remote_id = 'F-{}'.format(uuid.uuid4())
+        self.dir_dao.create_file([], 'file_1')
+        self.dir_dao.create_file([], 'file_2')
+        self.dao.update_file_local([], 'file_1', 1, f1_local_id, 'null', 100, 120, 4, FileTransferStatus.SYNCED_DATA)
+        self.dao.update_file_local([], 'file_2', 1, f2_local_id, 'null', 100, 120, 4, FileTransferStatus.TRANSFERRING_DATA)
+        self.dao.update_file_remote(f1_local_id, f1_remote_id, FileTransferStatus.TRANSFERRING_DATA)
+        self.dao.update_file_remote(f1_local_id, transfer_status=FileTransferStatus.TRANSFERRING_DATA, transferred_chunks=3)
+        # Status only update keeps the uploaded chunks.
+        self.dao.update_file_remote(f1_local_id, transfer_status=FileTransferStatus.TRANSFER_DATA_FAILED)
+        self.dao.update_file_remote(f2_local_id, f2_remote_id, FileTransferStatus.TRANSFERRING_DATA)
+        self.assertEqual(self.dao.list_unsynced_files(local=True), [
+            (2, FileType.BINARY_DATA, 1, f2_local_id, f2_remote_id, 'null', 100, 120, 4, 0, 4, FileTransferStatus.TRANSFERRING_DATA, FileTransferStatus.TRANSFERRING_DATA)
+        ])
+        self.assertEqual(self.dao.list_unsynced_files(remote=True), [
+            (1, FileType.BINARY_DATA, 1, f1_local_id, f1_remote_id, 'null', 100, 120, 4, 3, 4, FileTransferStatus.SYNCED_DATA, FileTransferStatus.TRANSFER_DATA_FAILED),
+            (2, FileType.BINARY_DATA, 1, f2_local_id, f2_remote_id, 'null', 100, 120, 4, 0, 4, FileTransferStatus.TRANSFERRING_DATA, FileTransferStatus.TRANSFERRING_DATA)
+        ])
+        # Uploading to a new remote file resets the uploaded chunks.
+        self.dao.update_file_remote(f1_local_id, 'F-{}'.format(uuid.uuid4()), FileTransferStatus.TRANSFERRING_DATA)
+        self.assertEqual(self.dao.get_file_metadata(f1_local_id).uploaded_chunks, 0)
+        self.dao.update_file_remote(f1_local_id, transfer_status=FileTransferStatus.SYNCED_DATA)
+        self.assertEqual(len(self.dao.list_unsynced_files(remote=True)), 1)
+
     def test_update_file_transfer_status(self):
         f1_local_id = 'F-{}'.format(uuid.uuid4())
         self.dir_dao.create_file([], 'file_1')
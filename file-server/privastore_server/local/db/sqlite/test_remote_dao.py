@@ -0,0 +1,91 @@
+import os
+import unittest
+from ....db.sqlite.conn_factory import sqlite_conn_factory
+from ....file import File
+from ...file_transfer_status import FileTransferStatus
+from ....remote_client import RemoteEndpoint
+from .remote_dao import SqliteRemoteDAO
+from .setup import setup_db
+
+class TestSqliteRemoteDAO(unittest.TestCase):
+
+    def setUp(self):
+        config = {
+            'sqlite-db-path': 'test_remote_dao.db'
+        }
+        try:
+            os.remove('test_remote_dao.db')
+        except:
+            pass
+        setup_db(config)
+        self.conn = sqlite_conn_factory('test_remote_dao.db')()
+        self.dao = SqliteRemoteDAO(self.conn)
+
+    def tearDown(self):
+        try:
+            self.conn.close()
+        except:
+            pass
+        try:
+            os.remove('test_remote_dao.db')
+        except:
+            pass
+
+    def test_get_remote_servers(self):
+        servers = self.dao.get_remote_servers('default-cluster')
+        self.assertEqual(len(servers), 1)
+        self.assertEqual(str(servers[0]), 'localhost:9090')
+        creds = self.dao.get_remote_credentials('default-cluster')
+        self.assertEqual(creds.username(), 'psadmin')
+
+    def test_file_replicas(self):
+        f1_remote_id = File.generate_file_id()
+        f2_remote_id = File.generate_file_id()
+        e1 = RemoteEndpoint('localhost', 9090)
+        e2 = RemoteEndpoint('localhost', 9091, True)
+        self.assertEqual(self.dao.get_file_replicas(f1_remote_id), [])
+        self.dao.update_file_replica(f1_remote_id, e1, FileTransferStatus.TRANSFERRING_DATA)
+        self.dao.update_file_replica(f1_remote_id, e2, FileTransferStatus.TRANSFERRING_DATA)
+        self.dao.update_file_replica(f2_remote_id, e1, FileTransferStatus.TRANSFERRING_DATA)
+        self.dao.update_file_replica(f1_remote_id, e2, FileTransferStatus.TRANSFER_DATA_FAILED, 3)
+        replicas = self.dao.get_file_replicas(f1_remote_id)
+        self.assertEqual(len(replicas), 2)
+        self.assertEqual(replicas[0].remote_id, f1_remote_id)
+        self.assertEqual(str(replicas[0].endpoint), 'localhost:9090')
+        self.assertFalse(replicas[0].endpoint.ssl())
+        self.assertEqual(replicas[0].transfer_status, FileTransferStatus.TRANSFERRING_DATA)
+        self.assertEqual(replicas[0].transferred_chunks, 0)
+        self.assertEqual(str(replicas[1].endpoint), 'localhost:9091')
+        self.assertTrue(replicas[1].endpoint.ssl())
+        self.assertEqual(replicas[1].transfer_status, FileTransferStatus.TRANSFER_DATA_FAILED)
+        self.assertEqual(replicas[1].transferred_chunks, 3)
+        self.dao.remove_file_replicas(f1_remote_id, [e1])
+        replicas = self.dao.get_file_replicas(f1_remote_id)
+        self.assertEqual(len(replicas), 1)
+        self.assertEqual(str(replicas[0].endpoint), 'localhost:9091')
+        self.dao.remove_file_replicas(f1_remote_id)
+        self.assertEqual(self.dao.get_file_replicas(f1_remote_id), [])
+        self.assertEqual(len(self.dao.get_file_replicas(f2_remote_id)), 1)
+
+    def test_file_shards(self):
+        f1_remote_id = File.generate_file_id()
+        e1 = RemoteEndpoint('localhost', 9090)
+        e2 = RemoteEndpoint('localhost', 9091)
+        shard_ids = [File.generate_file_id() for i in range(3)]
+        self.assertEqual(self.dao.get_file_shards(f1_remote_id), [])
+        self.dao.update_file_shard(f1_remote_id, 2, shard_ids[2], e1, 2, FileTransferStatus.TRANSFERRING_DATA)
+        self.dao.update_file_shard(f1_remote_id, 0, shard_ids[0], e1, 2, FileTransferStatus.TRANSFERRING_DATA)
+        self.dao.update_file_shard(f1_remote_id, 1, shard_ids[1], e2, 2, FileTransferStatus.TRANSFERRING_DATA)
+        self.dao.update_file_shard(f1_remote_id, 1, shard_ids[1], e2, 2, FileTransferStatus.TRANSFERRED_DATA, 5)
+        shards = self.dao.get_file_shards(f1_remote_id)
+        self.assertEqual([shard.shard_index for shard in shards], [0, 1, 2])
+        self.assertEqual([shard.shard_id for shard in shards], shard_ids)
+        self.assertEqual(str(shards[1].endpoint), 'localhost:9091')
+        self.assertEqual(shards[1].data_shards, 2)
+        self.assertEqual(shards[1].transfer_status, FileTransferStatus.TRANSFERRED_DATA)
+        self.assertEqual(shards[1].transferred_chunks, 5)
+        self.assertEqual(shards[0].transfer_status, FileTransferStatus.TRANSFERRING_DATA)
+        self.dao.remove_file_shards(f1_remote_id, [0, 2])
+        self.assertEqual([shard.shard_index for shard in self.dao.get_file_shards(f1_remote_id)], [1])
+        self.dao.remove_file_shards(f1_remote_id)
+        self.assertEqual(self.dao.get_file_shards(f1_remote_id), [])
@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import unittest
+import uuid
+from ....db.sqlite.conn_factory import sqlite_conn_factory
+from .setup import has_column, setup_db, upgrade_db
+from .task_dao import SqliteTaskDAO
+from ..task_dao import UPLOAD_WORKER
+
+class TestSqliteSetup(unittest.TestCase):
+
+    def setUp(self):
+        self.config = {
+            'sqlite-db-path': 'test_setup.db'
+        }
+        try:
+            os.remove('test_setup.db')
+        except:
+            pass
+        setup_db(self.config)
+
+    def tearDown(self):
+        try:
+            os.remove('test_setup.db')
+        except:
+            pass
+
+    def test_upgrade_db(self):
+        # Roll the schema back to before the task queue, replicas, shards,
+        # directory versions and the listing index.
+        conn = sqlite3.connect('test_setup.db')
+        try:
+            conn.execute('DROP TABLE ps_task')
+            conn.execute('DROP TABLE ps_file_replica')
+            conn.execute('DROP TABLE ps_file_shard')
+            conn.execute('DROP INDEX ps_file_parent_name_idx')
+            conn.execute('ALTER TABLE ps_directory DROP COLUMN change_counter')
+            conn.commit()
+            self.assertFalse(has_column(conn, 'ps_directory', 'change_counter'))
+        finally:
+            conn.close()
+
+        # Safe to run more than once.
+        upgrade_db(self.config)
+        upgrade_db(self.config)
+
+        conn = sqlite_conn_factory('test_setup.db')()
+        try:
+            tables = set([row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")])
+            for name in ['ps_task', 'ps_task_local_id_idx', 'ps_task_next_attempt_idx', 'ps_file_replica', 'ps_file_shard', 'ps_file_parent_name_idx']:
+                self.assertIn(name, tables)
+            self.assertTrue(has_column(conn, 'ps_directory', 'change_counter'))
+            self.assertEqual(conn.execute('SELECT change_counter FROM ps_directory WHERE id = 1').fetchone()[0], 0)
+
+            local_id = 'F-{}'.format(uuid.uuid4())
+            _, added = SqliteTaskDAO(conn).add_task('upload:3:{}'.format(local_id), UPLOAD_WORKER, 3, local_id, file_size=100)
+            self.assertTrue(added)
+        finally:
+            conn.close()
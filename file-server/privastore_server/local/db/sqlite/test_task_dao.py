@@ -0,0 +1,132 @@
+import os
+import time
+import unittest
+import uuid
+from ....error import TaskError
+from ....db.sqlite.conn_factory import sqlite_conn_factory
+from .setup import setup_db
+from .task_dao import SqliteTaskDAO
+from ..task_dao import DOWNLOAD_WORKER, UPLOAD_WORKER
+from ...task_status import TaskStatus
+
+class TestSqliteTaskDAO(unittest.TestCase):
+    
+    def setUp(self):
+        config = {
+            'sqlite-db-path': 'test_task_dao.db'
+        }
+        try:
+            os.remove('test_task_dao.db')
+        except:
+            pass
+        setup_db(config)
+        self.conn = sqlite_conn_factory('test_task_dao.db')()
+        self.dao = SqliteTaskDAO(self.conn)
+
+    def tearDown(self):
+        try:
+            self.conn.close()
+        except:
+            pass
+        try:
+            os.remove('test_task_dao.db')
+        except:
+            pass
+
+    def test_add_task(self):
+        f1_local_id = 'F-{}'.format(uuid.uuid4())
+        t1_id, added = self.dao.add_task('upload:3:{}'.format(f1_local_id), UPLOAD_WORKER, 3, f1_local_id, file_size=100)
+        self.assertTrue(added)
+        t1 = self.dao.get_task(t1_id)
+        self.assertEqual(t1.local_id, f1_local_id)
+        self.assertEqual(t1.worker_type, UPLOAD_WORKER)
+        self.assertEqual(t1.task_code, 3)
+        self.assertEqual(t1.file_size, 100)
+        self.assertIsNone(t1.epoch_no)
+        self.assertEqual(t1.status, TaskStatus.PENDING)
+        self.assertEqual(t1.retry_count, 0)
+        # Adding the same task again is a no-op.
+        self.assertEqual(self.dao.add_task('upload:3:{}'.format(f1_local_id), UPLOAD_WORKER, 3, f1_local_id, file_size=100), (t1_id, False))
+        self.assertEqual(len(self.dao.list_tasks()), 1)
+        # Adding a failed task resets it.
+        self.dao.fail_task(t1_id, 'error')
+        self.assertEqual(self.dao.get_task(t1_id).status, TaskStatus.FAILED)
+        self.assertEqual(self.dao.add_task('upload:3:{}'.format(f1_local_id), UPLOAD_WORKER, 3, f1_local_id, file_size=100), (t1_id, True))
+        t1 = self.dao.get_task(t1_id)
+        self.assertEqual(t1.status, TaskStatus.PENDING)
+        self.assertIsNone(t1.last_error)
+        with self.assertRaises(TaskError):
+            self.dao.add_task('upload:3:invalid', UPLOAD_WORKER, 3, 'invalid')
+        with self.assertRaises(TaskError):
+            self.dao.get_task(t1_id + 1)
+
+    def test_lease_tasks(self):
+        f1_local_id = 'F-{}'.format(uuid.uuid4())
+        f2_local_id = 'F-{}'.format(uuid.uuid4())
+        t1_id, _ = self.dao.add_task('upload:3:{}'.format(f1_local_id), UPLOAD_WORKER, 3, f1_local_id, file_size=100)
+        t2_id, _ = self.dao.add_task('upload:4:{}'.format(f1_local_id), UPLOAD_WORKER, 4, f1_local_id, epoch_no=1)
+        t3_id, _ = self.dao.add_task('upload:3:{}'.format(f2_local_id), UPLOAD_WORKER, 3, f2_local_id, file_size=100)
+        t4_id, _ = self.dao.add_task('download:3:{}'.format(f2_local_id), DOWNLOAD_WORKER, 3, f2_local_id, file_size=100)
+
+        # Commit task waits for the transfer task of the same file.
+        tasks = self.dao.lease_tasks(UPLOAD_WORKER, 'owner-1', 60, 10)
+        self.assertEqual([task.task_id for task in tasks], [t1_id, t3_id])
+        for task in tasks:
+            self.assertEqual(task.status, TaskStatus.LEASED)
+            self.assertEqual(task.lease_owner, 'owner-1')
+        self.assertEqual(self.dao.lease_tasks(UPLOAD_WORKER, 'owner-2', 60, 10), [])
+        self.assertEqual([task.task_id for task in self.dao.lease_tasks(DOWNLOAD_WORKER, 'owner-2', 60, 10)], [t4_id])
+
+        self.dao.complete_task(t1_id)
+        with self.assertRaises(TaskError):
+            self.dao.complete_task(t1_id)
+        self.assertEqual([task.task_id for task in self.dao.lease_tasks(UPLOAD_WORKER, 'owner-1', 60, 1)], [t2_id])
+
+        # Retried tasks are not leased until the backoff expires.
+        self.dao.retry_task(t2_id, 'error', time.time() + 60)
+        t2 = self.dao.get_task(t2_id)
+        self.assertEqual(t2.status, TaskStatus.PENDING)
+        self.assertEqual(t2.retry_count, 1)
+        self.assertEqual(t2.last_error, 'error')
+        self.assertEqual(self.dao.lease_tasks(UPLOAD_WORKER, 'owner-1', 60, 10), [])
+        self.dao.retry_task(t2_id, 'error', time.time())
+        self.assertEqual([task.task_id for task in self.dao.lease_tasks(UPLOAD_WORKER, 'owner-1', 60, 10)], [t2_id])
+        self.assertEqual(self.dao.get_task(t2_id).retry_count, 2)
+        self.dao.retry_task(t2_id, 'REMOTE_UNAVAILABLE', time.time(), count_retry=False)
+        t2 = self.dao.get_task(t2_id)
+        self.assertEqual(t2.retry_count, 2)
+        self.assertEqual(t2.last_error, 'REMOTE_UNAVAILABLE')
+
+    def test_lease_expiry(self):
+        f1_local_id = 'F-{}'.format(uuid.uuid4())
+        t1_id, _ = self.dao.add_task('upload:3:{}'.format(f1_local_id), UPLOAD_WORKER, 3, f1_local_id, file_size=100)
+        self.assertEqual(len(self.dao.lease_tasks(UPLOAD_WORKER, 'owner-1', 0.1, 10)), 1)
+        self.assertEqual(self.dao.renew_leases('owner-2', 60), 0)
+        time.sleep(0.2)
+        # Expired leases can be taken over.
+        tasks = self.dao.lease_tasks(UPLOAD_WORKER, 'owner-2', 60, 10)
+        self.assertEqual([task.task_id for task in tasks], [t1_id])
+        self.assertEqual(self.dao.renew_leases('owner-2', 60), 1)
+        self.assertEqual(self.dao.lease_tasks(UPLOAD_WORKER, 'owner-1', 60, 10), [])
+        self.assertEqual(self.dao.release_leases('owner-1'), 0)
+        self.assertEqual(self.dao.release_leases('owner-2', [t1_id]), 1)
+        self.assertEqual(self.dao.get_task(t1_id).status, TaskStatus.PENDING)
+        self.assertEqual(len(self.dao.lease_tasks(UPLOAD_WORKER, 'owner-1', 60, 10)), 1)
+        self.assertEqual(self.dao.release_leases(), 1)
+
+    def test_remove_tasks(self):
+        f1_local_id = 'F-{}'.format(uuid.uuid4())
+        f2_local_id = 'F-{}'.format(uuid.uuid4())
+        t1_id, _ = self.dao.add_task('upload:3:{}'.format(f1_local_id), UPLOAD_WORKER, 3, f1_local_id, file_size=100)
+        t2_id, _ = self.dao.add_task('upload:4:{}'.format(f1_local_id), UPLOAD_WORKER, 4, f1_local_id, epoch_no=1)
+        t3_id, _ = self.dao.add_task('download:3:{}'.format(f2_local_id), DOWNLOAD_WORKER, 3, f2_local_id, file_size=100)
+        self.dao.lease_tasks(UPLOAD_WORKER, 'owner-1', 60, 10)
+        self.assertEqual(self.dao.fail_tasks(f1_local_id, UPLOAD_WORKER, 4, 'transfer failed'), 1)
+        self.assertEqual(self.dao.get_task(t2_id).status, TaskStatus.FAILED)
+        # Leased tasks are kept unless requested.
+        self.assertEqual(self.dao.remove_tasks(f1_local_id), 1)
+        self.assertEqual([task.task_id for task in self.dao.list_tasks(f1_local_id)], [t1_id])
+        self.assertEqual(self.dao.remove_tasks(f1_local_id, include_leased=True), 1)
+        self.assertEqual([task.task_id for task in self.dao.list_tasks()], [t3_id])
+        self.assertEqual(self.dao.remove_tasks(worker_type=DOWNLOAD_WORKER), 1)
+        self.assertEqual(self.dao.list_tasks(), [])
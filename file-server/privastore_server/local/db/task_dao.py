@@ -0,0 +1,78 @@
+from collections import namedtuple
+from ...db.dao import DataAccessObject
+from ..task_status import TaskStatus
+from typing import Optional
+
+UPLOAD_WORKER = 'upload'
+DOWNLOAD_WORKER = 'download'
+
+TaskMetadata = namedtuple('TaskMetadata', ['task_id', 'task_key', 'worker_type', 'task_code', 'local_id', 'epoch_no', 'file_size', 'status', 'lease_owner', 'lease_expiry', 'retry_count', 'next_attempt', 'last_error'])
+
+class TaskDAO(DataAccessObject):
+
+    def __init__(self, conn):
+        super().__init__(conn)
+
+    '''
+        Add a task. Task keys are unique, adding a task with the key of an
+        existing pending or leased task is a no-op. Adding a task with the key
+        of a failed task resets it to pending. If lease_owner is given the
+        task is added leased to it for lease_time seconds.
+
+        Return the task id and whether the task was (re-)added.
+    '''
+    def add_task(self, task_key: str, worker_type: str, task_code: int, local_id: str, epoch_no: Optional[int]=None, file_size: Optional[int]=None, lease_owner: Optional[str]=None, lease_time: Optional[float]=None) -> tuple[int, bool]:
+        raise Exception('Not implemented!')
+
+    def get_task(self, task_id: int) -> 'TaskMetadata':
+        raise Exception('Not implemented!')
+
+    def list_tasks(self, local_id: Optional[str]=None, worker_type: Optional[str]=None, status: Optional[TaskStatus]=None) -> list['TaskMetadata']:
+        raise Exception('Not implemented!')
+
+    '''
+        Lease up to batch_size tasks for the given worker type that are ready
+        to run. Tasks for the same file are leased in the order they were
+        added, a task is not leased while an earlier task for the same file
+        is pending or leased.
+    '''
+    def lease_tasks(self, worker_type: str, lease_owner: str, lease_time: float, batch_size: int) -> list['TaskMetadata']:
+        raise Exception('Not implemented!')
+
+    def renew_leases(self, lease_owner: str, lease_time: float) -> int:
+        raise Exception('Not implemented!')
+
+    '''
+        Return leased tasks to pending. If task_ids is not given, release all
+        tasks leased by lease_owner (or all leased tasks if lease_owner is not
+        given either).
+    '''
+    def release_leases(self, lease_owner: Optional[str]=None, task_ids: Optional[list[int]]=None) -> int:
+        raise Exception('Not implemented!')
+
+    def complete_task(self, task_id: int) -> None:
+        raise Exception('Not implemented!')
+
+    '''
+        Return a task to pending until next_attempt. The retry counts against
+        the task's retries unless count_retry is False.
+    '''
+    def retry_task(self, task_id: int, error: str, next_attempt: float, count_retry: bool=True) -> None:
+        raise Exception('Not implemented!')
+
+    def fail_task(self, task_id: int, error: str) -> None:
+        raise Exception('Not implemented!')
+
+    '''
+        Fail pending tasks for a file (ex. commit after the file data failed
+        to transfer).
+    '''
+    def fail_tasks(self, local_id: str, worker_type: str, task_code: int, error: str) -> int:
+        raise Exception('Not implemented!')
+
+    '''
+        Remove tasks matching the given filters. Leased tasks are only removed
+        if include_leased is set.
+    '''
+    def remove_tasks(self, local_id: Optional[str]=None, worker_type: Optional[str]=None, include_leased: bool=False) -> int:
+        raise Exception('Not implemented!')
@@ -1,4 +1,7 @@
 from .async_worker import AsyncWorker
+from ..bandwidth_limiter import BandwidthLimiter
+from ..endpoint_selector import EndpointSelector
+from ..erasure import ErasureCode
 from .commit_file_task import CommitFileTask
 from .db.dao_factory import DAOFactory
 from ..db.db_conn_mgr import DbConnectionManager
@@ -7,7 +10,10 @@ from ..file_cache import FileCache
 from .file_transfer_status import FileTransferStatus
 import logging
 from queue import Queue
-from ..remote_client import RemoteClientError
+from ..remote_client import TRANSPORT_HTTP
+from ..remote_session import RemoteSession
+from ..replication import ErasureCoder, Shard
+from ..retry_policy import RetryPolicy
 from .transfer_chunk_task import TransferChunkTask
 from .transfer_file_task import TransferFileTask
 from typing import Optional
@@ -15,8 +21,8 @@ from ..worker_task import WorkerTask
 
 class DownloadWorker(AsyncWorker):
 
-    def __init__(self, dao_factory: DAOFactory, db_conn_mgr: DbConnectionManager, store: FileCache, worker_index: int=None, queue_size: int=1, completion_queue: Optional[Queue[WorkerTask]] = None, retry_interval: int=1, io_timeout: int=90):
-        super().__init__(dao_factory, db_conn_mgr, store, 'download-worker', worker_index, queue_size, completion_queue, retry_interval, io_timeout)
+    def __init__(self, dao_factory: DAOFactory, db_conn_mgr: DbConnectionManager, store: FileCache, worker_index: int=None, queue_size: int=1, completion_queue: Optional[Queue[WorkerTask]] = None, retry_interval: int=1, io_timeout: int=90, bandwidth_limiter: Optional[BandwidthLimiter]=None, endpoint_selector: Optional[EndpointSelector]=None, retry_policy: Optional[RetryPolicy]=None, batch_chunks: int=1, transport: str=TRANSPORT_HTTP, replication_factor: int=1, write_quorum: int=1, erasure_code: Optional[ErasureCode]=None, remote_session: Optional[RemoteSession]=None):
+        super().__init__(dao_factory, db_conn_mgr, store, 'download-worker', worker_index, queue_size, completion_queue, retry_interval, io_timeout, bandwidth_limiter, endpoint_selector, retry_policy, batch_chunks, transport, replication_factor, write_quorum, erasure_code, remote_session)
 
     def process_task(self, task: WorkerTask) -> None:
         if task.task_code() == TransferFileTask.TASK_CODE:
@@ -36,6 +42,22 @@ class DownloadWorker(AsyncWorker):
 
         logging.debug('Downloading file [{}] from remote server'.format(task.local_file_id()))
 
+        # Read replicated files from any replica that has committed them.
+        replicas = None
+        file_replicas = self.db().get_file_replicas(remote_id)
+        if len(file_replicas) > 0:
+            replicas = [replica.endpoint for replica in file_replicas if replica.transfer_status == FileTransferStatus.SYNCED_DATA]
+            logging.debug('File [{}] has [{}] synced replicas'.format(task.local_file_id(), len(replicas)))
+
+        # Erasure coded files are read (and if need be reconstructed) a group
+        # at a time.
+        coder = None
+        file_shards = self.db().get_file_shards(remote_id)
+        if len(file_shards) > 0:
+            coder = self.erasure_coder(file_shards[0].data_shards, len(file_shards))
+            shards = [Shard(s.shard_index, s.shard_id, s.endpoint) for s in file_shards if s.transfer_status == FileTransferStatus.SYNCED_DATA]
+            logging.debug('File [{}] has [{}] synced shards'.format(task.local_file_id(), len(shards)))
+
         file = self.store().append_file(task.local_file_id())
         logging.debug('Opened file for appending')
 
@@ -44,14 +66,24 @@ class DownloadWorker(AsyncWorker):
             # Chunk numbers are 1-indexed.
             start_chunk = downloaded_chunks+1
             logging.debug('Downloading chunks {} through {}'.format(start_chunk, total_chunks))
-            for chunk_num in range(start_chunk, total_chunks+1):
+            chunk_num = start_chunk
+            while chunk_num <= total_chunks:
                 if self.is_current_task_cancelled():
                     raise FileDownloadError('File [{}] download cancelled', FileServerErrorCode.REMOTE_DOWNLOAD_CANCELLED)
                 
-                chunk = self.remote_client().read_file_chunk(remote_id, chunk_num, timeout=self.io_timeout())
-                file.append_chunk(chunk)
-                self.db().update_file_download(task.local_file_id(), chunk_num)
-                logging.debug('Received chunk')
+                num_chunks = min(self.batch_chunks(), total_chunks-chunk_num+1)
+                if coder is not None:
+                    chunks = self.read_shard_chunks(coder, shards, chunk_num, total_chunks)
+                elif num_chunks == 1:
+                    chunks = [self.remote_client().read_file_chunk(remote_id, chunk_num, timeout=self.io_timeout(), replicas=replicas)]
+                else:
+                    chunks = self.remote_client().read_file_chunks(remote_id, chunk_num, num_chunks, timeout=self.io_timeout(), replicas=replicas)
+                for chunk in chunks:
+                    file.append_chunk(chunk)
+                chunk_num += len(chunks)
+                self.db().update_file_download(task.local_file_id(), chunk_num-1)
+                task.report_progress(chunk_num-1, total_chunks)
+                logging.debug('Received {} chunks'.format(len(chunks)))
             logging.debug('Received {} chunks'.format(total_chunks))
             downloaded = True
         finally:
@@ -62,3 +94,13 @@ class DownloadWorker(AsyncWorker):
                 self.store().close_file(file, writable=True, removable=False)
             logging.debug('Closed file in cache')
 
+    def read_shard_chunks(self, coder: ErasureCoder, shards: list[Shard], chunk_num: int, total_chunks: int) -> list[bytes]:
+        '''
+            Read the chunks from chunk_num to the end of its group.
+        '''
+        data_shards = coder.erasure_code().data_shards()
+        group_num = (chunk_num - 1) // data_shards + 1
+        group_start = (group_num - 1) * data_shards + 1
+        group_chunks = min(data_shards, total_chunks - group_start + 1)
+        chunks = coder.read_group(shards, group_num, group_chunks, timeout=self.io_timeout())
+        return chunks[chunk_num - group_start:]
@@ -1,5 +1,6 @@
 from ..error import FileError
 from ..file import File
+from typing import Callable, Optional
 from ..util.file import str_path
 from ..worker_task import WorkerTask
 
@@ -12,6 +13,8 @@ class FileTask(WorkerTask):
         if not File.is_valid_file_id(local_file_id):
             raise FileError('Invalid local file id!')
         self._local_file_id = local_file_id
+        self._task_id: Optional[int] = None
+        self._progress_callback: Optional[Callable[[int, Optional[int]], None]] = None
     
     def task_code(self):
         return self.TASK_CODE
@@ -22,5 +25,25 @@ class FileTask(WorkerTask):
     def local_file_id(self) -> str:
         return self._local_file_id
 
+    def task_id(self) -> Optional[int]:
+        '''
+            Id of the persisted task this worker task was created from.
+        '''
+        return self._task_id
+
+    def set_task_id(self, task_id: int) -> None:
+        self._task_id = task_id
+
+    def set_progress_callback(self, progress_callback: Optional[Callable[[int, Optional[int]], None]]) -> None:
+        self._progress_callback = progress_callback
+
+    def report_progress(self, transferred_chunks: int, total_chunks: Optional[int]=None) -> None:
+        '''
+            For use by the worker. Report the number of chunks transferred so
+            far.
+        '''
+        if self._progress_callback is not None:
+            self._progress_callback(transferred_chunks, total_chunks)
+
     def __str__(self):
         return '{} local-file-id=[{}]'.format(self.task_name(), self.local_file_id())
\ No newline at end of file
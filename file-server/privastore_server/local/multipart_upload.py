@@ -0,0 +1,361 @@
+import copy
+from ..daemon import Daemon
+from ..error import FileError, FileServerErrorCode
+from ..file import File
+from ..file_cache import FileCache
+import logging
+import time
+from threading import RLock
+from typing import Optional
+from ..util.file import str_path
+from ..util.time import format_datetime
+import uuid
+
+class MultipartUpload(object):
+
+    '''
+        A file uploaded in numbered parts, in any order and in parallel. Each
+        part is staged in the file store as a file of its own until the
+        upload is completed (the chunks of the parts are linked into the new
+        file in order) or aborted.
+
+        Uploads are changed through MultipartUploads only, the uploads it
+        returns are copies.
+    '''
+    def __init__(self, upload_id: str, path: list[str], file_name: str, key_id: str, expiry_time: int):
+        self._upload_id = upload_id
+        self._path = path
+        self._file_name = file_name
+        self._key_id = key_id
+        self._expiry_time = expiry_time
+        self._expires = round(time.time() + expiry_time)
+        # Part number -> (part file id, part size).
+        self._parts: dict[int, tuple[str, int]] = dict()
+        self._writers = 0
+        self._completing = False
+
+    def copy(self) -> 'MultipartUpload':
+        upload = copy.copy(self)
+        upload._parts = dict(self._parts)
+        return upload
+
+    def upload_id(self) -> str:
+        return self._upload_id
+
+    def path(self) -> list[str]:
+        return self._path
+
+    def file_name(self) -> str:
+        return self._file_name
+
+    def key_id(self) -> str:
+        return self._key_id
+
+    def expires(self) -> int:
+        return self._expires
+
+    def renew(self) -> None:
+        self._expires = round(time.time() + self._expiry_time)
+
+    def is_expired(self) -> bool:
+        # Parts in flight or a completion keep the upload alive.
+        if self._writers > 0 or self._completing:
+            return False
+        return round(time.time()) >= self._expires
+
+    def parts(self) -> list[tuple[int, int]]:
+        '''
+            The received parts as (part number, part size), in order.
+        '''
+        return sorted((part_num, part_size) for part_num, (_, part_size) in self._parts.items())
+
+    def part_files(self) -> list[str]:
+        return [self._parts[part_num][0] for part_num in sorted(self._parts.keys())]
+
+    def total_size(self) -> int:
+        return sum(part_size for _, part_size in self._parts.values())
+
+    def to_dict(self) -> dict:
+        return {
+            "upload-id": self._upload_id,
+            "path": str_path(self._path + [self._file_name]),
+            "expires": format_datetime(self._expires),
+            "parts": [{"part": part_num, "size": part_size} for part_num, part_size in self.parts()]
+        }
+
+class MultipartUploads(object):
+
+    '''
+        The multipart uploads in progress. Pre-forked server processes share
+        one, served from the manager process (see
+        LocalServer.prefork_shared_types), so the state of an upload only
+        changes here and uploads are returned as copies.
+
+        Removing an upload hands back the part files for the caller to remove
+        from the store.
+    '''
+    def __init__(self):
+        super().__init__()
+        self._uploads: dict[str, MultipartUpload] = dict()
+        self._lock = RLock()
+
+    def num_uploads(self) -> int:
+        with self._lock:
+            return len(self._uploads)
+
+    def add_upload(self, upload: MultipartUpload) -> None:
+        with self._lock:
+            self._uploads[upload.upload_id()] = upload.copy()
+
+    def get_upload(self, upload_id: str) -> Optional[MultipartUpload]:
+        '''
+            Returns None if the upload isn't found or has expired.
+        '''
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is None or upload.is_expired():
+                return None
+            return upload.copy()
+
+    def find_upload(self, upload_id: str) -> MultipartUpload:
+        upload = self._uploads.get(upload_id)
+        if upload is None:
+            raise FileError('Upload [{}] not found'.format(upload_id), FileServerErrorCode.FILE_NOT_FOUND)
+        return upload
+
+    def start_part(self, upload_id: str) -> None:
+        with self._lock:
+            upload = self.find_upload(upload_id)
+            if upload._completing:
+                raise FileError('Upload [{}] is being completed'.format(upload_id), FileServerErrorCode.FILE_NOT_WRITABLE)
+            upload._writers += 1
+            upload.renew()
+
+    def end_part(self, upload_id: str, part_num: int, part_file_id: Optional[str], part_size: int) -> Optional[str]:
+        '''
+            Returns the part file to remove, the part replaced or the part
+            itself if the upload was removed while it was written.
+        '''
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is None:
+                # Aborted while the part was being written.
+                return part_file_id
+            upload._writers -= 1
+            upload.renew()
+            if part_file_id is None:
+                return None
+            prev_part = upload._parts.get(part_num)
+            upload._parts[part_num] = part_file_id, part_size
+            logging.debug('Multipart upload [{}] part [{}] received [{}B]'.format(upload_id, part_num, part_size))
+            return prev_part[0] if prev_part is not None else None
+
+    def start_complete(self, upload_id: str) -> MultipartUpload:
+        '''
+            Returns the upload with the parts it is completed with.
+        '''
+        with self._lock:
+            upload = self.find_upload(upload_id)
+            if upload._completing or upload._writers > 0:
+                raise FileError('Upload [{}] has parts being uploaded'.format(upload_id), FileServerErrorCode.FILE_NOT_WRITABLE)
+            num_parts = len(upload._parts)
+            if num_parts == 0:
+                raise FileError('Upload [{}] has no parts'.format(upload_id), FileServerErrorCode.FILE_TOO_SMALL)
+            if max(upload._parts.keys()) != num_parts:
+                missing = [part_num for part_num in range(1, num_parts+1) if part_num not in upload._parts]
+                raise FileError('Upload [{}] is missing parts {}'.format(upload_id, missing), FileServerErrorCode.FILE_TOO_SMALL)
+            upload._completing = True
+            return upload.copy()
+
+    def end_complete(self, upload_id: str) -> None:
+        '''
+            The completion failed, keep the parts so it can be completed
+            again.
+        '''
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is not None:
+                upload._completing = False
+                upload.renew()
+
+    def remove_upload(self, upload_id: str, abort: bool=False, expired: bool=False) -> Optional[list[str]]:
+        '''
+            Returns the upload's part files or None if it wasn't removed (see
+            MultipartUploadManager.remove_upload).
+        '''
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is None:
+                return None
+            if abort and upload._completing:
+                raise FileError('Upload [{}] is being completed'.format(upload_id), FileServerErrorCode.FILE_NOT_WRITABLE)
+            if expired and not upload.is_expired():
+                return None
+            self._uploads.pop(upload_id)
+            return upload.part_files()
+
+    def expired_uploads(self) -> list[str]:
+        with self._lock:
+            return [upload_id for upload_id, upload in self._uploads.items() if upload.is_expired()]
+
+class MultipartUploadManager(Daemon):
+
+    '''
+        Keeps track of the multipart uploads in progress and removes those
+        abandoned (not used for the expiry time), reclaiming the store space
+        used by their parts.
+
+        Uploads are only kept in memory (see MultipartUploads), parts left in
+        the store by a restart are loaded as removable files and evicted as
+        needed.
+    '''
+    def __init__(self, upload_config, store: FileCache, daemon=True, uploads: Optional[MultipartUploads]=None):
+        super().__init__('multipart-upload-manager', daemon)
+        self._expiry_time = int(upload_config.get('multipart-upload-expiry-time', '3600'))
+        self._cleanup_interval = int(upload_config.get('multipart-upload-cleanup-interval', '60'))
+        self._max_parts = int(upload_config.get('multipart-upload-max-parts', '10000'))
+        self._store = store
+        self._uploads = uploads if uploads is not None else MultipartUploads()
+
+        logging.debug('Multipart upload expiry time: [{}s]'.format(self._expiry_time))
+        logging.debug('Multipart upload cleanup interval: [{}s]'.format(self._cleanup_interval))
+        logging.debug('Multipart upload max parts: [{}]'.format(self._max_parts))
+
+    def store(self) -> FileCache:
+        return self._store
+
+    def expiry_time(self) -> int:
+        return self._expiry_time
+
+    def max_parts(self) -> int:
+        return self._max_parts
+
+    def num_uploads(self) -> int:
+        return self._uploads.num_uploads()
+
+    @staticmethod
+    def is_valid_upload_id(upload_id: str) -> bool:
+        if not upload_id.startswith('U-'):
+            return False
+        try:
+            uuid.UUID(upload_id[2:])
+            return True
+        except:
+            return False
+
+    def start_upload(self, path: list[str], file_name: str, key_id: str) -> MultipartUpload:
+        upload_id = 'U-{}'.format(str(uuid.uuid4()))
+        upload = MultipartUpload(upload_id, path, file_name, key_id, self._expiry_time)
+        self._uploads.add_upload(upload)
+        logging.debug('Multipart upload [{}] of file [{}] started'.format(upload_id, str_path(path + [file_name])))
+        return upload
+
+    def get_upload(self, upload_id: str) -> MultipartUpload:
+        if not self.is_valid_upload_id(upload_id):
+            raise FileError('Invalid upload id [{}]'.format(upload_id), FileServerErrorCode.INVALID_FILE_ID)
+        upload = self._uploads.get_upload(upload_id)
+        if upload is None:
+            raise FileError('Upload [{}] not found'.format(upload_id), FileServerErrorCode.FILE_NOT_FOUND)
+        return upload
+
+    def start_part(self, upload: MultipartUpload, part_num: int) -> None:
+        if part_num < 1 or part_num > self._max_parts:
+            raise FileError('Invalid part number [{}]'.format(part_num), FileServerErrorCode.INVALID_CHUNK_NUM)
+        self._uploads.start_part(upload.upload_id())
+
+    def end_part(self, upload: MultipartUpload, part_num: int, part_file_id: Optional[str], part_size: int=0) -> None:
+        '''
+            Record a part once it's stored, replacing an earlier upload of the
+            same part. part_file_id is None if the part failed.
+        '''
+        remove_file_id = self._uploads.end_part(upload.upload_id(), part_num, part_file_id, part_size)
+        if remove_file_id is not None:
+            self.remove_part_file(remove_file_id)
+
+    def start_complete(self, upload: MultipartUpload) -> MultipartUpload:
+        '''
+            Returns the upload as it is completed, parts may have been
+            uploaded since upload was read.
+        '''
+        return self._uploads.start_complete(upload.upload_id())
+
+    def end_complete(self, upload: MultipartUpload, completed: bool) -> None:
+        '''
+            The upload is removed once completed. Otherwise its parts are kept
+            so it can be completed again.
+        '''
+        if completed:
+            self.remove_upload(upload)
+            return
+        self._uploads.end_complete(upload.upload_id())
+
+    def remove_upload(self, upload: MultipartUpload, abort: bool=False, expired: bool=False) -> bool:
+        '''
+            Remove the upload and its parts. If expired is set the upload is
+            only removed if it is still expired, it may have been renewed or
+            started completing since it was found expired.
+
+            Returns False if the upload wasn't removed.
+        '''
+        return self.remove_upload_by_id(upload.upload_id(), abort, expired)
+
+    def remove_upload_by_id(self, upload_id: str, abort: bool=False, expired: bool=False) -> bool:
+        part_files = self._uploads.remove_upload(upload_id, abort, expired)
+        if part_files is None:
+            return False
+        for part_file_id in part_files:
+            self.remove_part_file(part_file_id)
+        logging.debug('Multipart upload [{}] removed'.format(upload_id))
+        return True
+
+    def append_parts(self, upload: MultipartUpload, file: File) -> int:
+        '''
+            Append the chunks of the upload's parts to file in order, see
+            File.append_chunks_from. The parts are stored with the file's
+            chunk encoder. Returns the bytes appended.
+        '''
+        appended = 0
+        for part_file_id in upload.part_files():
+            part_file = self._store.read_file(part_file_id)
+            if part_file is None:
+                raise FileError('Upload part file [{}] not found'.format(part_file_id), FileServerErrorCode.FILE_IS_CORRUPT)
+            try:
+                file.append_chunks_from(part_file)
+                appended += part_file.file_size()
+            finally:
+                # The part is kept until the upload is removed.
+                self._store.close_file(part_file, removable=False)
+        return appended
+
+    def remove_part_file(self, part_file_id: str) -> None:
+        try:
+            if not self._store.shared():
+                # Files of a shared store are loaded as removable.
+                self._store.set_file_removable(part_file_id, True)
+            self._store.remove_file_by_id(part_file_id)
+        except Exception as e:
+            logging.warning('Could not remove upload part file [{}] from store: {}'.format(part_file_id, str(e)))
+
+    def remove_expired_uploads(self) -> int:
+        logging.debug('Removing expired multipart uploads')
+        removed = 0
+        for upload_id in self._uploads.expired_uploads():
+            if self.remove_upload_by_id(upload_id, expired=True):
+                removed += 1
+        logging.debug('Removed {} expired multipart uploads'.format(removed))
+        return removed
+
+    def run(self):
+        self._started.set()
+        logging.debug('Multipart upload manager started')
+        now = last_cleanup_t = round(time.time())
+        while not self._stop.wait(1):
+            now = round(time.time())
+            if now >= last_cleanup_t + self._cleanup_interval:
+                try:
+                    self.remove_expired_uploads()
+                except Exception as e:
+                    logging.error('Error removing expired multipart uploads: {}'.format(str(e)))
+                last_cleanup_t = now
+        self._stopped.set()
+        logging.debug('Multipart upload manager stopped')
@@ -0,0 +1,75 @@
+import asyncio
+from concurrent.futures import Future
+import logging
+from threading import RLock
+from typing import Callable, Optional
+
+ProgressCallback = Callable[['TaskFuture', int, Optional[int]], None]
+
+class TaskFuture(Future):
+
+    '''
+        Handle to a task submitted to the async controller.
+
+        Resolves when the persisted task completes (result None), fails for
+        good (the task error is raised from result()) or is cancelled. Retries
+        don't resolve the future. Can be waited on from threads (result() or
+        add_done_callback()) and awaited on an event loop.
+
+        Transfer tasks also report progress as (transferred chunks, total
+        chunks), total may be None if it isn't known yet (ex. an upload
+        streamed while the file is still being received).
+    '''
+    def __init__(self, task_id: int, task_key: str, worker_type: str, task_code: int, local_file_id: str):
+        super().__init__()
+        self._task_id = task_id
+        self._task_key = task_key
+        self._worker_type = worker_type
+        self._task_code = task_code
+        self._local_file_id = local_file_id
+        self._progress_lock = RLock()
+        self._progress: tuple[int, Optional[int]] = (0, None)
+        self._progress_callbacks: list[ProgressCallback] = []
+
+    def task_id(self) -> int:
+        return self._task_id
+
+    def task_key(self) -> str:
+        return self._task_key
+
+    def worker_type(self) -> str:
+        return self._worker_type
+
+    def task_code(self) -> int:
+        return self._task_code
+
+    def local_file_id(self) -> str:
+        return self._local_file_id
+
+    def progress(self) -> tuple[int, Optional[int]]:
+        with self._progress_lock:
+            return self._progress
+
+    def set_progress(self, transferred_chunks: int, total_chunks: Optional[int]=None) -> None:
+        with self._progress_lock:
+            self._progress = (transferred_chunks, total_chunks)
+            callbacks = list(self._progress_callbacks)
+        for callback in callbacks:
+            try:
+                callback(self, transferred_chunks, total_chunks)
+            except Exception as e:
+                logging.error('Task [{}] progress callback error: {}'.format(self._task_key, str(e)))
+
+    def add_progress_callback(self, callback: ProgressCallback) -> None:
+        with self._progress_lock:
+            self._progress_callbacks.append(callback)
+
+    def remove_progress_callback(self, callback: ProgressCallback) -> None:
+        with self._progress_lock:
+            self._progress_callbacks.remove(callback)
+
+    def __await__(self):
+        return asyncio.wrap_future(self).__await__()
+
+    def __str__(self):
+        return 'TASK_FUTURE task-id=[{}] task-key=[{}]'.format(self._task_id, self._task_key)
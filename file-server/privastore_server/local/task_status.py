@@ -0,0 +1,17 @@
+from enum import Enum
+
+class TaskStatus(Enum):
+    '''
+        Task is waiting to be leased by a worker (possibly after a retry
+        backoff).
+    '''
+    PENDING = 1
+    '''
+        Task is leased by a worker. If the lease expires before the task
+        completes the task can be leased again.
+    '''
+    LEASED = 2
+    '''
+        Task failed and ran out of retries.
+    '''
+    FAILED = 3
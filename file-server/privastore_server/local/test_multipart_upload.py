@@ -0,0 +1,60 @@
+from ..error import FileError
+from ..file_cache import FileCache
+from .multipart_upload import MultipartUploadManager
+import random
+import shutil
+import unittest
+
+class TestMultipartUpload(unittest.TestCase):
+
+    def cleanup(self):
+        try:
+            shutil.rmtree('test_multipart_upload')
+        except:
+            pass
+
+    def setUp(self):
+        self.cleanup()
+        self.store = FileCache({
+            'store-path': 'test_multipart_upload'
+        })
+        # Uploads expire as soon as they are idle.
+        self.upload_mgr = MultipartUploadManager({
+            'multipart-upload-expiry-time': '0'
+        }, self.store)
+
+    def tearDown(self):
+        self.cleanup()
+
+    def upload_part(self, upload, part_num):
+        self.upload_mgr.start_part(upload, part_num)
+        f = self.store.write_file()
+        f.append_chunk(random.randbytes(100))
+        self.store.close_file(f, removable=False)
+        self.upload_mgr.end_part(upload, part_num, f.file_id(), 100)
+        return f.file_id()
+
+    def test_remove_expired_uploads(self):
+        upload_1 = self.upload_mgr.start_upload([], 'file_1', 'system')
+        upload_2 = self.upload_mgr.start_upload([], 'file_2', 'system')
+        part_1 = self.upload_part(upload_1, 1)
+        part_2 = self.upload_part(upload_2, 1)
+        self.assertTrue(upload_1.is_expired())
+        self.assertTrue(upload_2.is_expired())
+
+        # An upload that started completing after it was found expired is
+        # kept.
+        self.upload_mgr.start_complete(upload_1)
+        self.assertFalse(self.upload_mgr.remove_upload(upload_1, expired=True))
+        self.assertEqual(self.upload_mgr.remove_expired_uploads(), 1)
+        self.assertEqual(self.upload_mgr.num_uploads(), 1)
+        self.assertTrue(self.store.has_file(part_1))
+        self.assertFalse(self.store.has_file(part_2))
+        with self.assertRaises(FileError):
+            self.upload_mgr.start_part(upload_2, 2)
+
+        # Once the completion fails the upload can expire again.
+        self.upload_mgr.end_complete(upload_1, False)
+        self.assertEqual(self.upload_mgr.remove_expired_uploads(), 1)
+        self.assertEqual(self.upload_mgr.num_uploads(), 0)
+        self.assertFalse(self.store.has_file(part_1))
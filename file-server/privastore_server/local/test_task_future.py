@@ -0,0 +1,54 @@
+import asyncio
+from concurrent.futures import CancelledError
+from ..error import FileServerErrorCode, FileUploadError
+from .task_future import TaskFuture
+from threading import Thread
+import unittest
+
+class TestTaskFuture(unittest.TestCase):
+
+    def get_future(self):
+        return TaskFuture(1, 'upload:3:F-1', 'upload', 3, 'F-1')
+
+    def test_result(self):
+        future = self.get_future()
+        done = []
+        future.add_done_callback(lambda f: done.append(f.task_id()))
+        self.assertFalse(future.done())
+        Thread(target=future.set_result, args=[None]).start()
+        self.assertIsNone(future.result(timeout=5))
+        self.assertEqual(done, [1])
+
+    def test_error(self):
+        future = self.get_future()
+        future.set_exception(FileUploadError('Upload failed', FileServerErrorCode.REMOTE_UPLOAD_ERROR))
+        with self.assertRaises(FileUploadError):
+            future.result()
+        future = self.get_future()
+        self.assertTrue(future.cancel())
+        with self.assertRaises(CancelledError):
+            future.result()
+
+    def test_progress(self):
+        future = self.get_future()
+        self.assertEqual(future.progress(), (0, None))
+        progress = []
+        def progress_cb(f, transferred_chunks, total_chunks):
+            progress.append((transferred_chunks, total_chunks))
+        def error_cb(f, transferred_chunks, total_chunks):
+            raise Exception('Callback error')
+        future.add_progress_callback(error_cb)
+        future.add_progress_callback(progress_cb)
+        future.set_progress(1)
+        future.set_progress(2, 5)
+        self.assertEqual(future.progress(), (2, 5))
+        future.remove_progress_callback(progress_cb)
+        future.set_progress(3, 5)
+        self.assertEqual(progress, [(1, None), (2, 5)])
+
+    def test_await(self):
+        future = self.get_future()
+        async def wait_future():
+            asyncio.get_running_loop().call_later(0.01, future.set_result, None)
+            return await future
+        self.assertIsNone(asyncio.run(wait_future()))
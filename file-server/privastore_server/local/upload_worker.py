@@ -1,6 +1,10 @@
 from .async_worker import AsyncWorker
+from ..bandwidth_limiter import BandwidthLimiter
+from ..endpoint_selector import EndpointSelector
+from ..erasure import ErasureCode
 from .commit_file_task import CommitFileTask
 from .db.dao_factory import DAOFactory
+from .db.remote_dao import FileReplica, FileShard
 from ..db.db_conn_mgr import DbConnectionManager
 from .delete_file_task import DeleteFileTask
 from ..error import FileError, FileServerError, FileServerErrorCode, FileUploadError, WorkerError
@@ -8,16 +12,23 @@ from ..file_cache import FileCache
 from .file_transfer_status import FileTransferStatus
 import logging
 from queue import Queue
-from ..remote_client import RemoteClientError
+from ..file import File
+from ..remote_client import RemoteClientError, RemoteEndpoint, TRANSPORT_HTTP
+from ..remote_session import RemoteSession
+from ..replication import ErasureCoder, Shard
+from ..retry_policy import RetryPolicy
 from .transfer_chunk_task import TransferChunkTask
 from .transfer_file_task import TransferFileTask
 from typing import Optional
 from ..worker_task import WorkerTask
 
+# Replicas (or shards) that no longer hold a usable copy of their data.
+REPLICA_FAILED_STATUSES = (FileTransferStatus.TRANSFER_DATA_FAILED, FileTransferStatus.NONE)
+
 class UploadWorker(AsyncWorker):
 
-    def __init__(self, dao_factory: DAOFactory, db_conn_mgr: DbConnectionManager, store: FileCache, worker_index: int=None, queue_size: int=1, completion_queue: Optional[Queue[WorkerTask]] = None, retry_interval: int=1, io_timeout: int=90):
-        super().__init__(dao_factory, db_conn_mgr, store, 'upload-worker', worker_index, queue_size, completion_queue, retry_interval, io_timeout)
+    def __init__(self, dao_factory: DAOFactory, db_conn_mgr: DbConnectionManager, store: FileCache, worker_index: int=None, queue_size: int=1, completion_queue: Optional[Queue[WorkerTask]] = None, retry_interval: int=1, io_timeout: int=90, bandwidth_limiter: Optional[BandwidthLimiter]=None, endpoint_selector: Optional[EndpointSelector]=None, retry_policy: Optional[RetryPolicy]=None, batch_chunks: int=1, transport: str=TRANSPORT_HTTP, replication_factor: int=1, write_quorum: int=1, erasure_code: Optional[ErasureCode]=None, remote_session: Optional[RemoteSession]=None):
+        super().__init__(dao_factory, db_conn_mgr, store, 'upload-worker', worker_index, queue_size, completion_queue, retry_interval, io_timeout, bandwidth_limiter, endpoint_selector, retry_policy, batch_chunks, transport, replication_factor, write_quorum, erasure_code, remote_session)
 
     def process_task(self, task: WorkerTask) -> None:
         if task.task_code() == CommitFileTask.TASK_CODE:
@@ -36,10 +47,19 @@ class UploadWorker(AsyncWorker):
         remote_id = file_metadata.remote_id
         remote_transfer_status = file_metadata.remote_transfer_status
 
-        if remote_transfer_status == FileTransferStatus.TRANSFERRED_DATA or remote_transfer_status == FileTransferStatus.SYNCING_DATA:
+        if remote_transfer_status == FileTransferStatus.TRANSFERRED_DATA or remote_transfer_status == FileTransferStatus.SYNCING_DATA or remote_transfer_status == FileTransferStatus.SYNC_DATA_FAILED:
             self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.SYNCING_DATA)
             logging.debug('Updated file remote status to syncing data')
 
+            replicas = self.db().get_file_replicas(remote_id)
+            if len(replicas) > 0:
+                self.do_commit_file_replicas(task, remote_id, replicas)
+                return
+            shards = self.db().get_file_shards(remote_id)
+            if len(shards) > 0:
+                self.do_commit_file_shards(task, remote_id, shards)
+                return
+
             try:
                 self.remote_client().commit_file(remote_id, task.epoch_no(), timeout=self.io_timeout())
                 logging.debug('Committed file')
@@ -58,6 +78,54 @@ class UploadWorker(AsyncWorker):
         else:
             raise FileUploadError('Cannot commit file [{}]. Invalid status {}'.format(task.local_file_id(), remote_transfer_status))
 
+    def do_commit_file_replicas(self, task: CommitFileTask, remote_id: str, replicas: list[FileReplica]) -> None:
+        '''
+            Commit the file on its replicas. The file is synced once the
+            write quorum has committed it.
+        '''
+        endpoints = [replica.endpoint for replica in replicas if replica.transfer_status not in REPLICA_FAILED_STATUSES]
+        acked, errors = self.replicator().commit_file(remote_id, endpoints, task.epoch_no(), timeout=self.io_timeout())
+        for replica in replicas:
+            name = str(replica.endpoint)
+            if name in errors:
+                self.db().update_file_replica(remote_id, replica.endpoint, FileTransferStatus.SYNC_DATA_FAILED, replica.transferred_chunks)
+            elif replica.transfer_status not in REPLICA_FAILED_STATUSES:
+                self.db().update_file_replica(remote_id, replica.endpoint, FileTransferStatus.SYNCED_DATA, replica.transferred_chunks)
+
+        try:
+            self.replicator().check_quorum(acked, errors, 'Commit file [{}]'.format(remote_id))
+        except RemoteClientError as e:
+            self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.SYNC_DATA_FAILED)
+            raise e
+        logging.debug('Committed file on [{}] replicas'.format(len(acked)))
+
+        self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.SYNCED_DATA)
+        logging.debug('Updated file remote status to synced data')
+
+    def do_commit_file_shards(self, task: CommitFileTask, remote_id: str, file_shards: list[FileShard]) -> None:
+        '''
+            Commit the erasure coded file's shards. The file is synced once
+            the write quorum of shards has committed it.
+        '''
+        coder = self.erasure_coder(file_shards[0].data_shards, len(file_shards))
+        shards = [Shard(s.shard_index, s.shard_id, s.endpoint) for s in file_shards if s.transfer_status not in REPLICA_FAILED_STATUSES]
+        acked, errors = coder.commit_shards(shards, task.epoch_no(), timeout=self.io_timeout())
+        for s in file_shards:
+            if s.shard_index in errors:
+                self.db().update_file_shard(remote_id, s.shard_index, s.shard_id, s.endpoint, s.data_shards, FileTransferStatus.SYNC_DATA_FAILED, s.transferred_chunks)
+            elif s.transfer_status not in REPLICA_FAILED_STATUSES:
+                self.db().update_file_shard(remote_id, s.shard_index, s.shard_id, s.endpoint, s.data_shards, FileTransferStatus.SYNCED_DATA, s.transferred_chunks)
+
+        try:
+            coder.check_quorum(acked, errors, 'Commit file [{}] shards'.format(remote_id))
+        except RemoteClientError as e:
+            self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.SYNC_DATA_FAILED)
+            raise e
+        logging.debug('Committed [{}] file shards'.format(len(acked)))
+
+        self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.SYNCED_DATA)
+        logging.debug('Updated file remote status to synced data')
+
     def do_delete_file(self, task: DeleteFileTask) -> None:
         try:
             file_metadata = self.db().get_file_metadata(task.local_file_id())
@@ -71,12 +139,30 @@ class UploadWorker(AsyncWorker):
 
         if remote_id is not None:
             logging.debug('File [{}] remote id [{}]'.format(task.local_file_id(), remote_id))
-            try:
-                self.remote_client().remove_file(remote_id, task.epoch_no(), timeout=self.io_timeout())
-                logging.debug('Removed file [{}] on remote server'.format(task.local_file_id()))
-            except RemoteClientError as e:
-                if e.error_code() != FileServerErrorCode.FILE_NOT_FOUND:
-                    raise e
+            replicas = self.db().get_file_replicas(remote_id)
+            file_shards = self.db().get_file_shards(remote_id)
+            if len(file_shards) > 0:
+                coder = self.erasure_coder(file_shards[0].data_shards, len(file_shards))
+                shards = [Shard(s.shard_index, s.shard_id, s.endpoint) for s in file_shards]
+                acked, errors = coder.remove_shards(shards, task.epoch_no(), timeout=self.io_timeout())
+                # Shards that couldn't be reached are left recorded for repair.
+                self.db().remove_file_shards(remote_id, [shard.shard_index for shard in acked])
+                coder.check_quorum(acked, errors, 'Remove file [{}] shards'.format(remote_id))
+                logging.debug('Removed file [{}] shards'.format(task.local_file_id()))
+            elif len(replicas) > 0:
+                endpoints = [replica.endpoint for replica in replicas]
+                acked, errors = self.replicator().remove_file(remote_id, endpoints, task.epoch_no(), timeout=self.io_timeout())
+                # Replicas that couldn't be reached are left recorded for repair.
+                self.db().remove_file_replicas(remote_id, acked)
+                self.replicator().check_quorum(acked, errors, 'Remove file [{}]'.format(remote_id))
+                logging.debug('Removed file [{}] on [{}] replicas'.format(task.local_file_id(), len(acked)))
+            else:
+                try:
+                    self.remote_client().remove_file(remote_id, task.epoch_no(), timeout=self.io_timeout())
+                    logging.debug('Removed file [{}] on remote server'.format(task.local_file_id()))
+                except RemoteClientError as e:
+                    if e.error_code() != FileServerErrorCode.FILE_NOT_FOUND:
+                        raise e
         
         try:
             self.db().remove_file_data(task.local_file_id())
@@ -95,11 +181,46 @@ class UploadWorker(AsyncWorker):
         if remote_transfer_status == FileTransferStatus.SYNCING_DATA or remote_transfer_status == FileTransferStatus.SYNCED_DATA or remote_transfer_status == FileTransferStatus.SYNC_DATA_FAILED:
             raise FileUploadError('File [{}] has or may already be committed. Cannot transfer file data'.format(task.local_file_id()), FileServerErrorCode.FILE_IS_COMMITTED)
 
-        remote_file_id = self.remote_client().create_file(task.file_size(), timeout=self.io_timeout())
-        logging.debug('Created remote file [{}]'.format(remote_file_id))
+        # Only known once the file has been fully received.
+        total_chunks = file_metadata.total_chunks if file_metadata.local_transfer_status == FileTransferStatus.SYNCED_DATA else None
 
-        self.db().update_file_remote(task.local_file_id(), remote_file_id, FileTransferStatus.TRANSFERRING_DATA)
-        logging.debug('Updated file remote status to transferring data')
+        if self.erasure_code() is not None:
+            self.do_transfer_file_shards(task, file_metadata.remote_id, total_chunks)
+            return
+        if self.replicator().replication_factor() > 1:
+            self.do_transfer_file_replicas(task, file_metadata.remote_id, total_chunks)
+            return
+
+        remote_file_id = file_metadata.remote_id
+        chunks_sent = 0
+
+        if remote_file_id is not None:
+            #
+            # The file was partially uploaded before (ex. the server was
+            # restarted during the upload). The remote server is the source of
+            # truth for how many chunks it has received so resume from there.
+            #
+            try:
+                remote_metadata = self.remote_client().get_file_metadata(remote_file_id, timeout=self.io_timeout())
+                if remote_metadata.is_committed:
+                    logging.debug('Remote file [{}] already committed'.format(remote_file_id))
+                    self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.TRANSFERRED_DATA, transferred_chunks=remote_metadata.file_chunks)
+                    return
+                chunks_sent = remote_metadata.file_chunks
+                logging.debug('Resuming upload to remote file [{}] from chunk [{}]'.format(remote_file_id, chunks_sent+1))
+                self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.TRANSFERRING_DATA, transferred_chunks=chunks_sent)
+            except RemoteClientError as e:
+                if e.error_code() != FileServerErrorCode.FILE_NOT_FOUND:
+                    raise e
+                logging.debug('Remote file [{}] not found. Restarting upload'.format(remote_file_id))
+                remote_file_id = None
+        
+        if remote_file_id is None:
+            remote_file_id = self.remote_client().create_file(task.file_size(), timeout=self.io_timeout())
+            logging.debug('Created remote file [{}]'.format(remote_file_id))
+
+            self.db().update_file_remote(task.local_file_id(), remote_file_id, FileTransferStatus.TRANSFERRING_DATA)
+            logging.debug('Updated file remote status to transferring data')
 
         if self.is_current_task_cancelled():
             raise FileUploadError('File [{}] upload cancelled'.format(task.local_file_id()), FileServerErrorCode.REMOTE_UPLOAD_CANCELLED)
@@ -108,16 +229,26 @@ class UploadWorker(AsyncWorker):
         logging.debug('Opened file [{}] in cache for reading'.format(task.local_file_id()))
 
         try:
-            chunks_sent = 0
+            if chunks_sent > 0:
+                file.seek_chunk(chunks_sent)
             while True:
                 if self.is_current_task_cancelled():
                     raise FileUploadError('File [{}] upload cancelled'.format(task.local_file_id()), FileServerErrorCode.REMOTE_UPLOAD_CANCELLED)
-                chunk_data = file.read_chunk()
-                if len(chunk_data) == 0:
+                chunks: list[bytes] = []
+                while len(chunks) < self.batch_chunks():
+                    chunk_data = file.read_chunk()
+                    if len(chunk_data) == 0:
+                        break
+                    chunks.append(chunk_data)
+                if len(chunks) == 0:
                     break
-                self.remote_client().send_file_chunk(remote_file_id, chunk_data, chunks_sent+1, timeout=self.io_timeout())
+                if len(chunks) == 1:
+                    self.remote_client().send_file_chunk(remote_file_id, chunks[0], chunks_sent+1, timeout=self.io_timeout())
+                else:
+                    self.remote_client().send_file_chunks(remote_file_id, chunks, chunks_sent+1, timeout=self.io_timeout())
+                chunks_sent += len(chunks)
                 self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.TRANSFERRING_DATA, transferred_chunks=chunks_sent)
-                chunks_sent += 1
+                task.report_progress(chunks_sent, total_chunks)
             logging.debug('Sent {} file chunks'.format(chunks_sent))
         except FileServerError as e:
             self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.TRANSFER_DATA_FAILED, transferred_chunks=chunks_sent)
@@ -126,6 +257,217 @@ class UploadWorker(AsyncWorker):
             self.store().close_file(file)
             logging.debug('Closed file in cache')
         
-        self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.TRANSFERRED_DATA)
+        self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.TRANSFERRED_DATA, transferred_chunks=chunks_sent)
+        task.report_progress(chunks_sent, chunks_sent)
+        logging.debug('Updated file remote status to transferred data')
+
+    def resume_replicas(self, task: TransferFileTask, remote_file_id: str) -> Optional[dict[str, tuple[RemoteEndpoint, int]]]:
+        '''
+            Find the replicas a partial upload can resume on and how many
+            chunks each has. Returns None if the upload must be restarted.
+        '''
+        replicas = self.db().get_file_replicas(remote_file_id)
+        endpoints = [replica.endpoint for replica in replicas if replica.transfer_status not in REPLICA_FAILED_STATUSES]
+        results, errors = self.replicator().get_file_metadata(remote_file_id, endpoints, timeout=self.io_timeout())
+
+        live = dict()
+        for endpoint in endpoints:
+            name = str(endpoint)
+            if name in results:
+                live[name] = (endpoint, results[name].file_chunks)
+            else:
+                self.db().update_file_replica(remote_file_id, endpoint, FileTransferStatus.TRANSFER_DATA_FAILED)
+
+        if len(live) >= self.replicator().write_quorum():
+            return live
+        # Can't tell whether the replicas are gone or just unreachable.
+        for e in errors.values():
+            if e.error_code() != FileServerErrorCode.FILE_NOT_FOUND:
+                raise e
+        logging.debug('Remote file [{}] not found on enough replicas. Restarting upload'.format(remote_file_id))
+        self.db().remove_file_replicas(remote_file_id)
+        return None
+
+    def do_transfer_file_replicas(self, task: TransferFileTask, remote_file_id: Optional[str], total_chunks: Optional[int]) -> None:
+        '''
+            Upload the file to replication_factor remote endpoints in parallel.
+            Replicas that fail are dropped, the upload fails if fewer than the
+            write quorum are left.
+        '''
+        live = None
+        if remote_file_id is not None:
+            live = self.resume_replicas(task, remote_file_id)
+
+        if live is None:
+            remote_file_id, endpoints = self.replicator().create_file(task.file_size(), timeout=self.io_timeout())
+            logging.debug('Created remote file [{}] on [{}] replicas'.format(remote_file_id, len(endpoints)))
+            self.db().update_file_remote(task.local_file_id(), remote_file_id, FileTransferStatus.TRANSFERRING_DATA)
+            for endpoint in endpoints:
+                self.db().update_file_replica(remote_file_id, endpoint, FileTransferStatus.TRANSFERRING_DATA)
+            live = dict([(str(endpoint), (endpoint, 0)) for endpoint in endpoints])
+
+        endpoints = [endpoint for endpoint, _ in live.values()]
+        replica_chunks = dict([(name, chunks) for name, (_, chunks) in live.items()])
+        chunks_sent = min(replica_chunks.values())
+        if chunks_sent > 0:
+            logging.debug('Resuming upload to remote file [{}] from chunk [{}]'.format(remote_file_id, chunks_sent+1))
+            self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.TRANSFERRING_DATA, transferred_chunks=chunks_sent)
+
+        if self.is_current_task_cancelled():
+            raise FileUploadError('File [{}] upload cancelled'.format(task.local_file_id()), FileServerErrorCode.REMOTE_UPLOAD_CANCELLED)
+
+        file = self.store().read_file(task.local_file_id())
+        logging.debug('Opened file [{}] in cache for reading'.format(task.local_file_id()))
+
+        try:
+            if chunks_sent > 0:
+                file.seek_chunk(chunks_sent)
+            while True:
+                if self.is_current_task_cancelled():
+                    raise FileUploadError('File [{}] upload cancelled'.format(task.local_file_id()), FileServerErrorCode.REMOTE_UPLOAD_CANCELLED)
+                chunks: list[bytes] = []
+                while len(chunks) < self.batch_chunks():
+                    chunk_data = file.read_chunk()
+                    if len(chunk_data) == 0:
+                        break
+                    chunks.append(chunk_data)
+                if len(chunks) == 0:
+                    break
+                acked, errors = self.replicator().send_chunks(remote_file_id, endpoints, chunks, chunks_sent+1, replica_chunks, timeout=self.io_timeout())
+                for endpoint in endpoints:
+                    name = str(endpoint)
+                    if name in errors:
+                        self.db().update_file_replica(remote_file_id, endpoint, FileTransferStatus.TRANSFER_DATA_FAILED, replica_chunks[name])
+                    else:
+                        replica_chunks[name] = max(replica_chunks[name], chunks_sent+len(chunks))
+                endpoints = acked
+                self.replicator().check_quorum(acked, errors, 'Send file [{}] chunks'.format(remote_file_id))
+                chunks_sent += len(chunks)
+                self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.TRANSFERRING_DATA, transferred_chunks=chunks_sent)
+                task.report_progress(chunks_sent, total_chunks)
+            logging.debug('Sent {} file chunks to [{}] replicas'.format(chunks_sent, len(endpoints)))
+        except FileServerError as e:
+            self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.TRANSFER_DATA_FAILED, transferred_chunks=chunks_sent)
+            raise e
+        finally:
+            self.store().close_file(file)
+            logging.debug('Closed file in cache')
+
+        for endpoint in endpoints:
+            self.db().update_file_replica(remote_file_id, endpoint, FileTransferStatus.TRANSFERRED_DATA, chunks_sent)
+        self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.TRANSFERRED_DATA, transferred_chunks=chunks_sent)
+        task.report_progress(chunks_sent, chunks_sent)
         logging.debug('Updated file remote status to transferred data')
 
+    def resume_shards(self, task: TransferFileTask, remote_file_id: str) -> Optional[tuple[ErasureCoder, list[FileShard], dict[int, int]]]:
+        '''
+            Find the shards a partial erasure coded upload can resume on and
+            how many fragments each has. Returns None if the upload must be
+            restarted.
+        '''
+        file_shards = self.db().get_file_shards(remote_file_id)
+        if len(file_shards) == 0:
+            return None
+        coder = self.erasure_coder(file_shards[0].data_shards, len(file_shards))
+        shards = [Shard(s.shard_index, s.shard_id, s.endpoint) for s in file_shards if s.transfer_status not in REPLICA_FAILED_STATUSES]
+        results, errors = coder.get_shard_metadata(shards, timeout=self.io_timeout())
+
+        shard_chunks = dict()
+        for s in file_shards:
+            if s.shard_index in results:
+                shard_chunks[s.shard_index] = results[s.shard_index].file_chunks
+            elif s.shard_index in errors:
+                self.db().update_file_shard(remote_file_id, s.shard_index, s.shard_id, s.endpoint, s.data_shards, FileTransferStatus.TRANSFER_DATA_FAILED)
+
+        if len(shard_chunks) >= coder.write_quorum():
+            return coder, file_shards, shard_chunks
+        for e in errors.values():
+            if e.error_code() != FileServerErrorCode.FILE_NOT_FOUND:
+                raise e
+        logging.debug('Remote file [{}] shards not found. Restarting upload'.format(remote_file_id))
+        self.db().remove_file_shards(remote_file_id)
+        return None
+
+    def do_transfer_file_shards(self, task: TransferFileTask, remote_file_id: Optional[str], total_chunks: Optional[int]) -> None:
+        '''
+            Upload the file erasure coded (see replication.ErasureCoder).
+            Shards that fail are dropped, the upload fails if fewer than the
+            write quorum are left.
+        '''
+        resumed = None
+        if remote_file_id is not None:
+            resumed = self.resume_shards(task, remote_file_id)
+
+        if resumed is not None:
+            coder, file_shards, shard_chunks = resumed
+        else:
+            code = self.erasure_code()
+            coder = self.erasure_coder(code.data_shards(), code.total_shards())
+            all_shards, created = coder.create_shards(task.file_size(), timeout=self.io_timeout())
+            # The file is known by its own id, its shards by theirs.
+            remote_file_id = File.generate_file_id()
+            self.db().update_file_remote(task.local_file_id(), remote_file_id, FileTransferStatus.TRANSFERRING_DATA)
+            created_indexes = set([shard.shard_index for shard in created])
+            for shard in all_shards:
+                status = FileTransferStatus.TRANSFERRING_DATA if shard.shard_index in created_indexes else FileTransferStatus.TRANSFER_DATA_FAILED
+                self.db().update_file_shard(remote_file_id, shard.shard_index, shard.shard_id, shard.endpoint, code.data_shards(), status)
+            logging.debug('Created remote file [{}] with [{}] shards'.format(remote_file_id, len(created)))
+            file_shards = self.db().get_file_shards(remote_file_id)
+            shard_chunks = dict([(index, 0) for index in created_indexes])
+
+        data_shards = coder.erasure_code().data_shards()
+        shards = [Shard(s.shard_index, s.shard_id, s.endpoint) for s in file_shards if s.shard_index in shard_chunks]
+        groups_sent = min(shard_chunks.values())
+        chunks_sent = groups_sent * data_shards
+        if chunks_sent > 0:
+            logging.debug('Resuming upload to remote file [{}] from chunk [{}]'.format(remote_file_id, chunks_sent+1))
+            self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.TRANSFERRING_DATA, transferred_chunks=chunks_sent)
+
+        if self.is_current_task_cancelled():
+            raise FileUploadError('File [{}] upload cancelled'.format(task.local_file_id()), FileServerErrorCode.REMOTE_UPLOAD_CANCELLED)
+
+        file = self.store().read_file(task.local_file_id())
+        logging.debug('Opened file [{}] in cache for reading'.format(task.local_file_id()))
+
+        # Whole groups per request, at least one.
+        batch_groups = max(self.batch_chunks() // data_shards, 1)
+        try:
+            if chunks_sent > 0:
+                file.seek_chunk(chunks_sent)
+            while True:
+                if self.is_current_task_cancelled():
+                    raise FileUploadError('File [{}] upload cancelled'.format(task.local_file_id()), FileServerErrorCode.REMOTE_UPLOAD_CANCELLED)
+                chunks: list[bytes] = []
+                while len(chunks) < batch_groups * data_shards:
+                    chunk_data = file.read_chunk()
+                    if len(chunk_data) == 0:
+                        break
+                    chunks.append(chunk_data)
+                if len(chunks) == 0:
+                    break
+                fragments = coder.encode_groups(chunks)
+                acked, errors = coder.send_fragments(shards, fragments, groups_sent+1, shard_chunks, timeout=self.io_timeout())
+                for s in file_shards:
+                    if s.shard_index in errors:
+                        self.db().update_file_shard(remote_file_id, s.shard_index, s.shard_id, s.endpoint, s.data_shards, FileTransferStatus.TRANSFER_DATA_FAILED, shard_chunks[s.shard_index])
+                for shard in acked:
+                    shard_chunks[shard.shard_index] = max(shard_chunks[shard.shard_index], groups_sent + len(fragments[shard.shard_index]))
+                shards = acked
+                coder.check_quorum(acked, errors, 'Send file [{}] fragments'.format(remote_file_id))
+                groups_sent += (len(chunks) + data_shards - 1) // data_shards
+                chunks_sent += len(chunks)
+                self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.TRANSFERRING_DATA, transferred_chunks=chunks_sent)
+                task.report_progress(chunks_sent, total_chunks)
+            logging.debug('Sent {} file chunks to [{}] shards'.format(chunks_sent, len(shards)))
+        except FileServerError as e:
+            self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.TRANSFER_DATA_FAILED, transferred_chunks=chunks_sent)
+            raise e
+        finally:
+            self.store().close_file(file)
+            logging.debug('Closed file in cache')
+
+        for shard in shards:
+            self.db().update_file_shard(remote_file_id, shard.shard_index, shard.shard_id, shard.endpoint, data_shards, FileTransferStatus.TRANSFERRED_DATA, shard_chunks[shard.shard_index])
+        self.db().update_file_remote(task.local_file_id(), transfer_status=FileTransferStatus.TRANSFERRED_DATA, transferred_chunks=chunks_sent)
+        task.report_progress(chunks_sent, chunks_sent)
+        logging.debug('Updated file remote status to transferred data')
@@ -3,9 +3,12 @@ import logging
 import os
 import signal
 
+from .admission_control import AdmissionControl
 from .local.async_controller import AsyncController
 from .local.controller import LocalServerController
+from .local.multipart_upload import MultipartUploadManager, MultipartUploads
 from .file_chunk import get_encrypted_chunk_encoder, get_encrypted_chunk_decoder
+from .prefork import PreforkServer
 from .server import Server
 from .util.crypto import get_encryptor_factory, get_decryptor_factory
 from .util.file import read_config
@@ -17,6 +20,7 @@ class LocalServer(Server):
         super().__init__('local_server', config)
         self._async_controller = None
         self._controller = None
+        self._upload_mgr = None
 
     def async_controller(self):
         return self._async_controller
@@ -24,6 +28,18 @@ class LocalServer(Server):
     def controller(self):
         return self._controller
 
+    def upload_mgr(self):
+        return self._upload_mgr
+
+    def prefork_supported(self) -> bool:
+        # Each process' async controller leases tasks from the database with
+        # its own lease owner. Admission control and bandwidth limits apply
+        # per process.
+        return True
+
+    def prefork_shared_types(self) -> dict:
+        return {'MultipartUploads': MultipartUploads}
+
     def dao_factory(self):
         db_type = db_type = self.db_config().get('db-type')
         if db_type == 'sqlite':
@@ -41,7 +57,7 @@ class LocalServer(Server):
 
     def init_async_controller(self):
         remote_config = self.config('remote')
-        self._async_controller = AsyncController(remote_config, self.dao_factory(), self.db_conn_mgr(), self.store())
+        self._async_controller = AsyncController(remote_config, self.dao_factory(), self.db_conn_mgr(), self.store(), recover=self.recover())
 
     def do_start(self):      
         logging.info('Starting PrivaStore local server ...')
@@ -52,16 +68,23 @@ class LocalServer(Server):
 
         logging.debug('Initializing controller')
         self.init_async_controller()
+        self._upload_mgr = MultipartUploadManager(self.store_config(), self.store(), uploads=self.shared_object('MultipartUploads'))
         self._controller = LocalServerController(self.async_controller(),
-            self.dao_factory(), self.db_conn_mgr(), self.session_mgr(), self.store())
+            self.dao_factory(), self.db_conn_mgr(), self.session_mgr(), self.store(), self.upload_mgr(),
+            AdmissionControl.from_config(self.store_config()))
         self._controller.init_auth(self.auth_config())
-        self._controller.init_store()
+        if self.recover():
+            self._controller.init_store()
         self.init_api()
 
         self.async_controller().start()
         self.async_controller().wait_started()
+        if self.recover():
+            self._controller.resume_uploads()
         self.session_mgr().start()
         self.session_mgr().wait_started()
+        self.upload_mgr().start()
+        self.upload_mgr().wait_started()
         self.api_daemon().start()
         self.api_daemon().wait_started()
 
@@ -70,9 +93,25 @@ class LocalServer(Server):
         self.api_daemon().join()
         self.session_mgr().stop()
         self.session_mgr().join()
+        self.upload_mgr().stop()
+        self.upload_mgr().join()
         self.async_controller().stop()
         self.async_controller().join()
 
+    def init_db(self):
+        super().init_db()
+        self.upgrade_db()
+
+    def upgrade_db(self):
+        db_config = self.db_config()
+        db_type = db_config.get('db-type', 'sqlite')
+
+        if db_type == 'sqlite':
+            from .local.db.sqlite.setup import upgrade_db
+            upgrade_db(db_config)
+        else:
+            raise Exception('Unsupported database: {}'.format(db_type))
+
     def setup_db(self):
         db_config = self.db_config()
         db_type = db_config.get('db-type', 'sqlite')
@@ -106,6 +145,10 @@ def server_main():
         server.setup_db()
         return
 
+    num_processes = int(server_config['api'].get('api-processes', '1'))
+    if num_processes > 1:
+        server = PreforkServer(lambda: LocalServer(server_config), num_processes)
+
     def handle_ctrl_c(signum, frame):
         print('Stopping...')
         server.stop()
@@ -0,0 +1,143 @@
+from .daemon import Daemon
+import logging
+import multiprocessing
+import signal
+from .server import Server
+from .session import SessionsServer
+from typing import Callable
+
+class PreforkManager(SessionsServer):
+
+    '''
+        Serves the sessions and the server's shared objects (see
+        Server.prefork_shared_types) to the worker processes.
+    '''
+    pass
+
+def run_worker(server_factory: Callable[[], Server], sessions, shared_objects: dict, recover: bool, ready) -> None:
+    '''
+        Worker process entry point. SIGTERM stops the server, Ctrl+C is left
+        to the parent.
+    '''
+    server = server_factory()
+    server.enable_prefork(sessions, shared_objects, recover)
+
+    def handle_stop(signum, frame):
+        server.stop()
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    server.start()
+    server.wait_started()
+    ready.set()
+    server.join()
+
+class PreforkServer(Daemon):
+
+    '''
+        Runs the server in num_processes worker processes sharing the API
+        ports (SO_REUSEPORT), the kernel spreads connections across them so
+        request handling isn't bound to one interpreter.
+
+        Sessions (and the server's other shared objects) are served to the
+        workers from a manager process (see PreforkManager), the file store
+        is shared through the store directory (see FileCache) and file state
+        through the database. Workers that exit are restarted, only the first
+        worker started recovers the state left by a previous run (see
+        Server.recover).
+    '''
+    def __init__(self, server_factory: Callable[[], Server], num_processes: int, start_timeout: float=30, stop_timeout: float=30, check_interval: float=1):
+        super().__init__('prefork-server')
+        if num_processes < 1:
+            raise Exception('Invalid number of server processes [{}]'.format(num_processes))
+        server = server_factory()
+        if not server.prefork_supported():
+            raise Exception('Server [{}] does not support pre-fork mode!'.format(server.name()))
+        self._server_factory = server_factory
+        self._shared_types = server.prefork_shared_types()
+        for type_name, type_callable in self._shared_types.items():
+            PreforkManager.register(type_name, type_callable)
+        self._num_processes = num_processes
+        self._start_timeout = start_timeout
+        self._stop_timeout = stop_timeout
+        self._check_interval = check_interval
+        self._context = multiprocessing.get_context('fork')
+        self._sessions_server = None
+        self._sessions = None
+        self._shared_objects = dict()
+        self._workers: list[multiprocessing.Process] = []
+        logging.debug('Pre-fork server processes: [{}]'.format(num_processes))
+
+    def num_processes(self) -> int:
+        return self._num_processes
+
+    def worker_pids(self) -> list[int]:
+        return [worker.pid for worker in self._workers if worker.is_alive()]
+
+    def start_worker(self, worker_index: int, recover: bool=False) -> multiprocessing.Process:
+        ready = self._context.Event()
+        worker = self._context.Process(name='server-worker-{}'.format(worker_index), target=run_worker, args=(self._server_factory, self._sessions, self._shared_objects, recover, ready), daemon=True)
+        worker.start()
+        if not ready.wait(self._start_timeout) or not worker.is_alive():
+            self.stop_worker(worker)
+            raise Exception('Server worker [{}] did not start!'.format(worker_index))
+        logging.debug('Server worker [{}] started pid [{}]'.format(worker_index, worker.pid))
+        return worker
+
+    def stop_worker(self, worker: multiprocessing.Process) -> None:
+        if worker.is_alive():
+            worker.terminate()
+        worker.join(self._stop_timeout)
+        if worker.is_alive():
+            logging.warning('Server worker pid [{}] did not stop, killing'.format(worker.pid))
+            worker.kill()
+            worker.join()
+
+    def stop_workers(self) -> None:
+        # Signal all the workers first so they drain in parallel.
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in self._workers:
+            try:
+                self.stop_worker(worker)
+            except Exception as e:
+                logging.error('Error stopping server worker pid [{}]: {}'.format(worker.pid, str(e)))
+        self._workers = []
+
+    def run(self):
+        try:
+            self._sessions_server = PreforkManager(ctx=self._context)
+            self._sessions_server.start()
+            self._sessions = self._sessions_server.Sessions()
+            self._shared_objects = {type_name: getattr(self._sessions_server, type_name)() for type_name in self._shared_types}
+            # Workers are started one at a time, the first is done recovering
+            # before the others start.
+            for i in range(self._num_processes):
+                self._workers.append(self.start_worker(i, recover=(i == 0)))
+        except Exception as e:
+            logging.error('Pre-fork server failed to start: {}'.format(str(e)))
+            self.stop_workers()
+            if self._sessions_server is not None:
+                self._sessions_server.shutdown()
+            self._stopped.set()
+            self._started.set()
+            return
+
+        self._started.set()
+        logging.info('Pre-fork server started')
+        while not self._stop.wait(self._check_interval):
+            for i, worker in enumerate(self._workers):
+                if worker.is_alive():
+                    continue
+                logging.warning('Server worker [{}] exited with code [{}], restarting'.format(i, worker.exitcode))
+                try:
+                    self._workers[i] = self.start_worker(i)
+                except Exception as e:
+                    logging.error('Error restarting server worker [{}]: {}'.format(i, str(e)))
+
+        logging.info('Pre-fork server stopping')
+        self.stop_workers()
+        self._sessions_server.shutdown()
+        self._stopped.set()
+        logging.info('Pre-fork server stopped')
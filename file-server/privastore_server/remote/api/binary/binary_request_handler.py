@@ -0,0 +1,225 @@
+from ....binary_protocol import APPEND_CHUNK, COMMIT_FILE, CREATE_FILE, END_EPOCH, FILE_METADATA, FILE_SIZE, LOGIN, READ_CHUNK, REMOVE_FILE, STATUS_ERROR, STATUS_OK, UINT32
+from ....binary_protocol import decode_file_id, decode_file_request, encode_message, MAX_BODY_LEN, Message, recv_message
+from ...controller import RemoteServerController
+from ....error import EpochError, FileError, FileServerError, FileServerErrorCode, RemoteFileError, SessionError
+from ....file import File, FILE_ID_LENGTH
+import json
+import logging
+import socket
+from socketserver import BaseRequestHandler
+import struct
+from ....util.logging import log_exception_stack
+
+class BinaryApiRequestHandler(BaseRequestHandler):
+
+    '''
+        Handles a binary protocol connection. The connection is logged in once
+        and its requests use the connection's session.
+
+        Requests are handled in the order they are received so appends to a
+        file can be pipelined.
+    '''
+
+    def __init__(self, request, client_address, server, controller: RemoteServerController):
+        self._controller = controller
+        self._session_id = None
+        super().__init__(request, client_address, server)
+
+    def controller(self) -> RemoteServerController:
+        return self._controller
+
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.request.settimeout(self.server.connection_timeout)
+        # Oversized chunks are read and rejected, larger messages close the connection.
+        max_body_len = max(MAX_BODY_LEN, FILE_ID_LENGTH + UINT32.size + self.controller().store().file_chunk_size())
+        logging.debug('Binary API connection from [{}]'.format(self.client_address))
+
+        try:
+            while True:
+                # Closed right away if the server is draining.
+                self.server.connection_idle(self.request)
+                try:
+                    message = recv_message(self.request, max_body_len)
+                except socket.timeout:
+                    logging.debug('Binary API connection idle, closing')
+                    return
+                except (OSError, ValueError) as e:
+                    logging.error('Binary API connection error: {}'.format(str(e)))
+                    return
+
+                if message is None:
+                    logging.debug('Binary API connection closed')
+                    return
+                self.server.connection_busy(self.request)
+
+                response = self.handle_message(message)
+                try:
+                    self.request.sendall(response)
+                except OSError as e:
+                    logging.error('Binary API connection error: {}'.format(str(e)))
+                    return
+        finally:
+            self.end_session()
+
+    def end_session(self):
+        if self._session_id is None:
+            return
+        try:
+            self.controller().logout_user(self._session_id)
+        except Exception as e:
+            logging.debug('Could not end session [{}]: {}'.format(self._session_id, str(e)))
+        self._session_id = None
+
+    def handle_message(self, message: Message) -> bytes:
+        try:
+            if message.code == LOGIN:
+                body = self.handle_login_user(message.body)
+            else:
+                if self._session_id is None:
+                    raise SessionError('Connection is not logged in', FileServerErrorCode.SESSION_NOT_FOUND)
+                self.controller().heartbeat_session(self._session_id)
+
+                if message.code == CREATE_FILE:
+                    body = self.handle_create_remote_file(message.body)
+                elif message.code == APPEND_CHUNK:
+                    body = self.handle_remote_file_write(message.body)
+                elif message.code == READ_CHUNK:
+                    body = self.handle_remote_file_read(message.body)
+                elif message.code == COMMIT_FILE:
+                    body = self.handle_commit_remote_file(message.body)
+                elif message.code == REMOVE_FILE:
+                    body = self.handle_remove_file(message.body)
+                elif message.code == END_EPOCH:
+                    body = self.handle_end_epoch(message.body)
+                elif message.code == FILE_METADATA:
+                    body = self.handle_get_remote_file_metadata(message.body)
+                else:
+                    raise FileServerError('Invalid request op [{}]'.format(message.code), FileServerErrorCode.INVALID_REQUEST)
+            return encode_message(message.request_id, STATUS_OK, body)
+        except FileServerError as e:
+            logging.error('Error [{}] - {}'.format(e.error_code(), str(e)))
+            return self.error_response(message, e.error_code())
+        except (ValueError, struct.error) as e:
+            logging.error('Invalid request: {}'.format(str(e)))
+            return self.error_response(message, FileServerErrorCode.INVALID_REQUEST)
+        except Exception as e:
+            logging.error('Internal error: {}'.format(str(e)))
+            log_exception_stack()
+            return self.error_response(message, FileServerErrorCode.INTERNAL_ERROR)
+
+    def error_response(self, message: Message, error_code: str) -> bytes:
+        return encode_message(message.request_id, STATUS_ERROR, error_code.encode('utf-8'))
+
+    def get_remote_file_id(self, body: bytes) -> tuple[str, bytes]:
+        remote_id, rest = decode_file_id(body)
+        if not File.is_valid_file_id(remote_id):
+            raise RemoteFileError('Invalid remote file id!', FileServerErrorCode.INVALID_FILE_ID)
+        return remote_id, rest
+
+    def get_file_request(self, body: bytes) -> tuple[str, int, bytes]:
+        self.get_remote_file_id(body)
+        return decode_file_request(body)
+
+    def parse_epoch_no(self, epoch_no: int) -> int:
+        if epoch_no < 1:
+            raise EpochError('Invalid epoch value. Must be >= 1', FileServerErrorCode.INVALID_EPOCH_NO)
+        return epoch_no
+
+    def parse_chunk_num(self, chunk_num: int) -> int:
+        if chunk_num < 1:
+            raise RemoteFileError('Invalid chunk number. Must be >= 1', FileServerErrorCode.INVALID_CHUNK_NUM)
+        return chunk_num
+
+    def handle_login_user(self, body: bytes) -> bytes:
+        '''
+            LOGIN <username> NUL <password>
+        '''
+        logging.debug('Login request')
+        username, password = body.decode('utf-8').split('\0')
+        session_id = self.controller().login_user(username, password)
+        self.end_session()
+        self._session_id = session_id
+        logging.debug('Connection logged in session [{}]'.format(session_id))
+        return b''
+
+    def handle_create_remote_file(self, body: bytes) -> bytes:
+        '''
+            CREATE_FILE <file size> [<file id>]
+
+            Responds with the file id.
+        '''
+        logging.debug('Create remote file request')
+        file_size, = FILE_SIZE.unpack_from(body)
+        if len(body) > FILE_SIZE.size:
+            remote_id, _ = self.get_remote_file_id(body[FILE_SIZE.size:])
+        else:
+            remote_id = File.generate_file_id()
+        self.controller().create_file(remote_id, file_size)
+        return remote_id.encode('ascii')
+
+    def handle_remote_file_write(self, body: bytes) -> bytes:
+        '''
+            APPEND_CHUNK <file id> <chunk number> <chunk bytes>
+
+            Chunk number must be == next chunk number.
+        '''
+        logging.debug('Append remote file chunk request')
+        remote_id, chunk_num, chunk = self.get_file_request(body)
+        chunk_num = self.parse_chunk_num(chunk_num)
+        if len(chunk) == 0:
+            raise ValueError('File chunk cannot be empty')
+        if len(chunk) > self.controller().store().file_chunk_size():
+            raise FileError('File chunk too large', FileServerErrorCode.FILE_CHUNK_TOO_LARGE)
+        self.controller().append_to_file(remote_id, chunk_num, chunk)
+        return b''
+
+    def handle_remote_file_read(self, body: bytes) -> bytes:
+        '''
+            READ_CHUNK <file id> <chunk number>
+
+            Responds with the chunk bytes.
+        '''
+        logging.debug('Read remote file chunk request')
+        remote_id, chunk_num, _ = self.get_file_request(body)
+        return self.controller().read_from_file(remote_id, self.parse_chunk_num(chunk_num))
+
+    def handle_commit_remote_file(self, body: bytes) -> bytes:
+        '''
+            COMMIT_FILE <file id> <epoch no>
+        '''
+        logging.debug('Commit remote file request')
+        remote_id, epoch_no, _ = self.get_file_request(body)
+        self.controller().commit_file(self.parse_epoch_no(epoch_no), remote_id)
+        return b''
+
+    def handle_remove_file(self, body: bytes) -> bytes:
+        '''
+            REMOVE_FILE <file id> <epoch no>
+        '''
+        logging.debug('Remove remote file request')
+        remote_id, epoch_no, _ = self.get_file_request(body)
+        self.controller().remove_file(self.parse_epoch_no(epoch_no), remote_id)
+        return b''
+
+    def handle_end_epoch(self, body: bytes) -> bytes:
+        '''
+            END_EPOCH <epoch no> [<marker file id>]
+        '''
+        logging.debug('End epoch request')
+        epoch_no, = UINT32.unpack_from(body)
+        marker_id = None
+        if len(body) > UINT32.size:
+            marker_id, _ = self.get_remote_file_id(body[UINT32.size:])
+        self.controller().end_epoch(self.parse_epoch_no(epoch_no), marker_id)
+        return b''
+
+    def handle_get_remote_file_metadata(self, body: bytes) -> bytes:
+        '''
+            FILE_METADATA <file id>
+
+            Responds with the file metadata JSON (as the HTTP API).
+        '''
+        logging.debug('Get remote file metadata request')
+        remote_id, _ = self.get_remote_file_id(body)
+        return json.dumps(self.controller().get_file_metadata(remote_id)).encode('utf-8')
@@ -0,0 +1,261 @@
+from ....api.http.asyncio_http_daemon import AsyncioHttpRequest, AsyncioHttpResponse
+from ....api.http.asyncio_request_handler import AsyncioHttpError, BaseAsyncioHttpApiRequestHandler
+from ....api.http.http_request_handler import CONTENT_TYPE_HEADER, CONTENT_TYPE_JSON, CONTENT_TYPE_OCTET_STREAM
+from ....chunk_batch import ChunkFrame, CHUNK_ERROR, CHUNK_OK, decode_frames, encode_frames, FRAME_HEADER_LEN, MAX_BATCH_CHUNKS
+from ...controller import RemoteServerController
+from ....error import EpochError, FileError, FileCacheError, FileServerErrorCode, RemoteFileError
+from ....file import File, FILE_ID_LENGTH
+from http import HTTPStatus
+from .http_request_handler import CHUNK_CHECKSUM_HEADER, CHUNKS_PATH_SUFFIX, COMMIT_PATH_SUFFIX, EPOCH_NO_HEADER, EPOCH_PATH, EPOCH_PATH_LEN, FILE_ID_HEADER, METADATA_PATH_SUFFIX, REMOTE_FILE_PATH, REMOTE_FILE_PATH_LEN
+import io
+import json
+import logging
+from typing import Any, Callable
+
+class AsyncioHttpApiRequestHandler(BaseAsyncioHttpApiRequestHandler):
+
+    '''
+        Remote server API on the asyncio HTTP daemon. Same routes and
+        responses as HttpApiRequestHandler (see there for the API docs).
+    '''
+    def __init__(self, controller: RemoteServerController):
+        super().__init__(controller)
+
+    def controller(self) -> RemoteServerController:
+        return self._controller
+
+    def route(self, request: AsyncioHttpRequest):
+        url_path = request.url_path
+        if request.method == 'GET' and url_path.startswith(REMOTE_FILE_PATH):
+            if url_path.endswith(METADATA_PATH_SUFFIX):
+                return self.handle_get_remote_file_metadata
+            elif url_path.endswith(CHUNKS_PATH_SUFFIX):
+                return self.handle_remote_file_batch_read
+            return self.handle_remote_file_read
+        if request.method == 'POST' and url_path.startswith(REMOTE_FILE_PATH):
+            return self.handle_create_remote_file
+        if request.method == 'PUT':
+            if url_path.startswith(EPOCH_PATH):
+                return self.handle_end_epoch
+            elif url_path.startswith(REMOTE_FILE_PATH):
+                if url_path.endswith(COMMIT_PATH_SUFFIX):
+                    return self.handle_commit_remote_file
+                elif url_path.endswith(CHUNKS_PATH_SUFFIX):
+                    return self.handle_remote_file_batch_write
+                return self.handle_remote_file_write
+        if request.method == 'DELETE' and url_path.startswith(REMOTE_FILE_PATH):
+            return self.handle_remove_file
+        return super().route(request)
+
+    async def call_controller(self, fn: Callable[..., Any], *args) -> Any:
+        try:
+            return await self.run_blocking(fn, *args)
+        except EpochError as e:
+            raise self.epoch_error(e)
+        except (FileError, FileCacheError, RemoteFileError) as e:
+            raise self.file_error(e)
+
+    def epoch_error(self, e: EpochError) -> AsyncioHttpError:
+        logging.error('Epoch error: {}'.format(str(e)))
+        if e.error_code() == FileServerErrorCode.EPOCH_IS_OVER:
+            return AsyncioHttpError(HTTPStatus.CONFLICT, e)
+        return AsyncioHttpError(HTTPStatus.BAD_REQUEST, e)
+
+    def get_chunk_num(self, request: AsyncioHttpRequest) -> int:
+        chunk_num = request.url_query.get('chunk')
+        if chunk_num is None:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Missing chunk number')
+        try:
+            chunk_num = int(chunk_num[-1])
+        except:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Invalid chunk number')
+        if chunk_num < 1:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Invalid chunk number. Must be >= 1')
+        return chunk_num
+
+    def get_chunk_count(self, request: AsyncioHttpRequest) -> int:
+        count = request.url_query.get('count')
+        if count is None:
+            return 1
+        try:
+            count = int(count[-1])
+        except:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Invalid chunk count')
+        if count < 1 or count > MAX_BATCH_CHUNKS:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Invalid chunk count. Must be between 1 and {}'.format(MAX_BATCH_CHUNKS))
+        return count
+
+    def parse_epoch_no(self, val) -> int:
+        try:
+            epoch_no = int(val)
+        except:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Invalid epoch value')
+        if epoch_no < 1:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Invalid epoch value. Must be >= 1')
+        return epoch_no
+
+    def get_epoch_no_from_path(self, request: AsyncioHttpRequest) -> int:
+        return self.parse_epoch_no(request.url_path[EPOCH_PATH_LEN+1:])
+
+    def get_epoch_no_from_header(self, request: AsyncioHttpRequest) -> int:
+        epoch_no = request.headers.get(EPOCH_NO_HEADER)
+        if epoch_no is None:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Missing {} header'.format(EPOCH_NO_HEADER))
+        return self.parse_epoch_no(epoch_no)
+
+    def get_remote_file_id(self, request: AsyncioHttpRequest) -> str:
+        prefix_len = REMOTE_FILE_PATH_LEN+1
+        file_id = request.url_path[prefix_len:prefix_len+FILE_ID_LENGTH]
+        if not File.is_valid_file_id(file_id):
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Invalid remote file id!')
+        return file_id
+
+    def chunk_frames_response(self, frames: list[ChunkFrame]) -> AsyncioHttpResponse:
+        return AsyncioHttpResponse(HTTPStatus.OK, {CONTENT_TYPE_HEADER: CONTENT_TYPE_OCTET_STREAM}, encode_frames(frames))
+
+    async def read_body(self, request: AsyncioHttpRequest, content_len: int) -> bytes:
+        body = await request.read_body()
+        if len(body) < content_len:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Not all chunk bytes could be read!')
+        return body
+
+    async def handle_create_remote_file(self, request: AsyncioHttpRequest) -> AsyncioHttpResponse:
+        logging.debug('Create remote file request')
+        await self.heartbeat_session(request)
+
+        remote_id = request.headers.get(FILE_ID_HEADER)
+        if remote_id is None:
+            remote_id = File.generate_file_id()
+        elif not File.is_valid_file_id(remote_id):
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Invalid remote file id!')
+
+        file_size = request.url_query.get('size')
+        if file_size is not None:
+            try:
+                file_size = int(file_size[-1])
+            except:
+                raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Invalid remote file size value')
+            if file_size < 0:
+                raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Invalid remote file size value. Must be >= 0')
+        else:
+            file_size = 0
+
+        await self.call_controller(self.controller().create_file, remote_id, file_size)
+        return AsyncioHttpResponse(HTTPStatus.OK, {FILE_ID_HEADER: remote_id})
+
+    async def handle_commit_remote_file(self, request: AsyncioHttpRequest) -> AsyncioHttpResponse:
+        logging.debug('Commit remote file request')
+        await self.heartbeat_session(request)
+        epoch_no = self.get_epoch_no_from_header(request)
+        remote_id = self.get_remote_file_id(request)
+
+        await self.call_controller(self.controller().commit_file, epoch_no, remote_id)
+        return AsyncioHttpResponse(HTTPStatus.OK)
+
+    async def handle_get_remote_file_metadata(self, request: AsyncioHttpRequest) -> AsyncioHttpResponse:
+        logging.debug('Get remote file metadata request')
+        await self.heartbeat_session(request)
+        remote_id = self.get_remote_file_id(request)
+
+        file_metadata = await self.call_controller(self.controller().get_file_metadata, remote_id)
+        return AsyncioHttpResponse(HTTPStatus.OK, {CONTENT_TYPE_HEADER: CONTENT_TYPE_JSON}, json.dumps(file_metadata).encode('utf-8'))
+
+    async def handle_remote_file_write(self, request: AsyncioHttpRequest) -> AsyncioHttpResponse:
+        logging.debug('Append remote file chunk request')
+        await self.heartbeat_session(request)
+        remote_id = self.get_remote_file_id(request)
+        chunk_num = self.get_chunk_num(request)
+        content_len = self.parse_content_length(request)
+
+        max_chunk_size = self.controller().store().file_chunk_size()
+        if content_len == 0:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'File chunk cannot be empty')
+        if content_len > max_chunk_size:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, FileError('File chunk too large', FileServerErrorCode.FILE_CHUNK_TOO_LARGE))
+
+        checksum = None
+        checksum_hex = request.headers.get(CHUNK_CHECKSUM_HEADER)
+        if checksum_hex is not None:
+            try:
+                checksum = bytes.fromhex(checksum_hex)
+            except ValueError:
+                raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'Invalid {} header'.format(CHUNK_CHECKSUM_HEADER))
+
+        # The chunk is read on the event loop, then written (and its checksum
+        # checked) on the executor.
+        chunk = await self.read_body(request, content_len)
+        await self.call_controller(self.controller().append_stream_to_file, remote_id, chunk_num, io.BytesIO(chunk), content_len, checksum)
+        return AsyncioHttpResponse(HTTPStatus.OK)
+
+    async def handle_remote_file_read(self, request: AsyncioHttpRequest) -> AsyncioHttpResponse:
+        logging.debug('Read remote file chunk request')
+        await self.heartbeat_session(request)
+        remote_id = self.get_remote_file_id(request)
+        chunk_num = self.get_chunk_num(request)
+
+        chunk = await self.call_controller(self.controller().read_from_file, remote_id, chunk_num)
+        return AsyncioHttpResponse(HTTPStatus.OK, body=chunk)
+
+    async def handle_remote_file_batch_write(self, request: AsyncioHttpRequest) -> AsyncioHttpResponse:
+        logging.debug('Append remote file chunks request')
+        await self.heartbeat_session(request)
+        remote_id = self.get_remote_file_id(request)
+        content_len = self.parse_content_length(request)
+
+        max_chunk_size = self.controller().store().file_chunk_size()
+        if content_len == 0:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'File chunks batch cannot be empty')
+        if content_len > MAX_BATCH_CHUNKS * (max_chunk_size + FRAME_HEADER_LEN):
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, FileError('File chunks batch too large', FileServerErrorCode.FILE_CHUNK_TOO_LARGE))
+
+        body = await self.read_body(request, content_len)
+        try:
+            frames = decode_frames(body, MAX_BATCH_CHUNKS)
+        except ValueError as e:
+            raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, str(e))
+
+        for frame in frames:
+            if frame.status != CHUNK_OK or len(frame.payload) == 0:
+                raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, 'File chunk cannot be empty')
+            if len(frame.payload) > max_chunk_size:
+                raise AsyncioHttpError(HTTPStatus.BAD_REQUEST, FileError('File chunk too large', FileServerErrorCode.FILE_CHUNK_TOO_LARGE))
+
+        errors = await self.call_controller(self.controller().append_chunks, remote_id, [(frame.chunk_num, frame.payload) for frame in frames])
+        return self.chunk_frames_response([
+            ChunkFrame(frame.chunk_num, CHUNK_OK, b'') if error is None else ChunkFrame(frame.chunk_num, CHUNK_ERROR, error.encode('utf-8'))
+            for frame, error in zip(frames, errors)
+        ])
+
+    async def handle_remote_file_batch_read(self, request: AsyncioHttpRequest) -> AsyncioHttpResponse:
+        logging.debug('Read remote file chunks request')
+        await self.heartbeat_session(request)
+        remote_id = self.get_remote_file_id(request)
+        chunk_num = self.get_chunk_num(request)
+        count = self.get_chunk_count(request)
+
+        chunks = await self.call_controller(self.controller().read_chunks, remote_id, chunk_num, count)
+        return self.chunk_frames_response([
+            ChunkFrame(num, CHUNK_OK, chunk) if error is None else ChunkFrame(num, CHUNK_ERROR, error.encode('utf-8'))
+            for num, chunk, error in chunks
+        ])
+
+    async def handle_remove_file(self, request: AsyncioHttpRequest) -> AsyncioHttpResponse:
+        logging.debug('Remove remote file request')
+        await self.heartbeat_session(request)
+        epoch_no = self.get_epoch_no_from_header(request)
+        remote_id = self.get_remote_file_id(request)
+
+        await self.call_controller(self.controller().remove_file, epoch_no, remote_id)
+        return AsyncioHttpResponse(HTTPStatus.OK)
+
+    async def handle_end_epoch(self, request: AsyncioHttpRequest) -> AsyncioHttpResponse:
+        logging.debug('End epoch request')
+        await self.heartbeat_session(request)
+        epoch_no = self.get_epoch_no_from_path(request)
+
+        marker_id = request.url_query.get('marker-id')
+        if marker_id is not None:
+            marker_id = marker_id[-1]
+
+        await self.call_controller(self.controller().end_epoch, epoch_no, marker_id)
+        return AsyncioHttpResponse(HTTPStatus.OK)
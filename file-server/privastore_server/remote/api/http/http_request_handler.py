@@ -1,20 +1,24 @@
+from ....chunk_batch import ChunkFrame, CHUNK_ERROR, CHUNK_OK, decode_frames, encode_frames, FRAME_HEADER_LEN, MAX_BATCH_CHUNKS
 from ...controller import RemoteServerController
 from ....error import EpochError, FileError, FileCacheError, FileServerErrorCode, RemoteFileError
 from ....file import File, FILE_ID_LENGTH
 from http import HTTPStatus
 from ....api.http.http_request_handler import BaseHttpApiRequestHandler
-from ....api.http.http_request_handler import CONNECTION_HEADER, CONNECTION_CLOSE, CONTENT_TYPE_HEADER, CONTENT_TYPE_JSON, CONTENT_LENGTH_HEADER
+from ....api.http.http_request_handler import CONTENT_TYPE_HEADER, CONTENT_TYPE_JSON, CONTENT_TYPE_OCTET_STREAM, CONTENT_LENGTH_HEADER
 import json
 import logging
 from ....util.file import read_all
 
 EPOCH_NO_HEADER = 'x-privastore-epoch-no'
 FILE_ID_HEADER = 'x-privastore-remote-file-id'
+# Optional hex SHA-256 of a chunk write's body.
+CHUNK_CHECKSUM_HEADER = 'x-privastore-chunk-sha256'
 
 EPOCH_PATH = '/1/epoch'
 EPOCH_PATH_LEN = len(EPOCH_PATH)
 REMOTE_FILE_PATH = '/1/file'
 REMOTE_FILE_PATH_LEN = len(REMOTE_FILE_PATH)
+CHUNKS_PATH_SUFFIX = '/chunks'
 COMMIT_PATH_SUFFIX = '/commit'
 METADATA_PATH_SUFFIX = '/metadata'
 
@@ -33,6 +37,8 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
         if self.url_path.startswith(REMOTE_FILE_PATH):
             if self.url_path.endswith(METADATA_PATH_SUFFIX):
                 self.handle_get_remote_file_metadata()
+            elif self.url_path.endswith(CHUNKS_PATH_SUFFIX):
+                self.handle_remote_file_batch_read()
             else:
                 self.handle_remote_file_read()
         else:
@@ -56,6 +62,8 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
         elif self.url_path.startswith(REMOTE_FILE_PATH):
             if self.url_path.endswith(COMMIT_PATH_SUFFIX):
                 self.handle_commit_remote_file()
+            elif self.url_path.endswith(CHUNKS_PATH_SUFFIX):
+                self.handle_remote_file_batch_write()
             else:
                 self.handle_remote_file_write()
         else:
@@ -88,6 +96,32 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
 
         return chunk_num
 
+    def get_chunk_count(self) -> int:
+        count = self.url_query.get('count')
+
+        if count is None:
+            return 1
+
+        try:
+            count = int(count[-1])
+        except:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid chunk count')
+            return
+        if count < 1 or count > MAX_BATCH_CHUNKS:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid chunk count. Must be between 1 and {}'.format(MAX_BATCH_CHUNKS))
+            return
+
+        return count
+
+    def send_chunk_frames(self, frames: list[ChunkFrame]) -> None:
+        body = encode_frames(frames)
+        self.send_response(HTTPStatus.OK)
+        self.send_header(CONTENT_TYPE_HEADER, CONTENT_TYPE_OCTET_STREAM)
+        self.send_header(CONTENT_LENGTH_HEADER, str(len(body)))
+        self.send_connection_header()
+        self.end_headers()
+        self.wfile.write(body)
+
     def get_epoch_no_from_path(self) -> int:
         try:
             prefix_len = EPOCH_PATH_LEN+1
@@ -144,10 +178,13 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
         '''
 
             Handle the create remote file API.
+            The client may choose the file id (ex. to use the same id on each
+            replica), otherwise one is generated.
             Method: POST
             Path: /1/file[?size=<file-size (in bytes)>]
             Request Headers:
                 x-privastore-session-id: <session-id>
+                x-privastore-remote-file-id: <file-id> (optional)
             
             Response Headers:
                 x-privastore-remote-file-id: <file-id>
@@ -164,7 +201,12 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
         if not self.heartbeat_session(session_id):
             return
 
-        remote_id = File.generate_file_id()
+        remote_id = self.headers.get(FILE_ID_HEADER)
+        if remote_id is None:
+            remote_id = File.generate_file_id()
+        elif not File.is_valid_file_id(remote_id):
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid remote file id!')
+            return
 
         file_size = self.url_query.get('size')
         if file_size is not None:
@@ -193,7 +235,7 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
         
         self.send_response(HTTPStatus.OK)
         self.send_header(CONTENT_LENGTH_HEADER, '0')
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
+        self.send_connection_header()
         self.send_header(FILE_ID_HEADER, remote_id)
         self.end_headers()
 
@@ -241,7 +283,7 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
         
         self.send_response(HTTPStatus.OK)
         self.send_header(CONTENT_LENGTH_HEADER, '0')
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
+        self.send_connection_header()
         self.end_headers()
 
     def handle_get_remote_file_metadata(self):
@@ -292,7 +334,7 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
         self.send_response(HTTPStatus.OK)
         self.send_header(CONTENT_TYPE_HEADER, CONTENT_TYPE_JSON)
         self.send_header(CONTENT_LENGTH_HEADER, str(len(file_metadata)))
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
+        self.send_connection_header()
         self.end_headers()
         self.wfile.write(file_metadata)
 
@@ -306,6 +348,9 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             Path: /1/file/<file-id>?chunk=<chunk-number>
             Request Headers:
                 x-privastore-session-id: <session-id>
+                x-privastore-chunk-sha256: <chunk-checksum> (optional)
+
+            The chunk is streamed to the store as it's read.
 
         '''
         logging.debug('Append remote file chunk request')
@@ -337,13 +382,17 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             self.send_error_response(HTTPStatus.BAD_REQUEST, FileError('File chunk too large', FileServerErrorCode.FILE_CHUNK_TOO_LARGE))
             return
         
-        chunk = read_all(self.rfile, self.content_len)
-        if len(chunk) < self.content_len:
-            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Not all chunk bytes could be read!')
-            return
-        
+        checksum = None
+        checksum_hex = self.headers.get(CHUNK_CHECKSUM_HEADER)
+        if checksum_hex is not None:
+            try:
+                checksum = bytes.fromhex(checksum_hex)
+            except ValueError:
+                self.send_error_response(HTTPStatus.BAD_REQUEST, 'Invalid {} header'.format(CHUNK_CHECKSUM_HEADER))
+                return
+
         try:
-            self.controller().append_to_file(remote_id, chunk_num, chunk)
+            self.controller().append_stream_to_file(remote_id, chunk_num, self.rfile, self.content_len, checksum)
         except EpochError as e:
             self.handle_epoch_error(e)
             return
@@ -356,7 +405,7 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
         
         self.send_response(HTTPStatus.OK)
         self.send_header(CONTENT_LENGTH_HEADER, '0')
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
+        self.send_connection_header()
         self.end_headers()
 
     def handle_remote_file_read(self):
@@ -393,6 +442,10 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             return
         
         try:
+            if self.sendfile_enabled():
+                # The chunk goes from disk to the socket after the headers.
+                self.controller().send_from_file(remote_id, chunk_num, self.connection, self.send_chunk_headers)
+                return
             chunk = self.controller().read_from_file(remote_id, chunk_num)
         except EpochError as e:
             self.handle_epoch_error(e)
@@ -404,11 +457,147 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
             self.handle_internal_error(e)
             return
         
+        self.send_chunk_headers(len(chunk))
+        self.wfile.write(chunk)
+
+    def send_chunk_headers(self, chunk_len: int) -> None:
         self.send_response(HTTPStatus.OK)
-        self.send_header(CONTENT_LENGTH_HEADER, len(chunk))
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
+        self.send_header(CONTENT_LENGTH_HEADER, chunk_len)
+        self.send_connection_header()
         self.end_headers()
-        self.wfile.write(chunk)
+
+    def handle_remote_file_batch_write(self):
+        '''
+
+            Handle the remote file batch write API.
+            Append several chunks to the file in one request. Chunks are
+            appended in order and must follow on from the file's last chunk.
+            Chunks after one that fails are not appended.
+            Method: PUT
+            Path: /1/file/<file-id>/chunks
+            Request Headers:
+                x-privastore-session-id: <session-id>
+
+            Request Body:
+                <chunk frames> (see chunk_batch)
+
+            Response Body:
+                <chunk frame with empty payload or error code per chunk>
+
+        '''
+        logging.debug('Append remote file chunks request')
+        self.wrap_sockets()
+
+        session_id = self.get_session_id()
+        if session_id is None:
+            return
+        
+        if not self.heartbeat_session(session_id):
+            return
+
+        remote_id = self.get_remote_file_id()
+        if remote_id is None:
+            return
+
+        if not self.parse_content_length():
+            return
+
+        max_chunk_size = self.controller().store().file_chunk_size()
+        if self.content_len == 0:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'File chunks batch cannot be empty')
+            return
+        if self.content_len > MAX_BATCH_CHUNKS * (max_chunk_size + FRAME_HEADER_LEN):
+            self.send_error_response(HTTPStatus.BAD_REQUEST, FileError('File chunks batch too large', FileServerErrorCode.FILE_CHUNK_TOO_LARGE))
+            return
+
+        body = read_all(self.rfile, self.content_len)
+        if len(body) < self.content_len:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, 'Not all chunk bytes could be read!')
+            return
+
+        try:
+            frames = decode_frames(body, MAX_BATCH_CHUNKS)
+        except ValueError as e:
+            self.send_error_response(HTTPStatus.BAD_REQUEST, str(e))
+            return
+
+        for frame in frames:
+            if frame.status != CHUNK_OK or len(frame.payload) == 0:
+                self.send_error_response(HTTPStatus.BAD_REQUEST, 'File chunk cannot be empty')
+                return
+            if len(frame.payload) > max_chunk_size:
+                self.send_error_response(HTTPStatus.BAD_REQUEST, FileError('File chunk too large', FileServerErrorCode.FILE_CHUNK_TOO_LARGE))
+                return
+
+        try:
+            errors = self.controller().append_chunks(remote_id, [(frame.chunk_num, frame.payload) for frame in frames])
+        except EpochError as e:
+            self.handle_epoch_error(e)
+            return
+        except (FileError, FileCacheError, RemoteFileError) as e:
+            self.handle_file_error(e)
+            return
+        except Exception as e:
+            self.handle_internal_error(e)
+            return
+
+        self.send_chunk_frames([
+            ChunkFrame(frame.chunk_num, CHUNK_OK, b'') if error is None else ChunkFrame(frame.chunk_num, CHUNK_ERROR, error.encode('utf-8'))
+            for frame, error in zip(frames, errors)
+        ])
+
+    def handle_remote_file_batch_read(self):
+        '''
+            Handle the remote file batch read API.
+            Read several consecutive chunks from a (committed) remote file.
+            Method: GET
+            Path: /1/file/<file-id>/chunks?chunk=<first-chunk-number>[&count=<number of chunks>]
+            Request Headers:
+                x-privastore-session-id: <session-id>
+
+            Response Body:
+                <chunk frame with chunk bytes or error code per chunk>
+
+        '''
+        logging.debug('Read remote file chunks request')
+        self.wrap_sockets()
+        self.read_body()
+
+        session_id = self.get_session_id()
+        if session_id is None:
+            return
+        
+        if not self.heartbeat_session(session_id):
+            return
+        
+        remote_id = self.get_remote_file_id()
+        if remote_id is None:
+            return
+        
+        chunk_num = self.get_chunk_num()
+        if chunk_num is None:
+            return
+
+        count = self.get_chunk_count()
+        if count is None:
+            return
+        
+        try:
+            chunks = self.controller().read_chunks(remote_id, chunk_num, count)
+        except EpochError as e:
+            self.handle_epoch_error(e)
+            return
+        except (FileError, FileCacheError, RemoteFileError) as e:
+            self.handle_file_error(e)
+            return
+        except Exception as e:
+            self.handle_internal_error(e)
+            return
+
+        self.send_chunk_frames([
+            ChunkFrame(num, CHUNK_OK, chunk) if error is None else ChunkFrame(num, CHUNK_ERROR, error.encode('utf-8'))
+            for num, chunk, error in chunks
+        ])
 
     def handle_remove_file(self):
         '''
@@ -453,7 +642,7 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
         
         self.send_response(HTTPStatus.OK)
         self.send_header(CONTENT_LENGTH_HEADER, '0')
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
+        self.send_connection_header()
         self.end_headers()
 
     def handle_end_epoch(self):
@@ -501,5 +690,5 @@ class HttpApiRequestHandler(BaseHttpApiRequestHandler):
         
         self.send_response(HTTPStatus.OK)
         self.send_header(CONTENT_LENGTH_HEADER, '0')
-        self.send_header(CONNECTION_HEADER, CONNECTION_CLOSE)
+        self.send_connection_header()
         self.end_headers()
\ No newline at end of file
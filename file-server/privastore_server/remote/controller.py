@@ -1,12 +1,13 @@
 from ..controller import Controller
 from .db.dao_factory import DAOFactory
 from ..db.db_conn_mgr import DbConnectionManager
-from ..error import FileServerErrorCode, RemoteFileError
+from ..error import FileServerError, FileServerErrorCode, RemoteFileError
 from ..file_cache import FileCache
 import logging
 from ..session_mgr import SessionManager
 from ..util.file import str_mem_size
-from typing import Optional
+import socket
+from typing import Any, BinaryIO, Callable, Optional
 
 class RemoteServerController(Controller):
 
@@ -30,6 +31,17 @@ class RemoteServerController(Controller):
     
     def append_to_file(self, remote_id: str, chunk_num: int, chunk: bytes) -> None:
         logging.debug('Append to remote file [{}] chunk-size [{}]'.format(remote_id, str_mem_size(len(chunk))))
+        self.append_chunk(remote_id, chunk_num, lambda file: file.append_chunk(chunk))
+
+    def append_stream_to_file(self, remote_id: str, chunk_num: int, in_file: BinaryIO, chunk_len: int, checksum: Optional[bytes] = None) -> bytes:
+        '''
+            Append a chunk of chunk_len bytes streamed from in_file (see
+            File.append_chunk_stream). Returns the chunk's SHA-256.
+        '''
+        logging.debug('Append stream to remote file [{}] chunk-size [{}]'.format(remote_id, str_mem_size(chunk_len)))
+        return self.append_chunk(remote_id, chunk_num, lambda file: file.append_chunk_stream(in_file, chunk_len, checksum))
+
+    def append_chunk(self, remote_id: str, chunk_num: int, append: Callable[[FileCache.CacheFileWriter], Any]) -> Any:
         conn = self.db_conn_mgr().db_connect()
         try:
             file_metadata = self.dao_factory().file_dao(conn).get_file_metadata(remote_id)
@@ -46,7 +58,7 @@ class RemoteServerController(Controller):
             if chunk_num != next_chunk_num:
                 raise RemoteFileError('Cannot write file [{}] chunk [{}]. Next chunk is [{}]'.format(remote_id, chunk_num, next_chunk_num), FileServerErrorCode.INVALID_CHUNK_NUM)
 
-            file.append_chunk(chunk)
+            res = append(file)
             logging.debug('Appended chunk')
 
             conn = self.db_conn_mgr().db_connect()
@@ -59,6 +71,7 @@ class RemoteServerController(Controller):
             self.store().close_file(file, writable=True)
 
         logging.debug('Appended to remote file [{}]'.format(remote_id))
+        return res
 
     def read_from_file(self, remote_id: str, chunk_num: int) -> bytes:
         logging.debug('Read chunk [{}] from remote file [{}]'.format(chunk_num, remote_id))
@@ -86,6 +99,133 @@ class RemoteServerController(Controller):
         finally:
             self.store().close_file(file)
         
+    def send_from_file(self, remote_id: str, chunk_num: int, sock: socket.socket, api_callback: Callable[[int], None]) -> int:
+        '''
+            Send a chunk of a (committed) remote file to sock straight from
+            disk (see File.send_chunk), falling back to reading it if it is
+            encoded. api_callback(chunk_len) is called first so the API can
+            send its headers. Returns the bytes sent.
+        '''
+        logging.debug('Send chunk [{}] from remote file [{}]'.format(chunk_num, remote_id))
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            file_metadata = self.dao_factory().file_dao(conn).get_file_metadata(remote_id)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+        if not file_metadata.is_committed:
+            raise RemoteFileError('Cannot read from uncommitted remote file [{}]'.format(remote_id), FileServerErrorCode.FILE_IS_UNCOMMITTED)
+
+        file = self.store().read_file(remote_id)
+
+        try:
+            # Seek just before the chunk to send.
+            file.seek_chunk(chunk_num-1)
+            if file.can_sendfile():
+                chunk_len = file.next_chunk_length()
+                if chunk_len == 0:
+                    raise RemoteFileError('Chunk [{}] not found'.format(chunk_num), FileServerErrorCode.INVALID_CHUNK_NUM)
+                api_callback(chunk_len)
+                sent = file.send_chunk(sock)
+            else:
+                chunk = file.read_chunk()
+                if len(chunk) == 0:
+                    raise RemoteFileError('Chunk [{}] not found'.format(chunk_num), FileServerErrorCode.INVALID_CHUNK_NUM)
+                api_callback(len(chunk))
+                sock.sendall(chunk)
+                sent = len(chunk)
+
+            logging.debug('Sent chunk size [{}]'.format(sent))
+            return sent
+        finally:
+            self.store().close_file(file)
+
+    def append_chunks(self, remote_id: str, chunks: list[tuple[int, bytes]]) -> list[Optional[str]]:
+        '''
+            Append a batch of (chunk number, chunk) to the file. Returns an
+            error code per chunk (None if the chunk was appended). Chunks after
+            a failed one are not appended.
+        '''
+        logging.debug('Append [{}] chunks to remote file [{}]'.format(len(chunks), remote_id))
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            file_metadata = self.dao_factory().file_dao(conn).get_file_metadata(remote_id)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+        if file_metadata.is_committed:
+            raise RemoteFileError('Cannot append chunk to committed remote file [{}]'.format(remote_id), FileServerErrorCode.FILE_IS_COMMITTED)
+
+        file = self.store().append_file(remote_id)
+        errors: list[Optional[str]] = []
+
+        try:
+            for chunk_num, chunk in chunks:
+                if len(errors) > 0 and errors[-1] is not None:
+                    errors.append(errors[-1])
+                    continue
+
+                next_chunk_num = file.total_chunks()+1
+                if chunk_num != next_chunk_num:
+                    logging.error('Cannot write file [{}] chunk [{}]. Next chunk is [{}]'.format(remote_id, chunk_num, next_chunk_num))
+                    errors.append(FileServerErrorCode.INVALID_CHUNK_NUM)
+                    continue
+
+                try:
+                    file.append_chunk(chunk)
+                    errors.append(None)
+                except FileServerError as e:
+                    logging.error('Cannot write file [{}] chunk [{}]: {}'.format(remote_id, chunk_num, str(e)))
+                    errors.append(e.error_code())
+            logging.debug('Appended chunks')
+
+            if len(errors) > 0 and errors[0] is None:
+                conn = self.db_conn_mgr().db_connect()
+                try:
+                    self.dao_factory().file_dao(conn).file_modified(remote_id)
+                    logging.debug('Updated file modified timestamp')
+                finally:
+                    self.db_conn_mgr().db_close(conn)
+        finally:
+            self.store().close_file(file, writable=True)
+
+        logging.debug('Appended to remote file [{}]'.format(remote_id))
+        return errors
+
+    def read_chunks(self, remote_id: str, chunk_num: int, num_chunks: int) -> list[tuple[int, Optional[bytes], Optional[str]]]:
+        '''
+            Read a batch of chunks starting from chunk_num. Returns (chunk
+            number, chunk, error code) for each chunk, chunks past the end of
+            the file have error INVALID_CHUNK_NUM.
+        '''
+        logging.debug('Read [{}] chunks from chunk [{}] of remote file [{}]'.format(num_chunks, chunk_num, remote_id))
+        conn = self.db_conn_mgr().db_connect()
+        try:
+            file_metadata = self.dao_factory().file_dao(conn).get_file_metadata(remote_id)
+        finally:
+            self.db_conn_mgr().db_close(conn)
+
+        if not file_metadata.is_committed:
+            raise RemoteFileError('Cannot read from uncommitted remote file [{}]'.format(remote_id), FileServerErrorCode.FILE_IS_UNCOMMITTED)
+
+        file = self.store().read_file(remote_id)
+        chunks: list[tuple[int, Optional[bytes], Optional[str]]] = []
+
+        try:
+            # Seek just before the first chunk to read.
+            file.seek_chunk(chunk_num-1)
+            end_chunk_num = chunk_num+num_chunks
+            for i in range(chunk_num, end_chunk_num):
+                chunk = file.read_chunk()
+                if len(chunk) == 0:
+                    chunks.extend([(j, None, FileServerErrorCode.INVALID_CHUNK_NUM) for j in range(i, end_chunk_num)])
+                    break
+                chunks.append((i, chunk, None))
+            logging.debug('Read chunks')
+            return chunks
+        finally:
+            self.store().close_file(file)
+
     def commit_file(self, epoch_no: int, remote_id: str) -> None:
         logging.debug('Commit remote file [{}] epoch [{}]'.format(remote_id, epoch_no))
         conn = self.db_conn_mgr().db_connect()
@@ -23,9 +23,16 @@ class SqliteFileDAO(FileDAO):
                     '''
                     INSERT INTO ps_remote_file (remote_id, created_timestamp, modified_timestamp) 
                     VALUES (?, ?, ?)
+                    ON CONFLICT (remote_id) DO NOTHING
                     '''
                 , (remote_id, file_timestamp, file_timestamp))
+                if cur.rowcount != 1:
+                    raise RemoteFileError('Remote file [{}] exists!'.format(remote_id), FileServerErrorCode.FILE_EXISTS)
                 self._conn.commit()
+            except RemoteFileError as e:
+                logging.error('Remote file error: {}'.format(str(e)))
+                self.rollback_nothrow()
+                raise e
             except Exception as e:
                 logging.error('Query error {}'.format(str(e)))
                 self.rollback_nothrow()
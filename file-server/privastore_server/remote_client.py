@@ -1,15 +1,50 @@
-from .api.http.http_request_handler import SESSION_ID_HEADER
+from .api.http.http_request_handler import BINARY_PORT_HEADER, HEALTH_PATH, SESSION_ID_HEADER
+from .bandwidth_limiter import BandwidthLimiter
+from .binary_client import BinaryConnection
+from .binary_protocol import APPEND_CHUNK, COMMIT_FILE, CREATE_FILE, END_EPOCH, FILE_METADATA, LOGIN, READ_CHUNK, REMOVE_FILE
+from .binary_protocol import encode_file_id, encode_file_request, FILE_SIZE, STATUS_OK, UINT32
+from .chunk_batch import ChunkFrame, CHUNK_OK, decode_frames, encode_frames, frame_error_code
 from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, wait
+from .endpoint_selector import EndpointSelector
 from .error import FileServerErrorCode, RemoteClientError
+import hashlib
 from http import HTTPStatus
+import json
 import logging
-import random
-from .remote.api.http.http_request_handler import EPOCH_NO_HEADER, FILE_ID_HEADER
+from .pool import Pool
+from .remote_session import RemoteSession
+from .remote.api.http.http_request_handler import CHUNK_CHECKSUM_HEADER, EPOCH_NO_HEADER, FILE_ID_HEADER
 import requests
+from .retry_policy import is_retryable_status, RetryPolicy
+from requests.adapters import HTTPAdapter
+from threading import Event, Lock
 import time
-from typing import Optional, Union
-
-RemoteFileMetadata = namedtuple('RemoteFileMetadata', ['file_size', 'file_store_usage', 'file_chunks', 'created_epoch', 'removed_epoch'])
+from typing import Any, Callable, Optional, Union
+
+# Transports for file and chunk requests. The binary transport falls back to
+# HTTP if the remote servers don't advertise a binary API port.
+TRANSPORT_HTTP = 'http'
+TRANSPORT_BINARY = 'binary'
+
+def chunk_frames_data(frames: list[ChunkFrame], chunk_offset: int, num_chunks: int) -> tuple[list[bytes], Optional[str]]:
+    '''
+        Payloads of a batch response's frames up to the first failed chunk and
+        the error code of that chunk (None if all num_chunks succeeded).
+    '''
+    chunks: list[bytes] = []
+    for i, frame in enumerate(frames):
+        if frame.chunk_num != chunk_offset+i:
+            return chunks, FileServerErrorCode.REMOTE_ERROR
+        error_code = frame_error_code(frame)
+        if error_code is not None:
+            return chunks, error_code
+        chunks.append(frame.payload)
+    if len(chunks) < num_chunks:
+        return chunks, FileServerErrorCode.REMOTE_ERROR
+    return chunks, None
+
+RemoteFileMetadata = namedtuple('RemoteFileMetadata', ['file_size', 'file_store_usage', 'file_chunks', 'is_committed', 'created_epoch', 'removed_epoch'])
 
 class RemoteEndpoint(object):
 
@@ -17,6 +52,15 @@ class RemoteEndpoint(object):
         self._host = host
         self._port = port
         self._ssl = ssl
+
+    def host(self):
+        return self._host
+
+    def port(self):
+        return self._port
+
+    def ssl(self):
+        return self._ssl
     
     def http_url(self):
         protocol = 'https' if self._ssl else 'http'
@@ -46,31 +90,146 @@ class RemoteCredentials(object):
 
 class RemoteClient(object):
 
-    def __init__(self, host: str=None, port: int=None, ssl: bool = False, remote_creds: RemoteCredentials = None, retry_interval: int = 1):
+    def __init__(self, host: str=None, port: int=None, ssl: bool = False, remote_creds: RemoteCredentials = None, retry_interval: int = 1, pool_size: int = 1, transport: str = TRANSPORT_HTTP):
+        if transport != TRANSPORT_HTTP and transport != TRANSPORT_BINARY:
+            raise RemoteClientError('Invalid remote transport [{}]'.format(transport))
         self._remote_creds = remote_creds
-        self._retry_interval = retry_interval
-        self._endpoints: list[RemoteEndpoint] = []
+        self._retry_policy = RetryPolicy(base_interval=retry_interval)
+        self._pool_size = pool_size
+        # Pools of persistent HTTP sessions by endpoint URL.
+        self._http_session_pools: dict[str, Pool] = dict()
+        self._http_session_pools_lock = Lock()
+        self._endpoint_selector = EndpointSelector()
         if host is not None and port is not None:
             self.add_remote_endpoint(RemoteEndpoint(host, port, ssl))
-        self._session_id: str = None
+        # The cluster session and the sessions of requests pinned to an
+        # endpoint (see replication), may be shared with other clients.
+        self._session = RemoteSession()
+        self._bandwidth_limiter: Optional[BandwidthLimiter] = None
+        # Runs hedged reads, created on first use.
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        self._transport = transport
+        # Binary connections and advertised binary API ports by endpoint.
+        self._binary_connections: dict[str, BinaryConnection] = dict()
+        self._binary_ports: dict[str, Optional[int]] = dict()
+        self._binary_lock = Lock()
+        # Set once the endpoints are checked for binary API support.
+        self._binary_supported: Optional[bool] = None
+
+    def transport(self) -> str:
+        return self._transport
     
+    def set_session(self, session: RemoteSession) -> None:
+        self._session = session
+
+    def session(self) -> RemoteSession:
+        return self._session
+
+    def set_bandwidth_limiter(self, bandwidth_limiter: Optional[BandwidthLimiter]) -> None:
+        self._bandwidth_limiter = bandwidth_limiter
+
+    def bandwidth_limiter(self) -> Optional[BandwidthLimiter]:
+        return self._bandwidth_limiter
+
     def set_retry_interval(self, retry_interval: int) -> None:
-        self._retry_interval = retry_interval
+        self._retry_policy.set_base_interval(retry_interval)
 
     def retry_interval(self) -> int:
-        return self._retry_interval
+        return self._retry_policy.base_interval()
+
+    def set_retry_policy(self, retry_policy: RetryPolicy) -> None:
+        '''
+            Share the retry policy (and retry budget) with other clients.
+        '''
+        self._retry_policy = retry_policy
+
+    def retry_policy(self) -> RetryPolicy:
+        return self._retry_policy
+
+    def set_endpoint_selector(self, endpoint_selector: EndpointSelector) -> None:
+        '''
+            Share endpoint selection (and health) with other clients. Endpoints
+            already added are added to the new selector.
+        '''
+        for endpoint in self._endpoint_selector.endpoints():
+            endpoint_selector.add_endpoint(endpoint)
+        self._endpoint_selector = endpoint_selector
+
+    def endpoint_selector(self) -> EndpointSelector:
+        return self._endpoint_selector
 
     def add_remote_endpoint(self, endpoint: RemoteEndpoint) -> None:
-        self._endpoints.append(endpoint)
+        self._endpoint_selector.add_endpoint(endpoint)
+        self._binary_supported = None
     
-    def get_remote_endpoint(self) -> RemoteEndpoint:
-        if len(self._endpoints) == 0:
+    def get_remote_endpoint(self, exclude: Optional[list[RemoteEndpoint]]=None) -> RemoteEndpoint:
+        if len(self._endpoint_selector.endpoints()) == 0:
             raise RemoteClientError('No remote server endpoints!')
 
-        endpoint = random.choice(self._endpoints)
+        endpoint = self._endpoint_selector.select(exclude=exclude)
+        if endpoint is None:
+            raise RemoteClientError('All remote server endpoints are unavailable', FileServerErrorCode.REMOTE_UNAVAILABLE)
+
         logging.debug('Using remote endpoint [{}]'.format(str(endpoint)))
         return endpoint
 
+    def create_http_session(self) -> requests.Session:
+        '''
+            Create an HTTP session holding a single keep-alive connection.
+            Retries are handled by send_remote_request.
+        '''
+        http_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0)
+        http_session.mount('http://', adapter)
+        http_session.mount('https://', adapter)
+        return http_session
+
+    def http_session_pool(self, endpoint: RemoteEndpoint) -> Pool:
+        url = endpoint.http_url()
+        with self._http_session_pools_lock:
+            pool = self._http_session_pools.get(url)
+            if pool is None:
+                pool = self._http_session_pools[url] = Pool(self.create_http_session, self._pool_size)
+            return pool
+
+    def hedge_executor(self) -> ThreadPoolExecutor:
+        with self._http_session_pools_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='hedged-read')
+            return self._hedge_executor
+
+    def replica_exclude(self, replicas: Optional[list[RemoteEndpoint]]) -> Optional[list[RemoteEndpoint]]:
+        '''
+            Endpoints to exclude so requests only go to the given replicas.
+        '''
+        if replicas is None:
+            return None
+        replica_names = set([str(replica) for replica in replicas])
+        return [endpoint for endpoint in self._endpoint_selector.endpoints() if str(endpoint) not in replica_names]
+
+    def close(self) -> None:
+        '''
+            Close the pooled HTTP connections and the binary connections.
+        '''
+        with self._binary_lock:
+            binary_connections = list(self._binary_connections.values())
+            self._binary_connections = dict()
+        for conn in binary_connections:
+            conn.close()
+        with self._http_session_pools_lock:
+            hedge_executor = self._hedge_executor
+            self._hedge_executor = None
+        if hedge_executor is not None:
+            hedge_executor.shutdown(wait=False)
+        with self._http_session_pools_lock:
+            pools = list(self._http_session_pools.values())
+            self._http_session_pools = dict()
+        for pool in pools:
+            http_session = pool.try_acquire()
+            while http_session is not None:
+                http_session.close()
+                http_session = pool.try_acquire()
+
     def set_remote_credentials(self, creds: RemoteCredentials) -> None:
         self._remote_creds = creds
 
@@ -91,15 +250,34 @@ class RemoteClient(object):
     def file_path(self, file_id: str):
         return f'/1/file/{file_id}'
 
+    def file_metadata_path(self, file_id: str):
+        return f'/1/file/{file_id}/metadata'
+
     def file_chunk_path(self, file_id: str, chunk_offset: int):
         return f'/1/file/{file_id}?chunk={chunk_offset}'
 
+    def file_chunks_path(self, file_id: str, chunk_offset: Optional[int] = None, count: Optional[int] = None):
+        if chunk_offset is not None and count is not None:
+            return f'/1/file/{file_id}/chunks?chunk={chunk_offset}&count={count}'
+        return f'/1/file/{file_id}/chunks'
+
     def commit_path(self, file_id: str):
         return f'/1/file/{file_id}/commit'
 
-    def session_expired(self):
-        logging.warn('Session [{}] expired'.format(self._session_id))
-        self._session_id = None
+    def epoch_path(self, epoch_no: int, marker_id: Optional[str] = None):
+        if marker_id is not None:
+            return f'/1/epoch/{epoch_no}?marker-id={marker_id}'
+        return f'/1/epoch/{epoch_no}'
+
+    def session_key(self, endpoint: Optional[RemoteEndpoint]=None) -> Optional[str]:
+        return str(endpoint) if endpoint is not None else None
+
+    def session_expired(self, endpoint: Optional[RemoteEndpoint]=None, session_id: Optional[str]=None) -> None:
+        '''
+            Drop the (cluster or endpoint) session, if session_id is given
+            only if it is still the current session.
+        '''
+        self._session.expired(session_id, self.session_key(endpoint))
 
     def get_error_code(self, response: requests.Response) -> str:
         if response is not None:
@@ -112,141 +290,686 @@ class RemoteClient(object):
 
         return FileServerErrorCode.REMOTE_ERROR
 
-    def send_remote_request(self, path: str, method=requests.get, headers=dict(), auth=None, data=None, renew_session: bool=False, timeout: float=90) -> Union[requests.Response, str]:
+    def wait_retry(self, attempt: int, end_t: float) -> bool:
+        '''
+            Back off before retrying a failed request. Returns False if the
+            retry budget is spent or the request would time out while backing
+            off.
+        '''
+        if not self._retry_policy.can_retry():
+            logging.warning('Retry budget exhausted')
+            return False
+        delay = self._retry_policy.backoff(attempt)
+        if time.time() + delay >= end_t:
+            return False
+        logging.debug('Retrying request in [{:.3f}s] ...'.format(delay))
+        time.sleep(delay)
+        return True
+
+    def send_remote_request(self, path: str, method: str='GET', headers=dict(), auth=None, data=None, renew_session: bool=False, timeout: float=90, endpoint: Optional[RemoteEndpoint]=None, cancelled: Optional[Event]=None, pin_endpoint: bool=False, exclude: Optional[list[RemoteEndpoint]]=None, retry: bool=True) -> Union[requests.Response, str]:
+        '''
+            Send a request to a remote endpoint. Connection errors, timeouts
+            and overload responses (see RETRYABLE_STATUSES) are retried with
+            backoff, as long as the retry budget allows. Other errors are
+            returned right away.
+
+            If endpoint is given the first attempt is sent to it, retries may
+            go to any endpoint (except those in exclude) unless pin_endpoint
+            is set. Requests pinned to an endpoint or restricted by exclude
+            use a session on that endpoint. Setting cancelled stops further
+            attempts.
+
+            If retry is not set failed attempts aren't retried.
+
+            Returns the response if successful, otherwise the error code.
+        '''
         start_t = time.time()
         end_t = start_t + timeout
+        attempt = 0
+        self._retry_policy.on_request()
+        # Requests may run in parallel, don't share the caller's headers.
+        headers = dict(headers)
 
         while True:
             now = time.time()
             if timeout <= 0 or now >= end_t:
                 return FileServerErrorCode.IO_TIMEOUT
+            if cancelled is not None and cancelled.is_set():
+                return FileServerErrorCode.REMOTE_DOWNLOAD_CANCELLED
             
+            try:
+                if endpoint is None or (attempt > 0 and not pin_endpoint):
+                    endpoint = self.get_remote_endpoint(exclude)
+                elif attempt > 0 and not self._endpoint_selector.health(endpoint).is_closed():
+                    raise RemoteClientError('Remote endpoint [{}] is unavailable'.format(str(endpoint)), FileServerErrorCode.REMOTE_UNAVAILABLE)
+            except RemoteClientError as e:
+                if e.error_code() == FileServerErrorCode.REMOTE_UNAVAILABLE:
+                    # Fail fast while every endpoint's circuit is open.
+                    logging.error(str(e))
+                    return e.error_code()
+                raise e
+
+            # Replicas may be on servers that don't share sessions.
+            session_endpoint = endpoint if pin_endpoint or exclude is not None else None
             if renew_session:
-                headers[SESSION_ID_HEADER] = self.get_session_id(timeout=(end_t - now))
-            
-            endpoint = self.get_remote_endpoint()
+                try:
+                    # Try another endpoint rather than wait for this one.
+                    failover = session_endpoint is not None and not pin_endpoint
+                    headers[SESSION_ID_HEADER] = self.get_session_id(timeout=(end_t - now), endpoint=session_endpoint, retry=retry and not failover)
+                except RemoteClientError as e:
+                    if failover and retry and self.wait_retry(attempt, end_t):
+                        attempt += 1
+                        continue
+                    raise e
+
             url = endpoint.http_url() + path
 
+            pool = self.http_session_pool(endpoint)
+            http_session = pool.acquire(timeout=(end_t-now))
+            if http_session is None:
+                return FileServerErrorCode.IO_TIMEOUT
+            request_t = self._endpoint_selector.begin_request(endpoint)
+            r = None
+            retryable = True
             try:
-                r = method(url, auth=auth, data=data, headers=headers, timeout=(end_t-now))
+                r = http_session.request(method, url, auth=auth, data=data, headers=headers, timeout=(end_t-now))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logging.error('Request error: {}'.format(str(e)))
             except Exception as e:
                 logging.error('Request error: {}'.format(str(e)))
-                time.sleep(self.retry_interval())
-                logging.debug('Retrying request ...')
-                continue
+                retryable = False
+            finally:
+                pool.release(http_session)
+                self._endpoint_selector.end_request(endpoint, request_t, r is not None and r.status_code < HTTPStatus.INTERNAL_SERVER_ERROR)
+
+            if r is None:
+                if retryable and retry and self.wait_retry(attempt, end_t):
+                    attempt += 1
+                    continue
+                return FileServerErrorCode.REMOTE_UNAVAILABLE if retryable else FileServerErrorCode.REMOTE_ERROR
 
             logging.debug('Request returned status {}'.format(str(r.status_code)))
 
             if r.status_code == HTTPStatus.OK:
+                if renew_session:
+                    # The remote server renewed the session.
+                    self._session.touch(headers[SESSION_ID_HEADER], self.session_key(session_endpoint))
                 return r
             elif r.status_code == HTTPStatus.UNAUTHORIZED:
                 if renew_session:
-                    self.session_expired()
+                    self.session_expired(session_endpoint, headers[SESSION_ID_HEADER])
+                    continue
+            elif is_retryable_status(r.status_code):
+                if retry and self.wait_retry(attempt, end_t):
+                    attempt += 1
                     continue
 
             error_code = self.get_error_code(r)
             logging.debug('Request returned error code {}'.format(error_code))
             return error_code
-    
-    def heartbeat_session(self, timeout: float=90) -> None:
-        if self._session_id is None:
-            raise RemoteClientError('No session id!')
+
+    def binary_port(self, endpoint: RemoteEndpoint, timeout: float=10) -> Optional[int]:
+        '''
+            Binary API port advertised by the endpoint's health check, None if
+            the endpoint has no binary API. Raises an error if the endpoint
+            can't be reached.
+        '''
+        key = str(endpoint)
+        with self._binary_lock:
+            if key in self._binary_ports:
+                return self._binary_ports[key]
+
+        pool = self.http_session_pool(endpoint)
+        http_session = pool.acquire(timeout=timeout)
+        if http_session is None:
+            raise RemoteClientError('Timed out checking remote endpoint [{}]'.format(key), FileServerErrorCode.IO_TIMEOUT)
+        try:
+            r = http_session.get(endpoint.http_url() + HEALTH_PATH, timeout=timeout)
+        finally:
+            pool.release(http_session)
+        if r.status_code != HTTPStatus.OK:
+            raise RemoteClientError('Remote endpoint [{}] health check status {}'.format(key, r.status_code), FileServerErrorCode.REMOTE_ERROR)
+
+        port = r.headers.get(BINARY_PORT_HEADER)
+        port = int(port) if port is not None else None
+        with self._binary_lock:
+            self._binary_ports[key] = port
+        return port
+
+    def use_binary_transport(self, timeout: float=10) -> bool:
+        '''
+            Whether to send requests over the binary transport. On first use
+            the endpoints are checked and if any doesn't advertise a binary
+            API the client falls back to HTTP. Endpoints that can't be reached
+            are checked again when connecting to them.
+        '''
+        if self._transport != TRANSPORT_BINARY:
+            return False
+        if self._binary_supported is not None:
+            return self._binary_supported
+
+        binary_supported = True
+        for endpoint in self._endpoint_selector.endpoints():
+            try:
+                if self.binary_port(endpoint, timeout=timeout) is None:
+                    logging.warning('Remote endpoint [{}] has no binary API, using HTTP transport'.format(str(endpoint)))
+                    binary_supported = False
+                    break
+            except Exception as e:
+                logging.debug('Could not check remote endpoint [{}] binary API: {}'.format(str(endpoint), str(e)))
+        self._binary_supported = binary_supported
+        return binary_supported
+
+    def binary_connection(self, endpoint: RemoteEndpoint, timeout: float=90) -> BinaryConnection:
+        key = str(endpoint)
+        with self._binary_lock:
+            conn = self._binary_connections.get(key)
+        if conn is not None and not conn.is_closed():
+            return conn
+
+        port = self.binary_port(endpoint, timeout=timeout)
+        if port is None:
+            raise RemoteClientError('Remote endpoint [{}] has no binary API'.format(key), FileServerErrorCode.REMOTE_ERROR)
+        conn = BinaryConnection(endpoint.host(), port, connect_timeout=timeout)
+
+        with self._binary_lock:
+            existing_conn = self._binary_connections.get(key)
+            if existing_conn is not None and not existing_conn.is_closed():
+                conn.close()
+                return existing_conn
+            self._binary_connections[key] = conn
+        return conn
+
+    def binary_login(self, conn: BinaryConnection, timeout: float=90) -> Optional[str]:
+        '''
+            Log in the connection. Returns the error code if the login failed.
+        '''
+        remote_creds = self.get_remote_credentials()
+
+        logging.debug('Login user [{}] on binary connection'.format(remote_creds.username()))
+        body = '{}\0{}'.format(remote_creds.username(), remote_creds.password()).encode('utf-8')
+        res = conn.request(LOGIN, body, timeout=timeout)
+        if res.code != STATUS_OK:
+            error_code = res.body.decode('utf-8')
+            logging.error('Login user [{}] error {}'.format(remote_creds.username(), error_code))
+            return error_code
+        conn.set_logged_in(True)
+        return None
+
+    def send_binary_request(self, code: int, bodies: list[bytes], timeout: float=90, endpoint: Optional[RemoteEndpoint]=None, cancelled: Optional[Event]=None, pin_endpoint: bool=False, exclude: Optional[list[RemoteEndpoint]]=None, retry: bool=True) -> Union[list[Union[bytes, str]], str]:
+        '''
+            Send requests to a remote endpoint over its binary connection. The
+            requests are pipelined on the connection and the remote server
+            handles them in order.
+
+            Connection errors and timeouts are retried as in
+            send_remote_request, the connection is logged in again if its
+            session expired. If retry is not set failed attempts aren't
+            retried.
+
+            Returns the response body or error code of each request, otherwise
+            the error code if the requests couldn't be sent.
+        '''
+        start_t = time.time()
+        end_t = start_t + timeout
+        attempt = 0
+        self._retry_policy.on_request()
+
+        while True:
+            now = time.time()
+            if timeout <= 0 or now >= end_t:
+                return FileServerErrorCode.IO_TIMEOUT
+            if cancelled is not None and cancelled.is_set():
+                return FileServerErrorCode.REMOTE_DOWNLOAD_CANCELLED
+
+            try:
+                if endpoint is None or (attempt > 0 and not pin_endpoint):
+                    endpoint = self.get_remote_endpoint(exclude)
+            except RemoteClientError as e:
+                if e.error_code() == FileServerErrorCode.REMOTE_UNAVAILABLE:
+                    logging.error(str(e))
+                    return e.error_code()
+                raise e
+
+            request_t = self._endpoint_selector.begin_request(endpoint)
+            conn = None
+            results = None
+            error_code = None
+            try:
+                conn = self.binary_connection(endpoint, timeout=(end_t-now))
+                if not conn.is_logged_in():
+                    error_code = self.binary_login(conn, timeout=(end_t-now))
+                if error_code is None:
+                    futures = [conn.submit(code, body) for body in bodies]
+                    results = []
+                    for future in futures:
+                        res = future.result(timeout=max(0, end_t-time.time()))
+                        results.append(res.body if res.code == STATUS_OK else res.body.decode('utf-8'))
+            except RemoteClientError as e:
+                logging.error('Request error: {}'.format(str(e)))
+                error_code = e.error_code()
+            except (OSError, FuturesTimeoutError) as e:
+                logging.error('Request error: {}'.format(str(e)))
+                results = None
+                if conn is not None:
+                    # Responses may still arrive, don't reuse the connection.
+                    conn.close()
+            finally:
+                connected = results is not None or error_code is not None
+                self._endpoint_selector.end_request(endpoint, request_t, connected and FileServerErrorCode.INTERNAL_ERROR not in (results or []))
+
+            if error_code is not None:
+                return error_code
+            if results is None:
+                if retry and self.wait_retry(attempt, end_t):
+                    attempt += 1
+                    continue
+                return FileServerErrorCode.REMOTE_UNAVAILABLE
+
+            if FileServerErrorCode.SESSION_NOT_FOUND in results:
+                logging.warning('Binary connection session expired')
+                conn.set_logged_in(False)
+                continue
+
+            return results
+
+    def send_binary_op(self, code: int, body: bytes, timeout: float=90, endpoint: Optional[RemoteEndpoint]=None, cancelled: Optional[Event]=None, pin_endpoint: bool=False) -> Union[bytes, str]:
+        '''
+            Send a single request over the binary transport. Returns the
+            response body if successful, otherwise the error code.
+        '''
+        res = self.send_binary_request(code, [body], timeout=timeout, endpoint=endpoint, cancelled=cancelled, pin_endpoint=pin_endpoint)
+        if isinstance(res, str):
+            return res
+        return res[0]
+
+    def heartbeat_session(self, timeout: float=90, endpoint: Optional[RemoteEndpoint]=None) -> None:
+        '''
+            Renew the (cluster or endpoint) session. Raises an error if there
+            is no session or the heartbeat failed.
+        '''
+        key = self.session_key(endpoint)
+        session_id = self._session.get(key)
+        if session_id is None:
+            raise RemoteClientError('No session id!', FileServerErrorCode.SESSION_NOT_FOUND)
 
         headers = dict()
-        headers[SESSION_ID_HEADER] = self._session_id
+        headers[SESSION_ID_HEADER] = session_id
 
-        logging.debug('Sending session [{}] heartbeat'.format(self._session_id))
+        logging.debug('Sending session [{}] heartbeat'.format(session_id))
         path = self.session_heartbeat_path()
-        res = self.send_remote_request(path, method=requests.put, headers=headers, timeout=timeout)
+        res = self.send_remote_request(path, method='PUT', headers=headers, timeout=timeout, endpoint=endpoint, pin_endpoint=endpoint is not None)
         if isinstance(res, requests.Response):
-            logging.debug('Session [{}] heartbeat ok'.format(self._session_id))
+            self._session.touch(session_id, key)
+            logging.debug('Session [{}] heartbeat ok'.format(session_id))
             return
         else:
-            logging.error('Heartbeat session [{}] error {}'.format(res))
-            raise RemoteClientError('Heartbeat session [{}] error {}'.format(res), res)
-
-    def get_session_id(self, timeout: float=90) -> str:
-        if self._session_id is not None:
-            return self._session_id
+            logging.error('Heartbeat session [{}] error {}'.format(session_id, res))
+            raise RemoteClientError('Heartbeat session [{}] error {}'.format(session_id, res), res)
+
+    def renew_sessions(self, timeout: float=90) -> None:
+        '''
+            Send heartbeats on the sessions that haven't been used for the
+            heartbeat interval. Expired sessions are logged in again so
+            transfers don't have to.
+        '''
+        endpoints = dict([(str(endpoint), endpoint) for endpoint in self._endpoint_selector.endpoints()])
+        for key, session_id in self._session.idle_sessions():
+            endpoint = endpoints.get(key) if key is not None else None
+            if key is not None and endpoint is None:
+                self._session.expired(session_id, key)
+                continue
+            try:
+                self.heartbeat_session(timeout=timeout, endpoint=endpoint)
+            except RemoteClientError as e:
+                if e.error_code() != FileServerErrorCode.SESSION_NOT_FOUND:
+                    continue
+                self._session.expired(session_id, key)
+                try:
+                    self.get_session_id(timeout=timeout, endpoint=endpoint, retry=False)
+                except RemoteClientError:
+                    pass
+
+    def get_session_id(self, timeout: float=90, endpoint: Optional[RemoteEndpoint]=None, retry: bool=True) -> str:
+        '''
+            Get the session, logging in if needed. If endpoint is given get
+            the session on that endpoint.
+        '''
+        session_id = self._session.get(self.session_key(endpoint))
+        if session_id is not None:
+            return session_id
+        return self._session.login(lambda: self.login(timeout, endpoint, retry), self.session_key(endpoint))
 
+    def login(self, timeout: float=90, endpoint: Optional[RemoteEndpoint]=None, retry: bool=True) -> str:
+        '''
+            Start a session, on endpoint if given. Use get_session_id to get
+            the shared session instead.
+        '''
         path = self.login_path()
         remote_creds = self.get_remote_credentials()
 
         logging.debug('Login user [{}]'.format(remote_creds.username()))
-        res = self.send_remote_request(path, method=requests.post, auth=remote_creds.to_tuple(), timeout=timeout)
+        res = self.send_remote_request(path, method='POST', auth=remote_creds.to_tuple(), timeout=timeout, endpoint=endpoint, pin_endpoint=endpoint is not None, retry=retry)
         if isinstance(res, requests.Response):
-            self._session_id = session_id = res.headers.get(SESSION_ID_HEADER)
+            session_id = res.headers.get(SESSION_ID_HEADER)
             logging.debug('User [{}] session [{}] started'.format(remote_creds.username(), session_id))
             return session_id
         else:
             logging.error('Login user [{}] error {}'.format(remote_creds.username(), res))
             raise RemoteClientError('Login user [{}] error {}'.format(remote_creds.username(), res), res)
-    
-    def create_file(self, file_size: Optional[int] = None, timeout: int = 90) -> str:
-        path = self.create_file_path(file_size)
 
+    def create_file(self, file_size: Optional[int] = None, timeout: int = 90, file_id: Optional[str] = None, endpoint: Optional[RemoteEndpoint] = None) -> str:
+        '''
+            Create a remote file. The remote server generates the file id
+            unless one is given. If endpoint is given the file is created on
+            that endpoint.
+        '''
         logging.debug('Creating file size [{}]'.format(file_size))
-        res = self.send_remote_request(path, method=requests.post, renew_session=True, timeout=timeout)
-        if isinstance(res, requests.Response):
-            file_id = res.headers.get(FILE_ID_HEADER)
-            logging.debug('Created file [{}] size [{}]'.format(file_id, file_size))
-            return file_id
+        pin_endpoint = endpoint is not None
+        if self.use_binary_transport():
+            body = FILE_SIZE.pack(file_size or 0)
+            if file_id is not None:
+                body += encode_file_id(file_id)
+            res = self.send_binary_op(CREATE_FILE, body, timeout=timeout, endpoint=endpoint, pin_endpoint=pin_endpoint)
+            file_id = res.decode('ascii') if isinstance(res, bytes) else None
         else:
+            path = self.create_file_path(file_size)
+            headers = dict()
+            if file_id is not None:
+                headers[FILE_ID_HEADER] = file_id
+            res = self.send_remote_request(path, method='POST', headers=headers, renew_session=True, timeout=timeout, endpoint=endpoint, pin_endpoint=pin_endpoint)
+            file_id = res.headers.get(FILE_ID_HEADER) if isinstance(res, requests.Response) else None
+
+        if isinstance(res, str):
             logging.error('Create file error {}'.format(res))
             raise RemoteClientError('Create file error {}'.format(res), res)
+        logging.debug('Created file [{}] size [{}]'.format(file_id, file_size))
+        return file_id
 
-    def remove_file(self, file_id: str, epoch_no: int, timeout: int = 90) -> str:
-        path = self.file_path(file_id)
-
-        headers = dict()
-        headers[EPOCH_NO_HEADER] = str(epoch_no)
-
+    def remove_file(self, file_id: str, epoch_no: int, timeout: int = 90, endpoint: Optional[RemoteEndpoint] = None) -> str:
         logging.debug('Removing file [{}] epoch-no [{}]'.format(file_id, epoch_no))
-        res = self.send_remote_request(path, method=requests.delete, headers=headers, renew_session=True, timeout=timeout)
-        if isinstance(res, requests.Response):
-            logging.debug('Removed file [{}] epoch-no [{}]'.format(file_id, epoch_no))
+        pin_endpoint = endpoint is not None
+        if self.use_binary_transport():
+            res = self.send_binary_op(REMOVE_FILE, encode_file_request(file_id, epoch_no), timeout=timeout, endpoint=endpoint, pin_endpoint=pin_endpoint)
         else:
+            path = self.file_path(file_id)
+            headers = dict()
+            headers[EPOCH_NO_HEADER] = str(epoch_no)
+            res = self.send_remote_request(path, method='DELETE', headers=headers, renew_session=True, timeout=timeout, endpoint=endpoint, pin_endpoint=pin_endpoint)
+
+        if isinstance(res, str):
             logging.error('Remove file [{}] epoch-no [{}] error {}'.format(file_id, epoch_no, res))
             raise RemoteClientError('Remove file [{}] epoch-no [{}] error {}'.format(file_id, epoch_no, res), res)
+        logging.debug('Removed file [{}] epoch-no [{}]'.format(file_id, epoch_no))
 
-    def read_file_chunk(self, remote_file_id: str, chunk_offset: int, timeout: int = 90) -> bytes:
-        path = self.file_chunk_path(remote_file_id, chunk_offset)
-
+    def get_file_metadata(self, remote_file_id: str, timeout: int = 90, endpoint: Optional[RemoteEndpoint] = None) -> RemoteFileMetadata:
+        logging.debug('Get file [{}] metadata'.format(remote_file_id))
+        pin_endpoint = endpoint is not None
+        if self.use_binary_transport():
+            res = self.send_binary_op(FILE_METADATA, encode_file_id(remote_file_id), timeout=timeout, endpoint=endpoint, pin_endpoint=pin_endpoint)
+        else:
+            path = self.file_metadata_path(remote_file_id)
+            res = self.send_remote_request(path, method='GET', renew_session=True, timeout=timeout, endpoint=endpoint, pin_endpoint=pin_endpoint)
+
+        if isinstance(res, str):
+            logging.error('Get file [{}] metadata error {}'.format(remote_file_id, res))
+            raise RemoteClientError('Get file [{}] metadata error {}'.format(remote_file_id, res), res)
+        try:
+            metadata = json.loads(res) if isinstance(res, bytes) else res.json()
+            file_metadata = RemoteFileMetadata(
+                metadata['file-size'],
+                metadata['file-store-usage'],
+                metadata['file-chunks'],
+                metadata['is-committed'],
+                metadata['created-epoch-no'],
+                metadata['removed-epoch-no']
+            )
+        except Exception as e:
+            logging.error('Invalid file [{}] metadata: {}'.format(remote_file_id, str(e)))
+            raise RemoteClientError('Invalid file [{}] metadata'.format(remote_file_id), FileServerErrorCode.REMOTE_ERROR)
+        logging.debug('Got file [{}] metadata chunks [{}] committed [{}]'.format(remote_file_id, file_metadata.file_chunks, file_metadata.is_committed))
+        return file_metadata
+
+    def send_hedged(self, send_read: Callable[[RemoteEndpoint, Event], Any], exclude: Optional[list[RemoteEndpoint]]=None) -> Any:
+        '''
+            Send a read request with send_read(endpoint, cancelled) to any
+            endpoint not in exclude. If it takes longer than the endpoint's
+            hedge delay (see EndpointSelector.hedge_delay) send it to a second
+            endpoint too and return the first successful result.
+
+            The losing request can't be interrupted mid-flight, its result is
+            dropped and it isn't retried.
+        '''
+        try:
+            endpoint = self.get_remote_endpoint(exclude)
+        except RemoteClientError as e:
+            if e.error_code() == FileServerErrorCode.REMOTE_UNAVAILABLE:
+                logging.error(str(e))
+                return e.error_code()
+            raise e
+
+        hedge_delay = self._endpoint_selector.hedge_delay(endpoint)
+        if hedge_delay is None:
+            self._endpoint_selector.record_read()
+            return send_read(endpoint, None)
+
+        executor = self.hedge_executor()
+        cancelled = Event()
+        primary = executor.submit(send_read, endpoint, cancelled)
+        done, _ = wait([primary], timeout=hedge_delay)
+        if primary in done:
+            self._endpoint_selector.record_read()
+            return primary.result()
+
+        hedge_endpoint = self._endpoint_selector.select(exclude=[endpoint]+(exclude or []))
+        if hedge_endpoint is None:
+            self._endpoint_selector.record_read()
+            return primary.result()
+
+        logging.debug('Hedging read on remote endpoint [{}] after [{:.3f}s]'.format(str(hedge_endpoint), hedge_delay))
+        hedge = executor.submit(send_read, hedge_endpoint, cancelled)
+        pending = set([primary, hedge])
+        winner = None
+        res = None
+        error = None
+        while winner is None and len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for request in done:
+                try:
+                    res = request.result()
+                except Exception as e:
+                    error = e
+                    continue
+                # Errors are returned as error codes.
+                if not isinstance(res, str):
+                    winner = request
+                    break
+        cancelled.set()
+        self._endpoint_selector.record_read(hedged=True, hedge_won=(winner is hedge))
+
+        if winner is None and res is None and error is not None:
+            raise error
+        return res
+
+    def send_hedged_read(self, path: str, timeout: float=90, exclude: Optional[list[RemoteEndpoint]]=None, retry: bool=True) -> Union[requests.Response, str]:
+        '''
+            Send a hedged (see send_hedged) HTTP read request.
+        '''
+        return self.send_hedged(lambda endpoint, cancelled: self.send_remote_request(path, method='GET', headers=dict(), renew_session=True, timeout=timeout, endpoint=endpoint, cancelled=cancelled, exclude=exclude, retry=retry), exclude)
+
+    def send_hedged_binary_read(self, bodies: list[bytes], timeout: float=90, exclude: Optional[list[RemoteEndpoint]]=None, retry: bool=True) -> Union[list[Union[bytes, str]], str]:
+        '''
+            Send hedged (see send_hedged) binary READ_CHUNK requests.
+        '''
+        return self.send_hedged(lambda endpoint, cancelled: self.send_binary_request(READ_CHUNK, bodies, timeout=timeout, endpoint=endpoint, cancelled=cancelled, exclude=exclude, retry=retry), exclude)
+
+    def read_file_chunk(self, remote_file_id: str, chunk_offset: int, timeout: int = 90, replicas: Optional[list[RemoteEndpoint]] = None, retry: bool = True) -> bytes:
+        '''
+            Read a chunk. If replicas is given the chunk is read from one of
+            them. If retry is not set a failed read isn't retried.
+        '''
         logging.debug('Reading file [{}] chunk offset [{}]'.format(remote_file_id, chunk_offset))
-        res = self.send_remote_request(path, method=requests.get, renew_session=True, timeout=timeout)
-        if isinstance(res, requests.Response):
-            chunk = res.content
-            chunk_len = len(chunk)
-            logging.debug('Read file [{}] chunk offset [{}] size [{}B]'.format(remote_file_id, chunk_offset, chunk_len))
-            return chunk
+        exclude = self.replica_exclude(replicas)
+        if self.use_binary_transport():
+            res = self.send_hedged_binary_read([encode_file_request(remote_file_id, chunk_offset)], timeout=timeout, exclude=exclude, retry=retry)
+            if not isinstance(res, str):
+                res = res[0]
         else:
+            path = self.file_chunk_path(remote_file_id, chunk_offset)
+            res = self.send_hedged_read(path, timeout=timeout, exclude=exclude, retry=retry)
+            if isinstance(res, requests.Response):
+                res = res.content
+
+        if isinstance(res, str):
             logging.error('Read file [{}] chunk [{}] error {}'.format(remote_file_id, chunk_offset, res))
             raise RemoteClientError('Send file [{}] chunk [{}] error {}'.format(remote_file_id, chunk_offset, res), res)
-
-    def send_file_chunk(self, remote_file_id: str, chunk_data: bytes, chunk_offset: int, timeout: int = 90) -> None:
-        path = self.file_chunk_path(remote_file_id, chunk_offset)
+        chunk = res
+        chunk_len = len(chunk)
+        logging.debug('Read file [{}] chunk offset [{}] size [{}B]'.format(remote_file_id, chunk_offset, chunk_len))
+        if self._bandwidth_limiter is not None:
+            self._bandwidth_limiter.throttle_download(chunk_len)
+        return chunk
+
+    def send_file_chunk(self, remote_file_id: str, chunk_data: bytes, chunk_offset: int, timeout: int = 90, endpoint: Optional[RemoteEndpoint] = None) -> None:
         chunk_len = len(chunk_data)
 
+        if self._bandwidth_limiter is not None:
+            self._bandwidth_limiter.throttle_upload(chunk_len)
+
         logging.debug('Sending file [{}] chunk offset [{}] size [{}B]'.format(remote_file_id, chunk_offset, chunk_len))
-        res = self.send_remote_request(path, method=requests.put, data=chunk_data, renew_session=True, timeout=timeout)
-        if isinstance(res, requests.Response):
-            logging.debug('Sent file [{}] chunk offset [{}] size [{}B]'.format(remote_file_id, chunk_offset, chunk_len))
-            return
+        pin_endpoint = endpoint is not None
+        if self.use_binary_transport():
+            res = self.send_binary_op(APPEND_CHUNK, encode_file_request(remote_file_id, chunk_offset, chunk_data), timeout=timeout, endpoint=endpoint, pin_endpoint=pin_endpoint)
         else:
+            path = self.file_chunk_path(remote_file_id, chunk_offset)
+            headers = dict()
+            # Lets the remote server check the chunk as it streams it to disk.
+            headers[CHUNK_CHECKSUM_HEADER] = hashlib.sha256(chunk_data).hexdigest()
+            res = self.send_remote_request(path, method='PUT', headers=headers, data=chunk_data, renew_session=True, timeout=timeout, endpoint=endpoint, pin_endpoint=pin_endpoint)
+
+        if isinstance(res, str):
             logging.error('Send file [{}] chunk [{}] size [{}B] error {}'.format(remote_file_id, chunk_offset, chunk_len, res))
             raise RemoteClientError('Send file [{}] chunk [{}] size [{}B] error {}'.format(remote_file_id, chunk_offset, chunk_len, res), res)
-
-    def commit_file(self, remote_file_id: str, epoch_no: int, timeout: int = 90) -> None:
-        path = self.commit_path(remote_file_id)
-
-        headers = dict()
-        headers[EPOCH_NO_HEADER] = str(epoch_no)
-
+        logging.debug('Sent file [{}] chunk offset [{}] size [{}B]'.format(remote_file_id, chunk_offset, chunk_len))
+
+    def read_file_chunks(self, remote_file_id: str, chunk_offset: int, count: int, timeout: int = 90, replicas: Optional[list[RemoteEndpoint]] = None) -> list[bytes]:
+        '''
+            Read up to count chunks starting at chunk_offset in one request
+            (pipelined requests over the binary transport). Returns the chunks
+            read up to the first chunk that couldn't be read, raises an error
+            if the first chunk couldn't be read. If replicas is given the
+            chunks are read from one of them.
+        '''
+        logging.debug('Reading file [{}] [{}] chunks from offset [{}]'.format(remote_file_id, count, chunk_offset))
+        exclude = self.replica_exclude(replicas)
+        if self.use_binary_transport():
+            bodies = [encode_file_request(remote_file_id, chunk_offset+i) for i in range(count)]
+            res = self.send_hedged_binary_read(bodies, timeout=timeout, exclude=exclude)
+        else:
+            path = self.file_chunks_path(remote_file_id, chunk_offset, count)
+            res = self.send_hedged_read(path, timeout=timeout, exclude=exclude)
+
+        if isinstance(res, str):
+            logging.error('Read file [{}] chunks [{}] error {}'.format(remote_file_id, chunk_offset, res))
+            raise RemoteClientError('Read file [{}] chunks [{}] error {}'.format(remote_file_id, chunk_offset, res), res)
+        if isinstance(res, list):
+            chunks, error_code = self.binary_results_data(res)
+        else:
+            try:
+                frames = decode_frames(res.content, count)
+            except ValueError as e:
+                logging.error('Read file [{}] chunks [{}] invalid response: {}'.format(remote_file_id, chunk_offset, str(e)))
+                raise RemoteClientError('Read file [{}] chunks [{}] invalid response'.format(remote_file_id, chunk_offset), FileServerErrorCode.REMOTE_ERROR)
+            chunks, error_code = chunk_frames_data(frames, chunk_offset, count)
+        if len(chunks) == 0:
+            logging.error('Read file [{}] chunk [{}] error {}'.format(remote_file_id, chunk_offset, error_code))
+            raise RemoteClientError('Read file [{}] chunk [{}] error {}'.format(remote_file_id, chunk_offset, error_code), error_code)
+        chunks_len = sum([len(chunk) for chunk in chunks])
+        logging.debug('Read file [{}] [{}] chunks from offset [{}] size [{}B]'.format(remote_file_id, len(chunks), chunk_offset, chunks_len))
+        if self._bandwidth_limiter is not None:
+            self._bandwidth_limiter.throttle_download(chunks_len)
+        return chunks
+
+    def send_file_chunks(self, remote_file_id: str, chunks: list[bytes], chunk_offset: int, timeout: int = 90, endpoint: Optional[RemoteEndpoint] = None) -> None:
+        '''
+            Append the chunks, starting at chunk_offset, in one request
+            (pipelined requests over the binary transport). Raises an error if
+            any chunk wasn't appended, the chunks before it were.
+        '''
+        chunks_len = sum([len(chunk) for chunk in chunks])
+
+        if self._bandwidth_limiter is not None:
+            self._bandwidth_limiter.throttle_upload(chunks_len)
+
+        logging.debug('Sending file [{}] [{}] chunks from offset [{}] size [{}B]'.format(remote_file_id, len(chunks), chunk_offset, chunks_len))
+        pin_endpoint = endpoint is not None
+        if self.use_binary_transport():
+            bodies = [encode_file_request(remote_file_id, chunk_offset+i, chunk) for i, chunk in enumerate(chunks)]
+            res = self.send_binary_request(APPEND_CHUNK, bodies, timeout=timeout, endpoint=endpoint, pin_endpoint=pin_endpoint)
+        else:
+            path = self.file_chunks_path(remote_file_id)
+            data = encode_frames([ChunkFrame(chunk_offset+i, CHUNK_OK, chunk) for i, chunk in enumerate(chunks)])
+            res = self.send_remote_request(path, method='PUT', data=data, renew_session=True, timeout=timeout, endpoint=endpoint, pin_endpoint=pin_endpoint)
+
+        if isinstance(res, str):
+            logging.error('Send file [{}] chunks [{}] size [{}B] error {}'.format(remote_file_id, chunk_offset, chunks_len, res))
+            raise RemoteClientError('Send file [{}] chunks [{}] size [{}B] error {}'.format(remote_file_id, chunk_offset, chunks_len, res), res)
+        if isinstance(res, list):
+            sent_chunks, error_code = self.binary_results_data(res)
+        else:
+            try:
+                frames = decode_frames(res.content, len(chunks))
+            except ValueError as e:
+                logging.error('Send file [{}] chunks [{}] invalid response: {}'.format(remote_file_id, chunk_offset, str(e)))
+                raise RemoteClientError('Send file [{}] chunks [{}] invalid response'.format(remote_file_id, chunk_offset), FileServerErrorCode.REMOTE_ERROR)
+            sent_chunks, error_code = chunk_frames_data(frames, chunk_offset, len(chunks))
+        if error_code is not None:
+            failed_offset = chunk_offset+len(sent_chunks)
+            logging.error('Send file [{}] chunk [{}] error {}'.format(remote_file_id, failed_offset, error_code))
+            raise RemoteClientError('Send file [{}] chunk [{}] error {}'.format(remote_file_id, failed_offset, error_code), error_code)
+        logging.debug('Sent file [{}] [{}] chunks from offset [{}] size [{}B]'.format(remote_file_id, len(chunks), chunk_offset, chunks_len))
+
+    def binary_results_data(self, results: list[Union[bytes, str]]) -> tuple[list[bytes], Optional[str]]:
+        '''
+            Response bodies of pipelined binary requests up to the first failed
+            request and the error code of that request (None if all
+            succeeded).
+        '''
+        data: list[bytes] = []
+        for res in results:
+            if isinstance(res, str):
+                return data, res
+            data.append(res)
+        return data, None
+
+    def commit_file(self, remote_file_id: str, epoch_no: int, timeout: int = 90, endpoint: Optional[RemoteEndpoint] = None) -> None:
         logging.debug('Commit file [{}] epoch-no [{}]'.format(remote_file_id, epoch_no))
-        res = self.send_remote_request(path, method=requests.put, headers=headers, renew_session=True, timeout=timeout)
-        if isinstance(res, requests.Response):
-            logging.debug('Committed file [{}] epoch-no [{}]'.format(remote_file_id, epoch_no))
-            return
+        pin_endpoint = endpoint is not None
+        if self.use_binary_transport():
+            res = self.send_binary_op(COMMIT_FILE, encode_file_request(remote_file_id, epoch_no), timeout=timeout, endpoint=endpoint, pin_endpoint=pin_endpoint)
         else:
+            path = self.commit_path(remote_file_id)
+            headers = dict()
+            headers[EPOCH_NO_HEADER] = str(epoch_no)
+            res = self.send_remote_request(path, method='PUT', headers=headers, renew_session=True, timeout=timeout, endpoint=endpoint, pin_endpoint=pin_endpoint)
+
+        if isinstance(res, str):
             logging.error('Commit file [{}] epoch-no [{}] error {}'.format(remote_file_id, epoch_no, res))
-            raise RemoteClientError('Commit file [{}] epoch-no [{}] error {}'.format(remote_file_id, epoch_no, res), res)
\ No newline at end of file
+            raise RemoteClientError('Commit file [{}] epoch-no [{}] error {}'.format(remote_file_id, epoch_no, res), res)
+        logging.debug('Committed file [{}] epoch-no [{}]'.format(remote_file_id, epoch_no))
+
+    def end_epoch(self, epoch_no: int, marker_id: Optional[str] = None, timeout: int = 90) -> None:
+        logging.debug('End epoch [{}] marker [{}]'.format(epoch_no, marker_id))
+        if self.use_binary_transport():
+            body = UINT32.pack(epoch_no)
+            if marker_id is not None:
+                body += encode_file_id(marker_id)
+            res = self.send_binary_op(END_EPOCH, body, timeout=timeout)
+        else:
+            path = self.epoch_path(epoch_no, marker_id)
+            res = self.send_remote_request(path, method='PUT', renew_session=True, timeout=timeout)
+
+        if isinstance(res, str):
+            logging.error('End epoch [{}] error {}'.format(epoch_no, res))
+            raise RemoteClientError('End epoch [{}] error {}'.format(epoch_no, res), res)
+        logging.debug('Ended epoch [{}]'.format(epoch_no))
@@ -4,6 +4,7 @@ import os
 import signal
 
 from .remote.controller import RemoteServerController
+from .prefork import PreforkServer
 from .server import Server
 from .util.file import read_config
 from .util.logging import config_logging
@@ -12,11 +13,18 @@ class RemoteServer(Server):
 
     def __init__(self, config):
         super().__init__('remote_server', config)
+        self._binary_api_daemon = None
         self._controller = None
     
+    def binary_api_daemon(self):
+        return self._binary_api_daemon
+
     def controller(self):
         return self._controller
 
+    def prefork_supported(self) -> bool:
+        return True
+
     def dao_factory(self):
         db_type = db_type = self.db_config().get('db-type')
         if db_type == 'sqlite':
@@ -32,6 +40,28 @@ class RemoteServer(Server):
 
         return factory
 
+    def asyncio_request_handler(self):
+        from .remote.api.http.asyncio_request_handler import AsyncioHttpApiRequestHandler
+
+        return AsyncioHttpApiRequestHandler(self.controller())
+
+    def binary_request_handler_factory(self):
+        from .remote.api.binary.binary_request_handler import BinaryApiRequestHandler
+
+        def factory(request, client_address, server):
+            return BinaryApiRequestHandler(request, client_address, server, self.controller())
+
+        return factory
+
+    def init_binary_api(self):
+        if self.api_config().get('binary-api-port') is None:
+            return
+
+        logging.debug('Initializing binary API')
+        from .api.binary.binary_daemon import BinaryDaemon
+
+        self._binary_api_daemon = BinaryDaemon(self.api_config(), self.binary_request_handler_factory(), reuse_port=self.prefork())
+
     def do_start(self):      
         logging.info('Starting PrivaStore local server ...')
 
@@ -45,13 +75,20 @@ class RemoteServer(Server):
         self._controller.init_auth(self.auth_config())
 
         self.init_api()
+        self.init_binary_api()
 
         self.session_mgr().start()
         self.session_mgr().wait_started()
         self.api_daemon().start()
         self.api_daemon().wait_started()
+        if self.binary_api_daemon() is not None:
+            self.binary_api_daemon().start()
+            self.binary_api_daemon().wait_started()
 
     def do_stop(self):
+        if self.binary_api_daemon() is not None:
+            self.binary_api_daemon().stop()
+            self.binary_api_daemon().join()
         self.api_daemon().stop()
         self.api_daemon().join()
         self.session_mgr().stop()
@@ -90,6 +127,10 @@ def server_main():
         server.setup_db()
         return
 
+    num_processes = int(server_config['api'].get('api-processes', '1'))
+    if num_processes > 1:
+        server = PreforkServer(lambda: RemoteServer(server_config), num_processes)
+
     def handle_ctrl_c(signum, frame):
         print('Stopping...')
         server.stop()
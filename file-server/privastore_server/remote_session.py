@@ -0,0 +1,139 @@
+from .daemon import Daemon
+import logging
+from threading import Condition, Lock
+import time
+from typing import Callable, Optional
+
+class RemoteSession(object):
+
+    '''
+        Remote server sessions shared by the remote clients of a cluster.
+
+        Holds the cluster session and the sessions on individual endpoints
+        (used by requests pinned to an endpoint, see replication), keyed by
+        str(endpoint) with None for the cluster session. Logins are single
+        flight: while one client logs in, the others wanting the same session
+        wait for it instead of logging in too.
+
+        The remote server renews a session on every request, sessions that
+        haven't been used for heartbeat_interval are renewed by heartbeats
+        (see SessionHeartbeat) so they don't expire mid-transfer.
+    '''
+    def __init__(self, heartbeat_interval: float=60):
+        self._heartbeat_interval = heartbeat_interval
+        self._lock = Lock()
+        self._login_done = Condition(self._lock)
+        self._session_ids: dict[Optional[str], str] = dict()
+        # When each session was last used (monotonic).
+        self._last_used: dict[Optional[str], float] = dict()
+        self._logins_in_flight: set[Optional[str]] = set()
+
+    def heartbeat_interval(self) -> float:
+        return self._heartbeat_interval
+
+    def get(self, key: Optional[str]=None) -> Optional[str]:
+        with self._lock:
+            return self._session_ids.get(key)
+
+    def login(self, login: Callable[[], str], key: Optional[str]=None) -> str:
+        '''
+            Get the session, calling login() to start one if there is none.
+            Concurrent callers wait for the login in flight and share its
+            session. If it fails the next caller logs in again.
+        '''
+        with self._lock:
+            while key in self._logins_in_flight:
+                self._login_done.wait()
+            session_id = self._session_ids.get(key)
+            if session_id is not None:
+                return session_id
+            self._logins_in_flight.add(key)
+
+        session_id = None
+        try:
+            session_id = login()
+        finally:
+            with self._lock:
+                self._logins_in_flight.discard(key)
+                if session_id is not None:
+                    self._session_ids[key] = session_id
+                    self._last_used[key] = time.monotonic()
+                self._login_done.notify_all()
+        return session_id
+
+    def started(self, session_id: str, key: Optional[str]=None) -> str:
+        '''
+            Record a session started without login() (ex. by a client that
+            can't block on the logins in flight). Returns the current session,
+            which is kept if another login got there first.
+        '''
+        with self._lock:
+            current_id = self._session_ids.get(key)
+            if current_id is not None:
+                return current_id
+            self._session_ids[key] = session_id
+            self._last_used[key] = time.monotonic()
+            return session_id
+
+    def touch(self, session_id: str, key: Optional[str]=None) -> None:
+        '''
+            Record a successful request on the session.
+        '''
+        with self._lock:
+            if self._session_ids.get(key) == session_id:
+                self._last_used[key] = time.monotonic()
+
+    def expired(self, session_id: Optional[str]=None, key: Optional[str]=None) -> bool:
+        '''
+            Drop an expired session. If session_id is given the session is
+            only dropped if it is still the current one, so requests that
+            failed on an old session don't drop its replacement.
+
+            Returns True if the session was dropped.
+        '''
+        with self._lock:
+            current_id = self._session_ids.get(key)
+            if current_id is None or (session_id is not None and session_id != current_id):
+                return False
+            self._session_ids.pop(key)
+            self._last_used.pop(key, None)
+        if key is None:
+            logging.warning('Session [{}] expired'.format(current_id))
+        else:
+            logging.warning('Session [{}] on [{}] expired'.format(current_id, key))
+        return True
+
+    def idle_sessions(self) -> list[tuple[Optional[str], str]]:
+        '''
+            Sessions (key, session id) not used for the heartbeat interval.
+        '''
+        now = time.monotonic()
+        with self._lock:
+            return [(key, session_id) for key, session_id in self._session_ids.items() if now - self._last_used.get(key, 0) >= self._heartbeat_interval]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._session_ids = dict()
+            self._last_used = dict()
+
+class SessionHeartbeat(Daemon):
+
+    '''
+        Periodically renews idle sessions with renew_sessions() (see
+        RemoteClient.renew_sessions).
+    '''
+    def __init__(self, renew_sessions: Callable[[], None], check_interval: float=10):
+        super().__init__('session-heartbeat')
+        self._renew_sessions = renew_sessions
+        self._check_interval = check_interval
+
+    def run(self):
+        self._started.set()
+        logging.debug('Session heartbeat started')
+        while not self._stop.wait(self._check_interval):
+            try:
+                self._renew_sessions()
+            except Exception as e:
+                logging.error('Session heartbeat error: {}'.format(str(e)))
+        self._stopped.set()
+        logging.debug('Session heartbeat stopped')
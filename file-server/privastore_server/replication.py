@@ -0,0 +1,342 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from .erasure import ErasureCode
+from .error import FileServerError, FileServerErrorCode, RemoteClientError
+from .file import File
+import logging
+from .remote_client import RemoteClient, RemoteEndpoint, RemoteFileMetadata
+from typing import Any, Callable, Optional
+
+# An erasure coded file's shard, stored as remote file shard_id on endpoint.
+Shard = namedtuple('Shard', ['shard_index', 'shard_id', 'endpoint'])
+
+class Replicator(object):
+
+    '''
+        Synchronous replication of remote files.
+
+        Each remote file is written to replication_factor endpoints in
+        parallel under the same file id. A write succeeds once write_quorum
+        of them acknowledge it, replicas that fail are dropped from the rest
+        of the upload. The caller records which replicas hold the file so
+        they can be repaired and reads sent to them.
+    '''
+
+    def __init__(self, remote_client: RemoteClient, replication_factor: int=3, write_quorum: int=2):
+        if replication_factor < 1:
+            raise ValueError('Replication factor must be at least 1')
+        if write_quorum < 1 or write_quorum > replication_factor:
+            raise ValueError('Write quorum must be between 1 and the replication factor')
+        self._remote_client = remote_client
+        self._replication_factor = replication_factor
+        self._write_quorum = write_quorum
+        self._executor = ThreadPoolExecutor(max_workers=replication_factor, thread_name_prefix='replicator')
+
+    def remote_client(self) -> RemoteClient:
+        return self._remote_client
+
+    def replication_factor(self) -> int:
+        return self._replication_factor
+
+    def write_quorum(self) -> int:
+        return self._write_quorum
+
+    def select_replicas(self) -> list[RemoteEndpoint]:
+        '''
+            Select up to replication_factor distinct endpoints for a new file.
+        '''
+        selector = self._remote_client.endpoint_selector()
+        endpoints: list[RemoteEndpoint] = []
+        while len(endpoints) < self._replication_factor:
+            endpoint = selector.select(exclude=endpoints)
+            if endpoint is None:
+                break
+            endpoints.append(endpoint)
+
+        if len(endpoints) < self._write_quorum:
+            raise RemoteClientError('Only [{}] remote endpoints available, write quorum is [{}]'.format(len(endpoints), self._write_quorum), FileServerErrorCode.REMOTE_UNAVAILABLE)
+        if len(endpoints) < self._replication_factor:
+            logging.warning('Only [{}] remote endpoints available, replication factor is [{}]'.format(len(endpoints), self._replication_factor))
+        return endpoints
+
+    def fan_out(self, items: list, fn: Callable[[Any], Any], key: Callable[[Any], Any]=str) -> tuple[dict[Any, Any], dict[Any, FileServerError]]:
+        '''
+            Call fn(item) for each item (endpoints by default) in parallel.
+            Returns the results and the errors by key(item).
+        '''
+        futures = [(key(item), self._executor.submit(fn, item)) for item in items]
+        results = dict()
+        errors = dict()
+        for name, future in futures:
+            try:
+                results[name] = future.result()
+            except FileServerError as e:
+                logging.error('Replica [{}] error: {}'.format(name, str(e)))
+                errors[name] = e
+        return results, errors
+
+    def check_quorum(self, acked: list, errors: dict[Any, FileServerError], what: str, quorum: Optional[int]=None) -> None:
+        '''
+            Raise an error if fewer than quorum (by default write_quorum)
+            replicas acknowledged. The error code is the replicas' error code
+            if they all failed the same way.
+        '''
+        if quorum is None:
+            quorum = self._write_quorum
+        if len(acked) >= quorum:
+            return
+        error_codes = set([e.error_code() for e in errors.values()])
+        error_code = error_codes.pop() if len(error_codes) == 1 else FileServerErrorCode.REMOTE_ERROR
+        raise RemoteClientError('{} acknowledged by [{}] replicas, write quorum is [{}]'.format(what, len(acked), quorum), error_code)
+
+    def acked(self, items: list, results: dict[Any, Any], key: Callable[[Any], Any]=str) -> list:
+        return [item for item in items if key(item) in results]
+
+    def create_file(self, file_size: Optional[int]=None, timeout: int=90) -> tuple[str, list[RemoteEndpoint]]:
+        '''
+            Create the file on the selected replicas. Returns the file id and
+            the replicas it was created on.
+        '''
+        endpoints = self.select_replicas()
+        file_id = File.generate_file_id()
+
+        def create(endpoint: RemoteEndpoint) -> None:
+            try:
+                self._remote_client.create_file(file_size, timeout=timeout, file_id=file_id, endpoint=endpoint)
+            except RemoteClientError as e:
+                # A retried create may have gone through the first time.
+                if e.error_code() != FileServerErrorCode.FILE_EXISTS:
+                    raise e
+
+        results, errors = self.fan_out(endpoints, create)
+        created = self.acked(endpoints, results)
+        self.check_quorum(created, errors, 'Create file [{}]'.format(file_id))
+        logging.debug('Created remote file [{}] on [{}] replicas'.format(file_id, len(created)))
+        return file_id, created
+
+    def get_file_metadata(self, remote_id: str, endpoints: list[RemoteEndpoint], timeout: int=90) -> tuple[dict[str, RemoteFileMetadata], dict[str, FileServerError]]:
+        return self.fan_out(endpoints, lambda endpoint: self._remote_client.get_file_metadata(remote_id, timeout=timeout, endpoint=endpoint))
+
+    def send_chunks(self, remote_id: str, endpoints: list[RemoteEndpoint], chunks: list[bytes], chunk_offset: int, replica_chunks: Optional[dict[str, int]]=None, timeout: int=90) -> tuple[list[RemoteEndpoint], dict[str, FileServerError]]:
+        '''
+            Send the chunks starting at chunk_offset to each replica. If
+            replica_chunks is given it has the number of chunks each replica
+            already has, those aren't sent again. Returns the replicas that
+            acknowledged and the errors.
+        '''
+        def send(endpoint: RemoteEndpoint) -> None:
+            skip = 0
+            if replica_chunks is not None:
+                skip = max(replica_chunks.get(str(endpoint), 0) - (chunk_offset - 1), 0)
+            to_send = chunks[skip:]
+            if len(to_send) == 0:
+                return
+            if len(to_send) == 1:
+                self._remote_client.send_file_chunk(remote_id, to_send[0], chunk_offset+skip, timeout=timeout, endpoint=endpoint)
+            else:
+                self._remote_client.send_file_chunks(remote_id, to_send, chunk_offset+skip, timeout=timeout, endpoint=endpoint)
+
+        results, errors = self.fan_out(endpoints, send)
+        return self.acked(endpoints, results), errors
+
+    def commit_file(self, remote_id: str, endpoints: list[RemoteEndpoint], epoch_no: int, timeout: int=90) -> tuple[list[RemoteEndpoint], dict[str, FileServerError]]:
+        def commit(endpoint: RemoteEndpoint) -> None:
+            try:
+                self._remote_client.commit_file(remote_id, epoch_no, timeout=timeout, endpoint=endpoint)
+            except RemoteClientError as e:
+                if e.error_code() != FileServerErrorCode.FILE_IS_COMMITTED:
+                    raise e
+
+        results, errors = self.fan_out(endpoints, commit)
+        return self.acked(endpoints, results), errors
+
+    def remove_file(self, remote_id: str, endpoints: list[RemoteEndpoint], epoch_no: int, timeout: int=90) -> tuple[list[RemoteEndpoint], dict[str, FileServerError]]:
+        def remove(endpoint: RemoteEndpoint) -> None:
+            try:
+                self._remote_client.remove_file(remote_id, epoch_no, timeout=timeout, endpoint=endpoint)
+            except RemoteClientError as e:
+                if e.error_code() != FileServerErrorCode.FILE_NOT_FOUND:
+                    raise e
+
+        results, errors = self.fan_out(endpoints, remove)
+        return self.acked(endpoints, results), errors
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def shard_key(shard: Shard) -> int:
+    return shard.shard_index
+
+class ErasureCoder(object):
+
+    '''
+        Erasure coded storage of remote files.
+
+        A file's chunks are split into groups of k (see erasure.ErasureCode).
+        Fragment i of every group is stored in shard i, a remote file of its
+        own, so shard i < k holds every k-th data chunk and the rest hold
+        parity. Shards are spread across the remote endpoints. Any k shards
+        are enough to read the file back.
+    '''
+
+    def __init__(self, replicator: Replicator, erasure_code: ErasureCode):
+        self._replicator = replicator
+        self._erasure_code = erasure_code
+        # Writes need at least the k shards to read the file back.
+        self._write_quorum = min(max(replicator.write_quorum(), erasure_code.data_shards()), erasure_code.total_shards())
+
+    def erasure_code(self) -> ErasureCode:
+        return self._erasure_code
+
+    def write_quorum(self) -> int:
+        return self._write_quorum
+
+    def remote_client(self) -> RemoteClient:
+        return self._replicator.remote_client()
+
+    def check_quorum(self, acked: list[Shard], errors: dict[int, FileServerError], what: str) -> None:
+        self._replicator.check_quorum(acked, errors, what, self._write_quorum)
+
+    def select_shard_endpoints(self) -> list[RemoteEndpoint]:
+        '''
+            Spread the shards across the available endpoints. Shards share
+            endpoints if there are fewer endpoints than shards.
+        '''
+        selector = self.remote_client().endpoint_selector()
+        total_shards = self._erasure_code.total_shards()
+        endpoints: list[RemoteEndpoint] = []
+        while len(endpoints) < total_shards:
+            endpoint = selector.select(exclude=endpoints)
+            if endpoint is None:
+                break
+            endpoints.append(endpoint)
+
+        if len(endpoints) == 0:
+            raise RemoteClientError('All remote server endpoints are unavailable', FileServerErrorCode.REMOTE_UNAVAILABLE)
+        if len(endpoints) < total_shards:
+            logging.warning('Only [{}] remote endpoints available for [{}] shards'.format(len(endpoints), total_shards))
+        return [endpoints[i % len(endpoints)] for i in range(total_shards)]
+
+    def create_shards(self, file_size: Optional[int]=None, timeout: int=90) -> tuple[list[Shard], list[Shard]]:
+        '''
+            Create the shards of a new file. Returns all the shards and the
+            shards created.
+        '''
+        endpoints = self.select_shard_endpoints()
+        shards = [Shard(i, File.generate_file_id(), endpoint) for i, endpoint in enumerate(endpoints)]
+        data_shards = self._erasure_code.data_shards()
+        shard_size = (file_size + data_shards - 1) // data_shards if file_size is not None else None
+
+        def create(shard: Shard) -> None:
+            try:
+                self.remote_client().create_file(shard_size, timeout=timeout, file_id=shard.shard_id, endpoint=shard.endpoint)
+            except RemoteClientError as e:
+                if e.error_code() != FileServerErrorCode.FILE_EXISTS:
+                    raise e
+
+        results, errors = self._replicator.fan_out(shards, create, key=shard_key)
+        created = self._replicator.acked(shards, results, key=shard_key)
+        self.check_quorum(created, errors, 'Create file shards')
+        logging.debug('Created [{}] file shards'.format(len(created)))
+        return shards, created
+
+    def encode_groups(self, chunks: list[bytes]) -> dict[int, list[bytes]]:
+        '''
+            Encode consecutive groups of chunks (only the last group may be
+            short). Returns each shard's fragments by shard index.
+        '''
+        code = self._erasure_code
+        k = code.data_shards()
+        fragments = dict([(i, []) for i in range(code.total_shards())])
+        for start in range(0, len(chunks), k):
+            group = chunks[start:start+k]
+            for i, chunk in enumerate(group):
+                fragments[i].append(chunk)
+            for j, parity in enumerate(code.encode(group)):
+                fragments[k+j].append(parity)
+        return fragments
+
+    def send_fragments(self, shards: list[Shard], fragments: dict[int, list[bytes]], group_offset: int, shard_chunks: Optional[dict[int, int]]=None, timeout: int=90) -> tuple[list[Shard], dict[int, FileServerError]]:
+        '''
+            Send each shard its fragments of the groups starting at
+            group_offset. If shard_chunks is given it has the number of
+            fragments each shard already has, those aren't sent again.
+        '''
+        def send(shard: Shard) -> None:
+            shard_fragments = fragments.get(shard.shard_index, [])
+            skip = 0
+            if shard_chunks is not None:
+                skip = max(shard_chunks.get(shard.shard_index, 0) - (group_offset - 1), 0)
+            to_send = shard_fragments[skip:]
+            if len(to_send) == 0:
+                return
+            if len(to_send) == 1:
+                self.remote_client().send_file_chunk(shard.shard_id, to_send[0], group_offset+skip, timeout=timeout, endpoint=shard.endpoint)
+            else:
+                self.remote_client().send_file_chunks(shard.shard_id, to_send, group_offset+skip, timeout=timeout, endpoint=shard.endpoint)
+
+        results, errors = self._replicator.fan_out(shards, send, key=shard_key)
+        return self._replicator.acked(shards, results, key=shard_key), errors
+
+    def get_shard_metadata(self, shards: list[Shard], timeout: int=90) -> tuple[dict[int, RemoteFileMetadata], dict[int, FileServerError]]:
+        return self._replicator.fan_out(shards, lambda shard: self.remote_client().get_file_metadata(shard.shard_id, timeout=timeout, endpoint=shard.endpoint), key=shard_key)
+
+    def commit_shards(self, shards: list[Shard], epoch_no: int, timeout: int=90) -> tuple[list[Shard], dict[int, FileServerError]]:
+        def commit(shard: Shard) -> None:
+            try:
+                self.remote_client().commit_file(shard.shard_id, epoch_no, timeout=timeout, endpoint=shard.endpoint)
+            except RemoteClientError as e:
+                if e.error_code() != FileServerErrorCode.FILE_IS_COMMITTED:
+                    raise e
+
+        results, errors = self._replicator.fan_out(shards, commit, key=shard_key)
+        return self._replicator.acked(shards, results, key=shard_key), errors
+
+    def remove_shards(self, shards: list[Shard], epoch_no: int, timeout: int=90) -> tuple[list[Shard], dict[int, FileServerError]]:
+        def remove(shard: Shard) -> None:
+            try:
+                self.remote_client().remove_file(shard.shard_id, epoch_no, timeout=timeout, endpoint=shard.endpoint)
+            except RemoteClientError as e:
+                if e.error_code() != FileServerErrorCode.FILE_NOT_FOUND:
+                    raise e
+
+        results, errors = self._replicator.fan_out(shards, remove, key=shard_key)
+        return self._replicator.acked(shards, results, key=shard_key), errors
+
+    def read_fragments(self, shards: list[Shard], group_num: int, timeout: int=90, retry: bool=True) -> tuple[dict[int, bytes], dict[int, FileServerError]]:
+        return self._replicator.fan_out(shards, lambda shard: self.remote_client().read_file_chunk(shard.shard_id, group_num, timeout=timeout, replicas=[shard.endpoint], retry=retry), key=shard_key)
+
+    def read_group(self, shards: list[Shard], group_num: int, group_chunks: int, timeout: int=90) -> list[bytes]:
+        '''
+            Read the group_chunks data chunks of group group_num (1-indexed).
+            The data shards are read first, missing chunks are reconstructed
+            from the parity shards.
+        '''
+        k = self._erasure_code.data_shards()
+        # Data shards past the end of a short group are known to be empty.
+        fragments = dict([(i, b'') for i in range(group_chunks, k)])
+        data = [shard for shard in shards if shard.shard_index < group_chunks]
+        parity = [shard for shard in shards if shard.shard_index >= k]
+        # Don't wait on an unavailable data shard if parity can replace it.
+        results, errors = self.read_fragments(data, group_num, timeout, retry=len(parity) == 0)
+        fragments.update(results)
+
+        if len(fragments) < k:
+            logging.warning('Reconstructing group [{}] from parity, [{}] data shards unavailable'.format(group_num, k - len(fragments)))
+            # Read only as many parity fragments as needed, more if some fail.
+            while len(fragments) < k and len(parity) > 0:
+                needed = k - len(fragments)
+                batch, parity = parity[:needed], parity[needed:]
+                results, batch_errors = self.read_fragments(batch, group_num, timeout)
+                fragments.update(results)
+                errors.update(batch_errors)
+
+        if len(fragments) < k:
+            error_codes = set([e.error_code() for e in errors.values()])
+            error_code = error_codes.pop() if len(error_codes) == 1 else FileServerErrorCode.REMOTE_ERROR
+            raise RemoteClientError('Group [{}] has [{}] of the [{}] fragments needed'.format(group_num, len(fragments), k), error_code)
+
+        try:
+            return self._erasure_code.decode(fragments)[:group_chunks]
+        except ValueError as e:
+            raise RemoteClientError('Group [{}] decode error: {}'.format(group_num, str(e)), FileServerErrorCode.REMOTE_DOWNLOAD_ERROR)
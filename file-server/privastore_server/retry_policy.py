@@ -0,0 +1,138 @@
+import configparser
+from http import HTTPStatus
+import random
+from threading import Lock
+import time
+from typing import Union
+
+# Responses worth retrying, possibly against another endpoint.
+RETRYABLE_STATUSES = frozenset([
+    HTTPStatus.TOO_MANY_REQUESTS,
+    HTTPStatus.BAD_GATEWAY,
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    HTTPStatus.GATEWAY_TIMEOUT
+])
+
+def is_retryable_status(status_code: int) -> bool:
+    return status_code in RETRYABLE_STATUSES
+
+class RetryBudget(object):
+
+    '''
+        Limits retries to a fraction of requests so a struggling remote isn't
+        flooded with retries from every client at once.
+
+        Each request deposits ratio tokens and each retry withdraws one. A
+        floor of min_retries_per_sec tokens is added over time so clients that
+        send few requests can still retry. The balance is capped at
+        max_balance.
+    '''
+    def __init__(self, ratio: float=0.2, min_retries_per_sec: float=10, max_balance: float=100):
+        self._lock = Lock()
+        self._ratio = ratio
+        self._min_retries_per_sec = min_retries_per_sec
+        self._max_balance = max_balance
+        self._balance = max_balance
+        self._last_t = time.monotonic()
+        self._retries = 0
+        self._rejected = 0
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self._balance = min(self._max_balance, self._balance + (now - self._last_t) * self._min_retries_per_sec)
+        self._last_t = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.refill()
+            self._balance = min(self._max_balance, self._balance + self._ratio)
+
+    def withdraw(self) -> bool:
+        '''
+            Take a retry from the budget. Returns False if the budget is spent.
+        '''
+        with self._lock:
+            self.refill()
+            if self._balance < 1:
+                self._rejected += 1
+                return False
+            self._balance -= 1
+            self._retries += 1
+            return True
+
+    def balance(self) -> float:
+        with self._lock:
+            self.refill()
+            return self._balance
+
+    def metrics(self) -> dict:
+        with self._lock:
+            self.refill()
+            return {
+                'balance': self._balance,
+                'retries': self._retries,
+                'rejected': self._rejected
+            }
+
+class RetryPolicy(object):
+
+    '''
+        Exponential backoff with full jitter: the delay before retry n is
+        random between 0 and min(max_interval, base_interval * 2^n). Random
+        delays spread out clients that failed at the same time (ex. on a remote
+        restart) instead of having them all retry in lockstep.
+    '''
+    def __init__(self, base_interval: float=1, max_interval: float=30, budget: RetryBudget=None):
+        self._base_interval = base_interval
+        self._max_interval = max_interval
+        self._budget = budget if budget is not None else RetryBudget()
+
+    @staticmethod
+    def from_config(remote_config: Union[dict, configparser.ConfigParser]) -> 'RetryPolicy':
+        '''
+            Configuration:
+                worker-retry-interval - base retry interval (default 1s)
+                max-retry-interval - backoff cap (default 30s)
+                retry-budget-ratio - retries allowed per request (default 0.2)
+                retry-budget-min-rate - retries allowed per second regardless
+                    of requests (default 10)
+                retry-budget-max - most retries that can be saved up
+                    (default 100)
+        '''
+        budget = RetryBudget(
+            ratio=float(remote_config.get('retry-budget-ratio', '0.2')),
+            min_retries_per_sec=float(remote_config.get('retry-budget-min-rate', '10')),
+            max_balance=float(remote_config.get('retry-budget-max', '100'))
+        )
+        return RetryPolicy(
+            base_interval=float(remote_config.get('worker-retry-interval', '1')),
+            max_interval=float(remote_config.get('max-retry-interval', '30')),
+            budget=budget
+        )
+
+    def base_interval(self) -> float:
+        return self._base_interval
+
+    def set_base_interval(self, base_interval: float) -> None:
+        self._base_interval = base_interval
+
+    def max_interval(self) -> float:
+        return self._max_interval
+
+    def budget(self) -> RetryBudget:
+        return self._budget
+
+    def backoff(self, attempt: int) -> float:
+        '''
+            Delay before the given retry attempt (0 is the first retry).
+        '''
+        return random.uniform(0, min(self._max_interval, self._base_interval * (2 ** min(attempt, 32))))
+
+    def on_request(self) -> None:
+        self._budget.deposit()
+
+    def can_retry(self) -> bool:
+        return self._budget.withdraw()
+
+    def metrics(self) -> dict:
+        return self._budget.metrics()
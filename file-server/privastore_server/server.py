@@ -5,6 +5,7 @@ import logging
 import os
 from .session_mgr import SessionManager
 from threading import Event
+from typing import Optional
 from .util.logging import log_exception_stack
 
 class Server(Daemon):
@@ -16,6 +17,11 @@ class Server(Daemon):
         self._db_conn_mgr = None
         self._session_mgr = None
         self._store = None
+        # Set when running as a pre-forked worker process (see prefork).
+        self._prefork = False
+        self._shared_sessions = None
+        self._shared_objects = dict()
+        self._recover = True
     
     def config(self, section=None):
         if section:
@@ -50,12 +56,54 @@ class Server(Daemon):
     def http_request_handler_factory(self):
         raise Exception('Not implemented!')
 
+    def asyncio_request_handler(self):
+        raise Exception('Asyncio API not supported!')
+
     def session_mgr(self):
         return self._session_mgr
 
     def store(self):
         return self._store
 
+    def prefork_supported(self) -> bool:
+        return False
+
+    def prefork(self) -> bool:
+        return self._prefork
+
+    def prefork_shared_types(self) -> dict:
+        '''
+            Types (name -> callable) of the objects the pre-forked worker
+            processes share besides sessions. One of each is served to the
+            workers from the manager process (see PreforkServer).
+        '''
+        return dict()
+
+    def shared_object(self, name: str):
+        return self._shared_objects.get(name)
+
+    def recover(self) -> bool:
+        '''
+            Whether to recover the state left by a previous run (ex. half
+            written files) on start. Only the first pre-forked worker does,
+            the others would undo the work of the running workers.
+        '''
+        return self._recover
+
+    def enable_prefork(self, sessions, shared_objects: Optional[dict]=None, recover: bool=False) -> None:
+        '''
+            Run as one of several pre-forked worker processes: sessions and
+            shared_objects (see prefork_shared_types) are shared with the
+            other workers, the API ports are bound with SO_REUSEPORT and the
+            file store is shared.
+        '''
+        if not self.prefork_supported():
+            raise Exception('Pre-fork mode not supported!')
+        self._prefork = True
+        self._shared_sessions = sessions
+        self._shared_objects = shared_objects if shared_objects is not None else dict()
+        self._recover = recover
+
     def init_api(self) -> None:
         api_type = self.api_config().get('api-type', 'http')
 
@@ -63,7 +111,12 @@ class Server(Daemon):
             logging.debug('Initializing HTTP API')
             from .api.http.http_daemon import HttpDaemon
 
-            self._api_daemon = HttpDaemon(self.api_config(), self.http_request_handler_factory())
+            self._api_daemon = HttpDaemon(self.api_config(), self.http_request_handler_factory(), reuse_port=self.prefork())
+        elif api_type == 'asyncio':
+            logging.debug('Initializing asyncio HTTP API')
+            from .api.http.asyncio_http_daemon import AsyncioHttpDaemon
+
+            self._api_daemon = AsyncioHttpDaemon(self.api_config(), self.asyncio_request_handler(), reuse_port=self.prefork())
         else:
             raise Exception('Unsupported API type: {}'.format(api_type))
 
@@ -85,12 +138,12 @@ class Server(Daemon):
 
     def init_session(self):
         logging.debug('Initializing session')
-        self._session_mgr = SessionManager(self.session_config())
+        self._session_mgr = SessionManager(self.session_config(), sessions=self._shared_sessions)
 
     def init_store(self):
         logging.debug('Initializing file store')
         store_config = self.store_config()
-        self._store = FileCache(store_config)
+        self._store = FileCache(store_config, shared=self.prefork())
 
     def do_start(self):
         pass
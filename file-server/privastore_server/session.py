@@ -1,5 +1,6 @@
 from .error import SessionError, FileServerErrorCode
 import logging
+from multiprocessing.managers import BaseManager
 import time
 from threading import RLock
 from .util.time import format_datetime
@@ -73,4 +74,15 @@ class Sessions(object):
                     sessions_removed += 1
         logging.debug('Removed {} expired sessions'.format(sessions_removed))
         return sessions_removed
-        
\ No newline at end of file
+        
+
+class SessionsServer(BaseManager):
+
+    '''
+        Serves Sessions from a separate process so that pre-forked server
+        processes share them (see prefork). The Sessions proxies it returns
+        run every call in the server process, one round trip per call.
+    '''
+    pass
+
+SessionsServer.register('Sessions', Sessions)
@@ -2,14 +2,16 @@ import logging
 from .session import Sessions
 from .daemon import Daemon
 import time
+from typing import Optional
 
 class SessionManager(Daemon):
 
-    def __init__(self, session_config, daemon=True):
+    def __init__(self, session_config, daemon=True, sessions: Optional[Sessions]=None):
         super().__init__('session-manager', daemon)
         self._session_expiry_time = int(session_config.get('session-expiry-time', 300))
         self._session_cleanup_interval = int(session_config.get('session-cleanup-interval', 60))
-        self._sessions = Sessions()
+        # Shared sessions are passed in by pre-forked servers.
+        self._sessions = sessions if sessions is not None else Sessions()
 
         logging.debug('Session expiry time: [{}s]'.format(self._session_expiry_time))
         logging.debug('Session cleanup interval: [{}s]'.format(self._session_cleanup_interval))
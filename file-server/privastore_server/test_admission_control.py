@@ -0,0 +1,151 @@
+from .admission_control import AdmissionControl
+from .error import AdmissionError, FileServerErrorCode
+from threading import Thread
+import time
+import unittest
+
+class TestAdmissionControl(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def wait_for(self, cond, timeout=5):
+        end_t = time.monotonic() + timeout
+        while not cond():
+            self.assertLess(time.monotonic(), end_t)
+            time.sleep(0.01)
+
+    def test_unlimited(self):
+        admission_control = AdmissionControl()
+        admissions = [admission_control.admit(1024) for _ in range(100)]
+        self.assertEqual(admission_control.transfers(), 100)
+        self.assertEqual(admission_control.reserved_bytes(), 100 * 1024)
+        for admission in admissions:
+            admission.release()
+            # Releasing twice has no effect.
+            admission.release()
+        self.assertEqual(admission_control.transfers(), 0)
+        self.assertEqual(admission_control.reserved_bytes(), 0)
+
+    def test_max_transfers(self):
+        admission_control = AdmissionControl(max_transfers=2, timeout=5)
+        admission_1 = admission_control.admit()
+        admission_2 = admission_control.admit()
+        admitted = []
+        t = Thread(target=lambda: admitted.append(admission_control.admit()))
+        t.start()
+        self.wait_for(lambda: admission_control.waiting() == 1)
+        self.assertEqual(len(admitted), 0)
+        admission_1.release()
+        t.join()
+        self.assertEqual(len(admitted), 1)
+        self.assertEqual(admission_control.transfers(), 2)
+        self.assertEqual(admission_control.waiting(), 0)
+        admission_2.release()
+        admitted[0].release()
+        self.assertEqual(admission_control.transfers(), 0)
+
+    def test_fifo(self):
+        admission_control = AdmissionControl(max_transfers=1, timeout=5)
+        admission = admission_control.admit()
+        order = []
+        def admit(i):
+            admission = admission_control.admit()
+            order.append(i)
+            admission.release()
+        threads = []
+        for i in range(5):
+            t = Thread(target=admit, args=(i,))
+            t.start()
+            threads.append(t)
+            self.wait_for(lambda: admission_control.waiting() == i + 1)
+        admission.release()
+        for t in threads:
+            t.join()
+        self.assertEqual(order, [0, 1, 2, 3, 4])
+
+    def test_max_reserved_bytes(self):
+        admission_control = AdmissionControl(max_reserved_bytes=1000, timeout=5)
+        admission_1 = admission_control.admit(600)
+        admitted = []
+        t = Thread(target=lambda: admitted.append(admission_control.admit(600)))
+        t.start()
+        self.wait_for(lambda: admission_control.waiting() == 1)
+        # Transfers behind the one waiting are held back even if they fit.
+        t2 = Thread(target=lambda: admitted.append(admission_control.admit(100)))
+        t2.start()
+        self.wait_for(lambda: admission_control.waiting() == 2)
+        admission_1.release()
+        t.join()
+        t2.join()
+        self.assertEqual([admission.reserved_bytes() for admission in admitted], [600, 100])
+        self.assertEqual(admission_control.reserved_bytes(), 700)
+        for admission in admitted:
+            admission.release()
+
+        # A transfer larger than the limit is let in on its own.
+        admission = admission_control.admit(5000)
+        self.assertEqual(admission_control.reserved_bytes(), 5000)
+        admission.release()
+
+    def test_unknown_size(self):
+        admission_control = AdmissionControl(max_reserved_bytes=1000, timeout=0, unknown_size_bytes=800)
+        # Uploads of unknown size reserve the estimate.
+        admission = admission_control.admit(None)
+        self.assertEqual(admission.reserved_bytes(), 800)
+        with self.assertRaises(AdmissionError):
+            admission_control.admit(None)
+        with self.assertRaises(AdmissionError):
+            admission_control.admit(300)
+        admission_control.admit(200).release()
+        admission.release()
+        self.assertEqual(admission_control.reserved_bytes(), 0)
+
+    def test_timeout(self):
+        admission_control = AdmissionControl(max_transfers=1, timeout=0.1, retry_after=7)
+        admission = admission_control.admit()
+        try:
+            admission_control.admit()
+            self.fail('Expected admission to time out')
+        except AdmissionError as e:
+            self.assertEqual(e.error_code(), FileServerErrorCode.SERVER_BUSY)
+            self.assertEqual(e.retry_after(), 7)
+        self.assertEqual(admission_control.waiting(), 0)
+        admission.release()
+        admission_control.admit().release()
+        metrics = admission_control.metrics()
+        self.assertEqual(metrics['admitted'], 2)
+        self.assertEqual(metrics['timed-out'], 1)
+        self.assertEqual(metrics['rejected'], 0)
+        self.assertGreater(metrics['wait-time'], 0)
+
+    def test_queue_full(self):
+        admission_control = AdmissionControl(max_transfers=1, max_waiting=0)
+        admission = admission_control.admit()
+        with self.assertRaises(AdmissionError):
+            admission_control.admit()
+        admission.release()
+        admission_control.admit().release()
+        metrics = admission_control.metrics()
+        self.assertEqual(metrics['admitted'], 2)
+        self.assertEqual(metrics['rejected'], 1)
+        self.assertEqual(metrics['transfers'], 0)
+
+    def test_from_config(self):
+        admission_control = AdmissionControl.from_config({
+            'max-client-transfers': '4',
+            'max-reserved-bytes': '1MB',
+            'max-file-size': '2MB'
+        })
+        self.assertEqual(admission_control.max_transfers(), 4)
+        self.assertEqual(admission_control.max_reserved_bytes(), 1024 * 1024)
+        self.assertEqual(admission_control.unknown_size_bytes(), 2 * 1024 * 1024)
+        admission_control = AdmissionControl.from_config({
+            'chunked-upload-reserved-bytes': '64MB'
+        })
+        self.assertEqual(admission_control.max_transfers(), 0)
+        self.assertEqual(admission_control.max_reserved_bytes(), 0)
+        self.assertEqual(admission_control.unknown_size_bytes(), 64 * 1024 * 1024)
@@ -0,0 +1,84 @@
+import asyncio
+from .asyncio_remote_client import AsyncioRemoteClient
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .remote_client import RemoteClient, RemoteEndpoint
+from threading import Lock, Thread
+import unittest
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.num_requests = 0
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        self.num_requests += 1
+        if self.num_requests > 1 and self.server.drop_reused:
+            # Closed as if it had been idle too long.
+            self.close_connection = True
+            return
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Length', str(len(self.server.body)))
+        if self.server.close:
+            self.send_header('Connection', 'close')
+        else:
+            self.send_header('Keep-Alive', 'timeout=15, max=100')
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestAsyncioRemoteClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('localhost', 0), KeepAliveHandler)
+        self.server.daemon_threads = True
+        self.server.lock = Lock()
+        self.server.connections = 0
+        self.server.drop_reused = False
+        self.server.close = False
+        self.server.body = b'data'
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = RemoteEndpoint('localhost', self.server.server_address[1])
+        self.client = AsyncioRemoteClient(RemoteClient(), max_idle_connections=2)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def send_requests(self, num_requests, parallel=False):
+        async def send():
+            request = lambda: self.client.do_request(self.endpoint, 'GET', '/', dict(), None)
+            if parallel:
+                responses = await asyncio.gather(*[request() for _ in range(num_requests)])
+            else:
+                responses = [await request() for _ in range(num_requests)]
+            num_idle = self.client.num_idle_connections(self.endpoint)
+            await self.client.close()
+            return [r.content for r in responses], num_idle
+        return asyncio.run(send())
+
+    def test_keep_alive(self):
+        self.assertEqual(self.send_requests(3), ([b'data']*3, 1))
+        self.assertEqual(self.server.connections, 1)
+
+        # Idle connections kept are limited.
+        self.assertEqual(self.send_requests(4, parallel=True), ([b'data']*4, 2))
+        self.assertEqual(self.server.connections, 5)
+
+    def test_connection_close(self):
+        self.server.close = True
+        self.assertEqual(self.send_requests(2), ([b'data']*2, 0))
+        self.assertEqual(self.server.connections, 2)
+
+    def test_stale_connection(self):
+        # Requests on reused connections are retried once on a new one.
+        self.server.drop_reused = True
+        self.assertEqual(self.send_requests(3), ([b'data']*3, 1))
+        self.assertEqual(self.server.connections, 3)
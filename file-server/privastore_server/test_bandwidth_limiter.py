@@ -0,0 +1,111 @@
+from .bandwidth_limiter import BandwidthLimiter, RateSchedule, TokenBucket, DOWNLOAD, TOTAL, UPLOAD
+import time
+import unittest
+
+class TestBandwidthLimiter(unittest.TestCase):
+    
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_token_bucket(self):
+        bucket = TokenBucket()
+        self.assertEqual(bucket.reserve(1000000), 0, 'Expected unlimited bucket not to throttle')
+
+        bucket = TokenBucket(1000, 1000)
+        # Bucket starts empty.
+        self.assertAlmostEqual(bucket.reserve(500), 0.5, delta=0.05)
+        self.assertAlmostEqual(bucket.reserve(500), 1.0, delta=0.05)
+
+        # Callers queue up behind the outstanding debt.
+        bucket = TokenBucket(10000, 10000)
+        start_t = time.monotonic()
+        self.assertAlmostEqual(bucket.consume(2000), 0.2, delta=0.05)
+        self.assertGreaterEqual(time.monotonic() - start_t, 0.15)
+
+        bucket.set_rate(0)
+        self.assertEqual(bucket.reserve(1000000), 0, 'Expected unlimited bucket not to throttle')
+
+    def test_token_bucket_refill(self):
+        bucket = TokenBucket(10000, 1000)
+        time.sleep(0.2)
+        # Tokens are capped at the bucket capacity.
+        self.assertAlmostEqual(bucket.tokens(), 1000, delta=1)
+        self.assertEqual(bucket.reserve(1000), 0)
+        self.assertGreater(bucket.reserve(1000), 0)
+
+    def test_rate_schedule(self):
+        schedule = RateSchedule.parse('23:00-07:00=0,07:00-23:00=256KB')
+        self.assertEqual(schedule.rate_at(0), 0)
+        self.assertEqual(schedule.rate_at(23*60+30), 0)
+        self.assertEqual(schedule.rate_at(6*60+59), 0)
+        self.assertEqual(schedule.rate_at(7*60), 256*1024)
+        self.assertEqual(schedule.rate_at(12*60), 256*1024)
+        self.assertEqual(str(schedule), '23:00-07:00=0,07:00-23:00=262144B')
+
+        self.assertEqual(RateSchedule.parse(str(schedule)).windows(), schedule.windows())
+
+        schedule = RateSchedule.parse('09:00-17:00=1MB')
+        self.assertIsNone(schedule.rate_at(8*60))
+        self.assertEqual(schedule.rate_at(9*60), 1024*1024)
+
+        for invalid_schedule in ['09:00=1MB', '25:00-07:00=1MB', '09:00-17:00=fast', '09:00-17:00']:
+            with self.assertRaises(Exception):
+                RateSchedule.parse(invalid_schedule)
+
+    def test_bandwidth_limiter(self):
+        limiter = BandwidthLimiter.from_config({
+            'upload-bandwidth-limit': '1KB',
+            'download-bandwidth-limit': '0',
+        })
+        self.assertEqual(limiter.limit(UPLOAD), 1024)
+        self.assertEqual(limiter.limit(DOWNLOAD), 0)
+        self.assertEqual(limiter.limit(TOTAL), 0)
+
+        self.assertEqual(limiter.reserve(DOWNLOAD, 1000000), 0)
+        self.assertAlmostEqual(limiter.reserve(UPLOAD, 512), 0.5, delta=0.05)
+
+        # Global limit applies to both directions.
+        limiter.set_limit(TOTAL, 2048)
+        self.assertAlmostEqual(limiter.reserve(DOWNLOAD, 1024), 0.5, delta=0.05)
+
+        metrics = limiter.metrics()
+        self.assertEqual(metrics[UPLOAD]['bytes'], 512)
+        self.assertEqual(metrics[DOWNLOAD]['bytes'], 1001024)
+        self.assertEqual(metrics[TOTAL]['bytes'], 1001536)
+        self.assertEqual(metrics[UPLOAD]['throttled-count'], 1)
+        self.assertEqual(metrics[DOWNLOAD]['throttled-count'], 1)
+        self.assertEqual(metrics[TOTAL]['throttled-count'], 2)
+        self.assertAlmostEqual(metrics[TOTAL]['throttled-time'], 1.0, delta=0.1)
+
+        with self.assertRaises(Exception):
+            limiter.reserve(TOTAL, 1)
+        with self.assertRaises(Exception):
+            limiter.set_limit('sideways', 1)
+
+    def test_bandwidth_limiter_schedule(self):
+        limiter = BandwidthLimiter()
+        limiter.set_limit(UPLOAD, 1024)
+        limiter.set_schedule(UPLOAD, RateSchedule.parse('23:00-07:00=0'))
+        self.assertEqual(limiter.current_rate(UPLOAD, 12*60), 1024)
+        self.assertEqual(limiter.current_rate(UPLOAD, 1*60), 0)
+        limiter.set_schedule(UPLOAD, None)
+        self.assertEqual(limiter.current_rate(UPLOAD, 1*60), 1024)
+
+    def test_bandwidth_limiter_burst(self):
+        limiter = BandwidthLimiter()
+        limiter.set_limit(UPLOAD, 1024)
+        self.assertEqual(limiter.current_burst(UPLOAD, 12*60), 1024)
+        # Changing only the burst size takes effect.
+        limiter.set_limit(UPLOAD, 1024, 4096)
+        self.assertEqual(limiter.current_rate(UPLOAD, 12*60), 1024)
+        self.assertEqual(limiter.current_burst(UPLOAD, 12*60), 4096)
+        limiter.set_limit(UPLOAD, 1024)
+        self.assertEqual(limiter.current_burst(UPLOAD, 12*60), 1024)
+        # The burst size is kept across scheduled rate changes.
+        limiter.set_limit(UPLOAD, 1024, 4096)
+        limiter.set_schedule(UPLOAD, RateSchedule.parse('23:00-07:00=2KB'))
+        self.assertEqual(limiter.current_rate(UPLOAD, 1*60), 2048)
+        self.assertEqual(limiter.current_burst(UPLOAD, 1*60), 4096)
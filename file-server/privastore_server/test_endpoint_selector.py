@@ -0,0 +1,175 @@
+import asyncio
+from .asyncio_remote_client import AsyncioRemoteClient
+from .endpoint_selector import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, EndpointSelector
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .remote_client import RemoteClient, RemoteCredentials, RemoteEndpoint
+from threading import Thread
+import time
+import unittest
+
+class TestEndpointSelector(unittest.TestCase):
+
+    def setUp(self):
+        self.fast = RemoteEndpoint('localhost', 9000)
+        self.slow = RemoteEndpoint('localhost', 9001)
+        self.selector = EndpointSelector(failure_threshold=2, open_time=0.2)
+        self.selector.add_endpoint(self.fast)
+        self.selector.add_endpoint(self.slow)
+        # Duplicate endpoints are ignored.
+        self.selector.add_endpoint(RemoteEndpoint('localhost', 9000))
+
+    def tearDown(self):
+        pass
+
+    def record(self, endpoint, latency, success=True):
+        self.selector.begin_request(endpoint)
+        self.selector.end_request(endpoint, time.monotonic() - latency, success)
+
+    def test_select(self):
+        self.assertIsNone(EndpointSelector().select())
+        self.assertEqual(len(self.selector.endpoints()), 2)
+
+        self.record(self.fast, 0.01)
+        self.record(self.slow, 0.5)
+        for _ in range(10):
+            self.assertEqual(str(self.selector.select()), str(self.fast))
+
+        # Outstanding requests make an endpoint look slower.
+        for _ in range(100):
+            self.selector.begin_request(self.fast)
+        self.assertEqual(str(self.selector.select()), str(self.slow))
+
+    def test_circuit_breaker(self):
+        self.record(self.slow, 0.01)
+        self.record(self.fast, 0.01, success=False)
+        self.assertEqual(self.selector.open_endpoints(), [])
+        self.record(self.fast, 0.01, success=False)
+        self.assertEqual([str(e) for e in self.selector.open_endpoints()], [str(self.fast)])
+        self.assertEqual(self.selector.health(self.fast).circuit(), CIRCUIT_OPEN)
+        self.assertGreater(self.selector.health(self.fast).error_rate(), 0)
+        for _ in range(10):
+            self.assertEqual(str(self.selector.select()), str(self.slow))
+        self.assertEqual(self.selector.metrics()[str(self.fast)]['circuit'], CIRCUIT_OPEN)
+
+        # Once the open time passes a single trial request is let through.
+        time.sleep(0.25)
+        selected = [str(self.selector.select()) for _ in range(20)]
+        self.assertEqual(selected.count(str(self.fast)), 1)
+        self.assertEqual(self.selector.health(self.fast).circuit(), CIRCUIT_HALF_OPEN)
+
+        # Failed trial opens the circuit for twice as long.
+        self.record(self.fast, 0.01, success=False)
+        self.assertEqual(self.selector.health(self.fast).circuit(), CIRCUIT_OPEN)
+        time.sleep(0.25)
+        self.assertEqual(self.selector.health(self.fast).circuit(), CIRCUIT_OPEN)
+        self.assertFalse(self.selector.health(self.fast).can_trial(time.monotonic()))
+        time.sleep(0.2)
+        self.assertTrue(self.selector.health(self.fast).can_trial(time.monotonic()))
+
+        # Successful trial closes the circuit.
+        self.selector.health(self.fast).start_trial(time.monotonic())
+        self.record(self.fast, 0.01)
+        self.assertEqual(self.selector.health(self.fast).circuit(), CIRCUIT_CLOSED)
+        self.assertEqual(self.selector.open_endpoints(), [])
+
+    def test_probe(self):
+        for endpoint in [self.fast, self.slow]:
+            self.record(endpoint, 0.01, success=False)
+            self.record(endpoint, 0.01, success=False)
+        self.assertEqual(len(self.selector.open_endpoints()), 2)
+        # All circuits open, fail fast.
+        self.assertIsNone(self.selector.select())
+
+        def check_health(endpoint):
+            if str(endpoint) == str(self.slow):
+                raise Exception('Connection refused')
+            return True
+        self.assertEqual(self.selector.probe(check_health), 1)
+        self.assertEqual([str(e) for e in self.selector.open_endpoints()], [str(self.slow)])
+        self.assertEqual(self.selector.health(self.fast).consecutive_failures(), 0)
+        self.assertEqual(str(self.selector.select()), str(self.fast))
+
+    def test_hedge_delay(self):
+        self.assertIsNone(self.selector.hedge_delay(self.fast))
+        selector = EndpointSelector(hedge_reads=True, hedge_percentile=90, hedge_min_samples=10, hedge_min_delay=0.05)
+        selector.add_endpoint(self.fast)
+        for latency in range(10):
+            selector.begin_request(self.fast)
+            selector.end_request(self.fast, time.monotonic() - (latency + 1) / 10, True)
+        # Single endpoint, nowhere to hedge to.
+        self.assertIsNone(selector.hedge_delay(self.fast))
+        selector.add_endpoint(self.slow)
+        self.assertAlmostEqual(selector.hedge_delay(self.fast), 1.0, delta=0.01)
+        self.assertIsNone(selector.hedge_delay(self.slow))
+        self.assertEqual([str(selector.select(exclude=[self.fast])) for _ in range(5)], [str(self.slow)] * 5)
+        self.assertIsNone(selector.select(exclude=[self.fast, self.slow]))
+
+class StubRemoteHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.send_response(HTTPStatus.OK)
+        self.send_header('x-privastore-session-id', 'S-1')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Length', str(len(self.server.body)))
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestHedgedReads(unittest.TestCase):
+
+    def start_stub_server(self, delay, body):
+        server = ThreadingHTTPServer(('localhost', 0), StubRemoteHandler)
+        server.daemon_threads = True
+        server.delay = delay
+        server.body = body
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.servers.append(server)
+        return RemoteEndpoint('localhost', server.server_address[1])
+
+    def setUp(self):
+        self.servers = []
+        self.slow = self.start_stub_server(2, b'slow')
+        self.fast = self.start_stub_server(0, b'fast')
+        self.selector = EndpointSelector(hedge_reads=True, hedge_min_samples=1, hedge_min_delay=0.01)
+        self.client = RemoteClient(remote_creds=RemoteCredentials('psadmin', 'psadmin'))
+        self.client.set_endpoint_selector(self.selector)
+        self.client.add_remote_endpoint(self.slow)
+        self.client.add_remote_endpoint(self.fast)
+        # Make the slow endpoint look fast so reads go to it first.
+        for endpoint, latency in [(self.slow, 0.01), (self.fast, 0.5)]:
+            self.selector.begin_request(endpoint)
+            self.selector.end_request(endpoint, time.monotonic() - latency, True)
+
+    def tearDown(self):
+        self.client.close()
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def test_hedged_read(self):
+        start_t = time.time()
+        self.assertEqual(self.client.read_file_chunk('F-1', 1, timeout=10), b'fast')
+        self.assertLess(time.time() - start_t, 1.5)
+        metrics = self.selector.hedge_metrics()
+        self.assertEqual(metrics['hedged-reads'], 1)
+        self.assertEqual(metrics['hedge-wins'], 1)
+        self.assertEqual(metrics['hedge-rate'], 1.0)
+
+    def test_asyncio_hedged_read(self):
+        client = AsyncioRemoteClient(self.client)
+        start_t = time.time()
+        self.assertEqual(asyncio.run(client.read_file_chunk('F-1', 1, timeout=10)), b'fast')
+        self.assertLess(time.time() - start_t, 1.5)
+        self.assertEqual(self.selector.hedge_metrics()['hedge-wins'], 1)
+        # The losing read was cancelled.
+        self.assertEqual(self.selector.health(self.slow).outstanding(), 0)
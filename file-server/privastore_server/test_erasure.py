@@ -0,0 +1,54 @@
+import itertools
+import random
+import unittest
+from .erasure import ErasureCode, gf_inv, gf_invert_matrix, gf_mul
+
+class TestErasureCode(unittest.TestCase):
+
+    def test_gf_arithmetic(self):
+        for a in range(1, 256):
+            self.assertEqual(gf_mul(a, gf_inv(a)), 1)
+            self.assertEqual(gf_mul(a, 0), 0)
+            self.assertEqual(gf_mul(a, 1), a)
+        with self.assertRaises(ZeroDivisionError):
+            gf_inv(0)
+        matrix = [[1, 2], [3, 4]]
+        inv = gf_invert_matrix(matrix)
+        for i in range(2):
+            for j in range(2):
+                x = gf_mul(matrix[i][0], inv[0][j]) ^ gf_mul(matrix[i][1], inv[1][j])
+                self.assertEqual(x, 1 if i == j else 0)
+        with self.assertRaises(ValueError):
+            gf_invert_matrix([[1, 1], [1, 1]])
+
+    def test_encode_decode(self):
+        for k, m in [(1, 1), (2, 1), (3, 2), (4, 2), (5, 3)]:
+            code = ErasureCode(k, m)
+            self.assertEqual(code.total_shards(), k + m)
+            # Full groups and short (last) groups with a short last chunk.
+            for num_chunks in [k, max(k-1, 1)]:
+                chunks = [random.randbytes(100) for i in range(num_chunks-1)] + [random.randbytes(37)]
+                parity = code.encode(chunks)
+                self.assertEqual(len(parity), m)
+                fragments = dict(enumerate(chunks + [b''] * (k - num_chunks)))
+                for j, p in enumerate(parity):
+                    fragments[k+j] = p
+                # Any k fragments reconstruct the group.
+                for indexes in itertools.combinations(range(k + m), k):
+                    decoded = code.decode(dict([(i, fragments[i]) for i in indexes]))
+                    self.assertEqual(decoded[:num_chunks], chunks)
+
+    def test_decode_errors(self):
+        code = ErasureCode(3, 2)
+        chunks = [random.randbytes(10) for i in range(3)]
+        parity = code.encode(chunks)
+        with self.assertRaises(ValueError):
+            code.decode({0: chunks[0], 3: parity[0]})
+        with self.assertRaises(ValueError):
+            code.decode({0: chunks[0], 1: chunks[1], 3: parity[0][:-1]})
+        with self.assertRaises(ValueError):
+            code.encode(chunks + [b''])
+        with self.assertRaises(ValueError):
+            ErasureCode(0, 2)
+        with self.assertRaises(ValueError):
+            ErasureCode(200, 57)
@@ -1,8 +1,11 @@
+import hashlib
+import io
 import os
 import random
 import shutil
+import socket
 import unittest
-from .error import FileError
+from .error import FileError, FileServerErrorCode
 from .file import File
 from .file_chunk import get_encrypted_chunk_encoder, get_encrypted_chunk_decoder
 from .util.crypto import get_encryptor_factory, get_decryptor_factory
@@ -154,4 +157,133 @@ class TestFile(unittest.TestCase):
         self.assertEqual(f2.read_chunk(), chunk2)
         self.assertEqual(f2.read_chunk(), chunk3)
         self.assertEqual(f2.read_chunk(), b'')
-        f2.close()
\ No newline at end of file
+        f2.close()
+
+    def test_append_chunks_from(self):
+        key = os.urandom(16)
+        chunk_enc = get_encrypted_chunk_encoder(get_encryptor_factory('aes-128-cbc', key))
+        chunk_dec = get_encrypted_chunk_decoder(get_decryptor_factory('aes-128-cbc', key))
+
+        chunk1 = random.randbytes(1024)
+        chunk2 = random.randbytes(100)
+        chunk3 = random.randbytes(1024)
+
+        f1 = File('test_file', mode='w', encode_chunk=chunk_enc, decode_chunk=chunk_dec)
+        f1.append_chunk(chunk1)
+        f1.append_chunk(chunk2)
+        f1.close()
+        f2 = File('test_file', mode='w', encode_chunk=chunk_enc, decode_chunk=chunk_dec)
+        f2.append_chunk(chunk3)
+        f2.close()
+
+        f = File('test_file', mode='w', encode_chunk=chunk_enc, decode_chunk=chunk_dec)
+        for src_file_id in [f1.file_id(), f2.file_id()]:
+            src_file = File('test_file', file_id=src_file_id, mode='r', encode_chunk=chunk_enc, decode_chunk=chunk_dec)
+            f.append_chunks_from(src_file)
+            src_file.close()
+        f.close()
+        self.assertEqual(f.total_chunks(), 3)
+        self.assertEqual(f.file_size(), 1024+100+1024)
+        self.assertEqual(f.size_on_disk(), f1.size_on_disk() + f2.size_on_disk())
+
+        # The chunks are linked, they outlive the source files.
+        File('test_file', file_id=f1.file_id(), mode='r').remove()
+        File('test_file', file_id=f2.file_id(), mode='r').remove()
+        f3 = File('test_file', file_id=f.file_id(), mode='r', encode_chunk=chunk_enc, decode_chunk=chunk_dec)
+        self.assertEqual(f3.read(), chunk1 + chunk2 + chunk3)
+        f3.seek(1024+50)
+        self.assertEqual(f3.read(100), chunk2[50:] + chunk3[:50])
+        f3.close()
+
+        f4 = File('test_file', mode='w')
+        f4.write(b'abc')
+        with self.assertRaises(FileError):
+            f4.append_chunks_from(f3)
+        f4.close()
+
+    def test_append_chunk_stream(self):
+        chunk1 = random.randbytes(1000)
+        chunk2 = random.randbytes(100)
+
+        f = File('test_file', mode='w')
+        # Streamed through a buffer smaller than the chunk.
+        self.assertEqual(f.append_chunk_stream(io.BytesIO(chunk1), len(chunk1), buffer_size=64), hashlib.sha256(chunk1).digest())
+
+        # Bad and truncated chunks aren't appended.
+        with self.assertRaises(FileError) as e:
+            f.append_chunk_stream(io.BytesIO(chunk2), len(chunk2), checksum=hashlib.sha256(chunk1).digest())
+        self.assertEqual(e.exception.error_code(), FileServerErrorCode.FILE_CHUNK_CHECKSUM_MISMATCH)
+        with self.assertRaises(FileError) as e:
+            f.append_chunk_stream(io.BytesIO(chunk2[:50]), len(chunk2))
+        self.assertEqual(e.exception.error_code(), FileServerErrorCode.IO_ERROR)
+        self.assertEqual(f.total_chunks(), 1)
+
+        f.append_chunk_stream(io.BytesIO(chunk2), len(chunk2), checksum=hashlib.sha256(chunk2).digest())
+        f.close()
+        self.assertEqual(f.file_size(), len(chunk1)+len(chunk2))
+
+        f2 = File('test_file', file_id=f.file_id(), mode='r')
+        self.assertEqual(f2.read_chunk(), chunk1)
+        self.assertEqual(f2.read_chunk(), chunk2)
+        self.assertEqual(f2.read_chunk(), b'')
+        f2.close()
+
+        # Encoded chunks are read whole.
+        key = os.urandom(16)
+        chunk_enc = get_encrypted_chunk_encoder(get_encryptor_factory('aes-128-cbc', key))
+        chunk_dec = get_encrypted_chunk_decoder(get_decryptor_factory('aes-128-cbc', key))
+        f3 = File('test_file', mode='w', encode_chunk=chunk_enc, decode_chunk=chunk_dec)
+        f3.append_chunk_stream(io.BytesIO(chunk1), len(chunk1), checksum=hashlib.sha256(chunk1).digest())
+        f3.close()
+        f4 = File('test_file', file_id=f3.file_id(), mode='r', encode_chunk=chunk_enc, decode_chunk=chunk_dec)
+        self.assertEqual(f4.read_chunk(), chunk1)
+        f4.close()
+
+    def test_send_chunk(self):
+        chunk1 = random.randbytes(1024)
+        chunk2 = random.randbytes(100)
+
+        f = File('test_file', mode='w')
+        f.append_chunk(chunk1)
+        f.append_chunk(chunk2)
+        f.close()
+
+        s1, s2 = socket.socketpair()
+        try:
+            f2 = File('test_file', file_id=f.file_id(), mode='r')
+            self.assertTrue(f2.can_sendfile())
+            self.assertEqual(f2.next_chunk_length(), len(chunk1))
+            self.assertEqual(f2.send_chunk(s1), len(chunk1))
+            self.assertEqual(f2.read_chunk(), chunk2)
+            self.assertEqual(f2.next_chunk_length(), 0)
+            self.assertEqual(f2.send_chunk(s1), 0)
+            f2.seek_chunk(1)
+            self.assertEqual(f2.send_chunk(s1), len(chunk2))
+            f2.close()
+            s1.close()
+
+            data = b''
+            while True:
+                buf = s2.recv(4096)
+                if len(buf) == 0:
+                    break
+                data += buf
+            self.assertEqual(data, chunk1 + chunk2)
+        finally:
+            s1.close()
+            s2.close()
+
+        key = os.urandom(16)
+        chunk_enc = get_encrypted_chunk_encoder(get_encryptor_factory('aes-128-cbc', key))
+        chunk_dec = get_encrypted_chunk_decoder(get_decryptor_factory('aes-128-cbc', key))
+        f3 = File('test_file', mode='w', encode_chunk=chunk_enc, decode_chunk=chunk_dec)
+        f3.append_chunk(chunk1)
+        f3.close()
+        f4 = File('test_file', file_id=f3.file_id(), mode='r', encode_chunk=chunk_enc, decode_chunk=chunk_dec)
+        self.assertFalse(f4.can_sendfile())
+        try:
+            f4.send_chunk(None)
+            self.fail('Expected file error')
+        except FileError:
+            pass
+        f4.close()
@@ -356,3 +356,90 @@ class TestFileCache(unittest.TestCase):
             self.assertTrue(writer_ok.is_set())
             self.cache.remove_file_by_id(file_id)
         
+
+    def test_shared_store(self):
+        # Two stores sharing a directory stand in for two processes.
+        cache_config = {
+            'store-path': 'test_file_cache',
+        }
+        cache_1 = FileCache(cache_config, shared=True)
+        cache_2 = FileCache(cache_config, shared=True)
+
+        f1_id = File.generate_file_id()
+        cache_1.create_empty_file(f1_id, 100, removable=True)
+        # Space used is shared by the stores.
+        self.assertEqual(cache_1.cache_used(), 100)
+        self.assertEqual(cache_2.cache_used(), 100)
+        self.assertTrue(cache_2.has_file(f1_id))
+        self.assertEqual(cache_2.files(), [f1_id])
+        with self.assertRaises(FileCacheError) as ctx:
+            cache_2.create_empty_file(f1_id, 100)
+        self.assertEqual(ctx.exception.error_code(), FileServerErrorCode.FILE_EXISTS)
+        # The file created by the other store is still there.
+        self.assertTrue(cache_1.has_file(f1_id))
+        self.assertEqual(cache_2.cache_used(), 100)
+
+        # Appends see the chunks appended through the other store.
+        chunk1 = random.randbytes(100)
+        chunk2 = random.randbytes(50)
+        f1 = cache_2.append_file(f1_id)
+        f1.append_chunk(chunk1)
+        # One writer across stores.
+        with self.assertRaises(FileCacheError):
+            cache_1.append_file(f1_id)
+        cache_2.close_file(f1, writable=True)
+        f1 = cache_1.append_file(f1_id)
+        self.assertEqual(f1.total_chunks(), 1)
+        f1.append_chunk(chunk2)
+        cache_1.close_file(f1, writable=False)
+        f1_size = cache_1.file_metadata(f1_id).size_on_disk
+        self.assertTrue(f1_size >= 150)
+        self.assertEqual(cache_2.cache_used(), f1_size)
+
+        f2 = cache_2.read_file(f1_id)
+        self.assertEqual(f2.read_chunk(), chunk1)
+        self.assertEqual(f2.read_chunk(), chunk2)
+        self.assertEqual(f2.read_chunk(), b'')
+        cache_2.close_file(f2)
+        self.assertEqual(cache_1.file_metadata(f1_id).file_chunks, 2)
+
+        # Files being read by the other store can't be removed.
+        f2 = cache_2.read_file(f1_id)
+        with self.assertRaises(FileCacheError) as ctx:
+            cache_1.remove_file_by_id(f1_id)
+        self.assertEqual(ctx.exception.error_code(), FileServerErrorCode.FILE_NOT_REMOVABLE)
+        self.assertEqual(f2.read_chunk(), chunk1)
+        cache_2.close_file(f2)
+
+        cache_1.remove_file_by_id(f1_id)
+        self.assertFalse(cache_2.has_file(f1_id))
+        self.assertIsNone(cache_2.read_file(f1_id))
+        self.assertEqual(cache_2.cache_used(), 0)
+
+    def test_shared_store_size(self):
+        cache_config = {
+            'store-path': 'test_file_cache',
+            'store-size': '1KB'
+        }
+        cache_1 = FileCache(cache_config, shared=True)
+        cache_2 = FileCache(cache_config, shared=True)
+
+        # The store size applies to the stores together.
+        f1 = cache_1.write_file(alloc_space=600)
+        with self.assertRaises(FileCacheError) as ctx:
+            cache_2.write_file(alloc_space=600)
+        self.assertEqual(ctx.exception.error_code(), FileServerErrorCode.INSUFFICIENT_SPACE)
+        f2 = cache_2.write_file()
+        f2.append_chunk(random.randbytes(300))
+        with self.assertRaises(FileCacheError):
+            cache_1.write_file(alloc_space=200)
+        cache_2.close_file(f2)
+        cache_1.close_file(f1)
+        # Unused allocated space is freed once written.
+        self.assertEqual(cache_1.cache_used(), cache_1.file_metadata(f2.file_id()).size_on_disk)
+
+        # Space left allocated (ex. by a process that exited while writing)
+        # is dropped when the store is recounted.
+        cache_1.update_shared_used(500)
+        cache_1.recount_shared_used()
+        self.assertEqual(cache_2.cache_used(), cache_1.file_metadata(f2.file_id()).size_on_disk)
@@ -1,18 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
+import json
 import os
 import random
 import requests
 import shutil
+import signal
+import socket
 import urllib
 import uuid
+from .local.file_transfer_status import FileTransferStatus
 from .local_server import LocalServer
+from .prefork import PreforkServer
 from .remote_server import RemoteServer
 from .session import Sessions
+import sqlite3
 import time
 from .test_server import TestServer, HOSTNAME, PORT, URL
 
 REMOTE_PORT = 9090
 REMOTE_URL = "http://{}:{}{{}}".format(HOSTNAME, REMOTE_PORT)
+REPLICA_PORT = REMOTE_PORT+1
+REPLICA_URL = "http://{}:{}{{}}".format(HOSTNAME, REPLICA_PORT)
 
 class TestLocalServer(TestServer):
     
@@ -157,6 +166,34 @@ class TestLocalServer(TestServer):
         
         return True
     
+    def get_remote_file_chunks(self, remote_file_id: str, headers: dict) -> int:
+        r = self.send_request(REMOTE_URL.format('/1/file/{}/metadata'.format(remote_file_id)), headers=headers)
+        return r['file-chunks']
+
+    def interrupt_remote_upload(self, file_data: bytes, req_headers: dict, remote_req_headers: dict, min_chunks: int=2):
+        '''
+            Upload file_data and stop the server once the remote server has
+            acknowledged min_chunks chunks. Expects the upload bandwidth to be
+            limited so the remote upload is still running at that point.
+            Returns the remote file id and the remote chunk count at stop.
+        '''
+        # The upload is kept and continues in the background.
+        r = self.send_request(URL.format('/1/upload/file_1'), data=file_data, headers=req_headers, method=requests.post)
+        self.assertEqual(r.status_code, HTTPStatus.INTERNAL_SERVER_ERROR)
+
+        remote_file_id = None
+        def remote_file_started(timeout: float) -> bool:
+            nonlocal remote_file_id
+            r = self.send_request(URL.format('/1/file/file_1'), headers=req_headers)
+            remote_file_id = r['versions'][0]['remote-file-id']
+            return remote_file_id is not None and self.get_remote_file_chunks(remote_file_id, remote_req_headers) >= min_chunks
+        self.assertTrue(self.wait_for(remote_file_started, timeout=30))
+
+        self.stop_server()
+        remote_chunks = self.get_remote_file_chunks(remote_file_id, remote_req_headers)
+        self.assertLess(remote_chunks, len(file_data) // (1024*1024))
+        return remote_file_id, remote_chunks
+
     def send_login(self):
         r = requests.post(URL.format('/1/login'), auth=('psadmin', 'psadmin'))
         self.assertEqual(r.status_code, HTTPStatus.OK)
@@ -255,6 +292,193 @@ class TestLocalServer(TestServer):
         r = self.send_request(URL.format('/1/directory/{}/bar'.format(quoted_dir)), req_headers)
         self.assertEqual(r, [])
 
+    def test_list_directory_pages(self):
+        self.start_server()
+
+        session_id = self.send_login()
+        req_headers = {
+            'x-privastore-session-id': session_id
+        }
+
+        r = self.send_request(URL.format('/1/directory/dir_1'), req_headers, method=requests.put)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        entries = []
+        for i in range(25):
+            name = 'entry_{:02d}'.format(i)
+            if i % 3 == 0:
+                r = self.send_request(URL.format('/1/directory/dir_1/{}'.format(name)), req_headers, method=requests.put)
+                entries.append(['d', name])
+            else:
+                r = self.send_request(URL.format('/1/upload/dir_1/{}'.format(name)), req_headers, data=name.encode('utf-8'), method=requests.post)
+                entries.append(['f', name])
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+
+        pages = []
+        after = None
+        while True:
+            url = '/1/directory/dir_1?limit=10'
+            if after is not None:
+                url += '&after={}'.format(urllib.parse.quote(after))
+            r = self.send_request(URL.format(url), req_headers)
+            pages.append(r['entries'])
+            after = r['next']
+            if after is None:
+                break
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), entries)
+        r = self.send_request(URL.format('/1/directory/dir_1?after=entry_20'), req_headers)
+        self.assertEqual(r, {'entries': entries[21:], 'next': None})
+        r = self.send_request(URL.format('/1/directory/dir_1?limit=0'), req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.BAD_REQUEST)
+        r = self.send_request(URL.format('/1/directory/dir_1?format=xml'), req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.BAD_REQUEST)
+
+        # Streamed listings.
+        with requests.Session() as s:
+            r = s.get(URL.format('/1/directory/dir_1?format=jsonl'), headers=req_headers, stream=True)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            self.assertEqual(r.headers['Content-Type'], 'application/x-ndjson')
+            self.assertEqual(r.headers['Transfer-Encoding'], 'chunked')
+            self.assertEqual([json.loads(line) for line in r.iter_lines()], entries)
+            r = s.get(URL.format('/1/directory/dir_1?format=jsonl&after=entry_04&limit=3'), headers=req_headers)
+            self.assertEqual([json.loads(line) for line in r.iter_lines()], entries[5:8])
+            r = s.get(URL.format('/1/directory/dir_2?format=jsonl'), headers=req_headers)
+            self.assertEqual(r.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_response_compression(self):
+        self.start_server()
+
+        session_id = self.send_login()
+        req_headers = {
+            'x-privastore-session-id': session_id
+        }
+
+        def accept(encoding):
+            return dict(req_headers, **{'Accept-Encoding': encoding})
+
+        r = self.send_request(URL.format('/1/directory/dir_1'), req_headers, method=requests.put)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        entries = []
+        for i in range(100):
+            name = 'directory_entry_{:03d}'.format(i)
+            r = self.send_request(URL.format('/1/directory/dir_1/{}'.format(name)), req_headers, method=requests.put)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            entries.append(['d', name])
+        file_1 = random.randbytes(10*1024)
+        r = self.send_request(URL.format('/1/upload/file_1'), req_headers, data=file_1, method=requests.post)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+
+        r = requests.get(URL.format('/1/directory/dir_1'), headers=accept('gzip'))
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(r.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(r.headers['Vary'], 'Accept-Encoding')
+        self.assertTrue(int(r.headers['Content-Length']) < len(json.dumps(entries)))
+        self.assertEqual(r.json(), entries)
+        etag = r.headers['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        r = requests.get(URL.format('/1/directory/dir_1'), headers=dict(accept('gzip'), **{'If-None-Match': etag}))
+        self.assertEqual(r.status_code, HTTPStatus.NOT_MODIFIED)
+        r = requests.get(URL.format('/1/directory/dir_1'), headers=accept('gzip;q=0.5, deflate'))
+        self.assertEqual(r.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(r.json(), entries)
+        for encoding in ['identity', 'gzip;q=0, deflate;q=0', 'br']:
+            r = requests.get(URL.format('/1/directory/dir_1'), headers=accept(encoding))
+            self.assertNotIn('Content-Encoding', r.headers)
+            self.assertEqual(r.headers['ETag'], etag[2:])
+            self.assertEqual(r.json(), entries)
+        r = requests.get(URL.format('/1/directory/dir_1?limit=50'), headers=accept('*'))
+        self.assertEqual(r.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(r.json()['entries'], entries[:50])
+        # Small responses aren't compressed.
+        r = requests.get(URL.format('/1/directory/dir_1?limit=2'), headers=accept('gzip'))
+        self.assertNotIn('Content-Encoding', r.headers)
+        self.assertEqual(r.json()['entries'], entries[:2])
+        # Streamed listings.
+        r = requests.get(URL.format('/1/directory/dir_1?format=jsonl'), headers=accept('gzip'), stream=True)
+        self.assertEqual(r.headers['Content-Encoding'], 'gzip')
+        self.assertEqual([json.loads(line) for line in r.iter_lines()], entries)
+        # File data is never compressed.
+        r = requests.get(URL.format('/1/download/file_1'), headers=accept('gzip'))
+        self.assertNotIn('Content-Encoding', r.headers)
+        self.assertEqual(r.content, file_1)
+
+    def test_bandwidth_limit(self):
+        self.config['remote']['upload-bandwidth-limit'] = '1MB'
+        self.config['remote']['upload-bandwidth-burst'] = '4MB'
+        self.start_server()
+        req_headers = {
+            'x-privastore-session-id': self.send_login()
+        }
+
+        def upload_metrics():
+            r = self.send_request(URL.format('/1/metrics'), headers=req_headers)
+            return r['bandwidth']['upload']
+
+        r = upload_metrics()
+        self.assertEqual(r['current-limit'], 1024*1024)
+        self.assertEqual(r['burst'], 4*1024*1024)
+
+        # Changing the limit keeps the configured burst size.
+        r = requests.put(URL.format('/1/bandwidth?direction=upload&limit=2MB'), headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        r = upload_metrics()
+        self.assertEqual(r['current-limit'], 2*1024*1024)
+        self.assertEqual(r['burst'], 4*1024*1024)
+
+        # And the other way around.
+        r = requests.put(URL.format('/1/bandwidth?direction=upload&burst=8MB'), headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        r = upload_metrics()
+        self.assertEqual(r['current-limit'], 2*1024*1024)
+        self.assertEqual(r['burst'], 8*1024*1024)
+
+        r = requests.put(URL.format('/1/bandwidth?direction=upload&burst=lots'), headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_admission_control(self):
+        self.get_config()['store'].update({
+            'max-client-transfers': '1',
+            'admission-queue-size': '0',
+            'admission-retry-after': '3'
+        })
+        self.start_server()
+
+        session_id = self.send_login()
+        req_headers = {
+            'x-privastore-session-id': session_id
+        }
+
+        file_1 = random.randbytes(10*1024)
+        r = self.send_request(URL.format('/1/upload/file_1'), req_headers, data=file_1, method=requests.post)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+
+        # Take the only transfer slot.
+        admission = self.server.controller().admission_control().admit()
+        try:
+            r = self.send_request(URL.format('/1/upload/file_2'), req_headers, data=file_1, method=requests.post)
+            self.assertEqual(r.status_code, HTTPStatus.SERVICE_UNAVAILABLE)
+            self.assertEqual(r.headers['Retry-After'], '3')
+            r = requests.get(URL.format('/1/download/file_1'), headers=req_headers)
+            self.assertEqual(r.status_code, HTTPStatus.SERVICE_UNAVAILABLE)
+            self.assertEqual(r.headers['Retry-After'], '3')
+            # Requests that don't transfer file data aren't held back.
+            r = self.send_request(URL.format('/1/file/file_1'), req_headers, method=requests.get)
+            self.assertEqual(r['versions'][0]['file-size'], len(file_1))
+        finally:
+            admission.release()
+
+        r = self.send_request(URL.format('/1/upload/file_2'), req_headers, data=file_1, method=requests.post)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        r = requests.get(URL.format('/1/download/file_2'), headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(r.content, file_1)
+
+        r = self.send_request(URL.format('/1/metrics'), req_headers, method=requests.get)
+        metrics = r['admission']
+        self.assertEqual(metrics['transfers'], 0)
+        self.assertEqual(metrics['admitted'], 4)
+        self.assertEqual(metrics['rejected'], 2)
+
     def test_file_api(self):
         self.enable_remote()
         self.start_server()
@@ -338,7 +562,16 @@ class TestLocalServer(TestServer):
         self.assertEqual(r['versions'][0]['total-chunks'], 5)
         file_3_id = r['versions'][0]['local-file-id']
         file_3_remote_id = r['versions'][0]['remote-file-id']
-        self.assertTrue(self.wait_for(self.check_file_synced, args=['/file_3', req_headers]))
+        # Synced uploads wait for the commit.
+        self.assertTrue(self.check_file_synced('/file_3', req_headers))
+        r = self.send_request(URL.format('/1/progress/file_3'), headers=req_headers, method=requests.get)
+        self.assertEqual(r['local-file-id'], file_3_id)
+        self.assertEqual(r['total-chunks'], 5)
+        self.assertEqual(r['remote-transfer-status'], 'SYNCED_DATA')
+        self.assertEqual(r['upload'], {'transferred-chunks': 5, 'in-progress': False})
+        self.assertEqual(r['download']['in-progress'], False)
+        r = self.send_request(URL.format('/1/progress/file_4'), headers=req_headers, method=requests.get)
+        self.assertEqual(r.status_code, HTTPStatus.NOT_FOUND)
         self.assertTrue(self.check_file_remote(file_3_remote_id, file_3_size, headers=remote_req_headers))
         r = self.send_request(URL.format('/1/upload/dir_1/file_1'), data=small_file, headers=req_headers, method=requests.post)
         self.assertEqual(r.status_code, HTTPStatus.OK)
@@ -436,4 +669,622 @@ class TestLocalServer(TestServer):
         self.assertEqual(r.status_code, HTTPStatus.NOT_FOUND)
         r = self.send_request(URL.format('/1/download/dir_1/dir_1a/file_1'), headers=req_headers, method=requests.get)
         self.assertEqual(r.status_code, HTTPStatus.OK)
-        self.assertEqual(r.content, small_file)
\ No newline at end of file
+        self.assertEqual(r.content, small_file)
+
+    def test_chunked_upload(self):
+        self.enable_remote()
+        self.start_server()
+        self.start_remote_server()
+
+        session_id = self.send_login()
+        req_headers = {
+            'x-privastore-session-id': session_id,
+            'Content-Type': 'application/octet-stream'
+        }
+
+        remote_session_id = self.send_remote_login()
+        remote_req_headers = {
+            'x-privastore-session-id': remote_session_id
+        }
+
+        def stream(data, piece_size):
+            for i in range(0, len(data), piece_size):
+                yield data[i:i+piece_size]
+
+        large_file = random.randbytes(3*1024*1024+100)
+        small_file = random.randbytes(500*1024)
+
+        with requests.Session() as s:
+            # Generators are sent with Transfer-Encoding: chunked.
+            r = s.post(URL.format('/1/upload/file_1'), data=stream(large_file, 100*1000), headers=req_headers)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            r = s.post(URL.format('/1/upload/file_2'), data=stream(small_file, 4096), headers=req_headers)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            r = s.post(URL.format('/1/upload/file_3'), data=stream(b'', 4096), headers=req_headers)
+            self.assertEqual(r.status_code, HTTPStatus.BAD_REQUEST)
+            r = s.get(URL.format('/1/download/file_2'), headers=req_headers)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            self.assertEqual(r.content, small_file)
+
+        r = self.send_request(URL.format('/1/file/file_1'), headers=req_headers, method=requests.get)
+        self.assertEqual(r['versions'][0]['file-size'], len(large_file))
+        self.assertEqual(r['versions'][0]['total-chunks'], 4)
+        file_1_size = r['versions'][0]['size-on-disk']
+        self.assertTrue(file_1_size >= len(large_file))
+        self.assertTrue(self.check_file_synced('/file_1', req_headers))
+        r = self.send_request(URL.format('/1/file/file_1'), headers=req_headers, method=requests.get)
+        self.assertTrue(self.check_file_remote(r['versions'][0]['remote-file-id'], file_1_size, headers=remote_req_headers))
+        r = self.send_request(URL.format('/1/file/file_3'), headers=req_headers, method=requests.get)
+        self.assertEqual(r.status_code, HTTPStatus.NOT_FOUND)
+
+        self.stop_server()
+        # Clear the cache to force downloads from the remote server.
+        shutil.rmtree(os.path.join(self.get_test_dir(), 'cache'))
+        self.restart_server()
+
+        session_id = self.send_login()
+        req_headers = {
+            'x-privastore-session-id': session_id
+        }
+
+        r = self.send_request(URL.format('/1/download/file_1'), headers=req_headers, method=requests.get)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(r.content, large_file)
+
+    def test_multipart_upload(self):
+        self.config['store']['multipart-upload-expiry-time'] = '2'
+        self.config['store']['multipart-upload-cleanup-interval'] = '1'
+        self.start_server()
+
+        session_id = self.send_login()
+        req_headers = {
+            'x-privastore-session-id': session_id
+        }
+        store = self.server.store()
+        num_files = len(store.files())
+        cache_used = store.cache_used()
+
+        r = self.send_request(URL.format('/1/multipart/file_1'), headers=req_headers, method=requests.post)
+        upload_id = r['upload-id']
+        r = self.send_request(URL.format('/1/uploads/{}'.format(upload_id)), headers=req_headers, method=requests.get)
+        self.assertEqual(r['path'], '/file_1')
+        self.assertEqual(r['parts'], [])
+
+        parts = [random.randbytes(1024*1024), random.randbytes(1024*1024+10), random.randbytes(1000)]
+
+        def upload_part(part_num):
+            return requests.put(URL.format('/1/uploads/{}/{}'.format(upload_id, part_num)), headers=req_headers, data=parts[part_num-1]).status_code
+
+        # Parts in parallel, in any order.
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            self.assertEqual(list(executor.map(upload_part, [3, 1, 2])), [HTTPStatus.OK]*3)
+        r = self.send_request(URL.format('/1/uploads/{}'.format(upload_id)), headers=req_headers, method=requests.get)
+        self.assertEqual(r['parts'], [{'part': i+1, 'size': len(part)} for i, part in enumerate(parts)])
+
+        # Parts uploaded again replace the earlier ones.
+        parts[1] = random.randbytes(5000)
+        self.assertEqual(upload_part(2), HTTPStatus.OK)
+        r = self.send_request(URL.format('/1/uploads/{}'.format(upload_id)), headers=req_headers, method=requests.get)
+        self.assertEqual(r['parts'][1], {'part': 2, 'size': 5000})
+        self.assertEqual(len(store.files()), num_files + 3)
+
+        r = self.send_request(URL.format('/1/uploads/{}/0'.format(upload_id)), headers=req_headers, data=b'abc', method=requests.put)
+        self.assertEqual(r.status_code, HTTPStatus.BAD_REQUEST)
+        r = self.send_request(URL.format('/1/uploads/U-{}/1'.format(str(uuid.uuid4()))), headers=req_headers, data=b'abc', method=requests.put)
+        self.assertEqual(r.status_code, HTTPStatus.NOT_FOUND)
+
+        admitted = self.send_request(URL.format('/1/metrics'), headers=req_headers)['admission']['admitted']
+        r = self.send_request(URL.format('/1/uploads/{}'.format(upload_id)), headers=req_headers, method=requests.post)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        # The staged parts aren't admitted again.
+        self.assertEqual(self.send_request(URL.format('/1/metrics'), headers=req_headers)['admission']['admitted'], admitted)
+        r = self.send_request(URL.format('/1/uploads/{}'.format(upload_id)), headers=req_headers, method=requests.get)
+        self.assertEqual(r.status_code, HTTPStatus.NOT_FOUND)
+        r = self.send_request(URL.format('/1/download/file_1'), headers=req_headers, method=requests.get)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(r.content, b''.join(parts))
+        # Only the file is left in the store.
+        self.assertEqual(len(store.files()), num_files + 1)
+
+        # Missing parts.
+        r = self.send_request(URL.format('/1/multipart/file_2'), headers=req_headers, method=requests.post)
+        upload_id = r['upload-id']
+        self.assertEqual(upload_part(2), HTTPStatus.OK)
+        r = self.send_request(URL.format('/1/uploads/{}'.format(upload_id)), headers=req_headers, method=requests.post)
+        self.assertEqual(r.status_code, HTTPStatus.CONFLICT)
+        r = self.send_request(URL.format('/1/uploads/{}'.format(upload_id)), headers=req_headers, method=requests.delete)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        r = self.send_request(URL.format('/1/uploads/{}'.format(upload_id)), headers=req_headers, method=requests.get)
+        self.assertEqual(r.status_code, HTTPStatus.NOT_FOUND)
+        self.assertEqual(len(store.files()), num_files + 1)
+
+        # Abandoned uploads expire, their parts are removed.
+        r = self.send_request(URL.format('/1/multipart/file_3'), headers=req_headers, method=requests.post)
+        upload_id = r['upload-id']
+        self.assertEqual(upload_part(1), HTTPStatus.OK)
+        self.assertEqual(len(store.files()), num_files + 2)
+        self.assertTrue(self.wait_for(lambda timeout: self.server.upload_mgr().num_uploads() == 0, timeout=10))
+        self.assertEqual(len(store.files()), num_files + 1)
+        r = self.send_request(URL.format('/1/file/file_3'), headers=req_headers, method=requests.get)
+        self.assertEqual(r.status_code, HTTPStatus.NOT_FOUND)
+        r = self.send_request(URL.format('/1/file/file_1'), headers=req_headers, method=requests.get)
+        self.assertEqual(store.cache_used(), cache_used + r['versions'][0]['size-on-disk'])
+
+    def test_prefork_server(self):
+        self.enable_remote()
+        self.start_remote_server()
+        self.server_factory().setup_db()
+        self.server = PreforkServer(self.server_factory, 2)
+        self.server.start()
+        self.server.wait_started()
+        self.assertEqual(len(self.server.worker_pids()), 2)
+
+        # Every request is on a new connection, the workers share sessions,
+        # multipart uploads and files. Each runs its own transfers.
+        def send_request(url, method=requests.get, headers={}, data=None):
+            return method(URL.format(url), headers=dict(headers, Connection='close'), data=data)
+
+        def login():
+            r = requests.post(URL.format('/1/login'), auth=('psadmin', 'psadmin'), headers={'Connection': 'close'})
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            return {
+                'x-privastore-session-id': r.headers.get('x-privastore-session-id'),
+                'Content-Type': 'application/octet-stream'
+            }
+
+        req_headers = login()
+        files = {'file_{}'.format(i): random.randbytes(300*1024) for i in range(4)}
+        for file_name, file_data in files.items():
+            r = send_request('/1/upload/{}'.format(file_name), method=requests.post, headers=req_headers, data=file_data)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+
+        r = send_request('/1/multipart/file_mp', method=requests.post, headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        upload_id = r.json()['upload-id']
+        parts = [random.randbytes(1024*1024), random.randbytes(1000), random.randbytes(5000)]
+        for i, part in enumerate(parts):
+            r = send_request('/1/uploads/{}/{}'.format(upload_id, i+1), method=requests.put, headers=req_headers, data=part)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+        r = send_request('/1/uploads/{}'.format(upload_id), headers=req_headers)
+        self.assertEqual(r.json()['parts'], [{'part': i+1, 'size': len(part)} for i, part in enumerate(parts)])
+        r = send_request('/1/uploads/{}'.format(upload_id), method=requests.post, headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        files['file_mp'] = b''.join(parts)
+
+        for file_name, file_data in files.items():
+            self.assertTrue(self.wait_for(self.check_file_synced, args=['/{}'.format(file_name), req_headers]))
+            r = send_request('/1/download/{}'.format(file_name), headers=req_headers)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            self.assertEqual(r.content, file_data)
+
+        # Workers that die are restarted.
+        pid = self.server.worker_pids()[0]
+        os.kill(pid, signal.SIGKILL)
+        self.assertTrue(self.wait_for(lambda timeout: len(self.server.worker_pids()) == 2 and pid not in self.server.worker_pids(), timeout=10))
+        for file_name, file_data in files.items():
+            r = send_request('/1/download/{}'.format(file_name), headers=req_headers)
+            self.assertEqual(r.content, file_data)
+
+        self.stop_server()
+        # Clear the cache to force downloads from the remote server.
+        shutil.rmtree(os.path.join(self.get_test_dir(), 'cache'))
+        self.server = PreforkServer(self.server_factory, 2)
+        self.server.start()
+        self.server.wait_started()
+
+        # Readers on other workers wait for the file to be downloaded.
+        req_headers = login()
+        def download(file_name):
+            return send_request('/1/download/{}'.format(file_name), headers=req_headers).content
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            file_names = [file_name for file_name in files for _ in range(3)]
+            self.assertEqual(list(executor.map(download, file_names)), [files[file_name] for file_name in file_names])
+
+    def test_conditional_requests(self):
+        self.start_server()
+
+        session_id = self.send_login()
+        req_headers = {
+            'x-privastore-session-id': session_id
+        }
+
+        def conditional(headers):
+            return dict(req_headers, **headers)
+
+        file_1 = random.randbytes(100*1024)
+        r = self.send_request(URL.format('/1/directory/dir_1'), headers=req_headers, method=requests.put)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        r = self.send_request(URL.format('/1/upload/dir_1/file_1'), headers=req_headers, data=file_1, method=requests.post)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+
+        # Downloads.
+        r = requests.get(URL.format('/1/download/dir_1/file_1'), headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(r.content, file_1)
+        etag = r.headers['ETag']
+        last_modified = r.headers['Last-Modified']
+        self.assertEqual(r.headers['Cache-Control'], 'private, no-cache')
+        r = requests.get(URL.format('/1/download/dir_1/file_1'), headers=conditional({'If-None-Match': etag}))
+        self.assertEqual(r.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(r.content, b'')
+        self.assertEqual(r.headers['ETag'], etag)
+        r = requests.get(URL.format('/1/download/dir_1/file_1'), headers=conditional({'If-None-Match': 'W/"x", W/{}'.format(etag)}))
+        self.assertEqual(r.status_code, HTTPStatus.NOT_MODIFIED)
+        r = requests.get(URL.format('/1/download/dir_1/file_1'), headers=conditional({'If-Modified-Since': last_modified}))
+        self.assertEqual(r.status_code, HTTPStatus.NOT_MODIFIED)
+        # If-None-Match takes precedence.
+        r = requests.get(URL.format('/1/download/dir_1/file_1'), headers=conditional({'If-None-Match': '"x"', 'If-Modified-Since': last_modified}))
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(r.content, file_1)
+        r = requests.get(URL.format('/1/download/dir_1/file_1'), headers=conditional({'If-Modified-Since': 'Thu, 01 Jan 1970 00:00:00 GMT'}))
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(r.content, file_1)
+
+        # Metadata.
+        r = requests.get(URL.format('/1/file/dir_1/file_1'), headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        r = requests.get(URL.format('/1/file/dir_1/file_1'), headers=conditional({'If-None-Match': r.headers['ETag']}))
+        self.assertEqual(r.status_code, HTTPStatus.NOT_MODIFIED)
+
+        # Listings.
+        r = requests.get(URL.format('/1/directory/dir_1'), headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        etag = r.headers['ETag']
+        r = requests.get(URL.format('/1/directory/dir_1'), headers=conditional({'If-None-Match': etag}))
+        self.assertEqual(r.status_code, HTTPStatus.NOT_MODIFIED)
+        r = self.send_request(URL.format('/1/upload/dir_1/file_2'), headers=req_headers, data=b'abc', method=requests.post)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        r = requests.get(URL.format('/1/directory/dir_1'), headers=conditional({'If-None-Match': etag}))
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(len(r.json()), 2)
+        self.assertNotEqual(r.headers['ETag'], etag)
+        etag = r.headers['ETag']
+        r = self.send_request(URL.format('/1/directory/dir_1/dir_2'), headers=req_headers, method=requests.put)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        r = requests.get(URL.format('/1/directory/dir_1'), headers=conditional({'If-None-Match': etag}))
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(len(r.json()), 3)
+
+    def enable_throttled_remote(self):
+        self.enable_remote()
+        # About one chunk per second, sent one at a time.
+        self.config['remote']['upload-bandwidth-limit'] = '1MB'
+        self.config['remote']['transfer-batch-chunks'] = '1'
+        self.config['remote']['sync-upload-timeout'] = '0.1'
+
+    def test_resume_remote_upload(self):
+        self.enable_throttled_remote()
+        self.start_server()
+        self.start_remote_server()
+
+        req_headers = {
+            'x-privastore-session-id': self.send_login(),
+            'Content-Type': 'application/octet-stream'
+        }
+        remote_req_headers = {
+            'x-privastore-session-id': self.send_remote_login()
+        }
+
+        file_data = random.randbytes(8*1024*1024)
+        remote_file_id, remote_chunks = self.interrupt_remote_upload(file_data, req_headers, remote_req_headers)
+
+        self.restart_server()
+        req_headers = {
+            'x-privastore-session-id': self.send_login()
+        }
+        self.assertTrue(self.wait_for(self.check_file_synced, args=['/file_1', req_headers]))
+
+        # The upload carried on into the same remote file.
+        r = self.send_request(URL.format('/1/file/file_1'), headers=req_headers)
+        self.assertEqual(r['versions'][0]['remote-file-id'], remote_file_id)
+        total_chunks = r['versions'][0]['total-chunks']
+        self.assertEqual(self.get_remote_file_chunks(remote_file_id, remote_req_headers), total_chunks)
+
+        # Only the chunks the remote server didn't have were sent again.
+        r = self.send_request(URL.format('/1/metrics'), headers=req_headers)
+        self.assertLess(r['bandwidth']['upload']['bytes'], len(file_data) - (remote_chunks-1)*1024*1024)
+
+        r = self.send_request(URL.format('/1/download/file_1'), headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(r.content, file_data)
+
+    def test_resume_remote_upload_removed(self):
+        self.enable_throttled_remote()
+        self.start_server()
+        self.start_remote_server()
+
+        req_headers = {
+            'x-privastore-session-id': self.send_login(),
+            'Content-Type': 'application/octet-stream'
+        }
+        remote_req_headers = {
+            'x-privastore-session-id': self.send_remote_login()
+        }
+
+        file_data = random.randbytes(4*1024*1024)
+        remote_file_id, _ = self.interrupt_remote_upload(file_data, req_headers, remote_req_headers)
+        r = requests.delete(REMOTE_URL.format('/1/file/{}'.format(remote_file_id)), headers=dict(remote_req_headers, **{'x-privastore-epoch-no': '1'}))
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertTrue(self.check_file_remote(remote_file_id, None, remote_req_headers, check_removed=True))
+
+        # The upload starts over in a new remote file.
+        self.restart_server()
+        req_headers = {
+            'x-privastore-session-id': self.send_login()
+        }
+        self.assertTrue(self.wait_for(self.check_file_synced, args=['/file_1', req_headers]))
+        r = self.send_request(URL.format('/1/file/file_1'), headers=req_headers)
+        new_remote_file_id = r['versions'][0]['remote-file-id']
+        self.assertNotEqual(new_remote_file_id, remote_file_id)
+        self.assertTrue(self.check_file_remote(new_remote_file_id, r['versions'][0]['size-on-disk'], remote_req_headers))
+
+    def test_progress_wait(self):
+        self.enable_throttled_remote()
+        self.start_server()
+        self.start_remote_server()
+
+        req_headers = {
+            'x-privastore-session-id': self.send_login(),
+            'Content-Type': 'application/octet-stream'
+        }
+        r = self.send_request(URL.format('/1/upload/file_1'), data=random.randbytes(4*1024*1024), headers=req_headers, method=requests.post)
+        self.assertEqual(r.status_code, HTTPStatus.INTERNAL_SERVER_ERROR)
+
+        # Each response comes back as soon as the upload moves on.
+        transferred_chunks = []
+        for _ in range(20):
+            start_t = time.monotonic()
+            r = self.send_request(URL.format('/1/progress/file_1?wait=30'), headers=req_headers)
+            if not r['upload']['in-progress']:
+                break
+            self.assertLess(time.monotonic() - start_t, 10)
+            transferred_chunks.append(r['upload']['transferred-chunks'])
+        self.assertFalse(r['upload']['in-progress'])
+        self.assertEqual(r['upload']['transferred-chunks'], r['total-chunks'])
+        self.assertGreater(len(transferred_chunks), 1)
+        self.assertEqual(transferred_chunks, sorted(transferred_chunks))
+
+        # Nothing to wait for.
+        start_t = time.monotonic()
+        r = self.send_request(URL.format('/1/progress/file_1?wait=30'), headers=req_headers)
+        self.assertFalse(r['upload']['in-progress'])
+        self.assertLess(time.monotonic() - start_t, 10)
+
+        r = self.send_request(URL.format('/1/progress/file_1?wait=-1'), headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_file_api_asyncio_engine(self):
+        self.enable_remote()
+        self.config['remote']['transfer-engine'] = 'asyncio'
+        self.config['remote']['transfer-window'] = '2'
+        self.start_server()
+        self.start_remote_server()
+
+        session_id = self.send_login()
+        req_headers = {
+            'x-privastore-session-id': session_id,
+            'Content-Type': 'application/octet-stream'
+        }
+
+        remote_session_id = self.send_remote_login()
+        remote_req_headers = {
+            'x-privastore-session-id': remote_session_id
+        }
+
+        small_file = random.randbytes(500*1024)
+        large_file = random.randbytes(5*1024*1024)
+
+        r = self.send_request(URL.format('/1/upload/file_1'), data=small_file, headers=req_headers, method=requests.post)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        r = self.send_request(URL.format('/1/upload/file_2'), data=large_file, headers=req_headers, method=requests.post)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        r = self.send_request(URL.format('/1/file/file_2'), headers=req_headers, method=requests.get)
+        self.assertEqual(r['versions'][0]['total-chunks'], 5)
+        file_2_size = r['versions'][0]['size-on-disk']
+        self.assertTrue(self.wait_for(self.check_file_synced, args=['/file_1', req_headers]))
+        self.assertTrue(self.wait_for(self.check_file_synced, args=['/file_2', req_headers]))
+        r = self.send_request(URL.format('/1/file/file_2'), headers=req_headers, method=requests.get)
+        file_2_remote_id = r['versions'][0]['remote-file-id']
+        self.assertTrue(self.check_file_remote(file_2_remote_id, file_2_size, headers=remote_req_headers))
+
+        r = self.send_request(URL.format('/1/file/file_1'), headers=req_headers, method=requests.get)
+        file_1_remote_id = r['versions'][0]['remote-file-id']
+        file_1_size = r['versions'][0]['size-on-disk']
+        r = self.send_request(URL.format('/1/file/file_1'), headers=req_headers, method=requests.delete)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertTrue(self.wait_for(self.check_file_remote, args=[file_1_remote_id, file_1_size, remote_req_headers], kwargs={'check_removed':True}, timeout=1))
+
+        self.stop_server()
+        # Clear the cache to force downloads from the remote server.
+        shutil.rmtree(os.path.join(self.get_test_dir(), 'cache'))
+        self.restart_server()
+
+        session_id = self.send_login()
+        req_headers = {
+            'x-privastore-session-id': session_id
+        }
+
+        r = self.send_request(URL.format('/1/download/file_2'), headers=req_headers, method=requests.get)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(r.content, large_file)
+
+    def test_asyncio_engine_stop(self):
+        self.enable_remote()
+        self.config['remote']['transfer-engine'] = 'asyncio'
+        self.config['remote']['sync-upload-timeout'] = '1'
+        # Accept connections to the remote server but never reply.
+        remote_sock = socket.create_server((HOSTNAME, REMOTE_PORT))
+        try:
+            self.start_server()
+            session_id = self.send_login()
+            req_headers = {
+                'x-privastore-session-id': session_id,
+                'Content-Type': 'application/octet-stream'
+            }
+            # Times out waiting for the remote upload.
+            r = self.send_request(URL.format('/1/upload/file_1'), data=random.randbytes(1024), headers=req_headers, method=requests.post)
+            self.assertEqual(r.status_code, HTTPStatus.INTERNAL_SERVER_ERROR)
+
+            # Remote requests in flight are cancelled, not waited on.
+            start_t = time.monotonic()
+            self.stop_server()
+            self.assertLess(time.monotonic() - start_t, 10)
+        finally:
+            remote_sock.close()
+
+    def test_file_api_replication(self):
+        self.enable_remote()
+        self.config['remote']['replication-factor'] = '2'
+        self.server = self.server_factory()
+        self.server.setup_db()
+        conn = sqlite3.connect(self.config['db']['sqlite-db-path'])
+        try:
+            conn.execute("INSERT INTO ps_remote_server (hostname, port, cluster_id) VALUES (?, ?, 1)", (HOSTNAME, REPLICA_PORT))
+            conn.commit()
+        finally:
+            conn.close()
+        self.server.start()
+        self.server.wait_started()
+        self.start_remote_server()
+        replica_dir = os.path.join(self.get_test_dir(), 'replica')
+        os.mkdir(replica_dir)
+        replica_config = dict(self.get_remote_config())
+        replica_config['api'] = dict(replica_config['api'], **{'api-port': str(REPLICA_PORT)})
+        replica_config['store'] = dict(replica_config['store'], **{'store-path': os.path.join(replica_dir, 'cache')})
+        replica_config['db'] = dict(replica_config['db'], **{'sqlite-db-path': os.path.join(replica_dir, 'remote_server.db')})
+        replica_server = RemoteServer(replica_config)
+        replica_server.setup_db()
+        replica_server.start()
+        replica_server.wait_started()
+
+        try:
+            session_id = self.send_login()
+            req_headers = {
+                'x-privastore-session-id': session_id,
+                'Content-Type': 'application/octet-stream'
+            }
+            remote_req_headers = {
+                'x-privastore-session-id': self.send_remote_login()
+            }
+            r = requests.post(REPLICA_URL.format('/1/login'), auth=('psadmin', 'psadmin'))
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            replica_req_headers = {
+                'x-privastore-session-id': r.headers.get('x-privastore-session-id')
+            }
+
+            small_file = random.randbytes(500*1024)
+            large_file = random.randbytes(5*1024*1024)
+            r = self.send_request(URL.format('/1/upload/file_1'), data=small_file, headers=req_headers, method=requests.post)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            r = self.send_request(URL.format('/1/upload/file_2'), data=large_file, headers=req_headers, method=requests.post)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            self.assertTrue(self.wait_for(self.check_file_synced, args=['/file_1', req_headers]))
+            self.assertTrue(self.wait_for(self.check_file_synced, args=['/file_2', req_headers]))
+
+            # Both replicas hold the committed files under the same id.
+            r = self.send_request(URL.format('/1/file/file_1'), headers=req_headers, method=requests.get)
+            file_1_remote_id = r['versions'][0]['remote-file-id']
+            file_1_size = r['versions'][0]['size-on-disk']
+            r = self.send_request(URL.format('/1/file/file_2'), headers=req_headers, method=requests.get)
+            file_2_remote_id = r['versions'][0]['remote-file-id']
+            file_2_size = r['versions'][0]['size-on-disk']
+            for url, headers in [(REMOTE_URL, remote_req_headers), (REPLICA_URL, replica_req_headers)]:
+                r = self.send_request(url.format('/1/file/{}/metadata'.format(file_2_remote_id)), headers=headers)
+                self.assertEqual(r['file-size'], file_2_size)
+                self.assertTrue(r['is-committed'])
+
+            r = self.send_request(URL.format('/1/file/file_1'), headers=req_headers, method=requests.delete)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            self.assertTrue(self.wait_for(self.check_file_remote, args=[file_1_remote_id, file_1_size, remote_req_headers], kwargs={'check_removed':True}, timeout=5))
+            r = requests.get(REPLICA_URL.format('/1/file/{}/metadata'.format(file_1_remote_id)), headers=replica_req_headers)
+            self.assertEqual(r.status_code, HTTPStatus.NOT_FOUND)
+
+            # Reads are served by the remaining replica.
+            self.stop_server()
+            shutil.rmtree(os.path.join(self.get_test_dir(), 'cache'))
+            self.remote_server.stop()
+            self.remote_server.join()
+            self.remote_server = None
+            self.restart_server()
+
+            session_id = self.send_login()
+            r = self.send_request(URL.format('/1/download/file_2'), headers={'x-privastore-session-id': session_id}, method=requests.get)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            self.assertEqual(r.content, large_file)
+        finally:
+            replica_server.stop()
+            replica_server.join()
+
+    def test_file_api_erasure_coding(self):
+        self.enable_remote()
+        self.config['remote']['erasure-data-shards'] = '2'
+        self.config['remote']['erasure-parity-shards'] = '1'
+        self.server = self.server_factory()
+        self.server.setup_db()
+        conn = sqlite3.connect(self.config['db']['sqlite-db-path'])
+        try:
+            conn.execute("INSERT INTO ps_remote_server (hostname, port, cluster_id) VALUES (?, ?, 1)", (HOSTNAME, REPLICA_PORT))
+            conn.commit()
+        finally:
+            conn.close()
+        self.server.start()
+        self.server.wait_started()
+        self.start_remote_server()
+        replica_dir = os.path.join(self.get_test_dir(), 'replica')
+        os.mkdir(replica_dir)
+        replica_config = dict(self.get_remote_config())
+        replica_config['api'] = dict(replica_config['api'], **{'api-port': str(REPLICA_PORT)})
+        replica_config['store'] = dict(replica_config['store'], **{'store-path': os.path.join(replica_dir, 'cache')})
+        replica_config['db'] = dict(replica_config['db'], **{'sqlite-db-path': os.path.join(replica_dir, 'remote_server.db')})
+        replica_server = RemoteServer(replica_config)
+        replica_server.setup_db()
+        replica_server.start()
+        replica_server.wait_started()
+
+        try:
+            session_id = self.send_login()
+            req_headers = {
+                'x-privastore-session-id': session_id,
+                'Content-Type': 'application/octet-stream'
+            }
+
+            large_file = random.randbytes(5*1024*1024 + 1000)
+            r = self.send_request(URL.format('/1/upload/file_1'), data=large_file, headers=req_headers, method=requests.post)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            self.assertTrue(self.wait_for(self.check_file_synced, args=['/file_1', req_headers]))
+
+            # The file is stored as 2 data shards and 1 parity shard.
+            r = self.send_request(URL.format('/1/file/file_1'), headers=req_headers, method=requests.get)
+            remote_id = r['versions'][0]['remote-file-id']
+            conn = sqlite3.connect(self.config['db']['sqlite-db-path'])
+            try:
+                rows = conn.execute("SELECT shard_index, port, transfer_status FROM ps_file_shard WHERE remote_id = ? ORDER BY shard_index", (remote_id,)).fetchall()
+            finally:
+                conn.close()
+            self.assertEqual([row[0] for row in rows], [0, 1, 2])
+            # Shards are spread round robin across the endpoints.
+            self.assertEqual(rows[0][1], rows[2][1])
+            self.assertNotEqual(rows[0][1], rows[1][1])
+            self.assertTrue(all(row[2] == FileTransferStatus.SYNCED_DATA.value for row in rows))
+
+            # The data shard on the stopped endpoint is reconstructed from parity.
+            self.stop_server()
+            shutil.rmtree(os.path.join(self.get_test_dir(), 'cache'))
+            if rows[1][1] == REPLICA_PORT:
+                replica_server.stop()
+                replica_server.join()
+                replica_server = None
+            else:
+                self.remote_server.stop()
+                self.remote_server.join()
+                self.remote_server = None
+            self.restart_server()
+
+            session_id = self.send_login()
+            r = self.send_request(URL.format('/1/download/file_1'), headers={'x-privastore-session-id': session_id}, method=requests.get)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            self.assertEqual(r.content, large_file)
+        finally:
+            if replica_server is not None:
+                replica_server.stop()
+                replica_server.join()
@@ -1,13 +1,31 @@
+import hashlib
+from .binary_client import BinaryConnection
+from .binary_protocol import CREATE_FILE, FILE_SIZE, STATUS_ERROR
+from concurrent.futures import ThreadPoolExecutor
+from .chunk_batch import ChunkFrame, CHUNK_OK, decode_frames, encode_frames, frame_error_code
+from .error import RemoteClientError
 from http import HTTPStatus
 import os
+import copy
+import signal
+import socket
 import random
 import requests
+import time
 import uuid
 from .file import File
+from .remote_client import RemoteClient, RemoteCredentials, RemoteEndpoint, TRANSPORT_BINARY
+from .prefork import PreforkServer
 from .remote_server import RemoteServer
+from .erasure import ErasureCode
+from .remote_session import RemoteSession
+from .replication import ErasureCoder, Replicator
 from .session import Sessions
 from .test_server import TestServer, HOSTNAME, PORT, URL
 
+BINARY_PORT = PORT+1
+REPLICA_PORT = PORT+2
+
 class TestRemoteServer(TestServer):
     
     def get_test_dir(self):
@@ -56,6 +74,9 @@ class TestRemoteServer(TestServer):
     def test_session_api(self):
         self.start_server()
 
+        # Health check doesn't need a session.
+        r = requests.get(URL.format('/1/health'))
+        self.assertEqual(r.status_code, HTTPStatus.OK)
         r = requests.post(URL.format('/1/login'), auth=('psadmin', 'psadm1n'))
         self.assertEqual(r.status_code, HTTPStatus.UNAUTHORIZED)
         self.assertEqual(r.json()['error'], 'INCORRECT_PASSWORD')
@@ -85,6 +106,144 @@ class TestRemoteServer(TestServer):
         self.assertEqual(r.status_code, HTTPStatus.UNAUTHORIZED)
         self.assertEqual(r.json()['error'], 'SESSION_NOT_FOUND')
     
+    def test_shared_session(self):
+        self.start_server()
+        remote_session = RemoteSession(heartbeat_interval=0)
+        clients = [RemoteClient(HOSTNAME, PORT, remote_creds=RemoteCredentials('psadmin', 'psadmin')) for i in range(2)]
+        for client in clients:
+            client.set_session(remote_session)
+        try:
+            # Clients share the login.
+            session_id = clients[0].get_session_id()
+            self.assertEqual(clients[1].get_session_id(), session_id)
+            clients[1].create_file(1024)
+            self.assertEqual(remote_session.get(), session_id)
+
+            # Idle sessions are renewed, expired ones are logged in again.
+            clients[0].renew_sessions()
+            self.assertEqual(remote_session.get(), session_id)
+            r = requests.post(URL.format('/1/logout'), headers={'x-privastore-session-id':session_id})
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            clients[0].renew_sessions()
+            new_session_id = remote_session.get()
+            self.assertIsNotNone(new_session_id)
+            self.assertNotEqual(new_session_id, session_id)
+            clients[1].create_file(1024)
+            self.assertEqual(remote_session.get(), new_session_id)
+        finally:
+            for client in clients:
+                client.close()
+
+    def test_keep_alive(self):
+        self.get_config()['api']['keep-alive-max-requests'] = '3'
+        self.start_server()
+
+        with requests.Session() as http_session:
+            r = http_session.post(URL.format('/1/login'), auth=('psadmin', 'psadmin'))
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            self.assertEqual(r.headers.get('Connection'), 'keep-alive')
+            self.assertEqual(r.headers.get('Keep-Alive'), 'timeout=15, max=2')
+            session_id = r.headers.get('x-privastore-session-id')
+            inv_session_id = 'S-{}'.format(str(uuid.uuid4()))
+            # Unread request body is drained before the next request.
+            r = http_session.put(URL.format('/1/file/{}?chunk=1'.format(File.generate_file_id())), headers={'x-privastore-session-id':inv_session_id}, data=random.randbytes(1024))
+            self.assertEqual(r.status_code, HTTPStatus.UNAUTHORIZED)
+            self.assertEqual(r.headers.get('Connection'), 'keep-alive')
+            r = http_session.put(URL.format('/1/heartbeat'), headers={'x-privastore-session-id':session_id})
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            self.assertEqual(r.headers.get('Connection'), 'close')
+            r = http_session.put(URL.format('/1/heartbeat'), headers={'x-privastore-session-id':session_id})
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            self.assertEqual(r.headers.get('Connection'), 'keep-alive')
+            r = http_session.put(URL.format('/1/heartbeat'), headers={'x-privastore-session-id':session_id, 'Connection':'close'})
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            self.assertEqual(r.headers.get('Connection'), 'close')
+
+    def test_pooled_server(self):
+        self.get_config()['api']['http-server-mode'] = 'pooled'
+        self.get_config()['api']['http-worker-threads'] = '2'
+        self.get_config()['api']['http-shutdown-timeout'] = '1'
+        self.start_server()
+
+        # More concurrent requests than workers wait their turn.
+        def login(_):
+            r = requests.post(URL.format('/1/login'), auth=('psadmin', 'psadmin'), headers={'Connection': 'close'})
+            return r.status_code
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            self.assertEqual(list(executor.map(login, range(16))), [HTTPStatus.OK] * 16)
+
+        # Idle keep-alive connections don't hold the workers.
+        http_sessions = [requests.Session() for _ in range(4)]
+        for http_session in http_sessions:
+            r = http_session.post(URL.format('/1/login'), auth=('psadmin', 'psadmin'))
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            self.assertEqual(r.headers.get('Connection'), 'keep-alive')
+        start_t = time.time()
+        self.assertEqual(login(None), HTTPStatus.OK)
+        self.assertLess(time.time() - start_t, 5)
+        # The idle connections are picked up again on their next request.
+        for http_session in http_sessions:
+            r = http_session.post(URL.format('/1/login'), auth=('psadmin', 'psadmin'))
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            self.assertEqual(r.headers.get('Connection'), 'keep-alive')
+            http_session.close()
+
+        # Keep-alive works and the idle connection is closed on shutdown.
+        http_session = requests.Session()
+        r = http_session.post(URL.format('/1/login'), auth=('psadmin', 'psadmin'))
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(r.headers.get('Connection'), 'keep-alive')
+        start_t = time.time()
+        self.stop_server()
+        self.assertLess(time.time() - start_t, 5)
+        http_session.close()
+        with self.assertRaises(requests.ConnectionError):
+            requests.post(URL.format('/1/login'), auth=('psadmin', 'psadmin'))
+        self.restart_server()
+
+    def test_prefork_server(self):
+        self.config['store']['chunk-size'] = '1000B'
+        self.server_factory().setup_db()
+        self.server = PreforkServer(self.server_factory, 2)
+        self.server.start()
+        self.server.wait_started()
+        self.assertEqual(len(self.server.worker_pids()), 2)
+
+        # Every request is on a new connection, the workers share sessions
+        # and files.
+        def send_request(url, method=requests.get, headers={}, data=None):
+            return method(URL.format(url), headers=dict(headers, Connection='close'), data=data)
+
+        r = requests.post(URL.format('/1/login'), auth=('psadmin', 'psadmin'), headers={'Connection': 'close'})
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        req_headers = {
+            'x-privastore-session-id': r.headers.get('x-privastore-session-id'),
+            'x-privastore-epoch-no': '1'
+        }
+        r = send_request('/1/file?size=1000', method=requests.post, headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        file_id = r.headers.get('x-privastore-remote-file-id')
+        chunks = [random.randbytes(1000) for i in range(8)]
+        for i, chunk in enumerate(chunks):
+            r = send_request('/1/file/{}?chunk={}'.format(file_id, i+1), method=requests.put, headers=req_headers, data=chunk)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+        r = send_request('/1/file/{}/commit'.format(file_id), method=requests.put, headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        for i, chunk in enumerate(chunks):
+            r = send_request('/1/file/{}?chunk={}'.format(file_id, i+1), headers=req_headers)
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+            self.assertEqual(r.content, chunk)
+        file_metadata = send_request('/1/file/{}/metadata'.format(file_id), headers=req_headers).json()
+        self.assertEqual(file_metadata.get('file-chunks'), 8)
+        self.assertEqual(file_metadata.get('is-committed'), True)
+
+        # Workers that die are restarted.
+        pid = self.server.worker_pids()[0]
+        os.kill(pid, signal.SIGKILL)
+        self.assertTrue(self.wait_for(lambda timeout: len(self.server.worker_pids()) == 2 and pid not in self.server.worker_pids(), timeout=10))
+        r = send_request('/1/heartbeat', method=requests.put, headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+
     def test_create_file(self):
         self.start_server()
         r = requests.post(URL.format('/1/login'), auth=('psadmin', 'psadmin'))
@@ -119,6 +278,16 @@ class TestRemoteServer(TestServer):
         self.assertEqual(file_2_metadata.get('file-store-usage'), 1000)
         self.assertEqual(file_1_metadata.get('file-chunks'), 0)
         self.assertEqual(file_2_metadata.get('is-committed'), False)
+        # Clients may choose the file id, ex. to create replicas.
+        file_3_id = File.generate_file_id()
+        r = self.send_request(URL.format('/1/file'), method=requests.post, headers=dict(req_headers, **{'x-privastore-remote-file-id': file_3_id}))
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(r.headers.get('x-privastore-remote-file-id'), file_3_id)
+        r = self.send_request(URL.format('/1/file'), method=requests.post, headers=dict(req_headers, **{'x-privastore-remote-file-id': file_3_id}))
+        self.assertEqual(r.status_code, HTTPStatus.CONFLICT)
+        self.assertEqual(r.json()['error'], 'FILE_EXISTS')
+        r = self.send_request(URL.format('/1/file'), method=requests.post, headers=dict(req_headers, **{'x-privastore-remote-file-id': 'F-invalid'}))
+        self.assertEqual(r.status_code, HTTPStatus.BAD_REQUEST)
 
     def test_commit_file(self):
         self.start_server()
@@ -203,7 +372,16 @@ class TestRemoteServer(TestServer):
         r = self.send_request(URL.format('/1/file/{}?chunk=2'.format(file_1_id)), data=chunk_2, method=requests.put, headers=req_headers)
         self.assertEqual(r.status_code, HTTPStatus.BAD_REQUEST)
         self.assertEqual(r.json()['error'], 'FILE_CHUNK_TOO_LARGE')
-        r = self.send_request(URL.format('/1/file/{}?chunk=2'.format(file_1_id)), data=chunk_3, method=requests.put, headers=req_headers)
+        # Chunks with a bad checksum aren't appended.
+        checksum_headers = dict(req_headers, **{'x-privastore-chunk-sha256': hashlib.sha256(chunk_1).hexdigest()})
+        r = self.send_request(URL.format('/1/file/{}?chunk=2'.format(file_1_id)), data=chunk_3, method=requests.put, headers=checksum_headers)
+        self.assertEqual(r.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(r.json()['error'], 'FILE_CHUNK_CHECKSUM_MISMATCH')
+        checksum_headers['x-privastore-chunk-sha256'] = 'xyz'
+        r = self.send_request(URL.format('/1/file/{}?chunk=2'.format(file_1_id)), data=chunk_3, method=requests.put, headers=checksum_headers)
+        self.assertEqual(r.status_code, HTTPStatus.BAD_REQUEST)
+        checksum_headers['x-privastore-chunk-sha256'] = hashlib.sha256(chunk_3).hexdigest()
+        r = self.send_request(URL.format('/1/file/{}?chunk=2'.format(file_1_id)), data=chunk_3, method=requests.put, headers=checksum_headers)
         self.assertEqual(r.status_code, HTTPStatus.OK)
         r = self.send_request(URL.format('/1/file/{}/commit'.format(file_1_id)), method=requests.put, headers=req_headers)
         self.assertEqual(r.status_code, HTTPStatus.OK)
@@ -373,3 +551,303 @@ class TestRemoteServer(TestServer):
         r = self.send_request(URL.format('/1/epoch/2'), method=requests.put, headers=req_headers)
         self.assertEqual(r.status_code, HTTPStatus.OK)
         
+
+    def test_batch_chunks(self):
+        self.config['store']['chunk-size'] = '1000B'
+        self.start_server()
+        r = requests.post(URL.format('/1/login'), auth=('psadmin', 'psadmin'))
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        session_id = r.headers.get('x-privastore-session-id')
+        req_headers = {
+            'x-privastore-session-id': session_id,
+            'x-privastore-epoch-no': '1'
+        }
+        r = self.send_request(URL.format('/1/file?size=3000'), method=requests.post, headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        file_1_id = r.headers.get('x-privastore-remote-file-id')
+        chunks = [random.randbytes(1000), random.randbytes(1000), random.randbytes(500)]
+
+        # Chunk 3 doesn't follow on from chunk 1, it and the chunks after it aren't written.
+        batch = encode_frames([ChunkFrame(1, CHUNK_OK, chunks[0]), ChunkFrame(3, CHUNK_OK, chunks[2]), ChunkFrame(4, CHUNK_OK, chunks[2])])
+        r = self.send_request(URL.format('/1/file/{}/chunks'.format(file_1_id)), data=batch, method=requests.put, headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual([frame_error_code(frame) for frame in decode_frames(r.content)], [None, 'INVALID_CHUNK_NUM', 'INVALID_CHUNK_NUM'])
+        batch = encode_frames([ChunkFrame(2, CHUNK_OK, random.randbytes(1001))])
+        r = self.send_request(URL.format('/1/file/{}/chunks'.format(file_1_id)), data=batch, method=requests.put, headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(r.json()['error'], 'FILE_CHUNK_TOO_LARGE')
+        r = self.send_request(URL.format('/1/file/{}/chunks'.format(file_1_id)), data=b'\x00\x00', method=requests.put, headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.BAD_REQUEST)
+
+        client = RemoteClient(HOSTNAME, PORT, remote_creds=RemoteCredentials('psadmin', 'psadmin'))
+        try:
+            client.send_file_chunks(file_1_id, chunks[1:], 2)
+            with self.assertRaises(RemoteClientError) as e:
+                client.read_file_chunks(file_1_id, 1, 3)
+            self.assertEqual(e.exception.error_code(), 'FILE_IS_UNCOMMITTED')
+            client.commit_file(file_1_id, 1)
+            self.assertEqual(client.read_file_chunks(file_1_id, 1, 3), chunks)
+            # Reads stop at the end of the file.
+            self.assertEqual(client.read_file_chunks(file_1_id, 2, 5), chunks[1:])
+            with self.assertRaises(RemoteClientError) as e:
+                client.read_file_chunks(file_1_id, 4, 2)
+            self.assertEqual(e.exception.error_code(), 'INVALID_CHUNK_NUM')
+        finally:
+            client.close()
+        r = self.send_request(URL.format('/1/file/{}/chunks?chunk=1&count=65'.format(file_1_id)), method=requests.get, headers=req_headers)
+        self.assertEqual(r.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_binary_api(self):
+        self.config['api']['binary-api-port'] = str(BINARY_PORT)
+        self.config['store']['chunk-size'] = '1000B'
+        self.start_server()
+        r = requests.get(URL.format('/1/health'))
+        self.assertEqual(r.status_code, HTTPStatus.OK)
+        self.assertEqual(r.headers.get('x-privastore-binary-port'), str(BINARY_PORT))
+
+        # Requests need a logged in connection.
+        conn = BinaryConnection(HOSTNAME, BINARY_PORT)
+        try:
+            res = conn.request(CREATE_FILE, FILE_SIZE.pack(1000), timeout=10)
+            self.assertEqual(res.code, STATUS_ERROR)
+            self.assertEqual(res.body, b'SESSION_NOT_FOUND')
+        finally:
+            conn.close()
+
+        client = RemoteClient(HOSTNAME, PORT, remote_creds=RemoteCredentials('psadmin', 'psadmin'), transport=TRANSPORT_BINARY)
+        try:
+            self.assertTrue(client.use_binary_transport())
+            chunks = [random.randbytes(1000), random.randbytes(1000), random.randbytes(1000), random.randbytes(500)]
+            file_1_id = client.create_file(3500)
+            self.assertTrue(File.is_valid_file_id(file_1_id))
+            client.send_file_chunk(file_1_id, chunks[0], 1)
+            with self.assertRaises(RemoteClientError) as e:
+                client.send_file_chunk(file_1_id, chunks[1], 3)
+            self.assertEqual(e.exception.error_code(), 'INVALID_CHUNK_NUM')
+            with self.assertRaises(RemoteClientError) as e:
+                client.send_file_chunk(file_1_id, random.randbytes(1001), 2)
+            self.assertEqual(e.exception.error_code(), 'FILE_CHUNK_TOO_LARGE')
+            client.send_file_chunks(file_1_id, chunks[1:], 2)
+            with self.assertRaises(RemoteClientError) as e:
+                client.read_file_chunk(file_1_id, 1)
+            self.assertEqual(e.exception.error_code(), 'FILE_IS_UNCOMMITTED')
+            file_1_metadata = client.get_file_metadata(file_1_id)
+            self.assertEqual(file_1_metadata.file_chunks, 4)
+            self.assertFalse(file_1_metadata.is_committed)
+            client.commit_file(file_1_id, 1)
+            self.assertEqual(client.read_file_chunk(file_1_id, 2), chunks[1])
+            self.assertEqual(client.read_file_chunks(file_1_id, 1, 4), chunks)
+            # Reads stop at the end of the file.
+            self.assertEqual(client.read_file_chunks(file_1_id, 3, 5), chunks[2:])
+            with self.assertRaises(RemoteClientError) as e:
+                client.read_file_chunks(file_1_id, 5, 2)
+            self.assertEqual(e.exception.error_code(), 'INVALID_CHUNK_NUM')
+            client.end_epoch(1, file_1_id)
+            with self.assertRaises(RemoteClientError) as e:
+                client.end_epoch(1)
+            self.assertEqual(e.exception.error_code(), 'EPOCH_IS_OVER')
+            client.remove_file(file_1_id, 2)
+            with self.assertRaises(RemoteClientError) as e:
+                client.get_file_metadata(file_1_id)
+            self.assertEqual(e.exception.error_code(), 'FILE_NOT_FOUND')
+        finally:
+            client.close()
+
+        # Servers without the binary API are used over HTTP.
+        self.stop_server()
+        del self.config['api']['binary-api-port']
+        self.restart_server()
+        client = RemoteClient(HOSTNAME, PORT, remote_creds=RemoteCredentials('psadmin', 'psadmin'), transport=TRANSPORT_BINARY)
+        try:
+            self.assertFalse(client.use_binary_transport())
+            file_2_id = client.create_file(1000)
+            client.send_file_chunk(file_2_id, chunks[0], 1)
+            client.commit_file(file_2_id, 2)
+            self.assertEqual(client.read_file_chunk(file_2_id, 1), chunks[0])
+        finally:
+            client.close()
+
+    def test_binary_api_workers(self):
+        self.config['api']['binary-api-port'] = str(BINARY_PORT)
+        self.config['api']['binary-worker-threads'] = '1'
+        self.start_server()
+
+        conn_1 = BinaryConnection(HOSTNAME, BINARY_PORT)
+        conn_2 = BinaryConnection(HOSTNAME, BINARY_PORT)
+        try:
+            res = conn_1.request(CREATE_FILE, FILE_SIZE.pack(1000), timeout=10)
+            self.assertEqual(res.body, b'SESSION_NOT_FOUND')
+
+            # The only worker is held by the first connection, the second
+            # waits in the backlog until it's closed.
+            future = conn_2.submit(CREATE_FILE, FILE_SIZE.pack(1000))
+            time.sleep(0.5)
+            self.assertFalse(future.done())
+            conn_1.close()
+            self.assertEqual(future.result(10).body, b'SESSION_NOT_FOUND')
+
+            # Idle connections don't hold up the shutdown.
+            stop_t = time.monotonic()
+            self.stop_server()
+            self.assertLess(time.monotonic() - stop_t, 5)
+            self.assertTrue(self.wait_for(lambda timeout: conn_2.is_closed(), timeout=5))
+        finally:
+            conn_1.close()
+            conn_2.close()
+
+    def test_replication(self):
+        self.config['store']['chunk-size'] = '1000B'
+        self.start_server()
+        replica_dir = os.path.join(self.get_test_dir(), 'replica')
+        os.mkdir(replica_dir)
+        replica_config = copy.deepcopy(self.config)
+        replica_config['api']['api-port'] = str(REPLICA_PORT)
+        replica_config['store']['store-path'] = os.path.join(replica_dir, 'cache')
+        replica_config['db']['sqlite-db-path'] = os.path.join(replica_dir, 'local_server.db')
+        replica_server = RemoteServer(replica_config)
+        replica_server.setup_db()
+        replica_server.start()
+        replica_server.wait_started()
+
+        client = RemoteClient(HOSTNAME, PORT, remote_creds=RemoteCredentials('psadmin', 'psadmin'))
+        client.add_remote_endpoint(RemoteEndpoint(HOSTNAME, REPLICA_PORT))
+        replicator = Replicator(client, 2, 2)
+        try:
+            chunks = [random.randbytes(1000), random.randbytes(1000), random.randbytes(500)]
+            file_id, endpoints = replicator.create_file(2500)
+            self.assertEqual(len(endpoints), 2)
+            # Replicas that already have some chunks are only sent the rest.
+            client.send_file_chunk(file_id, chunks[0], 1, endpoint=endpoints[0])
+            acked, errors = replicator.send_chunks(file_id, endpoints, chunks, 1, {str(endpoints[0]): 1})
+            self.assertEqual(len(acked), 2)
+            self.assertEqual(len(errors), 0)
+            results, errors = replicator.get_file_metadata(file_id, endpoints)
+            self.assertEqual(len(errors), 0)
+            for metadata in results.values():
+                self.assertEqual(metadata.file_chunks, 3)
+            acked, errors = replicator.commit_file(file_id, endpoints, 1)
+            self.assertEqual(len(acked), 2)
+            # Committing again is acknowledged.
+            acked, errors = replicator.commit_file(file_id, endpoints, 1)
+            self.assertEqual(len(acked), 2)
+            # Any replica can serve reads.
+            for endpoint in endpoints:
+                self.assertEqual(client.read_file_chunks(file_id, 1, 3, replicas=[endpoint]), chunks)
+
+            # Reads are served by the remaining replicas.
+            replica_server.stop()
+            replica_server.join()
+            replica_server = None
+            self.assertEqual(client.read_file_chunk(file_id, 3, replicas=endpoints), chunks[2])
+        finally:
+            replicator.close()
+            client.close()
+            if replica_server is not None:
+                replica_server.stop()
+                replica_server.join()
+
+        # Writes fail without a quorum of replicas.
+        client = RemoteClient(HOSTNAME, PORT, remote_creds=RemoteCredentials('psadmin', 'psadmin'))
+        client.add_remote_endpoint(RemoteEndpoint(HOSTNAME, REPLICA_PORT))
+        replicator = Replicator(client, 2, 2)
+        try:
+            with self.assertRaises(RemoteClientError) as e:
+                replicator.create_file(1000, timeout=2)
+            self.assertEqual(e.exception.error_code(), 'REMOTE_UNAVAILABLE')
+            replicator.close()
+            replicator = Replicator(client, 2, 1)
+            file_id, endpoints = replicator.create_file(1000, timeout=2)
+            self.assertEqual(len(endpoints), 1)
+        finally:
+            replicator.close()
+            client.close()
+
+    def test_erasure_coding(self):
+        self.config['store']['chunk-size'] = '1000B'
+        self.start_server()
+        replica_dir = os.path.join(self.get_test_dir(), 'replica')
+        os.mkdir(replica_dir)
+        replica_config = copy.deepcopy(self.config)
+        replica_config['api']['api-port'] = str(REPLICA_PORT)
+        replica_config['store']['store-path'] = os.path.join(replica_dir, 'cache')
+        replica_config['db']['sqlite-db-path'] = os.path.join(replica_dir, 'local_server.db')
+        replica_server = RemoteServer(replica_config)
+        replica_server.setup_db()
+        replica_server.start()
+        replica_server.wait_started()
+
+        client = RemoteClient(HOSTNAME, PORT, remote_creds=RemoteCredentials('psadmin', 'psadmin'))
+        client.add_remote_endpoint(RemoteEndpoint(HOSTNAME, REPLICA_PORT))
+        replicator = Replicator(client, 3, 2)
+        coder = ErasureCoder(replicator, ErasureCode(2, 1))
+        try:
+            # Shards are spread across the endpoints.
+            shards, created = coder.create_shards(4500)
+            self.assertEqual(len(shards), 3)
+            self.assertEqual(len(created), 3)
+            self.assertEqual(len(set([str(shard.endpoint) for shard in shards])), 2)
+            chunks = [random.randbytes(990) for i in range(4)] + [random.randbytes(500)]
+            fragments = coder.encode_groups(chunks)
+            self.assertEqual([len(fragments[i]) for i in range(3)], [3, 2, 3])
+            acked, errors = coder.send_fragments(shards, fragments, 1)
+            self.assertEqual(len(acked), 3)
+            acked, errors = coder.commit_shards(shards, 1)
+            self.assertEqual(len(acked), 3)
+            self.assertEqual(coder.read_group(shards, 1, 2) + coder.read_group(shards, 2, 2) + coder.read_group(shards, 3, 1), chunks)
+
+            # Chunks of a lost data shard are reconstructed from parity.
+            acked, errors = coder.remove_shards(shards[:1], 2)
+            self.assertEqual(len(acked), 1)
+            self.assertEqual(coder.read_group(shards, 1, 2) + coder.read_group(shards, 2, 2) + coder.read_group(shards, 3, 1), chunks)
+            acked, errors = coder.remove_shards(shards[1:2], 2)
+            with self.assertRaises(RemoteClientError) as e:
+                coder.read_group(shards, 1, 2)
+            self.assertEqual(e.exception.error_code(), 'FILE_NOT_FOUND')
+            # The last group only needs one fragment.
+            self.assertEqual(coder.read_group(shards, 3, 1), chunks[4:])
+        finally:
+            replicator.close()
+            client.close()
+            replica_server.stop()
+            replica_server.join()
+
+class TestAsyncioRemoteServer(TestRemoteServer):
+
+    '''
+        Runs the remote server tests against the asyncio HTTP API.
+    '''
+    def get_test_dir(self):
+        return 'test_asyncio_remote_server'
+
+    def get_config(self):
+        if self.config:
+            return self.config
+        config = super().get_config()
+        config['api']['api-type'] = 'asyncio'
+        return config
+
+    def test_idle_connections(self):
+        self.start_server()
+        # Idle keep-alive connections don't tie up a thread each.
+        conns = []
+        try:
+            for i in range(200):
+                sock = socket.create_connection((HOSTNAME, PORT))
+                sock.sendall(b'GET /1/health HTTP/1.1\r\nHost: localhost\r\n\r\n')
+                conns.append(sock)
+            for sock in conns:
+                self.assertTrue(sock.recv(4096).startswith(b'HTTP/1.1 200 OK'))
+            self.assertEqual(self.server.api_daemon().num_connections(), 200)
+            r = requests.post(URL.format('/1/login'), auth=('psadmin', 'psadmin'))
+            self.assertEqual(r.status_code, HTTPStatus.OK)
+
+            # Idle connections are closed right away on shutdown.
+            start_t = time.time()
+            self.stop_server()
+            self.assertLess(time.time() - start_t, 5)
+            for sock in conns:
+                self.assertEqual(sock.recv(4096), b'')
+        finally:
+            for sock in conns:
+                sock.close()
+        self.restart_server()
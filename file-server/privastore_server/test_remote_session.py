@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+from .remote_session import RemoteSession
+from threading import Lock
+import time
+import unittest
+
+class TestRemoteSession(unittest.TestCase):
+
+    def test_single_flight_login(self):
+        session = RemoteSession()
+        logins = []
+        lock = Lock()
+
+        def login():
+            time.sleep(0.1)
+            with lock:
+                logins.append(1)
+                return 'S-{}'.format(len(logins))
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            session_ids = list(executor.map(lambda _: session.login(login), range(8)))
+        self.assertEqual(len(logins), 1)
+        self.assertEqual(session_ids, ['S-1'] * 8)
+        self.assertEqual(session.get(), 'S-1')
+
+        # Endpoint sessions are separate.
+        self.assertIsNone(session.get('localhost:9000'))
+        self.assertEqual(session.login(login, 'localhost:9000'), 'S-2')
+        self.assertEqual(session.get(), 'S-1')
+
+    def test_failed_login(self):
+        session = RemoteSession()
+
+        def fail():
+            raise Exception('Login failed')
+
+        with self.assertRaises(Exception):
+            session.login(fail)
+        self.assertIsNone(session.get())
+        # The next caller logs in again.
+        self.assertEqual(session.login(lambda: 'S-1'), 'S-1')
+
+    def test_expired(self):
+        session = RemoteSession()
+        session.login(lambda: 'S-1')
+        self.assertTrue(session.expired('S-1'))
+        self.assertIsNone(session.get())
+        self.assertFalse(session.expired('S-1'))
+
+        # A request that failed on an old session doesn't drop the new one.
+        session.login(lambda: 'S-2')
+        self.assertFalse(session.expired('S-1'))
+        self.assertEqual(session.get(), 'S-2')
+        self.assertTrue(session.expired())
+        self.assertIsNone(session.get())
+
+    def test_started(self):
+        session = RemoteSession()
+        self.assertEqual(session.started('S-1'), 'S-1')
+        self.assertEqual(session.get(), 'S-1')
+        # The session already started is kept.
+        self.assertEqual(session.started('S-2'), 'S-1')
+        self.assertEqual(session.login(lambda: 'S-3'), 'S-1')
+
+    def test_idle_sessions(self):
+        session = RemoteSession(heartbeat_interval=0.2)
+        session.login(lambda: 'S-1')
+        session.login(lambda: 'S-2', 'localhost:9000')
+        self.assertEqual(session.idle_sessions(), [])
+        time.sleep(0.1)
+        session.touch('S-2', 'localhost:9000')
+        time.sleep(0.15)
+        self.assertEqual(session.idle_sessions(), [(None, 'S-1')])
+        # Only the current session is touched.
+        session.touch('S-0')
+        self.assertEqual(session.idle_sessions(), [(None, 'S-1')])
+        session.touch('S-1')
+        self.assertEqual(session.idle_sessions(), [])
+        session.clear()
+        self.assertIsNone(session.get())
@@ -0,0 +1,56 @@
+from .endpoint_selector import EndpointSelector
+from .error import FileServerErrorCode
+from .remote_client import RemoteClient
+from .retry_policy import RetryBudget, RetryPolicy
+import time
+import unittest
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_backoff(self):
+        policy = RetryPolicy(base_interval=1, max_interval=10)
+        for attempt in range(10):
+            cap = min(10, 2 ** attempt)
+            delays = [policy.backoff(attempt) for _ in range(50)]
+            self.assertTrue(all([0 <= delay <= cap for delay in delays]))
+        # Full jitter, retries are spread out.
+        self.assertGreater(len(set([policy.backoff(5) for _ in range(10)])), 1)
+
+    def test_retry_budget(self):
+        budget = RetryBudget(ratio=0.5, min_retries_per_sec=0, max_balance=2)
+        self.assertTrue(budget.withdraw())
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        self.assertTrue(budget.withdraw())
+        metrics = budget.metrics()
+        self.assertEqual(metrics['retries'], 3)
+        self.assertEqual(metrics['rejected'], 2)
+
+        budget = RetryBudget(ratio=0, min_retries_per_sec=10, max_balance=1)
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        time.sleep(0.15)
+        self.assertTrue(budget.withdraw())
+
+    def test_remote_unavailable(self):
+        # Nothing listening on the port.
+        client = RemoteClient('localhost', 1, retry_interval=0.01)
+        client.set_endpoint_selector(EndpointSelector(failure_threshold=2, open_time=60))
+        client.set_retry_policy(RetryPolicy(base_interval=0.01, budget=RetryBudget(ratio=0, min_retries_per_sec=0, max_balance=1)))
+        start_t = time.time()
+        self.assertEqual(client.send_remote_request('/1/health', timeout=10), FileServerErrorCode.REMOTE_UNAVAILABLE)
+        self.assertEqual(client.retry_policy().metrics()['rejected'], 1)
+        # Circuit is open, fail fast.
+        self.assertEqual(client.endpoint_selector().open_endpoints()[0].port(), 1)
+        self.assertEqual(client.send_remote_request('/1/health', timeout=10), FileServerErrorCode.REMOTE_UNAVAILABLE)
+        self.assertLess(time.time() - start_t, 5)
+        client.close()
@@ -35,8 +35,7 @@ class TestServer(unittest.TestCase):
         config_logging(config['logging']['log-level'])
 
     def tearDown(self):
-        self.server.stop()
-        self.server.join()
+        self.stop_server()
         self.cleanup()
 
     def start_server(self):
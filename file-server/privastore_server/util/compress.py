@@ -0,0 +1,80 @@
+from typing import Optional
+import zlib
+
+# HTTP content codings.
+GZIP = 'gzip'
+DEFLATE = 'deflate'
+# In order of preference.
+ENCODINGS = [GZIP, DEFLATE]
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    '''
+        Pick the content coding for a response from the request's
+        Accept-Encoding header. Returns None if the body should be sent as
+        is.
+    '''
+    if accept_encoding is None:
+        return None
+    qvalues = dict()
+    for coding in accept_encoding.split(','):
+        coding, _, params = coding.partition(';')
+        coding = coding.strip().lower()
+        if coding == '':
+            continue
+        qvalue = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[coding] = qvalue
+
+    encoding = None
+    encoding_qvalue = 0.0
+    for coding in ENCODINGS:
+        qvalue = qvalues.get(coding, qvalues.get('*', 0.0))
+        if qvalue > encoding_qvalue:
+            encoding = coding
+            encoding_qvalue = qvalue
+    return encoding
+
+def compressor(encoding: str, level: int=6):
+    if encoding == GZIP:
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif encoding == DEFLATE:
+        # HTTP deflate is the zlib format.
+        return zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS)
+    raise Exception('Unsupported content coding [{}]'.format(encoding))
+
+def compress(data: bytes, encoding: str, level: int=6) -> bytes:
+    c = compressor(encoding, level)
+    return c.compress(data) + c.flush()
+
+class CompressWriter(object):
+
+    '''
+        Compresses a body written in pieces of unknown total length. Each
+        write is flushed through to the underlying writer, so the receiver
+        can decode what has been written so far. finish writes the end of
+        the compressed stream.
+    '''
+    def __init__(self, writer, encoding: str, level: int=6):
+        self._writer = writer
+        self._compressor = compressor(encoding, level)
+
+    def writer(self):
+        return self._writer
+
+    def write(self, data):
+        if len(data) == 0:
+            return 0
+        self._writer.write(self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        return len(data)
+
+    def finish(self):
+        self._writer.write(self._compressor.flush())
+
+    def flush(self):
+        return self._writer.flush()
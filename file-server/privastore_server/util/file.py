@@ -40,17 +40,39 @@ def chunked_copy(in_file: BinaryIO, out_file: BinaryIO, file_size: int, chunk_si
     out_file.flush()
     return bytes_copied
 
+# Buffer used to stream request bodies to files.
+STREAM_BUFFER_SIZE = 64 * KILOBYTE
+
 def read_all(file: BinaryIO, read_len: int):
+    buf = bytearray(read_len)
+    view = memoryview(buf)
     read = 0
-    buf = bytes()
     while read < read_len:
-        r = file.read(read_len-read)
-        r_len = len(r)
-        if r_len == 0:
+        r_len = file.readinto(view[read:])
+        if not r_len:
             raise Exception('No data read!')
-        buf += r
         read += r_len
-    return buf
+    return bytes(buf)
+
+def stream_copy(in_file: BinaryIO, out_file: BinaryIO, copy_len: int, buf: bytearray, hash=None) -> int:
+    '''
+        Copy copy_len bytes from in_file to out_file through buf, so only
+        len(buf) bytes are held at a time. The bytes are also fed to hash if
+        given (see hashlib). Returns the bytes copied, fewer than copy_len if
+        in_file ended first.
+    '''
+    view = memoryview(buf)
+    copied = 0
+    while copied < copy_len:
+        r_len = in_file.readinto(view[:min(len(buf), copy_len - copied)])
+        if not r_len:
+            break
+        data = view[:r_len]
+        if hash is not None:
+            hash.update(data)
+        write_all(out_file, data)
+        copied += r_len
+    return copied
 
 def write_all(file: BinaryIO, data: bytes):
     data_len = len(data)
@@ -1,3 +1,26 @@
+import socket
+from socketserver import TCPServer
+
+# Longest chunk size or trailer line in a chunked request body.
+MAX_CHUNK_LINE = 1024
+
+def bind_server(server: TCPServer, reuse_port: bool=False) -> None:
+    '''
+        Bind and activate a server created with bind_and_activate=False. With
+        reuse_port several processes can bind the same port (SO_REUSEPORT),
+        the kernel spreads incoming connections between them.
+    '''
+    try:
+        if reuse_port:
+            if not hasattr(socket, 'SO_REUSEPORT'):
+                raise Exception('SO_REUSEPORT not supported on this platform!')
+            server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server.server_bind()
+        server.server_activate()
+    except:
+        server.server_close()
+        raise
+
 class SocketWrapper(object):
 
     def __init__(self, sock):
@@ -16,6 +39,28 @@ class SocketWrapper(object):
         self._bytes_read += len(data)
         return data
     
+    def readline(self, size=-1):
+        if self._error:
+            raise Exception('Socket broken')
+        try:
+            data = self._sock.readline(size)
+        except Exception as e:
+            self._error = True
+            raise e
+        self._bytes_read += len(data)
+        return data
+
+    def readinto(self, buf):
+        if self._error:
+            raise Exception('Socket broken')
+        try:
+            n = self._sock.readinto(buf)
+        except Exception as e:
+            self._error = True
+            raise e
+        self._bytes_read += n or 0
+        return n
+
     def write(self, data):
         if self._error:
             raise Exception('Socket broken')
@@ -32,4 +77,95 @@ class SocketWrapper(object):
         return self._sock.close()
 
     def bytes_read(self):
-        return self._bytes_read
\ No newline at end of file
+        return self._bytes_read
+
+class ChunkedEncodingError(Exception):
+    pass
+
+class ChunkedReader(object):
+
+    '''
+        Reads a request body sent with Transfer-Encoding: chunked. read
+        returns the decoded data, b'' once the last chunk and the trailers
+        have been read.
+    '''
+    def __init__(self, sock):
+        self._sock = sock
+        self._chunk_remaining = 0
+        self._bytes_read = 0
+        self._eof = False
+
+    def read_line(self):
+        line = self._sock.readline(MAX_CHUNK_LINE+1)
+        if len(line) > MAX_CHUNK_LINE:
+            raise ChunkedEncodingError('Chunked body line too long')
+        if not line.endswith(b'\n'):
+            raise ChunkedEncodingError('Chunked body ended early')
+        return line
+
+    def next_chunk(self):
+        size = self.read_line().split(b';', 1)[0].strip()
+        try:
+            chunk_len = int(size, 16)
+            if chunk_len < 0:
+                raise ValueError()
+        except ValueError:
+            raise ChunkedEncodingError('Invalid chunk size')
+        if chunk_len == 0:
+            # Skip the trailers.
+            while self.read_line().strip() != b'':
+                pass
+            self._eof = True
+        self._chunk_remaining = chunk_len
+
+    def read(self, size):
+        if self._eof:
+            return b''
+        if self._chunk_remaining == 0:
+            self.next_chunk()
+            if self._eof:
+                return b''
+        read_len = min(size, self._chunk_remaining)
+        data = self._sock.read(read_len)
+        if len(data) < read_len:
+            raise ChunkedEncodingError('Chunked body ended early')
+        self._chunk_remaining -= read_len
+        self._bytes_read += read_len
+        if self._chunk_remaining == 0 and self.read_line().strip() != b'':
+            raise ChunkedEncodingError('Missing chunk terminator')
+        return data
+
+    def eof(self):
+        return self._eof
+
+    def close(self):
+        return self._sock.close()
+
+    def bytes_read(self):
+        return self._bytes_read
+
+class ChunkedWriter(object):
+
+    '''
+        Writes a response body of unknown length with Transfer-Encoding:
+        chunked, each write is sent as a chunk. finish sends the last chunk.
+    '''
+    def __init__(self, sock):
+        self._sock = sock
+        self._bytes_written = 0
+
+    def write(self, data):
+        if len(data) == 0:
+            return 0
+        self._sock.write(b'%x\r\n' % len(data) + data + b'\r\n')
+        self._bytes_written += len(data)
+        return len(data)
+
+    def finish(self):
+        self._sock.write(b'0\r\n\r\n')
+
+    def flush(self):
+        return self._sock.flush()
+
+    def bytes_written(self):
+        return self._bytes_written